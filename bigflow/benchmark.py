@@ -0,0 +1,313 @@
+"""Reproducible performance benchmarks of the bigflow hot paths, run by `bigflow benchmark`.
+
+Each benchmark is a context manager which prepares its fixtures (synthetic projects, workflows, configs)
+and yields a callable - only execution time of that callable is measured.
+Results are reported as a json document, so they can be stored by CI and compared between bigflow versions.
+"""
+
+import contextlib
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import typing
+
+from pathlib import Path
+
+import bigflow
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_REPEAT = 5
+
+_BENCHMARKS: typing.Dict[str, typing.Callable[[int], typing.ContextManager[typing.Callable[[], typing.Any]]]] = {}
+_DEFAULT_SIZES: typing.Dict[str, int] = {}
+
+
+class BenchmarkResult(typing.NamedTuple):
+    name: str
+    size: int
+    repeat: int
+    min_sec: typing.Optional[float] = None
+    median_sec: typing.Optional[float] = None
+    mean_sec: typing.Optional[float] = None
+    max_sec: typing.Optional[float] = None
+    skipped: typing.Optional[str] = None
+
+
+def benchmark(name: str, default_size: int):
+    """Registers generator function as a benchmark `name`, the function is converted into a context manager."""
+
+    def decorator(f):
+        _BENCHMARKS[name] = contextlib.contextmanager(f)
+        _DEFAULT_SIZES[name] = default_size
+        return f
+
+    return decorator
+
+
+def list_benchmarks() -> typing.List[str]:
+    return list(_BENCHMARKS)
+
+
+def run_benchmark(name: str, repeat: int = DEFAULT_REPEAT, size: typing.Optional[int] = None) -> BenchmarkResult:
+    size = size or _DEFAULT_SIZES[name]
+    logger.info("Run benchmark %s, size %d, repeat %d", name, size, repeat)
+
+    try:
+        with _BENCHMARKS[name](size) as measured:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                measured()
+                timings.append(time.perf_counter() - start)
+    except ImportError as e:
+        logger.warning("Skip benchmark %s: %s", name, e)
+        return BenchmarkResult(name=name, size=size, repeat=repeat, skipped=str(e))
+
+    return BenchmarkResult(
+        name=name,
+        size=size,
+        repeat=repeat,
+        min_sec=min(timings),
+        median_sec=statistics.median(timings),
+        mean_sec=statistics.mean(timings),
+        max_sec=max(timings),
+    )
+
+
+def run_benchmarks(
+    names: typing.Optional[typing.Iterable[str]] = None,
+    repeat: int = DEFAULT_REPEAT,
+    scale: float = 1.0,
+) -> typing.List[BenchmarkResult]:
+    names = list(names or _BENCHMARKS)
+    unknown = [n for n in names if n not in _BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {unknown}, available are {list(_BENCHMARKS)}")
+    return [
+        run_benchmark(name, repeat, max(1, int(_DEFAULT_SIZES[name] * scale)))
+        for name in names
+    ]
+
+
+def results_to_json(results: typing.List[BenchmarkResult]) -> dict:
+    return {
+        'bigflow_version': bigflow.__version__,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+        'results': [r._asdict() for r in results],
+    }
+
+
+@contextlib.contextmanager
+def _quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def _synthetic_project(modules: int, jobs_per_workflow: int = 5):
+    """Creates importable package with `modules` modules, each module defines a single workflow."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        package_name = "bf_benchmark_project"
+        package_dir = Path(tmpdir) / package_name
+        package_dir.mkdir()
+        (package_dir / "__init__.py").write_text("")
+
+        for i in range(modules):
+            (package_dir / f"workflow_{i}.py").write_text(textwrap.dedent(f"""
+                import bigflow
+
+                class Job(bigflow.Job):
+                    def execute(self, context):
+                        pass
+
+                workflow_{i} = bigflow.Workflow(
+                    workflow_id="workflow_{i}",
+                    definition=[Job(id="job_{i}_" + str(j)) for j in range({jobs_per_workflow})],
+                )
+            """))
+
+        sys.path.insert(0, tmpdir)
+        try:
+            yield package_dir
+        finally:
+            sys.path.remove(tmpdir)
+            _unload_modules(package_name)
+
+
+def _unload_modules(package_name: str):
+    for m in [m for m in sys.modules if m == package_name or m.startswith(package_name + ".")]:
+        del sys.modules[m]
+
+
+def _layered_job_graph(size: int, width: int = 10) -> dict:
+    """Builds a DAG of `size` jobs split into layers, each job depends on two jobs from the previous layer."""
+
+    class _Job(bigflow.Job):
+        def execute(self, context):
+            pass
+
+    jobs = [_Job(id=f"job_{i}") for i in range(size)]
+    graph = {}
+    for i, job in enumerate(jobs[:-width]):
+        layer_start = (i // width + 1) * width
+        graph[job] = [jobs[layer_start + i % width]]
+        if layer_start + (i + 1) % width < size:
+            graph[job].append(jobs[layer_start + (i + 1) % width])
+    return graph
+
+
+@benchmark("cli_startup", default_size=1)
+def _cli_startup(size):
+    cmd = [sys.executable, "-m", "bigflow", "-h"]
+    # benchmark exactly the same bigflow which is imported now
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+        str(Path(bigflow.__file__).parent.parent), env.get('PYTHONPATH')]))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        def measured():
+            for _ in range(size):
+                subprocess.run(cmd, cwd=tmpdir, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        yield measured
+
+
+@benchmark("walk_workflows", default_size=100)
+def _walk_workflows(size):
+    import bigflow.cli
+
+    with _synthetic_project(modules=size) as package_dir:
+        def measured():
+            _unload_modules(package_dir.name)
+            workflows = list(bigflow.cli.walk_workflows(package_dir))
+            assert len(workflows) == size
+        yield measured
+
+
+@benchmark("definition_order", default_size=2000)
+def _definition_order(size):
+    graph = _layered_job_graph(size)
+
+    def measured():
+        definition = bigflow.Definition(graph)
+        definition._sequential_order()
+
+    yield measured
+
+
+@benchmark("generate_dag_file", default_size=50)
+def _generate_dag_file(size):
+    import bigflow.dagbuilder
+
+    workflow = bigflow.Workflow(workflow_id="benchmark", definition=bigflow.Definition(_layered_job_graph(100)))
+    with tempfile.TemporaryDirectory() as workdir:
+        def measured():
+            with _quiet():
+                for _ in range(size):
+                    bigflow.dagbuilder.generate_dag_file(
+                        workdir, "eu.gcr.io/project/image", workflow, "2020-01-01", "0.1.0", "project")
+        yield measured
+
+
+@benchmark("config_resolve", default_size=1000)
+def _config_resolve(size):
+    properties = {f"property_{i}": f"value_{i}" for i in range(50)}
+    config = bigflow.Config(name='dev', properties=properties)
+    for env in ['test', 'prod']:
+        config.add_configuration(env, {"property_0": env})
+
+    def measured():
+        with _quiet():
+            for i in range(size):
+                config.resolve(['dev', 'test', 'prod'][i % 3])
+
+    yield measured
+
+
+@benchmark("konfig_construct", default_size=1000)
+def _konfig_construct(size):
+    from bigflow.konfig import Konfig, expand, dynamic
+
+    attrs = {f"property_{i}": f"value_{i}" for i in range(50)}
+    attrs.update({f"expanded_{i}": expand("{property_%d}/suffix" % i) for i in range(10)})
+    attrs['computed'] = dynamic(lambda self: self.property_0 + self.property_1)
+    BenchmarkKonfig = type("BenchmarkKonfig", (Konfig,), attrs)
+
+    def measured():
+        for _ in range(size):
+            BenchmarkKonfig()
+
+    yield measured
+
+
+@benchmark("templated_dataset_manager", default_size=1000)
+def _templated_dataset_manager(size):
+    from bigflow.bigquery.dataset_manager import TemplatedDatasetManager
+
+    class _FakeDatasetManager:
+        dataset_id = "project.dataset"
+
+        def write_truncate(self, table_id, sql):
+            return sql
+
+        def collect(self, sql):
+            return sql
+
+    dm = TemplatedDatasetManager(
+        _FakeDatasetManager(),
+        internal_tables=[f"internal_{i}" for i in range(50)],
+        external_tables={f"external_{i}": f"other.dataset.external_{i}" for i in range(50)},
+        extras={f"extra_{i}": i for i in range(20)},
+        run_datetime="2020-01-01",
+    )
+    sql = "SELECT * FROM `{internal_1}` JOIN `{external_1}` USING (id) WHERE dt = '{dt}' AND x > {extra_1}"
+
+    def measured():
+        for _ in range(size):
+            dm.write_truncate("internal_0", sql)
+            dm.collect(sql)
+
+    yield measured
+
+
+@benchmark("dataflow_io", default_size=10000)
+def _dataflow_io(size):
+    import apache_beam as beam
+    import bigflow.dataflow.io as bf_io
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = os.path.join(tmpdir, "input.csv")
+        with open(input_file, 'w') as f:
+            f.write("a,b,c\n")
+            for i in range(size):
+                f.write(f"{i},{i * 2},value_{i}\n")
+
+        def measured():
+            with beam.Pipeline(runner='DirectRunner') as p:
+                _ = (p
+                     | bf_io.ReadCSVFilesPlain(input_file, fieldnames=['a', 'b', 'c'])
+                     | bf_io.WritePandasToCSV(os.path.join(tmpdir, "output")))
+
+        yield measured
+
+
+def dump_results(results: typing.List[BenchmarkResult], output: typing.Optional[str] = None):
+    content = json.dumps(results_to_json(results), indent=2)
+    if output:
+        Path(output).write_text(content)
+    else:
+        print(content)
@@ -1,6 +1,6 @@
 from bigflow.commons import public
 
-from . import interactive, dataset_configuration, job
+from . import interactive, dataset_configuration, job, parallel
 from .interactive import INLINE_COMPONENT_DATASET_ALIAS
 
 __all__ = [
@@ -9,7 +9,8 @@ __all__ = [
     'sensor',
     'INLINE_COMPONENT_DATASET_ALIAS',
     'DatasetConfig',
-    'Job'
+    'Job',
+    'gather',
 ]
 
 
@@ -31,3 +32,7 @@ def sensor(table_alias, where_clause, ds=None): ...
 
 @public(alias_for=interactive.interactive_component)
 def component(**dependencies): ...
+
+
+@public(alias_for=parallel.gather)
+def gather(*futures, max_concurrency=None, poll_interval_sec=parallel.DEFAULT_POLL_INTERVAL_SEC): ...
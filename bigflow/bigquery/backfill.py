@@ -0,0 +1,123 @@
+"""Rewriting a range of daily partitions.
+
+The SQL of `write_truncate_range` is rendered for every day of the range (`{dt}` is the date of a partition).
+When the range is safe, the partitions of up to `days_per_job` days are rewritten by a single scripted job:
+a transaction which deletes the range and inserts the union of the daily queries.
+Otherwise, e.g. when the SQL is a script or the table is not partitioned by day,
+each partition is written by a separate `write_truncate` job, a few of them at the same time.
+"""
+
+import datetime
+import typing
+
+from .templates import _scan
+
+
+DEFAULT_DAYS_PER_JOB = 31
+
+INGESTION_TIME = '_PARTITIONTIME'
+
+
+class RangeNotSupportedError(ValueError):
+    """Partitions can't be rewritten by a single job, they should be written one by one."""
+
+
+def _as_date(value: typing.Union[str, datetime.date]) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value[:10])
+
+
+def partition_dates(
+        start: typing.Union[str, datetime.date],
+        end: typing.Union[str, datetime.date]) -> typing.List[str]:
+    """
+    Dates (YYYY-MM-DD) of daily partitions from `start` to `end`, both inclusive.
+
+    >>> partition_dates('2020-02-28', '2020-03-01 00:00:00')
+    ['2020-02-28', '2020-02-29', '2020-03-01']
+    """
+    start, end = _as_date(start), _as_date(end)
+    if start > end:
+        raise ValueError(f"Start of the range {start} is after its end {end}")
+    return [(start + datetime.timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+def is_single_query(sql: str) -> bool:
+    """Checks that the SQL has no statement separators (a trailing one is allowed), so it can be used as a subquery."""
+    sql = sql.strip()
+    if sql.endswith(';'):
+        sql = sql[:-1]
+    state = None
+    start = 0
+    for i, char in enumerate(sql):
+        if char == ';':
+            state = _scan(sql[start:i], state)
+            start = i
+            if state is None:
+                return False
+    return True
+
+
+def _subquery(sql: str) -> str:
+    sql = sql.strip()
+    return '(\n{}\n)'.format(sql[:-1] if sql.endswith(';') else sql)
+
+
+def partition_insert(table, queries: typing.Dict[str, str]) -> typing.Tuple[str, str]:
+    """
+    INSERT statement which writes results of the queries (partition date YYYY-MM-DD -> SQL) to daily partitions
+    of the table (`google.cloud.bigquery.Table`), and the expression of the partition date of a row.
+    Each query has to return the columns of the table, a row outside its partition fails the statement.
+    """
+    partitioning = table.time_partitioning
+    if partitioning is None:
+        raise RangeNotSupportedError(f"Table {table.table_id} is not partitioned by time")
+    if (partitioning.type_ or 'DAY') != 'DAY':
+        raise RangeNotSupportedError(f"Table {table.table_id} is partitioned by {partitioning.type_}, not by day")
+    for sql in queries.values():
+        if not is_single_query(sql):
+            raise RangeNotSupportedError("SQL is not a single query")
+
+    columns = ', '.join(f"`{field.name}`" for field in table.schema)
+    dates = sorted(queries)
+    if partitioning.field is None:
+        partition_date = '_PARTITIONDATE'
+        insert_columns = f"{INGESTION_TIME}, {columns}"
+        selects = [
+            f"SELECT TIMESTAMP '{dt}', {columns} FROM {_subquery(queries[dt])}"
+            for dt in dates]
+    else:
+        partition_date = f"DATE(`{partitioning.field}`)"
+        insert_columns = columns
+        selects = [
+            f"SELECT {columns} FROM {_subquery(queries[dt])}\n"
+            f"WHERE IF({partition_date} = DATE '{dt}', TRUE, ERROR('Row outside of partition {dt}'))"
+            for dt in dates]
+
+    return partition_date, '\n'.join([
+        f"INSERT INTO {_quoted_table_id(table)} ({insert_columns})",
+        '\nUNION ALL\n'.join(selects) + ';',
+    ])
+
+
+def _quoted_table_id(table) -> str:
+    return f"`{table.project}.{table.dataset_id}.{table.table_id}`"
+
+
+def range_script(table, queries: typing.Dict[str, str]) -> str:
+    """
+    BigQuery script which replaces daily partitions of the table (`google.cloud.bigquery.Table`)
+    with results of the queries (partition date YYYY-MM-DD -> SQL).
+    Each query has to return the columns of the table, a row outside its partition fails the script.
+    """
+    partition_date, insert = partition_insert(table, queries)
+    dates = sorted(queries)
+    return '\n'.join([
+        'BEGIN TRANSACTION;',
+        f"DELETE FROM {_quoted_table_id(table)} WHERE {partition_date} BETWEEN DATE '{dates[0]}' AND DATE '{dates[-1]}';",
+        insert,
+        'COMMIT TRANSACTION;',
+    ])
@@ -0,0 +1,114 @@
+"""Byte budgets of BigQuery queries.
+
+A budget limits bytes billed by queries of a bigflow job (`bigflow.bigquery.Job(..., maximum_bytes_billed=...)`)
+or by all BigQuery jobs of a workflow run in one process (`limit_workflow_bytes_billed`).
+Before a query is sent, `maximum_bytes_billed` of its `QueryJobConfig` is set to what is left of the budgets,
+so BigQuery fails a runaway query before it scans more than that, instead of billing it.
+
+The limit of a query is reserved until the query is charged, so queries running at the same time never bill
+more than the budget together. Within `parallel()` and `gather`, the budget is shared by `max_concurrency` queries.
+"""
+
+import contextlib
+import logging
+import threading
+import typing
+
+from .stats import _human_bytes
+
+
+logger = logging.getLogger(__name__)
+
+
+WORKFLOW_BUDGET_RESOURCE = 'bigquery.workflow_budget'
+
+
+class BudgetExceededError(ValueError):
+    pass
+
+
+class BytesBudget(object):
+    """
+    Bytes billed which can be spent by queries. The limit of a query is the smallest of what is left of the budget
+    and of its parent budgets, it is reserved in all of them until the query is charged.
+    A failed query is never charged, its reservation is kept, so the budget doesn't let later queries bill more.
+    """
+
+    def __init__(self, maximum_bytes_billed: int, name: str = 'budget', parent: typing.Optional['BytesBudget'] = None):
+        if maximum_bytes_billed <= 0:
+            raise ValueError(f"maximum_bytes_billed should be positive, got {maximum_bytes_billed}")
+        self.maximum_bytes_billed = maximum_bytes_billed
+        self.name = name
+        self.parent = parent
+        self.billed = 0
+        self.reserved = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def _chain(self) -> typing.List['BytesBudget']:
+        return [self] + (self.parent._chain() if self.parent is not None else [])
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # locks are always taken from a job budget to its parents, so budgets sharing a parent can't deadlock
+        with contextlib.ExitStack() as stack:
+            for budget in self._chain():
+                stack.enter_context(budget._lock)
+            yield
+
+    def remaining(self) -> int:
+        """Bytes which can be billed by the next queries, not billed or reserved by running queries."""
+        return min(b.maximum_bytes_billed - b.billed - b.reserved for b in self._chain())
+
+    def limit(self, concurrency: int = 1) -> int:
+        """
+        `maximum_bytes_billed` of the next query, reserved until the query is charged. When up to `concurrency`
+        queries run at the same time, the next one gets its share of what is left.
+        Raises `BudgetExceededError` when a budget is used up or reserved by running queries.
+        """
+        with self._locked():
+            for budget in self._chain():
+                if budget.billed + budget.reserved >= budget.maximum_bytes_billed:
+                    raise BudgetExceededError(
+                        f"The {budget.name} is used up: billed {_human_bytes(budget.billed)}, "
+                        f"reserved by running queries {_human_bytes(budget.reserved)} "
+                        f"of {_human_bytes(budget.maximum_bytes_billed)}")
+            limit = max(1, self.remaining() // max(1, concurrency - self.running))
+            for budget in self._chain():
+                budget.reserved += limit
+                budget.running += 1
+        return limit
+
+    def charge(self, bytes_billed: typing.Optional[int], reserved: int = 0):
+        """Charges bytes billed by a query and releases the limit reserved for it (if the query was limited)."""
+        with self._locked():
+            for budget in self._chain():
+                budget.billed += bytes_billed or 0
+                if reserved:
+                    budget.reserved -= reserved
+                    budget.running -= 1
+
+
+def limit_workflow_bytes_billed(workflow, maximum_bytes_billed: int):
+    """
+    Limits bytes billed by BigQuery jobs of one run of the workflow which run in the same process
+    (`bigflow run --workflow`, `Workflow.run`). Each run starts with the full budget.
+    The budget is not shared between processes: on Airflow every job runs in a separate process,
+    so there it limits bytes billed by every job of the workflow separately, not by the whole workflow run.
+    """
+    workflow.resources.register(
+        WORKFLOW_BUDGET_RESOURCE,
+        lambda: BytesBudget(maximum_bytes_billed, f"budget of workflow {workflow.workflow_id}"))
+
+
+def job_budget(
+        job_id: str,
+        maximum_bytes_billed: typing.Optional[int],
+        resources=None) -> typing.Optional[BytesBudget]:
+    """The budget of one run of a bigflow job, None when neither the job nor its workflow is limited."""
+    workflow_budget = None
+    if resources is not None and resources.is_registered(WORKFLOW_BUDGET_RESOURCE):
+        workflow_budget = resources.get(WORKFLOW_BUDGET_RESOURCE)
+    if maximum_bytes_billed is None:
+        return workflow_budget
+    return BytesBudget(maximum_bytes_billed, f"budget of job {job_id}", workflow_budget)
@@ -0,0 +1,239 @@
+"""Bulk loading of records with BigQuery load jobs.
+
+Records are read lazily (from a list, an iterator or a newline-delimited JSON file), split into chunks,
+encoded as NDJSON, Parquet or Avro, and appended to a table by load jobs. Only chunks which are being loaded
+are kept in memory. Unlike streaming inserts, load jobs are free and rows don't stay in the streaming buffer.
+"""
+
+import io
+import json
+import logging
+import threading
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# hidden BQ, pyarrow and fastavro imports due to https://github.com/allegro/bigflow/issues/149
+
+
+logger = logging.getLogger(__name__)
+
+
+NEWLINE_DELIMITED_JSON = 'NEWLINE_DELIMITED_JSON'
+PARQUET = 'PARQUET'
+AVRO = 'AVRO'
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+_NO_ITEM = object()
+
+
+def iter_records(records: typing.Union[typing.Iterable[dict], Path]) -> typing.Iterator[dict]:
+    """
+    Iterates over records. A file is read line by line as newline-delimited JSON,
+    a file with a JSON array (the format accepted by `insert`) has to be loaded to memory at once.
+    """
+    if not isinstance(records, Path):
+        yield from records
+        return
+    with open(records, 'r') as f:
+        first_char = f.read(1)
+        while first_char.isspace():
+            first_char = f.read(1)
+        if first_char == '[':
+            f.seek(0)
+            yield from json.load(f)
+            return
+        f.seek(0)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def chunked(records: typing.Iterable[dict], chunk_size: int) -> typing.Iterator[typing.List[dict]]:
+    if chunk_size < 1:
+        raise ValueError("chunk_size should be a positive number")
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_ndjson(records: typing.List[dict], schema=None) -> bytes:
+    return b''.join(json.dumps(r, default=str).encode('utf-8') + b'\n' for r in records)
+
+
+_AVRO_TYPES = {
+    'STRING': 'string',
+    'GEOGRAPHY': 'string',
+    'BYTES': 'bytes',
+    'INTEGER': 'long',
+    'INT64': 'long',
+    'FLOAT': 'double',
+    'FLOAT64': 'double',
+    'BOOLEAN': 'boolean',
+    'BOOL': 'boolean',
+    'DATE': {'type': 'int', 'logicalType': 'date'},
+    'TIME': {'type': 'long', 'logicalType': 'time-micros'},
+    'TIMESTAMP': {'type': 'long', 'logicalType': 'timestamp-micros'},
+    'DATETIME': {'type': 'string', 'logicalType': 'datetime'},
+    'NUMERIC': {'type': 'bytes', 'logicalType': 'decimal', 'precision': 38, 'scale': 9},
+}
+
+
+def avro_schema(schema, name='record') -> dict:
+    """
+    Avro schema of records matching the BigQuery table schema (list of `bigquery.SchemaField`).
+
+    >>> from google.cloud.bigquery import SchemaField
+    >>> avro_schema([SchemaField('id', 'INTEGER', 'REQUIRED'), SchemaField('tags', 'STRING', 'REPEATED')])
+    {'type': 'record', 'name': 'record', 'fields': [{'name': 'id', 'type': 'long'}, {'name': 'tags', 'type': {'type': 'array', 'items': 'string'}}]}
+    """
+    fields = []
+    for field in schema:
+        if field.field_type in ('RECORD', 'STRUCT'):
+            field_type = avro_schema(field.fields, name=f"{name}_{field.name}")
+        elif field.field_type in _AVRO_TYPES:
+            field_type = _AVRO_TYPES[field.field_type]
+        else:
+            raise ValueError(f"Column {field.name} of type {field.field_type} can't be loaded from Avro")
+
+        if field.mode == 'REPEATED':
+            fields.append({'name': field.name, 'type': {'type': 'array', 'items': field_type}})
+        elif field.mode == 'REQUIRED':
+            fields.append({'name': field.name, 'type': field_type})
+        else:
+            fields.append({'name': field.name, 'type': ['null', field_type], 'default': None})
+    return {'type': 'record', 'name': name, 'fields': fields}
+
+
+def encode_avro(records: typing.List[dict], schema) -> bytes:
+    import fastavro
+    buffer = io.BytesIO()
+    fastavro.writer(buffer, fastavro.parse_schema(avro_schema(schema)), records)
+    return buffer.getvalue()
+
+
+def arrow_schema(schema):
+    """Arrow schema of records matching the BigQuery table schema (list of `bigquery.SchemaField`)."""
+    import pyarrow
+    types = {
+        'STRING': pyarrow.string(),
+        'GEOGRAPHY': pyarrow.string(),
+        'BYTES': pyarrow.binary(),
+        'INTEGER': pyarrow.int64(),
+        'INT64': pyarrow.int64(),
+        'FLOAT': pyarrow.float64(),
+        'FLOAT64': pyarrow.float64(),
+        'BOOLEAN': pyarrow.bool_(),
+        'BOOL': pyarrow.bool_(),
+        'DATE': pyarrow.date32(),
+        'TIME': pyarrow.time64('us'),
+        'TIMESTAMP': pyarrow.timestamp('us', tz='UTC'),
+        'DATETIME': pyarrow.timestamp('us'),
+        'NUMERIC': pyarrow.decimal128(38, 9),
+    }
+
+    def arrow_field(field):
+        if field.field_type in ('RECORD', 'STRUCT'):
+            field_type = pyarrow.struct([arrow_field(f) for f in field.fields])
+        elif field.field_type in types:
+            field_type = types[field.field_type]
+        else:
+            raise ValueError(f"Column {field.name} of type {field.field_type} can't be loaded from Parquet")
+        if field.mode == 'REPEATED':
+            field_type = pyarrow.list_(field_type)
+        return pyarrow.field(field.name, field_type, nullable=field.mode != 'REQUIRED')
+
+    return pyarrow.schema([arrow_field(f) for f in schema])
+
+
+def encode_parquet(records: typing.List[dict], schema) -> bytes:
+    import pyarrow
+    import pyarrow.parquet
+    columns = {field.name: [r.get(field.name) for r in records] for field in schema}
+    table = pyarrow.Table.from_pydict(columns, schema=arrow_schema(schema))
+    buffer = pyarrow.BufferOutputStream()
+    pyarrow.parquet.write_table(table, buffer)
+    return buffer.getvalue().to_pybytes()
+
+
+_ENCODERS = {
+    NEWLINE_DELIMITED_JSON: encode_ndjson,
+    PARQUET: encode_parquet,
+    AVRO: encode_avro,
+}
+
+
+def run_bounded(fn: typing.Callable, items: typing.Iterable, max_concurrency: int = 1) -> list:
+    """
+    Calls `fn` for each item using up to `max_concurrency` threads and returns results in the order of items.
+    Items are taken from the iterable only when a thread is free, so at most `max_concurrency` items are in memory.
+    After the first failure no new calls are started and the error is reraised.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency should be a positive number")
+    if max_concurrency == 1:
+        return [fn(item) for item in items]
+
+    slots = threading.Semaphore(max_concurrency)
+    failed = threading.Event()
+    futures = []
+
+    def on_done(future):
+        if future.exception() is not None:
+            failed.set()
+        slots.release()
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while True:
+            slots.acquire()
+            item = next(items, _NO_ITEM)
+            if item is _NO_ITEM or failed.is_set():
+                break
+            future = executor.submit(fn, item)
+            future.add_done_callback(on_done)
+            futures.append(future)
+    return [f.result() for f in futures]
+
+
+def load_records(
+        bigquery_client,
+        table_id: str,
+        records: typing.Union[typing.Iterable[dict], Path],
+        source_format: str = NEWLINE_DELIMITED_JSON,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_concurrency: int = 1,
+        on_job: typing.Optional[typing.Callable[[typing.Any], None]] = None) -> int:
+    """
+    Appends records to the table with load jobs, one job per chunk of `chunk_size` records.
+    Up to `max_concurrency` chunks are loaded at the same time. Returns the number of loaded rows.
+    `on_job` is called with every finished load job.
+    """
+    from google.cloud import bigquery
+
+    if source_format not in _ENCODERS:
+        raise ValueError(f"Unsupported source format {source_format}, use one of {', '.join(_ENCODERS)}")
+    encode = _ENCODERS[source_format]
+    schema = None if source_format == NEWLINE_DELIMITED_JSON else bigquery_client.get_table(table_id.split('$')[0]).schema
+
+    job_config = bigquery.LoadJobConfig()
+    job_config.source_format = source_format
+    job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
+    if source_format == AVRO:
+        job_config.use_avro_logical_types = True
+
+    def load_chunk(chunk):
+        job = bigquery_client.load_table_from_file(io.BytesIO(encode(chunk, schema)), table_id, job_config=job_config)
+        job.result()
+        logger.info("Loaded %d rows to %s (job %s)", len(chunk), table_id, job.job_id)
+        if on_job is not None:
+            on_job(job)
+        return len(chunk)
+
+    return sum(run_bounded(load_chunk, chunked(iter_records(records), chunk_size), max_concurrency))
@@ -12,12 +12,21 @@ class DatasetConfig:
                  external_tables: dict = None,
                  properties: dict = None,
                  is_master: bool = True,
-                 is_default: bool = True):
+                 is_default: bool = True,
+                 backend: str = None,
+                 use_query_parameters: bool = False,
+                 cache_tmp_tables: bool = False):
        all_properties = (properties or {}).copy()
        all_properties['project_id'] = project_id
        all_properties['dataset_name'] = dataset_name
        all_properties['internal_tables'] = internal_tables or []
        all_properties['external_tables'] = external_tables or {}
+       if backend:
+           all_properties['backend'] = backend
+       if use_query_parameters:
+           all_properties['use_query_parameters'] = use_query_parameters
+       if cache_tmp_tables:
+           all_properties['cache_tmp_tables'] = cache_tmp_tables
 
        self.delegate = Config(name=env, properties=all_properties, is_master=is_master, is_default=is_default)
 
@@ -28,7 +37,10 @@ class DatasetConfig:
                           internal_tables: list = None,
                           external_tables: dict = None,
                           properties: dict = None,
-                          is_default: bool = False):
+                          is_default: bool = False,
+                          backend: str = None,
+                          use_query_parameters: bool = None,
+                          cache_tmp_tables: bool = None):
 
         all_properties = (properties or {}).copy()
 
@@ -43,6 +55,15 @@ class DatasetConfig:
         if external_tables:
             all_properties['external_tables'] = external_tables
 
+        if backend:
+            all_properties['backend'] = backend
+
+        if use_query_parameters is not None:
+            all_properties['use_query_parameters'] = use_query_parameters
+
+        if cache_tmp_tables is not None:
+            all_properties['cache_tmp_tables'] = cache_tmp_tables
+
         self.delegate.add_configuration(env, all_properties, is_default=is_default)
         return self
 
@@ -52,7 +73,10 @@ class DatasetConfig:
             dataset_name=self.resolve_dataset_name(env),
             internal_tables=self.resolve_internal_tables(env),
             external_tables=self.resolve_external_tables(env),
-            extras=self.resolve_extra_properties(env))
+            extras=self.resolve_extra_properties(env),
+            backend=self.resolve_backend(env),
+            use_query_parameters=self.resolve_use_query_parameters(env),
+            cache_tmp_tables=self.resolve_cache_tmp_tables(env))
 
     def resolve_extra_properties(self, env: str = None):
         return {k: v for (k, v) in self.resolve(env).items() if self._is_extra_property(k)}
@@ -81,5 +105,16 @@ class DatasetConfig:
     def resolve_external_tables(self, env: str = None) -> str:
         return self.resolve_property('external_tables', env)
 
+    def resolve_backend(self, env: str = None) -> str:
+        return self.resolve(env).get('backend')
+
+    def resolve_use_query_parameters(self, env: str = None) -> bool:
+        return bool(self.resolve(env).get('use_query_parameters'))
+
+    def resolve_cache_tmp_tables(self, env: str = None) -> bool:
+        return bool(self.resolve(env).get('cache_tmp_tables'))
+
     def _is_extra_property(self, property_name) -> bool:
-        return property_name not in ['project_id','dataset_name','internal_tables','external_tables', 'env']
\ No newline at end of file
+        return property_name not in [
+            'project_id', 'dataset_name', 'internal_tables', 'external_tables', 'env', 'backend', 'use_query_parameters',
+            'cache_tmp_tables']
\ No newline at end of file
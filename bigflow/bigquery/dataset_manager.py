@@ -1,7 +1,12 @@
 import json
+import os
 import uuid
 import logging
 import functools
+import atexit
+import contextlib
+import threading
+import time
 import typing
 import logging
 from pathlib import Path
@@ -9,6 +14,27 @@ from pathlib import Path
 from google.cloud.bigquery import dataset
 # hidden BQ and pandas imports due to https://github.com/allegro/bigflow/issues/149
 
+from bigflow.workflow import ResourceRegistry
+from .parallel import QueryFuture, CompletedFuture, OperationGroup, gather, current_concurrency, DEFAULT_MAX_CONCURRENCY
+from .templates import AliasNotFoundError, render, render_with_parameters, query_parameter_type
+from .storage_read import ArrowTableReader, create_bqstorage_client, iter_rows, DEFAULT_MAX_STREAMS, \
+    DEFAULT_MAX_QUEUE_SIZE
+from .bulk_load import load_records, chunked, NEWLINE_DELIMITED_JSON, DEFAULT_CHUNK_SIZE
+from .backfill import RangeNotSupportedError, partition_dates, is_single_query, range_script, DEFAULT_DAYS_PER_JOB
+from .storage_write import StorageWriter, PENDING, DEFAULT_BATCH_SIZE, DEFAULT_MAX_IN_FLIGHT
+from .stats import StatsCollector
+from .budget import BytesBudget
+from .materialization import query_fingerprint, is_materialized, save_fingerprint, clear_fingerprint
+from .script import ScriptStatement, ScriptError, WRITE_TMP, WRITE_TRUNCATE, WRITE_APPEND, build_script, \
+    statement_at, child_job_line, failed_statement
+from .query_plan import analyze_job
+from .table_options import TableOptions, build_table, partition_type, HOUR, DAY, MONTH, YEAR, RANGE
+from .table_copy import snapshot_ddl, clone_ddl
+from .extract import ExtractedTable, ShardReader, extract_job_config, destination_uri, check_unique_uris, \
+    create_storage_client, PARQUET, DEFAULT_MAX_WORKERS
+from .merge import MergeResult, merge_statement, merge_result, partition_column, bounds_query, bounds_condition, \
+    STAGING_TABLE_SUFFIX
+
 
 logger = logging.getLogger(__name__)
 
@@ -16,10 +42,11 @@ logger = logging.getLogger(__name__)
 DEFAULT_REGION = 'europe-west1'
 DEFAULT_MACHINE_TYPE = 'n1-standard-1'
 DEFAULT_LOCATION = 'EU'
+DEFAULT_TABLES_CACHE_TTL_SEC = 300
 
-
-class AliasNotFoundError(ValueError):
-    pass
+BIGQUERY_BACKEND = 'bigquery'
+LOCAL_BACKEND = 'local'
+BACKEND_ENV_VARIABLE = 'bf_bigquery_backend'
 
 
 def handle_key_error(method):
@@ -33,18 +60,30 @@ def handle_key_error(method):
             missing_variable = e.args[0]
             raise AliasNotFoundError(
                 "'{missing_variable}' is missing in internal_tables or external_tables or extras.".format(
-                    missing_variable=missing_variable))
+                    missing_variable=missing_variable), missing_variable)
+        except AliasNotFoundError as e:
+            if e.alias in getattr(args[0], '_ended_temp_tables', ()):
+                raise AliasNotFoundError(
+                    f"'{e.alias}' was a TEMP table of a script, it was dropped when the script ended. "
+                    "Use it within the script, or pass temp_tables=False to script() to keep it in the dataset.",
+                    e.alias) from e
+            raise
 
     return decorated
 
 
-def get_partition_from_run_datetime_or_none(run_datetime):
+PARTITION_LENGTHS = {HOUR: 10, DAY: 8, MONTH: 6, YEAR: 4}
+
+
+def get_partition_from_run_datetime_or_none(run_datetime, partition_type=DAY):
     """
     :param run_datetime: string run datetime in format YYYY-MM-DD HH:mm:ss or YYY-MM-DD
-    :return: string partition in format YYYYMMDD
+    :param partition_type: HOUR, DAY, MONTH or YEAR
+    :return: string partition in format YYYYMMDDHH, YYYYMMDD, YYYYMM or YYYY
     """
     if run_datetime is not None:
-        return run_datetime[:10].replace('-', '')
+        partition = (run_datetime[:10].replace('-', '') + run_datetime[11:13]).ljust(PARTITION_LENGTHS[HOUR], '0')
+        return partition[:PARTITION_LENGTHS[partition_type]]
 
 
 class TemplatedDatasetManager(object):
@@ -56,12 +95,21 @@ class TemplatedDatasetManager(object):
                  internal_tables,
                  external_tables,
                  extras,
-                 run_datetime):
+                 run_datetime,
+                 use_query_parameters=False):
         self.dataset_manager = dataset_manager
         self.internal_tables = {t: self.create_full_table_id(t) for t in internal_tables}
         self.external_tables = external_tables
         self.extras = extras
         self.run_datetime = run_datetime
+        self.use_query_parameters = use_query_parameters
+        # merged variables per run datetime, reset when a table is added by `write_tmp`
+        self._template_variables = {}
+        # statements collected within the `script` block
+        self._script: typing.Optional[typing.List[ScriptStatement]] = None
+        self._script_temp_tables = True
+        # TEMP tables of finished scripts, they can't be referenced anymore
+        self._ended_temp_tables: typing.Set[str] = set()
 
         logger.debug(
             "Wrap %s with TemplatedDatasetManager, internal_tables %s,"
@@ -74,19 +122,94 @@ class TemplatedDatasetManager(object):
         )
 
     def write_truncate(self, table_name, sql, custom_run_datetime=None):
+        if self._script is not None:
+            return self._add_statement(WRITE_TRUNCATE, table_name, sql, custom_run_datetime)
         return self.write(self.dataset_manager.write_truncate, table_name, sql, custom_run_datetime)
 
     def write_append(self, table_name, sql, custom_run_datetime=None):
+        if self._script is not None:
+            return self._add_statement(WRITE_APPEND, table_name, sql, custom_run_datetime)
         return self.write(self.dataset_manager.write_append, table_name, sql, custom_run_datetime)
 
     def write_tmp(self, table_name, sql, custom_run_datetime=None):
-        self.internal_tables[table_name] = self.create_table_id(table_name)
+        if self._script is not None:
+            self._add_internal_table(table_name, temp=self._script_temp_tables)
+            return self._add_statement(WRITE_TMP, table_name, sql, custom_run_datetime)
+        self._add_internal_table(table_name)
         return self.write(self.dataset_manager.write_tmp, table_name, sql, custom_run_datetime)
 
+    def write_truncate_async(self, table_name, sql, custom_run_datetime=None):
+        return self.write(self.dataset_manager.write_truncate_async, table_name, sql, custom_run_datetime)
+
+    def write_append_async(self, table_name, sql, custom_run_datetime=None):
+        return self.write(self.dataset_manager.write_append_async, table_name, sql, custom_run_datetime)
+
+    def write_tmp_async(self, table_name, sql, custom_run_datetime=None):
+        self._add_internal_table(table_name)
+        return self.write(self.dataset_manager.write_tmp_async, table_name, sql, custom_run_datetime)
+
+    def copy_table(self, source_table, destination_table, write_disposition='WRITE_TRUNCATE'):
+        self._check_not_in_script()
+        return self.dataset_manager.copy_table(
+            self.resolve_table_id(source_table), self.create_table_id(destination_table), write_disposition)
+
+    def copy_table_async(self, source_table, destination_table, write_disposition='WRITE_TRUNCATE') -> QueryFuture:
+        self._check_not_in_script()
+        return self.dataset_manager.copy_table_async(
+            self.resolve_table_id(source_table), self.create_table_id(destination_table), write_disposition)
+
+    def snapshot_table(self, source_table, snapshot_table, expiration_days=None, snapshot_time=None):
+        self._check_not_in_script()
+        return self.dataset_manager.snapshot_table(
+            self.resolve_table_id(source_table), self.create_table_id(snapshot_table), expiration_days, snapshot_time)
+
+    def clone_table(self, source_table, clone_table, snapshot_time=None):
+        self._check_not_in_script()
+        return self.dataset_manager.clone_table(
+            self.resolve_table_id(source_table), self.create_table_id(clone_table), snapshot_time)
+
+    def extract_async(
+            self,
+            table_name,
+            uri_pattern,
+            destination_format=PARQUET,
+            compression=None,
+            custom_run_datetime=None) -> QueryFuture:
+        self._check_not_in_script()
+        table_id = self.resolve_table_id(table_name)
+        uri = destination_uri(uri_pattern, table_id, self.template_variables(custom_run_datetime))
+        return self.dataset_manager.extract_async(table_id, uri, destination_format, compression)
+
+    def resolve_table_id(self, table_name):
+        """Full id of a table of the dataset, of an external table alias, or a full table id as it is."""
+        name, _, partition = table_name.partition('$')
+        if '.' in name:
+            return table_name
+        if name in self.external_tables:
+            return self.external_tables[name] + ('$' + partition if partition else '')
+        return self.create_table_id(table_name)
+
+    @handle_key_error
+    def write_merge(self, table_name, sql, keys, custom_run_datetime=None):
+        table_id = self.create_table_id(table_name)
+        return self._run(functools.partial(self.dataset_manager.write_merge, table_id), sql, custom_run_datetime, keys)
+
     @handle_key_error
     def write(self, write_callable, table_name, sql, custom_run_datetime=None):
         table_id = self.create_table_id(table_name)
-        return write_callable(table_id, sql.format(**self.template_variables(custom_run_datetime)))
+        return self._run(functools.partial(write_callable, table_id), sql, custom_run_datetime)
+
+    @handle_key_error
+    def write_truncate_range(self, table_name, sql, run_datetimes, days_per_job=DEFAULT_DAYS_PER_JOB):
+        self._check_not_in_script()
+        table_id = self.create_table_id(table_name)
+        queries = {run_datetime: render(sql, self.template_variables(run_datetime)) for run_datetime in run_datetimes}
+        if not all(is_single_query(q) for q in queries.values()):
+            raise RangeNotSupportedError("SQL is not a single query")
+        return [
+            self.dataset_manager.write_truncate_range(table_id, {dt: queries[dt] for dt in chunk})
+            for chunk in chunked(run_datetimes, days_per_job)
+        ]
 
     def create_table_id(self, table_name):
         table_name_without_partition = table_name.split('$')[0]
@@ -96,15 +219,48 @@ class TemplatedDatasetManager(object):
 
     @handle_key_error
     def collect(self, sql, custom_run_datetime=None):
-        return self.dataset_manager.collect(sql.format(**self.template_variables(custom_run_datetime)))
+        return self._run(self.dataset_manager.collect, sql, custom_run_datetime)
 
     @handle_key_error
     def collect_list(self, sql: str, custom_run_datetime: typing.Optional[str] = None, record_as_dict: bool = False):
-        return self.dataset_manager.collect_list(
-            sql.format(**self.template_variables(custom_run_datetime)), record_as_dict)
+        return self._run(self.dataset_manager.collect_list, sql, custom_run_datetime, record_as_dict)
+
+    @handle_key_error
+    def collect_arrow(self, sql, custom_run_datetime=None, max_streams=DEFAULT_MAX_STREAMS):
+        return self._run(self.dataset_manager.collect_arrow, sql, custom_run_datetime, max_streams)
+
+    @handle_key_error
+    def collect_batches(
+            self,
+            sql,
+            custom_run_datetime=None,
+            as_dataframe=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        return self._run(
+            self.dataset_manager.collect_batches, sql, custom_run_datetime, as_dataframe, max_streams, max_queue_size)
+
+    @handle_key_error
+    def collect_iter(
+            self,
+            sql,
+            custom_run_datetime=None,
+            record_as_dict=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        return self._run(
+            self.dataset_manager.collect_iter, sql, custom_run_datetime, record_as_dict, max_streams, max_queue_size)
+
+    @handle_key_error
+    def collect_async(self, sql, custom_run_datetime=None):
+        return self._run(self.dataset_manager.collect_async, sql, custom_run_datetime)
+
+    @handle_key_error
+    def collect_list_async(self, sql: str, custom_run_datetime: typing.Optional[str] = None, record_as_dict: bool = False):
+        return self._run(self.dataset_manager.collect_list_async, sql, custom_run_datetime, record_as_dict)
 
     def dry_run(self, sql, custom_run_datetime=None):
-        return self.dataset_manager.dry_run(sql.format(**self.template_variables(custom_run_datetime)))
+        return self._run(self.dataset_manager.dry_run, sql, custom_run_datetime)
 
     def remove_dataset(self):
         return self.dataset_manager.remove_dataset()
@@ -122,28 +278,104 @@ class TemplatedDatasetManager(object):
     def table_exists(self, table_name):
         return self.dataset_manager.table_exists(table_name)
 
+    def _add_internal_table(self, table_name, temp=False):
+        # TEMP tables of a script are referenced by their bare names
+        self.internal_tables[table_name] = table_name if temp else self.create_table_id(table_name)
+        self._ended_temp_tables.discard(table_name)
+        self._template_variables.clear()
+
+    @contextlib.contextmanager
+    def script(self, temp_tables=True):
+        """
+        Write operations issued within the block are run as a single multi-statement script when the block exits.
+        With `temp_tables`, tables written by `write_tmp` are TEMP tables of the script.
+        """
+        if self._script is not None:
+            raise ValueError("Nested scripts are not supported")
+        self._script, self._script_temp_tables = [], temp_tables
+        internal_tables = dict(self.internal_tables)
+        try:
+            yield
+            if self._script:
+                self.dataset_manager.run_script(self._script)
+        finally:
+            temp_tables = {s.table_id.split('.')[-1] for s in self._script if s.temp}
+            self._script = None
+            for table_name in temp_tables:
+                # a table declared before the script refers to the dataset table again
+                if table_name in internal_tables:
+                    self.internal_tables[table_name] = internal_tables[table_name]
+                else:
+                    del self.internal_tables[table_name]
+                    self._ended_temp_tables.add(table_name)
+            self._template_variables.clear()
+
+    @handle_key_error
+    def _add_statement(self, operation, table_name, sql, custom_run_datetime):
+        # values are inlined, a script shares query parameters between all of its statements
+        self._script.append(ScriptStatement(
+            operation,
+            self.create_table_id(table_name),
+            render(sql, self.template_variables(custom_run_datetime)),
+            operation == WRITE_TMP and self._script_temp_tables))
+
+    def _check_not_in_script(self):
+        if self._script is not None:
+            raise ValueError("Only write_tmp, write_truncate and write_append can be used in a script")
+
+    def _run(self, operation, sql, custom_run_datetime, *args):
+        self._check_not_in_script()
+        variables = self.template_variables(custom_run_datetime)
+        if not self.use_query_parameters:
+            return operation(render(sql, variables), *args)
+        sql, query_parameters = render_with_parameters(sql, variables, self._parameter_names)
+        return operation(sql, *args, query_parameters=query_parameters)
+
+    @property
+    def _parameter_names(self):
+        return {'dt', *self.extras}
+
     def template_variables(self, custom_run_datetime=None):
-        result = {}
-        result.update(self.internal_tables)
-        result.update(self.external_tables)
-        result.update(self.extras)
-        result['dt'] = custom_run_datetime or self.run_datetime
-        return result
+        run_datetime = custom_run_datetime or self.run_datetime
+        if run_datetime not in self._template_variables:
+            result = {}
+            result.update(self.internal_tables)
+            result.update(self.external_tables)
+            result.update(self.extras)
+            result['dt'] = run_datetime
+            self._template_variables[run_datetime] = result
+        return self._template_variables[run_datetime]
 
     def create_table_from_schema(
             self,
             table_name: str,
-            schema: typing.Union[None, typing.List[dict], Path] = None,
-            table=None):
+            schema: typing.Union[None, typing.List[dict], dict, Path] = None,
+            table=None,
+            table_options: typing.Optional[TableOptions] = None):
         table_id = self.create_table_id(table_name)
-        return self.dataset_manager.create_table_from_schema(table_id, schema, table)
+        return self.dataset_manager.create_table_from_schema(table_id, schema, table, table_options)
+
+    def partition_type(self, table_name: str) -> typing.Optional[str]:
+        return self.dataset_manager.partition_type(self.create_table_id(table_name))
 
     def insert(
             self,
             table_name: str,
-            records: typing.Union[typing.List[dict], Path]):
+            records: typing.Union[typing.Iterable[dict], Path],
+            bulk: bool = False,
+            source_format: str = NEWLINE_DELIMITED_JSON,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_concurrency: int = 1):
         table_id = self.create_table_id(table_name)
-        return self.dataset_manager.insert(table_id, records)
+        return self.dataset_manager.insert(table_id, records, bulk, source_format, chunk_size, max_concurrency)
+
+    def open_writer(
+            self,
+            table_name: str,
+            stream_type: str = PENDING,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> StorageWriter:
+        return self.dataset_manager.open_writer(self.create_table_id(table_name), stream_type, batch_size, max_in_flight)
 
 
 class PartitionedDatasetManager(object):
@@ -154,6 +386,7 @@ class PartitionedDatasetManager(object):
     def __init__(self, templated_dataset_manager: TemplatedDatasetManager, partition):
         self._dataset_manager = templated_dataset_manager
         self.partition = partition
+        self._operation_group: typing.Optional[OperationGroup] = None
 
     def write_truncate(self, table_name, sql, partitioned=True, custom_run_datetime=None):
         return self._write(
@@ -171,6 +404,98 @@ class PartitionedDatasetManager(object):
             partitioned,
             custom_run_datetime)
 
+    def copy_table(
+            self,
+            source_table,
+            destination_table,
+            partitioned=True,
+            custom_run_datetime=None,
+            write_disposition='WRITE_TRUNCATE'):
+        """
+        Copies the source table (a table of the dataset, an external table alias or a full table id) to the table
+        or its runtime partition, with a copy job which is not billed.
+        """
+        destination_table = self._create_table_id(custom_run_datetime, destination_table, partitioned)
+        return self._dataset_manager.copy_table(source_table, destination_table, write_disposition)
+
+    def copy_table_async(
+            self,
+            source_table,
+            destination_table,
+            partitioned=True,
+            custom_run_datetime=None,
+            write_disposition='WRITE_TRUNCATE') -> QueryFuture:
+        destination_table = self._create_table_id(custom_run_datetime, destination_table, partitioned)
+        return self._submit(self._dataset_manager.copy_table_async(source_table, destination_table, write_disposition))
+
+    def extract(
+            self,
+            tables: typing.Union[str, typing.List[str]],
+            uri_pattern: str,
+            destination_format: str = PARQUET,
+            compression: typing.Optional[str] = None,
+            partitioned: bool = False,
+            custom_run_datetime: typing.Optional[str] = None,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> typing.List[ExtractedTable]:
+        """
+        Exports the tables (or their runtime partitions) to Cloud Storage, up to `max_concurrency` at the same time.
+        `{table}` and `{partition}` placeholders of the URI pattern are filled for each table,
+        e.g. `gs://bucket/{table}/{dt}/*.parquet`.
+        """
+        table_names = [tables] if isinstance(tables, str) else list(tables)
+        if partitioned:
+            table_names = [
+                name if '$' in name else self._create_table_id(custom_run_datetime, name, True)
+                for name in table_names]
+        variables = self._dataset_manager.template_variables(custom_run_datetime)
+        # URIs are built from resolved ids, different aliases may point to tables with the same name
+        check_unique_uris(
+            destination_uri(uri_pattern, self._dataset_manager.resolve_table_id(name), variables)
+            for name in table_names)
+        futures = [
+            self._dataset_manager.extract_async(
+                name, uri_pattern, destination_format, compression, custom_run_datetime)
+            for name in table_names]
+        return gather(*futures, max_concurrency=max_concurrency)
+
+    def extract_async(
+            self,
+            table_name: str,
+            uri_pattern: str,
+            destination_format: str = PARQUET,
+            compression: typing.Optional[str] = None,
+            partitioned: bool = False,
+            custom_run_datetime: typing.Optional[str] = None) -> QueryFuture:
+        table_name = self._create_table_id(custom_run_datetime, table_name, partitioned)
+        return self._submit(self._dataset_manager.extract_async(
+            table_name, uri_pattern, destination_format, compression, custom_run_datetime))
+
+    def read_extracted(
+            self,
+            uri_pattern: str,
+            destination_format: str = PARQUET,
+            max_workers: int = DEFAULT_MAX_WORKERS,
+            max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE) -> ShardReader:
+        """Opens a reader of Parquet or Avro files exported by `extract`, the URI pattern can have `*` wildcards."""
+        storage_client = create_storage_client(self.client) if uri_pattern.startswith('gs://') else None
+        return ShardReader(storage_client, uri_pattern, destination_format, max_workers, max_queue_size)
+
+    def snapshot_table(self, source_table, snapshot_table, expiration_days=None, snapshot_time=None):
+        """Creates a read-only snapshot of the table, as of `snapshot_time` (now by default)."""
+        return self._dataset_manager.snapshot_table(source_table, snapshot_table, expiration_days, snapshot_time)
+
+    def clone_table(self, source_table, clone_table, snapshot_time=None):
+        """Creates a writable clone of the table, as of `snapshot_time` (now by default)."""
+        return self._dataset_manager.clone_table(source_table, clone_table, snapshot_time)
+
+    def write_merge(self, table_name, sql, keys, partitioned=True, custom_run_datetime=None) -> MergeResult:
+        """
+        Upserts the query results: rows matching the table (or its partition) on the `keys` columns are updated,
+        the others are inserted. Returns numbers of inserted and updated rows.
+        """
+        table_id = self._create_table_id(custom_run_datetime, table_name, partitioned)
+        return self._dataset_manager.write_merge(table_id, sql, keys, custom_run_datetime)
+
     def write_tmp(self, table_name, sql, custom_run_datetime=None):
         return self._write(
             self._dataset_manager.write_tmp,
@@ -179,18 +504,126 @@ class PartitionedDatasetManager(object):
             False,
             custom_run_datetime)
 
+    def script(self, temp_tables: bool = True):
+        """
+        Collects `write_tmp`, `write_truncate` and `write_append` issued within the block and runs them as
+        a single BigQuery multi-statement script when the block exits. With `temp_tables`, tables written
+        by `write_tmp` are TEMP tables which exist only while the script runs.
+        """
+        return self._dataset_manager.script(temp_tables)
+
+    def write_truncate_range(
+            self,
+            table_name,
+            sql,
+            start,
+            end,
+            days_per_job=DEFAULT_DAYS_PER_JOB,
+            max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        Rewrites daily partitions from `start` to `end` (inclusive), `{dt}` is the date of each partition.
+        Partitions of up to `days_per_job` days are rewritten by a single scripted job. When the SQL or the table
+        doesn't allow it, partitions are written by separate jobs, up to `max_concurrency` at the same time.
+        """
+        run_datetimes = partition_dates(start, end)
+        try:
+            return self._dataset_manager.write_truncate_range(table_name, sql, run_datetimes, days_per_job)
+        except RangeNotSupportedError as e:
+            logger.info("Rewriting partitions of %s one by one: %s", table_name, e)
+        return gather(
+            *(self._write(self._dataset_manager.write_truncate_async, table_name, sql, True, run_datetime)
+              for run_datetime in run_datetimes),
+            max_concurrency=max_concurrency)
+
     def collect(self, sql, custom_run_datetime=None):
         return self._dataset_manager.collect(sql, custom_run_datetime)
 
     def collect_list(self, sql: str, custom_run_datetime: typing.Optional[str] = None, record_as_dict: bool = False):
         return self._dataset_manager.collect_list(sql, custom_run_datetime, record_as_dict)
 
+    def collect_arrow(self, sql, custom_run_datetime=None, max_streams=DEFAULT_MAX_STREAMS):
+        return self._dataset_manager.collect_arrow(sql, custom_run_datetime, max_streams)
+
+    def collect_batches(
+            self,
+            sql,
+            custom_run_datetime=None,
+            as_dataframe=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        return self._dataset_manager.collect_batches(
+            sql, custom_run_datetime, as_dataframe, max_streams, max_queue_size)
+
+    def collect_iter(
+            self,
+            sql,
+            custom_run_datetime=None,
+            record_as_dict=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        return self._dataset_manager.collect_iter(
+            sql, custom_run_datetime, record_as_dict, max_streams, max_queue_size)
+
     def dry_run(self, sql, custom_run_datetime=None):
         return self._dataset_manager.dry_run(sql, custom_run_datetime)
 
     def create_table(self, create_query):
         return self._dataset_manager.create_table(create_query)
 
+    def write_truncate_async(self, table_name, sql, partitioned=True, custom_run_datetime=None) -> QueryFuture:
+        return self._submit(self._write(
+            self._dataset_manager.write_truncate_async,
+            table_name,
+            sql,
+            partitioned,
+            custom_run_datetime))
+
+    def write_append_async(self, table_name, sql, partitioned=True, custom_run_datetime=None) -> QueryFuture:
+        return self._submit(self._write(
+            self._dataset_manager.write_append_async,
+            table_name,
+            sql,
+            partitioned,
+            custom_run_datetime))
+
+    def write_tmp_async(self, table_name, sql, custom_run_datetime=None) -> QueryFuture:
+        return self._submit(self._write(
+            self._dataset_manager.write_tmp_async,
+            table_name,
+            sql,
+            False,
+            custom_run_datetime))
+
+    def collect_async(self, sql, custom_run_datetime=None) -> QueryFuture:
+        return self._submit(self._dataset_manager.collect_async(sql, custom_run_datetime))
+
+    def collect_list_async(
+            self,
+            sql: str,
+            custom_run_datetime: typing.Optional[str] = None,
+            record_as_dict: bool = False) -> QueryFuture:
+        return self._submit(self._dataset_manager.collect_list_async(sql, custom_run_datetime, record_as_dict))
+
+    @contextlib.contextmanager
+    def parallel(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> typing.Iterator[OperationGroup]:
+        """
+        Async operations started within the block are run at most `max_concurrency` at the same time,
+        all of them are finished when the block exits. The first failure cancels the remaining operations.
+        """
+        if self._operation_group is not None:
+            raise ValueError("Nested parallel blocks are not supported")
+        self._operation_group = OperationGroup(max_concurrency)
+        try:
+            with self._operation_group as group:
+                yield group
+        finally:
+            self._operation_group = None
+
+    def _submit(self, future: QueryFuture) -> QueryFuture:
+        if self._operation_group is not None:
+            return self._operation_group.add(future)
+        return future.start()
+
     @property
     def runtime_str(self):
         return self._dataset_manager.run_datetime
@@ -229,33 +662,143 @@ class PartitionedDatasetManager(object):
     def create_table_from_schema(
             self,
             table_name: str,
-            schema: typing.Optional[typing.Union[typing.List[dict], Path]] = None,
-            table=None):
-        return self._dataset_manager.create_table_from_schema(table_name, schema, table)
+            schema: typing.Optional[typing.Union[typing.List[dict], dict, Path]] = None,
+            table=None,
+            table_options: typing.Optional[TableOptions] = None):
+        return self._dataset_manager.create_table_from_schema(table_name, schema, table, table_options)
 
     def insert(
             self,
             table_name: str,
-            records: typing.Union[typing.List[dict], Path],
+            records: typing.Union[typing.Iterable[dict], Path],
+            partitioned: bool = True,
+            custom_run_datetime: typing.Optional[str] = None,
+            bulk: bool = False,
+            source_format: str = NEWLINE_DELIMITED_JSON,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_concurrency: int = 1):
+        table_id = self._create_table_id(custom_run_datetime, table_name, partitioned)
+        return self._dataset_manager.insert(table_id, records, bulk, source_format, chunk_size, max_concurrency)
+
+    def open_writer(
+            self,
+            table_name: str,
             partitioned: bool = True,
-            custom_run_datetime: typing.Optional[str] = None):
+            custom_run_datetime: typing.Optional[str] = None,
+            stream_type: str = PENDING,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> StorageWriter:
+        """
+        Opens a writer which appends rows to the table (or its partition) with the Storage Write API.
+        With the default pending stream, rows are committed at once when the writer is closed.
+        """
         table_id = self._create_table_id(custom_run_datetime, table_name, partitioned)
-        return self._dataset_manager.insert(table_id, records)
+        return self._dataset_manager.open_writer(table_id, stream_type, batch_size, max_in_flight)
 
     def _write(self, write_callable, table_name, sql, partitioned, custom_run_datetime=None):
         table_id = self._create_table_id(custom_run_datetime, table_name, partitioned)
         return write_callable(table_id, sql, custom_run_datetime)
 
     def _create_table_id(self, custom_run_datetime, table_name, partitioned):
-        custom_partition = get_partition_from_run_datetime_or_none(custom_run_datetime)
         if partitioned:
-            table_name = table_name + '${partition}'.format(partition=custom_partition or self.partition)
+            table_name = table_name + '${partition}'.format(
+                partition=self._partition(table_name, custom_run_datetime))
         return table_name
 
+    def _partition(self, table_name, custom_run_datetime):
+        partition_type = self._dataset_manager.partition_type(table_name)
+        if partition_type == RANGE:
+            raise ValueError(f"Table {table_name} is partitioned by integer range, "
+                             "write it with partitioned=False")
+        if partition_type in (HOUR, MONTH, YEAR):
+            return get_partition_from_run_datetime_or_none(
+                custom_run_datetime or self._dataset_manager.run_datetime, partition_type)
+        return get_partition_from_run_datetime_or_none(custom_run_datetime) or self.partition
+
     def _table_exists(self, table_name):
         return self._dataset_manager.table_exists(table_name)
 
 
+def split_table_id(table_id: str) -> typing.Tuple[str, str]:
+    """
+    :param table_id: string 'project.dataset.table' with optional partition decorator ('$YYYYMMDD')
+    :return: tuple (dataset ID 'project.dataset', table name)
+    """
+    dataset_id, _, table_name = table_id.split('$')[0].rpartition('.')
+    return dataset_id, table_name
+
+
+class TablesCache(object):
+    """
+    Names of tables in datasets, each dataset is listed with a single metadata API call (no query jobs).
+    A cached listing expires after `ttl_sec`. A table which is missing in the listing triggers a refresh,
+    so tables created outside of bigflow are found too. Tables created or written by dataset managers
+    are added to the cache, removed datasets are evicted. The listing also tells time partitioning of tables.
+    """
+    def __init__(self, ttl_sec=DEFAULT_TABLES_CACHE_TTL_SEC):
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._tables: typing.Dict[str, typing.Tuple[float, typing.Dict[str, typing.Optional[str]]]] = {}
+
+    def table_exists(self, bigquery_client, dataset_id, table_name):
+        return self.partitioning(bigquery_client, dataset_id, table_name)[0]
+
+    def partitioning(self, bigquery_client, dataset_id, table_name) -> typing.Tuple[bool, typing.Optional[str]]:
+        """
+        Whether the table exists and its time partitioning type from the listing, None when the table isn't
+        partitioned by time, or its partitioning isn't known (e.g. the table was created after the listing).
+        """
+        tables = self._cached_tables(dataset_id)
+        if tables is None or table_name not in tables:
+            tables = self.refresh(bigquery_client, dataset_id)
+        return table_name in tables, tables.get(table_name)
+
+    def refresh(self, bigquery_client, dataset_id) -> typing.Dict[str, typing.Optional[str]]:
+        from google.api_core.exceptions import NotFound
+        logger.debug("List tables of dataset %s", dataset_id)
+        try:
+            tables = {t.table_id: t.partitioning_type for t in bigquery_client.list_tables(dataset_id)}
+        except NotFound:
+            tables = {}
+        with self._lock:
+            self._tables[dataset_id] = (time.monotonic(), tables)
+        return tables
+
+    def add(self, table_id, replaced=False):
+        """Adds a created or written table, a `replaced` table (e.g. by a DDL) may be partitioned differently."""
+        dataset_id, table_name = split_table_id(table_id)
+        with self._lock:
+            if dataset_id in self._tables:
+                tables = self._tables[dataset_id][1]
+                if replaced or table_name not in tables:
+                    tables[table_name] = None
+
+    def invalidate(self, dataset_id=None):
+        with self._lock:
+            if dataset_id is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(dataset_id, None)
+
+    def _cached_tables(self, dataset_id):
+        with self._lock:
+            listed_at, tables = self._tables.get(dataset_id, (None, None))
+            if listed_at is None or time.monotonic() - listed_at > self.ttl_sec:
+                return None
+            return tables
+
+
+tables_cache = TablesCache()
+
+# datasets known to exist, `create_dataset` is called once per process for each dataset
+_created_datasets: typing.Dict[str, typing.Any] = {}
+_created_datasets_lock = threading.Lock()
+
+# BigQuery clients shared by all dataset managers in the process, when no run-scoped registry is given
+client_pool = ResourceRegistry()
+atexit.register(client_pool.teardown)
+
+
 class DatasetManager(object):
     """
     Manages BigQuery IO operations.
@@ -263,39 +806,276 @@ class DatasetManager(object):
     def __init__(self,
                  bigquery_client,
                  dataset,
-                 logger):
+                 logger,
+                 stats: typing.Optional[StatsCollector] = None,
+                 budget: typing.Optional[BytesBudget] = None,
+                 cache_tmp_tables: bool = False):
         from google.cloud import bigquery
         self.bigquery_client: bigquery.Client  = bigquery_client
         self.dataset = dataset
         self.dataset_id = dataset.full_dataset_id.replace(':', '.')
         self.logger = logger
+        self.stats = stats
+        self.budget = budget
+        self.cache_tmp_tables = cache_tmp_tables
+        self._bqstorage_client = None
+        self._tables = {}
+
+    def write_tmp(self, table_id, sql, query_parameters=None):
+        fingerprint = self._tmp_table_fingerprint(table_id, sql, query_parameters) if self.cache_tmp_tables else None
+        if is_materialized(self.bigquery_client, table_id, fingerprint):
+            self.logger.info('Reusing %s, its SQL and inputs did not change', table_id)
+            return None
+        # a fingerprint of the previous content would match the table if the write didn't finish
+        clear_fingerprint(self.bigquery_client, table_id)
+        result = self.write(table_id, sql, 'WRITE_TRUNCATE', query_parameters)
+        if fingerprint is not None:
+            save_fingerprint(self.bigquery_client, table_id, fingerprint)
+        return result
 
-    def write_tmp(self, table_id, sql):
-        return self.write(table_id, sql, 'WRITE_TRUNCATE')
+    def write(self, table_id, sql, mode, query_parameters=None):
+        self.logger.info('%s to %s', mode, table_id)
+        job = self.bigquery_client.query(sql, job_config=self._write_job_config(table_id, mode, query_parameters))
+        result = job.result()
+        self._record(mode.lower(), job, table_id)
+        tables_cache.add(table_id)
+        return result
 
-    def write(self, table_id, sql, mode):
+    def write_async(self, table_id, sql, mode, check_table_exists=False, query_parameters=None) -> QueryFuture:
+        def submit():
+            if check_table_exists:
+                self.table_exists_or_error(table_id)
+            self.logger.info('%s to %s (async)', mode, table_id)
+            return self.bigquery_client.query(sql, job_config=self._write_job_config(table_id, mode, query_parameters))
+
+        def fetch_result(job):
+            result = job.result()
+            self._record(mode.lower(), job, table_id)
+            tables_cache.add(table_id)
+            return result
+
+        return QueryFuture(submit, fetch_result)
+
+    def write_truncate_async(self, table_id, sql, query_parameters=None) -> QueryFuture:
+        return self.write_async(table_id, sql, 'WRITE_TRUNCATE', True, query_parameters)
+
+    def write_append_async(self, table_id, sql, query_parameters=None) -> QueryFuture:
+        return self.write_async(table_id, sql, 'WRITE_APPEND', True, query_parameters)
+
+    def write_tmp_async(self, table_id, sql, query_parameters=None) -> QueryFuture:
+        fingerprint = self._tmp_table_fingerprint(table_id, sql, query_parameters) if self.cache_tmp_tables else None
+        if is_materialized(self.bigquery_client, table_id, fingerprint):
+            self.logger.info('Reusing %s, its SQL and inputs did not change', table_id)
+            return CompletedFuture(None)
+        write = self.write_async(table_id, sql, 'WRITE_TRUNCATE', query_parameters=query_parameters)
+
+        def submit():
+            clear_fingerprint(self.bigquery_client, table_id)
+            return write.start().job
+
+        def fetch_result(job):
+            result = write.result()
+            if fingerprint is not None:
+                save_fingerprint(self.bigquery_client, table_id, fingerprint)
+            return result
+
+        return QueryFuture(submit, fetch_result)
+
+    def collect_async(self, sql, query_parameters=None) -> QueryFuture:
+        def fetch_result(job):
+            result = job.to_dataframe()
+            self._record('collect', job)
+            return result
+        return QueryFuture(lambda: self._query(sql, query_parameters=query_parameters), fetch_result)
+
+    def collect_list_async(self, sql: str, record_as_dict: bool = False, query_parameters=None) -> QueryFuture:
+        def fetch_result(job):
+            result = list(job.result())
+            self._record('collect_list', job)
+            return [dict(e) for e in result] if record_as_dict else result
+        return QueryFuture(lambda: self._query(sql, query_parameters=query_parameters), fetch_result)
+
+    def _write_job_config(self, table_id, mode, query_parameters=None):
         from google.cloud import bigquery
-        self.logger.info('%s to %s', mode, table_id)
         job_config = bigquery.QueryJobConfig()
         job_config.use_legacy_sql = False
         job_config.allow_large_results = True
 
         job_config.destination = table_id
         job_config.write_disposition = mode
+        if query_parameters:
+            job_config.query_parameters = create_query_parameters(query_parameters)
+        return self._limit_bytes_billed(job_config)
 
-        job = self.bigquery_client.query(sql, job_config=job_config)
-        return job.result()
+    def _limit_bytes_billed(self, job_config):
+        if self.budget is not None and not job_config.dry_run:
+            job_config.maximum_bytes_billed = self.budget.limit(current_concurrency())
+        return job_config
 
-    def write_truncate(self, table_id, sql):
+    def write_truncate(self, table_id, sql, query_parameters=None):
         self.table_exists_or_error(table_id)
-        return self.write(table_id, sql, 'WRITE_TRUNCATE')
+        return self.write(table_id, sql, 'WRITE_TRUNCATE', query_parameters)
 
-    def write_append(self, table_id, sql):
+    def write_append(self, table_id, sql, query_parameters=None):
         self.table_exists_or_error(table_id)
-        return self.write(table_id, sql, 'WRITE_APPEND')
+        return self.write(table_id, sql, 'WRITE_APPEND', query_parameters)
+
+    def copy_table(self, source_table_id, destination_table_id, write_disposition='WRITE_TRUNCATE'):
+        """Copies the table (or its partition) with a copy job, which is not billed."""
+        return self.copy_table_async(source_table_id, destination_table_id, write_disposition).result()
+
+    def copy_table_async(
+            self,
+            source_table_id,
+            destination_table_id,
+            write_disposition='WRITE_TRUNCATE') -> QueryFuture:
+        def submit():
+            from google.cloud import bigquery
+            self.logger.info('COPY %s to %s (%s)', source_table_id, destination_table_id, write_disposition)
+            job_config = bigquery.CopyJobConfig()
+            job_config.write_disposition = write_disposition
+            return self.bigquery_client.copy_table(source_table_id, destination_table_id, job_config=job_config)
+
+        def fetch_result(job):
+            result = job.result()
+            self._record('copy_table', job, destination_table_id)
+            tables_cache.add(destination_table_id)
+            return result
+
+        return QueryFuture(submit, fetch_result)
+
+    def extract_async(
+            self,
+            table_id,
+            destination_uri,
+            destination_format=PARQUET,
+            compression=None) -> QueryFuture:
+        """Exports the table (or its partition) to Cloud Storage with an extract job, which is not billed."""
+        def submit():
+            self.logger.info('EXTRACT %s to %s', table_id, destination_uri)
+            return self.bigquery_client.extract_table(
+                table_id, destination_uri, job_config=extract_job_config(destination_format, compression))
+
+        def fetch_result(job):
+            job.result()
+            self._record('extract', job, table_id)
+            file_counts = getattr(job, 'destination_uri_file_counts', None)
+            return ExtractedTable(table_id, destination_uri, file_counts[0] if file_counts else None)
+
+        return QueryFuture(submit, fetch_result)
+
+    def snapshot_table(self, source_table_id, snapshot_table_id, expiration_days=None, snapshot_time=None):
+        return self._run_ddl(
+            'snapshot_table', snapshot_ddl(source_table_id, snapshot_table_id, expiration_days, snapshot_time),
+            snapshot_table_id)
+
+    def clone_table(self, source_table_id, clone_table_id, snapshot_time=None):
+        return self._run_ddl('clone_table', clone_ddl(source_table_id, clone_table_id, snapshot_time), clone_table_id)
+
+    def _run_ddl(self, operation, ddl, table_id):
+        from google.cloud import bigquery
+        self.logger.info('%s: %s', operation.upper(), ddl)
+        job_config = bigquery.QueryJobConfig()
+        job_config.use_legacy_sql = False
+        job = self.bigquery_client.query(ddl, job_config=self._limit_bytes_billed(job_config))
+        result = job.result()
+        self._record(operation, job, table_id)
+        tables_cache.add(table_id, replaced=True)
+        self._tables.pop(table_id, None)
+        return result
+
+    def write_merge(self, table_id, sql, keys, query_parameters=None) -> MergeResult:
+        """
+        Updates the rows of the table (or its partition) which match the query results on the keys,
+        inserts the others. A non-partitioned write to a table partitioned by a column stages the query result first,
+        so the MERGE reads only the partitions of the staged rows.
+        """
+        self.table_exists_or_error(table_id)
+        table_name, _, partition = table_id.partition('$')
+        table = self._get_table(table_name)
+        column = partition_column(table)
+        ingestion_time_partitioned = table.time_partitioning is not None and table.time_partitioning.field is None
+        if partition or column is None or ingestion_time_partitioned:
+            return self._merge(table_id, merge_statement(table, sql, keys, partition or None), query_parameters)
+
+        staging_table_id = table_name + STAGING_TABLE_SUFFIX + random_uuid()[:8]
+        self.write(staging_table_id, sql, 'WRITE_TRUNCATE', query_parameters)
+        try:
+            bounds_job = self._query(bounds_query(table, staging_table_id))
+            minimum, maximum, has_nulls = list(bounds_job.result())[0]
+            self._record('write_merge', bounds_job, table_id)
+            target_condition = bounds_condition(table, minimum, maximum, has_nulls, 'T')
+            if target_condition is None:
+                self.logger.info('Nothing to merge into %s', table_id)
+                return MergeResult(0, 0)
+            statement = merge_statement(table, f'SELECT * FROM `{staging_table_id}`', keys,
+                                        target_condition=target_condition)
+            return self._merge(table_id, statement)
+        finally:
+            self.bigquery_client.delete_table(staging_table_id, not_found_ok=True)
+
+    def _merge(self, table_id, statement, query_parameters=None) -> MergeResult:
+        from google.cloud import bigquery
+        self.logger.info('MERGE into %s: %s', table_id, statement)
+        job_config = bigquery.QueryJobConfig()
+        job_config.use_legacy_sql = False
+        if query_parameters:
+            job_config.query_parameters = create_query_parameters(query_parameters)
+        job = self.bigquery_client.query(statement, job_config=self._limit_bytes_billed(job_config))
+        job.result()
+        self._record('write_merge', job, table_id)
+        result = merge_result(job)
+        self.logger.info('MERGE into %s: %s rows inserted, %s rows updated', table_id, result.inserted, result.updated)
+        return result
+
+    def write_truncate_range(self, table_id, queries: typing.Dict[str, str]):
+        """Rewrites daily partitions of the table (partition date -> SQL) in a single scripted job."""
+        from google.cloud import bigquery
+        self.table_exists_or_error(table_id)
+        script = range_script(self.bigquery_client.get_table(table_id), queries)
+        self.logger.info('WRITE_TRUNCATE partitions %s..%s of %s', min(queries), max(queries), table_id)
+        job_config = bigquery.QueryJobConfig()
+        job_config.use_legacy_sql = False
+        job = self.bigquery_client.query(script, job_config=self._limit_bytes_billed(job_config))
+        result = job.result()
+        self._record('write_truncate_range', job, table_id)
+        return result
+
+    def run_script(self, statements: typing.List[ScriptStatement]):
+        """Runs write operations as one multi-statement script, statistics are recorded per statement."""
+        from google.api_core.exceptions import GoogleAPICallError
+        from google.cloud import bigquery
+        script, start_lines = build_script(statements, self.bigquery_client.get_table)
+        self.logger.info('SCRIPT of %s', ', '.join(f'{s.operation} to {s.table_id}' for s in statements))
+        job_config = bigquery.QueryJobConfig()
+        job_config.use_legacy_sql = False
+        job = self.bigquery_client.query(script, job_config=self._limit_bytes_billed(job_config))
+        try:
+            result = job.result()
+        except GoogleAPICallError as e:
+            child_jobs = self._record_script(job, statements, start_lines)
+            statement = failed_statement(statements, start_lines, child_jobs, e.message)
+            if statement is None:
+                raise
+            raise ScriptError(f"{statement.operation} to {statement.table_id} failed: {e.message}", statement) from e
+        self._record_script(job, statements, start_lines)
+        for statement in statements:
+            if not statement.temp:
+                tables_cache.add(statement.table_id)
+        return result
+
+    def _record_script(self, job, statements, start_lines) -> list:
+        child_jobs = list(self.bigquery_client.list_jobs(parent_job=job))
+        for child_job in child_jobs:
+            statement = statement_at(statements, start_lines, child_job_line(child_job))
+            if statement is not None:
+                self._record(statement.operation, child_job, statement.table_id, child_job=True)
+        if self.budget is not None:
+            self.budget.charge(None, _reserved_bytes(job))
+        return child_jobs
 
     def table_exists_or_error(self, table_id):
-        table_name = table_id.split('$')[0].split('.')[2]
+        _, table_name = split_table_id(table_id)
         if not self.table_exists(table_name):
             raise ValueError('Table {id} does not exist'.format(id=table_id))
 
@@ -308,74 +1088,148 @@ class DatasetManager(object):
 
         job = self.bigquery_client.query(
             create_query,
-            job_config=job_config)
-        return job.result()
+            job_config=self._limit_bytes_billed(job_config))
+        result = job.result()
+        self._record('create_table', job)
+        # the table name is known only to the DDL statement
+        tables_cache.invalidate(self.dataset_id)
+        self._tables.clear()
+        return result
 
-    def collect(self, sql):
-        return self._query(sql).to_dataframe()
+    def collect(self, sql, query_parameters=None):
+        job = self._query(sql, query_parameters=query_parameters)
+        result = job.to_dataframe()
+        self._record('collect', job)
+        return result
 
-    def collect_list(self, sql: str, record_as_dict: bool = False):
-        result = list(self._query(sql).result())
+    def collect_list(self, sql: str, record_as_dict: bool = False, query_parameters=None):
+        job = self._query(sql, query_parameters=query_parameters)
+        result = list(job.result())
+        self._record('collect_list', job)
         if record_as_dict:
             result = [dict(e) for e in result]
         return result
 
-    def dry_run(self, sql):
+    def collect_arrow(self, sql, max_streams=DEFAULT_MAX_STREAMS, query_parameters=None):
+        return self._read_query_result(sql, max_streams, query_parameters=query_parameters).read_all()
+
+    def collect_batches(
+            self,
+            sql,
+            as_dataframe=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+            query_parameters=None):
+        reader = self._read_query_result(sql, max_streams, max_queue_size, query_parameters)
+        return (batch.to_pandas() if as_dataframe else batch for batch in reader)
+
+    def collect_iter(
+            self,
+            sql,
+            record_as_dict=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+            query_parameters=None):
+        return iter_rows(self._read_query_result(sql, max_streams, max_queue_size, query_parameters), record_as_dict)
+
+    def _read_query_result(
+            self,
+            sql,
+            max_streams,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+            query_parameters=None) -> ArrowTableReader:
+        job = self._query(sql, query_parameters=query_parameters)
+        job.result()
+        self._record('collect_stream', job)
+        if self._bqstorage_client is None:
+            self._bqstorage_client = create_bqstorage_client(self.bigquery_client)
+        return ArrowTableReader(
+            self._bqstorage_client, job.destination, self.bigquery_client.project, max_streams, max_queue_size)
+
+    def dry_run(self, sql, query_parameters=None):
         from google.cloud import bigquery
         job_config = bigquery.QueryJobConfig()
         job_config.dry_run = True
-        query_job = self._query(sql, job_config=job_config)
+        query_job = self._query(sql, job_config=job_config, query_parameters=query_parameters)
         billed = self._convert_to_humanbytes(query_job.total_bytes_processed)
         return "This query will process {} and cost {}.".format(
           billed['size'],
           billed['cost'])
 
     def remove_dataset(self):
-        return self.bigquery_client.delete_dataset(self.dataset, delete_contents=True, not_found_ok=True)
+        result = self.bigquery_client.delete_dataset(self.dataset, delete_contents=True, not_found_ok=True)
+        tables_cache.invalidate(self.dataset_id)
+        forget_dataset(self.dataset_id)
+        for table_id in [t for t in self._tables if str(t).startswith(self.dataset_id + '.')]:
+            del self._tables[table_id]
+        return result
 
     def load_table_from_dataframe(self, table_id, df):
-        return self.bigquery_client.load_table_from_dataframe(df, table_id).result()
+        job = self.bigquery_client.load_table_from_dataframe(df, table_id)
+        result = job.result()
+        self._record('load', job, table_id)
+        tables_cache.add(table_id)
+        return result
 
     def table_exists(self, table_name):
-        return self.bigquery_client.query('''
-            SELECT count(*) as table_exists
-            FROM `{dataset_id}.__TABLES__`
-            WHERE table_id='{table_name}'
-            '''.format(
-                dataset_id=self.dataset_id,
-                table_name=table_name)) \
-            .result() \
-            .to_dataframe()['table_exists'] \
-            .iloc[0] > 0
+        return tables_cache.table_exists(self.bigquery_client, self.dataset_id, table_name)
 
     def create_table_from_schema(
             self,
             table_id: str,
-            schema: typing.Union[typing.List[dict], Path, None] = None,
-            table=None):
-        from google.cloud.bigquery import Table, TimePartitioning
-
-        if schema and table:
-            raise ValueError("You can't provide both schema and table, because the table you provide"
-                             "should already contain the schema.")
-        if not schema and not table:
-            raise ValueError("You must provide either schema or table.")
-
-        if isinstance(schema, Path):
-            schema = json.loads(schema.read_text())
-
-        if table is None:
-            table = Table(table_id, schema=schema)
-            table.time_partitioning = TimePartitioning()
+            schema: typing.Union[typing.List[dict], dict, Path, None] = None,
+            table=None,
+            table_options: typing.Optional[TableOptions] = None):
+        table = build_table(table_id, schema, table, table_options)
 
         self.logger.info(f'CREATING TABLE FROM SCHEMA: {table.schema}')
 
         self.bigquery_client.create_table(table)
+        table_id = f'{table.project}.{table.dataset_id}.{table.table_id}'
+        tables_cache.add(table_id)
+        self._tables[table_id] = table
+
+    def partition_type(self, table_id: str) -> typing.Optional[str]:
+        """
+        Partitioning of the table (`HOUR`, `DAY`, `MONTH`, `YEAR` or `RANGE`), None for a non-partitioned table.
+        A table which doesn't exist yet is assumed to be partitioned by day.
+        """
+        from google.api_core.exceptions import NotFound
+        table_id = table_id.split('$')[0]
+        dataset_id, table_name = split_table_id(table_id)
+        if table_id not in self._tables and dataset_id == self.dataset_id:
+            # the listing of the dataset, cached for checks of table existence, tells time partitioning,
+            # only tables partitioned by range (or not partitioned) need their metadata
+            exists, listed_type = tables_cache.partitioning(self.bigquery_client, dataset_id, table_name)
+            if not exists:
+                return DAY
+            if listed_type in (HOUR, DAY, MONTH, YEAR):
+                return listed_type
+        try:
+            return partition_type(self._get_table(table_id))
+        except NotFound:
+            return DAY
 
     def insert(
             self,
             table_id: str,
-            records: typing.Union[typing.List[dict], Path]):
+            records: typing.Union[typing.Iterable[dict], Path],
+            bulk: bool = False,
+            source_format: str = NEWLINE_DELIMITED_JSON,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_concurrency: int = 1):
+        """
+        Inserts records with a streaming insert or, when `bulk` is set, with load jobs
+        (records are split into chunks of `chunk_size` rows, up to `max_concurrency` chunks are loaded at the same time).
+        In the bulk mode, records can be an iterator or a path to a newline-delimited JSON file.
+        """
+        if bulk:
+            self.logger.info('LOADING RECORDS TO TABLE: %s', table_id)
+            result = load_records(
+                self.bigquery_client, table_id, records, source_format, chunk_size, max_concurrency,
+                on_job=lambda job: self._record('load', job, table_id))
+            tables_cache.add(table_id)
+            return result
         self.logger.info('INSERTING RECORDS TO TABLE: %s', table_id)
         table = self.bigquery_client.get_table(table_id)
         if isinstance(records, Path):
@@ -384,9 +1238,53 @@ class DatasetManager(object):
         errors = self.bigquery_client.insert_rows(table, records)
         if errors:
             raise ValueError(errors)
+        if self.stats is not None:
+            self.stats.record_rows('insert', len(records) if isinstance(records, (list, tuple)) else None, table_id)
 
-    def _query(self, sql, job_config=None):
+    def open_writer(
+            self,
+            table_id: str,
+            stream_type: str = PENDING,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> StorageWriter:
+        self.logger.info('OPENING %s WRITE STREAM TO TABLE: %s', stream_type, table_id)
+        tables_cache.add(table_id)
+        return StorageWriter(self.bigquery_client, table_id, stream_type, batch_size, max_in_flight)
+
+    def _tmp_table_fingerprint(self, table_id, sql, query_parameters=None):
+        from google.cloud import bigquery
+        job_config = bigquery.QueryJobConfig()
+        job_config.use_legacy_sql = False
+        if query_parameters:
+            job_config.query_parameters = create_query_parameters(query_parameters)
+        fingerprint = query_fingerprint(self.bigquery_client, sql, job_config, query_parameters)
+        if fingerprint is None:
+            self.logger.info("Result of the query written to %s can't be cached", table_id)
+        return fingerprint
+
+    def _record(self, operation, job, target=None, child_job=False):
+        if self.budget is not None:
+            # a child job of a script is limited by the script job, its limit is released with the script
+            self.budget.charge(getattr(job, 'total_bytes_billed', None), 0 if child_job else _reserved_bytes(job))
+        if self.stats is None:
+            return
+        self.stats.record_job(operation, job, target)
+        for warning in analyze_job(job, self._get_table):
+            self.logger.warning('%s %s: %s', operation, target or '', warning)
+
+    def _get_table(self, table_id):
+        if table_id not in self._tables:
+            self._tables[table_id] = self.bigquery_client.get_table(table_id)
+        return self._tables[table_id]
+
+    def _query(self, sql, job_config=None, query_parameters=None):
+        from google.cloud import bigquery
         self.logger.info('COLLECTING DATA: %s', sql)
+        if query_parameters:
+            job_config = job_config or bigquery.QueryJobConfig()
+            job_config.query_parameters = create_query_parameters(query_parameters)
+        if self.budget is not None:
+            job_config = self._limit_bytes_billed(job_config or bigquery.QueryJobConfig())
         if job_config:
             return self.bigquery_client.query(sql, job_config=job_config)
         else:
@@ -408,13 +1306,48 @@ class DatasetManager(object):
                 'cost': cost}
 
 
+def create_query_parameters(query_parameters: typing.Dict[str, typing.Any]) -> list:
+    """Converts a dict of values to named BigQuery query parameters."""
+    from google.cloud import bigquery
+    result = []
+    for name, value in query_parameters.items():
+        parameter_type = query_parameter_type(value)
+        if parameter_type is None:
+            raise ValueError(f"Value of {name} can't be a query parameter: {value!r}")
+        if parameter_type.startswith('ARRAY'):
+            result.append(bigquery.ArrayQueryParameter(name, parameter_type[len('ARRAY<'):-1], list(value)))
+        else:
+            result.append(bigquery.ScalarQueryParameter(name, parameter_type, value))
+    return result
+
+
 def create_dataset(dataset_name, bigquery_client, location=DEFAULT_LOCATION):
     from google.cloud import bigquery
-    dataset = bigquery.Dataset('{project_id}.{dataset_name}'.format(
+    dataset_id = '{project_id}.{dataset_name}'.format(
         project_id=bigquery_client.project,
-        dataset_name=dataset_name))
+        dataset_name=dataset_name)
+    with _created_datasets_lock:
+        if dataset_id in _created_datasets:
+            return _created_datasets[dataset_id]
+
+    dataset = bigquery.Dataset(dataset_id)
     dataset.location = location
-    return bigquery_client.create_dataset(dataset, exists_ok=True)
+    dataset = bigquery_client.create_dataset(dataset, exists_ok=True)
+    with _created_datasets_lock:
+        _created_datasets[dataset_id] = dataset
+    return dataset
+
+
+def _reserved_bytes(job) -> int:
+    """`maximum_bytes_billed` reserved in a budget for the query job, 0 for jobs of other types."""
+    maximum_bytes_billed = getattr(job, 'maximum_bytes_billed', None)
+    return maximum_bytes_billed if isinstance(maximum_bytes_billed, int) else 0
+
+
+def forget_dataset(dataset_id):
+    """Drops memoized dataset, so it is created again by the next `create_dataset` call."""
+    with _created_datasets_lock:
+        _created_datasets.pop(dataset_id, None)
 
 
 def random_uuid(suffix=''):
@@ -429,6 +1362,30 @@ def create_bigquery_client(project_id, credentials, location):
         location=location)
 
 
+def get_bigquery_client(project_id, credentials, location, resources=None):
+    """
+    Returns BigQuery client shared by all dataset managers with the same project, credentials and location.
+
+    :param resources: bigflow.workflow.ResourceRegistry which owns the client, the process-wide `client_pool` by default.
+    """
+    resources = resources if resources is not None else client_pool
+    try:
+        hash(credentials)
+        credentials_key = credentials
+    except TypeError:
+        credentials_key = id(credentials)
+    return resources.get_or_create(
+        ('bigquery.Client', project_id, credentials_key, location),
+        lambda: create_bigquery_client(project_id, credentials, location),
+        teardown=_close_bigquery_client)
+
+
+def _close_bigquery_client(client):
+    # `Client.close` is available since google-cloud-bigquery 1.27
+    if hasattr(client, 'close'):
+        client.close()
+
+
 def create_dataset_manager(
         project_id,
         runtime,
@@ -438,10 +1395,18 @@ def create_dataset_manager(
         extras=None,
         credentials=None,
         location=DEFAULT_LOCATION,
-        logger=None) -> typing.Tuple[str, PartitionedDatasetManager]:
+        logger=None,
+        resources=None,
+        backend=None,
+        use_query_parameters=False,
+        stats=None,
+        budget=None,
+        estimate=None,
+        cache_tmp_tables=False) -> typing.Tuple[str, PartitionedDatasetManager]:
     """
     Dataset manager factory.
     If dataset does not exist then it will also create dataset with given name.
+    BigQuery clients are pooled and existence of datasets is memoized, so the factory is cheap to call many times.
 
     :param dataset_name: string dataset name(not dataset id). If not provided, dataset_name will be random string.
     :param internal_tables: list of dataset table names that are gonna be available during processing.
@@ -454,6 +1419,17 @@ def create_dataset_manager(
     :param project_id: string full project id where dataset being processed is available.
     :param location: string location of dataset will be used to create datasets, tables, jobs, etc. EU by default.
     :param logger: custom logger.
+    :param resources: bigflow.workflow.ResourceRegistry which owns the BigQuery client. If empty, process-wide pool is used.
+    :param backend: 'bigquery' or 'local' (offline DuckDB database, see bigflow.bigquery.local).
+     If empty, `bf_bigquery_backend` environment variable is used, BigQuery by default.
+    :param use_query_parameters: if True, {dt} and extras are passed as named query parameters (@name)
+     instead of being formatted into SQL, so the text of a query is the same for every runtime.
+    :param stats: bigflow.bigquery.stats.StatsCollector which receives statistics of BigQuery jobs.
+    :param budget: bigflow.bigquery.budget.BytesBudget which limits bytes billed by queries (`maximum_bytes_billed`).
+    :param estimate: bigflow.bigquery.estimate.JobEstimate. If provided, queries are only dry-run and bytes they would
+     process are added to the estimate. Nothing is written and the dataset is not created.
+    :param cache_tmp_tables: if True, `write_tmp` reuses the table written before when neither the query
+     nor the tables it reads changed since then (see bigflow.bigquery.materialization).
     :return: tuple (full dataset ID, dataset manager).
     """
     dataset_name = dataset_name or random_uuid(suffix='_test_case')
@@ -464,9 +1440,28 @@ def create_dataset_manager(
         logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
         logger = logging.getLogger(__name__)
 
-    client = create_bigquery_client(project_id, credentials, location)
-    dataset = create_dataset(dataset_name, client, location)
-
-    core_dataset_manager = DatasetManager(client, dataset, logger)
-    templated_dataset_manager = TemplatedDatasetManager(core_dataset_manager, internal_tables, external_tables, extras, runtime)
+    backend = backend or os.environ.get(BACKEND_ENV_VARIABLE) or BIGQUERY_BACKEND
+    if estimate is not None:
+        from google.cloud import bigquery
+        from .estimate import DryRunDatasetManager
+        client = get_bigquery_client(project_id, credentials, location, resources)
+        # the dataset is not created, it may not exist yet
+        dataset = bigquery.Dataset.from_api_repr({
+            'id': f'{client.project}:{dataset_name}',
+            'datasetReference': {'projectId': client.project, 'datasetId': dataset_name},
+        })
+        core_dataset_manager = DryRunDatasetManager(client, dataset, logger, estimate)
+    elif backend == LOCAL_BACKEND:
+        from .local import LocalDatasetManager, get_connection
+        core_dataset_manager = LocalDatasetManager(get_connection(resources=resources), project_id, dataset_name, logger)
+        dataset = core_dataset_manager.dataset
+    elif backend == BIGQUERY_BACKEND:
+        client = get_bigquery_client(project_id, credentials, location, resources)
+        dataset = create_dataset(dataset_name, client, location)
+        core_dataset_manager = DatasetManager(client, dataset, logger, stats, budget, cache_tmp_tables)
+    else:
+        raise ValueError(f"Unknown backend {backend}, use {BIGQUERY_BACKEND} or {LOCAL_BACKEND}")
+
+    templated_dataset_manager = TemplatedDatasetManager(
+        core_dataset_manager, internal_tables, external_tables, extras, runtime, use_query_parameters)
     return dataset.full_dataset_id.replace(':', '.'), PartitionedDatasetManager(templated_dataset_manager, get_partition_from_run_datetime_or_none(runtime))
@@ -0,0 +1,270 @@
+"""Estimating bytes processed by BigQuery jobs of a workflow, with dry runs.
+
+`estimate_workflow` runs components of all `bigflow.bigquery.Job` jobs of a workflow with `DryRunDatasetManager`
+dependencies. Every query is sent to BigQuery as a dry run, which returns the number of bytes the query would
+process, nothing is written. Queries which read tables written earlier by the same workflow (e.g. by `write_tmp`)
+can't be estimated when those tables don't exist yet, and components which depend on query results
+see empty results, so for such jobs the estimate is a lower bound.
+
+The estimate is printed by `bigflow estimate`.
+"""
+
+import logging
+import threading
+import typing
+
+from .dataset_manager import DatasetManager, create_dataset_manager, create_query_parameters
+from .budget import job_budget
+from .parallel import CompletedFuture
+from .storage_read import DEFAULT_MAX_STREAMS, DEFAULT_MAX_QUEUE_SIZE
+from .storage_write import DiscardingWriter
+from .extract import ExtractedTable
+from .stats import _human_bytes, TIB_COST
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryEstimate(typing.NamedTuple):
+    operation: str
+    target: typing.Optional[str]
+    bytes_processed: typing.Optional[int]
+    error: typing.Optional[str] = None
+
+
+class JobEstimate(object):
+
+    def __init__(self, job_id: str, maximum_bytes_billed: typing.Optional[int] = None):
+        self.job_id = job_id
+        self.maximum_bytes_billed = maximum_bytes_billed
+        self.queries: typing.List[QueryEstimate] = []
+        self.error: typing.Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add(self, query: QueryEstimate):
+        with self._lock:
+            self.queries.append(query)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(q.bytes_processed or 0 for q in self.queries)
+
+    @property
+    def complete(self) -> bool:
+        return self.error is None and all(q.error is None for q in self.queries)
+
+    @property
+    def over_budget(self) -> bool:
+        return self.maximum_bytes_billed is not None and self.total_bytes > self.maximum_bytes_billed
+
+
+class WorkflowEstimate(object):
+
+    def __init__(self, workflow_id: str, runtime: str, maximum_bytes_billed: typing.Optional[int] = None):
+        self.workflow_id = workflow_id
+        self.runtime = runtime
+        self.maximum_bytes_billed = maximum_bytes_billed
+        self.jobs: typing.List[JobEstimate] = []
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(j.total_bytes for j in self.jobs)
+
+    @property
+    def over_budget(self) -> bool:
+        return any(j.over_budget for j in self.jobs) or (
+            self.maximum_bytes_billed is not None and self.total_bytes > self.maximum_bytes_billed)
+
+    def format(self) -> str:
+        lines = [
+            "Workflow {} ({}): processes {} (~{:.2f} USD){}".format(
+                self.workflow_id, self.runtime, _human_bytes(self.total_bytes),
+                self.total_bytes / 2 ** 40 * TIB_COST, _budget_note(self.total_bytes, self.maximum_bytes_billed)),
+        ]
+        for job in self.jobs:
+            lines.append("  job {}: processes {}{}{}".format(
+                job.job_id, _human_bytes(job.total_bytes), _budget_note(job.total_bytes, job.maximum_bytes_billed),
+                '' if job.complete else ' (lower bound)'))
+            if job.error is not None:
+                lines.append(f"    the component failed: {job.error}")
+            for query in sorted(job.queries, key=lambda q: -(q.bytes_processed or 0)):
+                lines.append("    {:<24} {:<48} {:>10}{}".format(
+                    query.operation, query.target or '', _human_bytes(query.bytes_processed),
+                    '' if query.error is None else f"  error: {query.error}"))
+        return '\n'.join(lines)
+
+
+def _budget_note(total_bytes: int, maximum_bytes_billed: typing.Optional[int]) -> str:
+    if maximum_bytes_billed is None:
+        return ''
+    status = 'EXCEEDS' if total_bytes > maximum_bytes_billed else 'within'
+    return f", {status} the budget of {_human_bytes(maximum_bytes_billed)}"
+
+
+class DryRunDatasetManager(DatasetManager):
+    """
+    Sends every query as a dry run and adds bytes it would process to `JobEstimate`.
+    Writes, loads and inserts are skipped, collect operations return empty results.
+    """
+
+    def __init__(self, bigquery_client, dataset, logger, estimate: JobEstimate):
+        super().__init__(bigquery_client, dataset, logger)
+        self.estimate = estimate
+
+    def write(self, table_id, sql, mode, query_parameters=None):
+        self._dry_run(mode.lower(), sql, query_parameters, table_id)
+
+    def write_async(self, table_id, sql, mode, check_table_exists=False, query_parameters=None):
+        return CompletedFuture(self.write(table_id, sql, mode, query_parameters))
+
+    def write_truncate(self, table_id, sql, query_parameters=None):
+        # the table may be created by an earlier, not executed, operation
+        return self.write(table_id, sql, 'WRITE_TRUNCATE', query_parameters)
+
+    def write_append(self, table_id, sql, query_parameters=None):
+        return self.write(table_id, sql, 'WRITE_APPEND', query_parameters)
+
+    def write_merge(self, table_id, sql, keys, query_parameters=None):
+        # only the query is estimated, MERGE also reads the merged partitions of the table
+        self._dry_run('write_merge', sql, query_parameters, table_id)
+
+    def write_truncate_range(self, table_id, queries: typing.Dict[str, str]):
+        for day, sql in sorted(queries.items()):
+            self._dry_run('write_truncate_range', sql, target=f"{table_id}${day.replace('-', '')}")
+
+    def run_script(self, statements):
+        # TEMP tables don't exist in a dry run, queries which read them can't be estimated
+        for statement in statements:
+            self._dry_run(statement.operation, statement.sql, target=statement.table_id)
+
+    def create_table(self, create_query):
+        self._dry_run('create_table', create_query, default_dataset=self.dataset)
+
+    def collect(self, sql, query_parameters=None):
+        import pandas as pd
+        self._dry_run('collect', sql, query_parameters)
+        return pd.DataFrame()
+
+    def collect_list(self, sql: str, record_as_dict: bool = False, query_parameters=None):
+        self._dry_run('collect_list', sql, query_parameters)
+        return []
+
+    def collect_async(self, sql, query_parameters=None):
+        return CompletedFuture(self.collect(sql, query_parameters))
+
+    def collect_list_async(self, sql: str, record_as_dict: bool = False, query_parameters=None):
+        return CompletedFuture(self.collect_list(sql, record_as_dict, query_parameters))
+
+    def collect_arrow(self, sql, max_streams=DEFAULT_MAX_STREAMS, query_parameters=None):
+        import pyarrow as pa
+        self._dry_run('collect_stream', sql, query_parameters)
+        return pa.table({})
+
+    def collect_batches(
+            self,
+            sql,
+            as_dataframe=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+            query_parameters=None):
+        self._dry_run('collect_stream', sql, query_parameters)
+        return iter([])
+
+    def collect_iter(
+            self,
+            sql,
+            record_as_dict=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+            query_parameters=None):
+        self._dry_run('collect_stream', sql, query_parameters)
+        return iter([])
+
+    def remove_dataset(self):
+        self.logger.info('Skipped in dry run: remove dataset %s', self.dataset_id)
+
+    def load_table_from_dataframe(self, table_id, df):
+        self.logger.info('Skipped in dry run: load to %s', table_id)
+
+    def copy_table(self, source_table_id, destination_table_id, write_disposition='WRITE_TRUNCATE'):
+        # copies, snapshots and clones are not billed
+        self.logger.info('Skipped in dry run: copy %s to %s', source_table_id, destination_table_id)
+
+    def copy_table_async(self, source_table_id, destination_table_id, write_disposition='WRITE_TRUNCATE'):
+        return CompletedFuture(self.copy_table(source_table_id, destination_table_id, write_disposition))
+
+    def extract_async(self, table_id, destination_uri, destination_format='PARQUET', compression=None):
+        # extract jobs are not billed
+        self.logger.info('Skipped in dry run: extract %s to %s', table_id, destination_uri)
+        return CompletedFuture(ExtractedTable(table_id, destination_uri))
+
+    def snapshot_table(self, source_table_id, snapshot_table_id, expiration_days=None, snapshot_time=None):
+        self.logger.info('Skipped in dry run: snapshot of %s', source_table_id)
+
+    def clone_table(self, source_table_id, clone_table_id, snapshot_time=None):
+        self.logger.info('Skipped in dry run: clone of %s', source_table_id)
+
+    def create_table_from_schema(self, table_id, schema=None, table=None, table_options=None):
+        self.logger.info('Skipped in dry run: create table %s', table_id)
+
+    def insert(self, table_id, records, *args, **kwargs):
+        self.logger.info('Skipped in dry run: insert to %s', table_id)
+
+    def open_writer(self, table_id, *args, **kwargs):
+        self.logger.info('Skipped in dry run: write stream to %s', table_id)
+        return DiscardingWriter()
+
+    def _dry_run(self, operation, sql, query_parameters=None, target=None, default_dataset=None):
+        from google.api_core.exceptions import GoogleAPICallError
+        from google.cloud import bigquery
+        job_config = bigquery.QueryJobConfig()
+        job_config.dry_run = True
+        job_config.use_query_cache = False
+        job_config.use_legacy_sql = False
+        if default_dataset is not None:
+            job_config.default_dataset = default_dataset
+        if query_parameters:
+            job_config.query_parameters = create_query_parameters(query_parameters)
+        try:
+            job = self.bigquery_client.query(sql, job_config=job_config)
+            query = QueryEstimate(operation, target, job.total_bytes_processed)
+        except GoogleAPICallError as e:
+            self.logger.warning("Dry run of %s %s failed: %s", operation, target or '', e)
+            query = QueryEstimate(operation, target, None, getattr(e, 'message', str(e)))
+        self.estimate.add(query)
+        return query
+
+
+def estimate_job(job, runtime: str, resources=None) -> JobEstimate:
+    """Runs the component of `bigflow.bigquery.Job` with dry run dataset managers."""
+    estimate = JobEstimate(job.id, job.maximum_bytes_billed)
+    dependencies = {}
+    for name in job._component_dependencies:
+        _, dependencies[name] = create_dataset_manager(
+            runtime=runtime, resources=resources, estimate=estimate, **job._find_config(name)._as_dict())
+    try:
+        job._run_component(dependencies)
+    except Exception as e:
+        logger.warning("Job %s can't be fully estimated, the component failed: %r", job.id, e)
+        estimate.error = repr(e)
+    return estimate
+
+
+def estimate_workflow(workflow, runtime: typing.Optional[str] = None) -> WorkflowEstimate:
+    from .job import Job
+    context = workflow._make_job_context(runtime)
+    resources = context.resources
+    resources.setup()
+    try:
+        workflow_budget = job_budget(workflow.workflow_id, None, resources)
+        estimate = WorkflowEstimate(
+            workflow.workflow_id, context.runtime_str,
+            workflow_budget.maximum_bytes_billed if workflow_budget is not None else None)
+        for workflow_job in workflow._build_sequential_order():
+            if isinstance(workflow_job.job, Job):
+                estimate.jobs.append(estimate_job(workflow_job.job, context.runtime_str, resources))
+            else:
+                logger.info("Job %s is not a BigQuery job, skipped", workflow_job.job.id)
+        return estimate
+    finally:
+        resources.teardown()
@@ -0,0 +1,220 @@
+"""Exporting tables to Cloud Storage and reading the exported files.
+
+`extract` runs BigQuery extract jobs (which are not billed) for many tables or partitions at the same time.
+A destination URI with a `*` wildcard lets BigQuery split a table into many files (shards), which is required
+for tables larger than 1 GB.
+
+`ShardReader` reads the shards back as `pyarrow.RecordBatch` objects. Shards are downloaded to temporary files
+by a few threads at the same time and read one row group (or Avro block of rows) at a time. Batches are passed
+to the consumer through a bounded queue, so memory used by a reader depends on neither the number of shards
+nor their size.
+"""
+
+import fnmatch
+import functools
+import glob
+import logging
+import os
+import tempfile
+import typing
+
+from .storage_read import merge_streams, DEFAULT_MAX_QUEUE_SIZE
+
+# hidden BQ, GCS, pyarrow and fastavro imports due to https://github.com/allegro/bigflow/issues/149
+
+
+logger = logging.getLogger(__name__)
+
+
+PARQUET = 'PARQUET'
+AVRO = 'AVRO'
+CSV = 'CSV'
+NEWLINE_DELIMITED_JSON = 'NEWLINE_DELIMITED_JSON'
+
+FORMATS = (PARQUET, AVRO, CSV, NEWLINE_DELIMITED_JSON)
+COMPRESSIONS = {
+    PARQUET: ('SNAPPY', 'GZIP', 'ZSTD', 'NONE'),
+    AVRO: ('SNAPPY', 'DEFLATE', 'NONE'),
+    CSV: ('GZIP', 'NONE'),
+    NEWLINE_DELIMITED_JSON: ('GZIP', 'NONE'),
+}
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_AVRO_BATCH_SIZE = 10_000
+
+
+class ExtractedTable(typing.NamedTuple):
+    table_id: str
+    destination_uri: str
+    file_count: typing.Optional[int] = None
+
+
+def extract_job_config(destination_format: str = PARQUET, compression: typing.Optional[str] = None):
+    """`ExtractJobConfig` of the format and the compression (the default compression of the format if None)."""
+    from google.cloud import bigquery
+    if destination_format not in FORMATS:
+        raise ValueError(f"Invalid format {destination_format}, expected one of: {', '.join(FORMATS)}")
+    if compression is not None and compression not in COMPRESSIONS[destination_format]:
+        raise ValueError(f"{destination_format} files can't be compressed with {compression}, "
+                         f"expected one of: {', '.join(COMPRESSIONS[destination_format])}")
+    job_config = bigquery.ExtractJobConfig()
+    job_config.destination_format = destination_format
+    if compression is not None:
+        job_config.compression = compression
+    if destination_format == AVRO:
+        job_config.use_avro_logical_types = True
+    return job_config
+
+
+def destination_uri(uri_pattern: str, table_id: str, variables: typing.Optional[typing.Mapping] = None) -> str:
+    """
+    Fills `{table}` and `{partition}` placeholders of the URI with the table name and its partition decorator
+    (empty for a whole table), other placeholders with the variables.
+
+    >>> destination_uri('gs://bucket/{table}/{partition}/*.parquet', 'p.d.events$20200101')
+    'gs://bucket/events/20200101/*.parquet'
+    """
+    table_name, _, partition = table_id.split('.')[-1].partition('$')
+    return uri_pattern.format(**{**(variables or {}), 'table': table_name, 'partition': partition})
+
+
+def check_unique_uris(uris: typing.Iterable[str]):
+    seen = set()
+    for uri in uris:
+        if uri in seen:
+            raise ValueError(f"Tables would be extracted to the same files {uri}, "
+                             "use {table} and {partition} placeholders in the URI pattern")
+        seen.add(uri)
+
+
+def _split_gcs_uri(uri: str) -> typing.Tuple[str, str]:
+    if not uri.startswith('gs://'):
+        raise ValueError(f"Not a Cloud Storage URI: {uri}")
+    bucket, _, path = uri[len('gs://'):].partition('/')
+    return bucket, path
+
+
+def list_shards(storage_client, uri_pattern: str) -> typing.List[str]:
+    """URIs of files matching the pattern (with `*` wildcards), in Cloud Storage or in the local file system."""
+    if not uri_pattern.startswith('gs://'):
+        return sorted(glob.glob(uri_pattern))
+    bucket, path = _split_gcs_uri(uri_pattern)
+    prefix = path.split('*')[0]
+    return sorted(
+        f'gs://{bucket}/{blob.name}'
+        for blob in storage_client.list_blobs(bucket, prefix=prefix)
+        if fnmatch.fnmatchcase(blob.name, path))
+
+
+def create_storage_client(bigquery_client):
+    from google.cloud import storage
+    return storage.Client(project=bigquery_client.project, credentials=bigquery_client._credentials)
+
+
+class ShardReader(object):
+    """
+    Iterates over `pyarrow.RecordBatch` objects of Parquet or Avro files exported by `extract`.
+    Up to `max_workers` shards are read in parallel, so the order of batches is not deterministic.
+    """
+    def __init__(
+            self,
+            storage_client,
+            uri_pattern: str,
+            destination_format: str = PARQUET,
+            max_workers: int = DEFAULT_MAX_WORKERS,
+            max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE):
+        if destination_format not in (PARQUET, AVRO):
+            raise ValueError(f"Only {PARQUET} and {AVRO} files can be read, got {destination_format}")
+        if max_workers < 1:
+            raise ValueError("max_workers should be a positive number")
+        self._storage_client = storage_client
+        self._format = destination_format
+        self._max_workers = max_workers
+        self._max_queue_size = max_queue_size
+        self.shards = list_shards(storage_client, uri_pattern)
+        logger.info("Read %d shards of %s", len(self.shards), uri_pattern)
+
+    def __iter__(self):
+        workers = min(self._max_workers, len(self.shards))
+        return merge_streams(
+            [functools.partial(self._read_shards, self.shards[i::workers]) for i in range(workers)],
+            self._max_queue_size)
+
+    def read_all(self):
+        import pyarrow
+        return pyarrow.Table.from_batches(list(self))
+
+    def to_dataframe(self):
+        return self.read_all().to_pandas()
+
+    def iter_dataframes(self):
+        """Yields a `pandas.DataFrame` per record batch, only a few batches are kept in memory at the same time."""
+        for batch in self:
+            yield batch.to_pandas()
+
+    def _read_shards(self, shards: typing.List[str]):
+        for shard in shards:
+            with self._local_file(shard) as path:
+                yield from (self._read_parquet(path) if self._format == PARQUET else self._read_avro(path))
+
+    def _local_file(self, shard: str):
+        if not shard.startswith('gs://'):
+            return _ExistingFile(shard)
+        bucket, path = _split_gcs_uri(shard)
+        return _DownloadedFile(self._storage_client.bucket(bucket).blob(path))
+
+    @staticmethod
+    def _read_parquet(path: str):
+        import pyarrow.parquet
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for i in range(parquet_file.num_row_groups):
+            yield from parquet_file.read_row_group(i).to_batches()
+
+    @staticmethod
+    def _read_avro(path: str, batch_size: int = DEFAULT_AVRO_BATCH_SIZE):
+        import fastavro
+        import pyarrow
+        with open(path, 'rb') as f:
+            reader = fastavro.reader(f)
+            names = [field['name'] for field in reader.writer_schema['fields']]
+            rows = []
+            for record in reader:
+                rows.append(record)
+                if len(rows) == batch_size:
+                    yield _record_batch(pyarrow, names, rows)
+                    rows = []
+            if rows:
+                yield _record_batch(pyarrow, names, rows)
+
+
+def _record_batch(pyarrow, names, rows):
+    return pyarrow.RecordBatch.from_arrays([pyarrow.array([row[n] for row in rows]) for n in names], names)
+
+
+class _ExistingFile(object):
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self) -> str:
+        return self.path
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class _DownloadedFile(object):
+    """Temporary copy of a blob, removed on exit."""
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.path = None
+
+    def __enter__(self) -> str:
+        fd, self.path = tempfile.mkstemp(prefix='bigflow-shard-')
+        with os.fdopen(fd, 'wb') as f:
+            self.blob.download_to_file(f)
+        return self.path
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        os.remove(self.path)
@@ -1,3 +1,4 @@
+import contextlib
 import functools
 import hashlib
 import logging
@@ -15,6 +16,13 @@ from .job import Job
 from .job import DEFAULT_RETRY_COUNT
 from .job import DEFAULT_RETRY_PAUSE_SEC
 from .dataset_manager import DEFAULT_LOCATION
+from .parallel import CompletedFuture, DEFAULT_MAX_CONCURRENCY
+from .storage_read import DEFAULT_MAX_STREAMS, DEFAULT_MAX_QUEUE_SIZE
+from .bulk_load import NEWLINE_DELIMITED_JSON, DEFAULT_CHUNK_SIZE
+from .backfill import DEFAULT_DAYS_PER_JOB
+from .storage_write import DiscardingWriter, PENDING, DEFAULT_BATCH_SIZE, DEFAULT_MAX_IN_FLIGHT
+from .table_options import TableOptions
+from .extract import PARQUET, DEFAULT_MAX_WORKERS
 from .interface import Dataset, DEFAULT_RUNTIME
 
 logger = logging.getLogger(__name__)
@@ -59,7 +67,10 @@ class InteractiveDatasetManager(Dataset):
                  external_tables=None,
                  credentials=None,
                  extras=None,
-                 location=DEFAULT_LOCATION):
+                 location=DEFAULT_LOCATION,
+                 backend=None,
+                 use_query_parameters=False,
+                 cache_tmp_tables=False):
         self.config = DatasetConfigInternal(
             project_id=project_id,
             dataset_name=dataset_name,
@@ -67,7 +78,10 @@ class InteractiveDatasetManager(Dataset):
             external_tables=external_tables,
             credentials=credentials,
             extras=extras,
-            location=location)
+            location=location,
+            backend=backend,
+            use_query_parameters=use_query_parameters,
+            cache_tmp_tables=cache_tmp_tables)
         logger.debug("Create InteractiveDatasetManager, config %s", self.config._as_dict())
 
     def write_truncate(self, table_name, sql, partitioned=True):
@@ -90,6 +104,17 @@ class InteractiveDatasetManager(Dataset):
             partitioned=partitioned,
             operation_name=DEFAULT_OPERATION_NAME)
 
+    def write_merge(self, table_name, sql, keys, partitioned=True):
+        method = 'write_merge'
+        return self._tmp_interactive_component_factory(
+            generate_component_name(method=method, table_name=table_name, sql=sql),
+            method,
+            table_name,
+            sql,
+            keys,
+            partitioned=partitioned,
+            operation_name=DEFAULT_OPERATION_NAME)
+
     def write_tmp(self, table_name, sql):
         method = 'write_tmp'
         return self._tmp_interactive_component_factory(
@@ -99,6 +124,26 @@ class InteractiveDatasetManager(Dataset):
             sql,
             operation_name=DEFAULT_OPERATION_NAME)
 
+    def write_truncate_range(
+            self,
+            table_name,
+            sql,
+            start,
+            end,
+            days_per_job=DEFAULT_DAYS_PER_JOB,
+            max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        method = 'write_truncate_range'
+        return self._tmp_interactive_component_factory(
+            generate_component_name(method=method, table_name=table_name, sql=sql),
+            method,
+            table_name,
+            sql,
+            start,
+            end,
+            days_per_job=days_per_job,
+            max_concurrency=max_concurrency,
+            operation_name=DEFAULT_OPERATION_NAME)
+
     def collect(self, sql):
         method = 'collect'
         return self._tmp_interactive_component_factory(
@@ -116,6 +161,47 @@ class InteractiveDatasetManager(Dataset):
             record_as_dict=record_as_dict,
             operation_name=DEFAULT_OPERATION_NAME)
 
+    def collect_arrow(self, sql: str, max_streams: int = DEFAULT_MAX_STREAMS):
+        method = 'collect_arrow'
+        return self._tmp_interactive_component_factory(
+            generate_component_name(method=method, table_name='', sql=sql),
+            method,
+            sql,
+            max_streams=max_streams,
+            operation_name=DEFAULT_OPERATION_NAME)
+
+    def collect_batches(
+            self,
+            sql: str,
+            as_dataframe: bool = False,
+            max_streams: int = DEFAULT_MAX_STREAMS,
+            max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE):
+        method = 'collect_batches'
+        return self._tmp_interactive_component_factory(
+            generate_component_name(method=method, table_name='', sql=sql),
+            method,
+            sql,
+            as_dataframe=as_dataframe,
+            max_streams=max_streams,
+            max_queue_size=max_queue_size,
+            operation_name=DEFAULT_OPERATION_NAME)
+
+    def collect_iter(
+            self,
+            sql: str,
+            record_as_dict: bool = False,
+            max_streams: int = DEFAULT_MAX_STREAMS,
+            max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE):
+        method = 'collect_iter'
+        return self._tmp_interactive_component_factory(
+            generate_component_name(method=method, table_name='', sql=sql),
+            method,
+            sql,
+            record_as_dict=record_as_dict,
+            max_streams=max_streams,
+            max_queue_size=max_queue_size,
+            operation_name=DEFAULT_OPERATION_NAME)
+
     def dry_run(self, sql):
         method = 'dry_run'
         return self._tmp_interactive_component_factory(
@@ -142,24 +228,77 @@ class InteractiveDatasetManager(Dataset):
             partitioned=partitioned,
             operation_name=DEFAULT_OPERATION_NAME)
 
+    def copy_table(self, source_table, destination_table, partitioned=True, write_disposition='WRITE_TRUNCATE'):
+        method = 'copy_table'
+        return self._tmp_interactive_component_factory(
+            generate_component_name(method=method, table_name=destination_table, sql=source_table),
+            method,
+            source_table=source_table,
+            destination_table=destination_table,
+            partitioned=partitioned,
+            write_disposition=write_disposition,
+            operation_name=DEFAULT_OPERATION_NAME)
+
+    def extract(self, tables, uri_pattern, destination_format=PARQUET, compression=None, partitioned=False):
+        method = 'extract'
+        return self._tmp_interactive_component_factory(
+            generate_component_name(
+                method=method,
+                table_name=tables if isinstance(tables, str) else '_'.join(tables),
+                sql=uri_pattern),
+            method,
+            tables=tables,
+            uri_pattern=uri_pattern,
+            destination_format=destination_format,
+            compression=compression,
+            partitioned=partitioned,
+            operation_name=DEFAULT_OPERATION_NAME)
+
+    def snapshot_table(self, source_table, snapshot_table, expiration_days=None, snapshot_time=None):
+        method = 'snapshot_table'
+        return self._tmp_interactive_component_factory(
+            generate_component_name(method=method, table_name=snapshot_table, sql=source_table),
+            method,
+            source_table=source_table,
+            snapshot_table=snapshot_table,
+            expiration_days=expiration_days,
+            snapshot_time=snapshot_time,
+            operation_name=DEFAULT_OPERATION_NAME)
+
+    def clone_table(self, source_table, clone_table, snapshot_time=None):
+        method = 'clone_table'
+        return self._tmp_interactive_component_factory(
+            generate_component_name(method=method, table_name=clone_table, sql=source_table),
+            method,
+            source_table=source_table,
+            clone_table=clone_table,
+            snapshot_time=snapshot_time,
+            operation_name=DEFAULT_OPERATION_NAME)
+
     def create_table_from_schema(
             self,
             table_name: str,
-            schema: typing.Union[typing.List[dict], Path, None] = None,
-            table=None):
+            schema: typing.Union[typing.List[dict], dict, Path, None] = None,
+            table=None,
+            table_options: typing.Optional[TableOptions] = None):
         method = 'create_table_from_schema'
         return self._tmp_interactive_component_factory(
             generate_component_name(method=method, table_name=table_name, sql=''),
             method,
             table_name=table_name,
             schema=schema,
-            table=table)
+            table=table,
+            table_options=table_options)
 
     def insert(
             self,
             table_name: str,
-            records: typing.Union[typing.List[dict], Path],
-            partitioned: bool = True):
+            records: typing.Union[typing.Iterable[dict], Path],
+            partitioned: bool = True,
+            bulk: bool = False,
+            source_format: str = NEWLINE_DELIMITED_JSON,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_concurrency: int = 1):
         method = 'insert'
         return self._tmp_interactive_component_factory(
             generate_component_name(method=method, table_name=table_name, sql=''),
@@ -167,6 +306,10 @@ class InteractiveDatasetManager(Dataset):
             table_name=table_name,
             records=records,
             partitioned=partitioned,
+            bulk=bulk,
+            source_format=source_format,
+            chunk_size=chunk_size,
+            max_concurrency=max_concurrency,
             operation_name=DEFAULT_OPERATION_NAME)
 
     def delete_dataset(self):
@@ -212,7 +355,8 @@ class InteractiveComponent(object):
                id=None,
                retry_count=DEFAULT_RETRY_COUNT,
                retry_pause_sec=DEFAULT_RETRY_PAUSE_SEC,
-               dependencies_override=None):
+               dependencies_override=None,
+               maximum_bytes_billed=None):
         _, component_callable = decorate_component_dependencies_with_operation_level_dataset_manager(self._standard_component)
 
         dependencies_override = dependencies_override or {}
@@ -225,6 +369,7 @@ class InteractiveComponent(object):
             id=id,
             retry_count=retry_count,
             retry_pause_sec=retry_pause_sec,
+            maximum_bytes_billed=maximum_bytes_billed,
             **dependency_config)
 
     @log_syntax_error
@@ -338,6 +483,16 @@ class OperationLevelDatasetManager(Dataset):
             partitioned=partitioned,
             custom_run_datetime=custom_run_datetime)
 
+    def write_merge(self, table_name, sql, keys, partitioned=True, custom_run_datetime=None, operation_name=None):
+        return self._run_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.write_merge,
+            sql=sql,
+            table_name=table_name,
+            keys=keys,
+            partitioned=partitioned,
+            custom_run_datetime=custom_run_datetime)
+
     def write_tmp(self, table_name, sql, custom_run_datetime=None, operation_name=None):
         return self._run_operation(
             operation_name=operation_name,
@@ -346,6 +501,25 @@ class OperationLevelDatasetManager(Dataset):
             table_name=table_name,
             custom_run_datetime=custom_run_datetime)
 
+    def write_truncate_range(
+            self,
+            table_name,
+            sql,
+            start,
+            end,
+            days_per_job=DEFAULT_DAYS_PER_JOB,
+            max_concurrency=DEFAULT_MAX_CONCURRENCY,
+            operation_name=None):
+        return self._run_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.write_truncate_range,
+            sql=sql,
+            table_name=table_name,
+            start=start,
+            end=end,
+            days_per_job=days_per_job,
+            max_concurrency=max_concurrency)
+
     def collect(self, sql, custom_run_datetime=None, operation_name=None):
         return self._run_operation(
             operation_name=operation_name,
@@ -366,6 +540,48 @@ class OperationLevelDatasetManager(Dataset):
             custom_run_datetime=custom_run_datetime,
             record_as_dict=record_as_dict)
 
+    def collect_arrow(self, sql, custom_run_datetime=None, max_streams=DEFAULT_MAX_STREAMS, operation_name=None):
+        return self._run_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.collect_arrow,
+            sql=sql,
+            custom_run_datetime=custom_run_datetime,
+            max_streams=max_streams)
+
+    def collect_batches(
+            self,
+            sql: str,
+            custom_run_datetime: typing.Optional[str] = None,
+            as_dataframe: bool = False,
+            max_streams: int = DEFAULT_MAX_STREAMS,
+            max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+            operation_name=None):
+        return self._run_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.collect_batches,
+            sql=sql,
+            custom_run_datetime=custom_run_datetime,
+            as_dataframe=as_dataframe,
+            max_streams=max_streams,
+            max_queue_size=max_queue_size)
+
+    def collect_iter(
+            self,
+            sql: str,
+            custom_run_datetime: typing.Optional[str] = None,
+            record_as_dict: bool = False,
+            max_streams: int = DEFAULT_MAX_STREAMS,
+            max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+            operation_name=None):
+        return self._run_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.collect_iter,
+            sql=sql,
+            custom_run_datetime=custom_run_datetime,
+            record_as_dict=record_as_dict,
+            max_streams=max_streams,
+            max_queue_size=max_queue_size)
+
     def dry_run(self, sql, custom_run_datetime=None, operation_name=None):
         return self._run_operation(
             operation_name=operation_name,
@@ -373,6 +589,61 @@ class OperationLevelDatasetManager(Dataset):
             sql=sql,
             custom_run_datetime=custom_run_datetime)
 
+    def write_truncate_async(self, table_name, sql, partitioned=True, custom_run_datetime=None, operation_name=None):
+        return self._run_async_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.write_truncate_async,
+            sql=sql,
+            table_name=table_name,
+            partitioned=partitioned,
+            custom_run_datetime=custom_run_datetime)
+
+    def write_append_async(self, table_name, sql, partitioned=True, custom_run_datetime=None, operation_name=None):
+        return self._run_async_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.write_append_async,
+            sql=sql,
+            table_name=table_name,
+            partitioned=partitioned,
+            custom_run_datetime=custom_run_datetime)
+
+    def write_tmp_async(self, table_name, sql, custom_run_datetime=None, operation_name=None):
+        return self._run_async_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.write_tmp_async,
+            sql=sql,
+            table_name=table_name,
+            custom_run_datetime=custom_run_datetime)
+
+    def collect_async(self, sql, custom_run_datetime=None, operation_name=None):
+        return self._run_async_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.collect_async,
+            sql=sql,
+            custom_run_datetime=custom_run_datetime)
+
+    def collect_list_async(
+            self,
+            sql: str,
+            custom_run_datetime: typing.Optional[str] = None,
+            record_as_dict: bool = False,
+            operation_name=None):
+        return self._run_async_operation(
+            operation_name=operation_name,
+            method=self._dataset_manager.collect_list_async,
+            sql=sql,
+            custom_run_datetime=custom_run_datetime,
+            record_as_dict=record_as_dict)
+
+    def parallel(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        return self._dataset_manager.parallel(max_concurrency)
+
+    def script(self, temp_tables=True):
+        if self._peek or self._operation_name is not None:
+            # a single operation is run
+            return contextlib.nullcontext()
+        return self._dataset_manager.script(temp_tables)
+
     def create_table(self, create_query, operation_name=None):
         if self._should_run_operation(operation_name):
             return self._results_container, self._dataset_manager.create_table(create_query=create_query)
@@ -387,23 +658,131 @@ class OperationLevelDatasetManager(Dataset):
                 custom_run_datetime=custom_run_datetime,
                 partitioned=partitioned)
 
+    def copy_table(
+            self,
+            source_table,
+            destination_table,
+            partitioned=True,
+            custom_run_datetime=None,
+            write_disposition='WRITE_TRUNCATE',
+            operation_name=None):
+        if self._should_run_writing_operation(operation_name):
+            return self._dataset_manager.copy_table(
+                source_table=source_table,
+                destination_table=destination_table,
+                partitioned=partitioned,
+                custom_run_datetime=custom_run_datetime,
+                write_disposition=write_disposition)
+
+    def copy_table_async(
+            self,
+            source_table,
+            destination_table,
+            partitioned=True,
+            custom_run_datetime=None,
+            write_disposition='WRITE_TRUNCATE',
+            operation_name=None):
+        if not self._should_run_writing_operation(operation_name):
+            return CompletedFuture(None)
+        return self._dataset_manager.copy_table_async(
+            source_table=source_table,
+            destination_table=destination_table,
+            partitioned=partitioned,
+            custom_run_datetime=custom_run_datetime,
+            write_disposition=write_disposition)
+
+    def extract(
+            self,
+            tables,
+            uri_pattern,
+            destination_format=PARQUET,
+            compression=None,
+            partitioned=False,
+            custom_run_datetime=None,
+            max_concurrency=DEFAULT_MAX_CONCURRENCY,
+            operation_name=None):
+        if self._should_run_writing_operation(operation_name):
+            return self._dataset_manager.extract(
+                tables=tables,
+                uri_pattern=uri_pattern,
+                destination_format=destination_format,
+                compression=compression,
+                partitioned=partitioned,
+                custom_run_datetime=custom_run_datetime,
+                max_concurrency=max_concurrency)
+        return []
+
+    def extract_async(
+            self,
+            table_name,
+            uri_pattern,
+            destination_format=PARQUET,
+            compression=None,
+            partitioned=False,
+            custom_run_datetime=None,
+            operation_name=None):
+        if not self._should_run_writing_operation(operation_name):
+            return CompletedFuture(None)
+        return self._dataset_manager.extract_async(
+            table_name=table_name,
+            uri_pattern=uri_pattern,
+            destination_format=destination_format,
+            compression=compression,
+            partitioned=partitioned,
+            custom_run_datetime=custom_run_datetime)
+
+    def read_extracted(
+            self,
+            uri_pattern,
+            destination_format=PARQUET,
+            max_workers=DEFAULT_MAX_WORKERS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        return self._dataset_manager.read_extracted(uri_pattern, destination_format, max_workers, max_queue_size)
+
+    def snapshot_table(
+            self,
+            source_table,
+            snapshot_table,
+            expiration_days=None,
+            snapshot_time=None,
+            operation_name=None):
+        if self._should_run_writing_operation(operation_name):
+            return self._dataset_manager.snapshot_table(
+                source_table=source_table,
+                snapshot_table=snapshot_table,
+                expiration_days=expiration_days,
+                snapshot_time=snapshot_time)
+
+    def clone_table(self, source_table, clone_table, snapshot_time=None, operation_name=None):
+        if self._should_run_writing_operation(operation_name):
+            return self._dataset_manager.clone_table(
+                source_table=source_table,
+                clone_table=clone_table,
+                snapshot_time=snapshot_time)
+
     def create_table_from_schema(
             self,
             table_name: str,
-            schema: typing.Union[typing.List[dict], Path, None] = None,
+            schema: typing.Union[typing.List[dict], dict, Path, None] = None,
             table=None,
+            table_options=None,
             operation_name=None):
         if self._should_run_operation(operation_name):
             return self._results_container, self._dataset_manager.create_table_from_schema(
                 table_name=table_name,
                 schema=schema,
-                table=table)
+                table=table,
+                table_options=table_options)
 
     def insert(
             self,
             table_name: str,
-            records: typing.Union[typing.List[dict], Path],
+            records: typing.Union[typing.Iterable[dict], Path],
             partitioned: bool = True,
+            bulk: bool = False,
+            source_format: str = NEWLINE_DELIMITED_JSON,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_concurrency: int = 1,
             operation_name=None):
         if self._should_peek_operation_results(operation_name):
             return records
@@ -411,7 +790,30 @@ class OperationLevelDatasetManager(Dataset):
             return self._results_container, self._dataset_manager.insert(
                 table_name=table_name,
                 records=records,
-                partitioned=partitioned)
+                partitioned=partitioned,
+                bulk=bulk,
+                source_format=source_format,
+                chunk_size=chunk_size,
+                max_concurrency=max_concurrency)
+
+    def open_writer(
+            self,
+            table_name: str,
+            partitioned: bool = True,
+            custom_run_datetime: typing.Optional[str] = None,
+            stream_type: str = PENDING,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+            operation_name=None):
+        if self._should_run_operation(operation_name) and not self._should_peek_operation_results(operation_name):
+            return self._dataset_manager.open_writer(
+                table_name=table_name,
+                partitioned=partitioned,
+                custom_run_datetime=custom_run_datetime,
+                stream_type=stream_type,
+                batch_size=batch_size,
+                max_in_flight=max_in_flight)
+        return DiscardingWriter()
 
     def delete_dataset(self, operation_name=None):
         if self._should_run_operation(operation_name):
@@ -464,12 +866,21 @@ class OperationLevelDatasetManager(Dataset):
             import pandas as pd
             return pd.DataFrame()
 
+    def _run_async_operation(self, operation_name, method, sql, *args, **kwargs):
+        if self._should_peek_operation_results(operation_name) or not self._should_run_operation(operation_name):
+            return CompletedFuture(self._run_operation(operation_name, method, sql, *args, **kwargs))
+        return method(*args, sql=sql, **kwargs)
+
     def _should_peek_operation_results(self, operation_name):
         return self._operation_name == operation_name and self._peek is not None
 
     def _should_run_operation(self, operation_name):
         return self._operation_name == operation_name or self._operation_name is None
 
+    def _should_run_writing_operation(self, operation_name):
+        # operations without SQL have nothing to peek, they are skipped
+        return self._should_run_operation(operation_name) and not self._should_peek_operation_results(operation_name)
+
 
 class DatasetConfigInternal(object):
 
@@ -480,7 +891,10 @@ class DatasetConfigInternal(object):
                  external_tables=None,
                  credentials=None,
                  extras=None,
-                 location=DEFAULT_LOCATION):
+                 location=DEFAULT_LOCATION,
+                 backend=None,
+                 use_query_parameters=False,
+                 cache_tmp_tables=False):
         self.project_id = project_id
         self.dataset_name = dataset_name
         self.internal_tables = internal_tables or []
@@ -488,6 +902,9 @@ class DatasetConfigInternal(object):
         self.credentials = credentials or None
         self.extras = extras or {}
         self.location = location
+        self.backend = backend
+        self.use_query_parameters = use_query_parameters
+        self.cache_tmp_tables = cache_tmp_tables
 
     def _as_dict(self):
         return {
@@ -497,7 +914,10 @@ class DatasetConfigInternal(object):
             'external_tables': self.external_tables,
             'credentials': self.credentials,
             'extras': self.extras,
-            'location': self.location
+            'location': self.location,
+            'backend': self.backend,
+            'use_query_parameters': self.use_query_parameters,
+            'cache_tmp_tables': self.cache_tmp_tables,
         }
 
 
@@ -52,8 +52,9 @@ class Dataset(ABC):
     def create_table_from_schema(
             self,
             table_name: str,
-            schema: typing.Union[typing.List[dict], Path, None] = None,
-            table=None):
+            schema: typing.Union[typing.List[dict], dict, Path, None] = None,
+            table=None,
+            table_options=None):
         pass
 
     @abstractmethod
@@ -4,6 +4,8 @@ from inspect import getargspec
 
 from bigflow.workflow import DEFAULT_EXECUTION_TIMEOUT_IN_SECONDS
 from .dataset_manager import create_dataset_manager
+from .stats import StatsCollector
+from .budget import job_budget
 
 import logging
 logger = logging.getLogger(__name__)
@@ -20,6 +22,7 @@ class Job(bigflow.Job):
                  retry_count=DEFAULT_RETRY_COUNT,
                  retry_pause_sec=DEFAULT_RETRY_PAUSE_SEC,
                  execution_timeout_sec=DEFAULT_EXECUTION_TIMEOUT_IN_SECONDS,
+                 maximum_bytes_billed=None,
                  **dependency_configuration):
         self.id = id or component.__name__
         logger.debug("Init bigquery Job with id %s", self.id)
@@ -29,16 +32,26 @@ class Job(bigflow.Job):
         self.retry_count = retry_count
         self.retry_pause_sec = retry_pause_sec
         self.execution_timeout_sec = execution_timeout_sec
+        self.maximum_bytes_billed = maximum_bytes_billed
 
     def execute(self, context: bigflow.JobContext):
         logger.info("Execute job %s: %s", self.id, context)
-        return self._run_component(self._build_dependencies(context.runtime_str))
+        stats = StatsCollector(self.id, context.runtime_str)
+        budget = job_budget(self.id, self.maximum_bytes_billed, context.resources)
+        try:
+            return self._run_component(
+                self._build_dependencies(context.runtime_str, context.resources, stats, budget))
+        finally:
+            stats.log_summary()
 
-    def _build_dependencies(self, runtime):
+    def _build_dependencies(self, runtime, resources=None, stats=None, budget=None):
         deps = {
             dependency_name: self._build_dependency(
                 dependency_config=self._find_config(dependency_name),
-                runtime=runtime)
+                runtime=runtime,
+                resources=resources,
+                stats=stats,
+                budget=budget)
             for dependency_name in self._component_dependencies
         }
         logger.debug("Dependencies for %s are: %s", self.id, deps)
@@ -64,9 +77,12 @@ class Job(bigflow.Job):
                 return config
         raise ValueError("Can't find config for dependency: " + target_dependency_name)
 
-    def _build_dependency(self, dependency_config, runtime):
+    def _build_dependency(self, dependency_config, runtime, resources=None, stats=None, budget=None):
         logger.debug("Build dataset manager for config %s", dependency_config)
         _, dataset_manager = create_dataset_manager(
             runtime=runtime,
+            resources=resources,
+            stats=stats,
+            budget=budget,
             **dependency_config._as_dict())
         return dataset_manager
\ No newline at end of file
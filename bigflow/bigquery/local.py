@@ -0,0 +1,670 @@
+"""Offline dataset manager running on an embedded DuckDB database.
+
+`LocalDatasetManager` implements the same operations as `DatasetManager`, so components can be tested
+without BigQuery credentials, in seconds. BigQuery datasets are DuckDB schemas (the project is ignored),
+partition decorators (`table$YYYYMMDD`) are emulated with the partitioning column of a table
+(`_PARTITIONTIME` column is added to ingestion-time partitioned tables), and SQL is translated to the DuckDB dialect
+by `translate_sql`. The translation is thin: it covers identifiers, literals, types and a few common functions only.
+
+Use it by passing `backend='local'` to `DatasetConfig` or by setting `bf_bigquery_backend=local` environment variable.
+"""
+
+import datetime
+import decimal
+import logging
+import os
+import re
+import typing
+from pathlib import Path
+
+from bigflow.workflow import ResourceRegistry
+from .parallel import QueryFuture
+from .bulk_load import iter_records, chunked, NEWLINE_DELIMITED_JSON, DEFAULT_CHUNK_SIZE
+from .backfill import RangeNotSupportedError
+from .script import WRITE_TMP, WRITE_TRUNCATE, WRITE_APPEND
+from .storage_read import DEFAULT_MAX_STREAMS, DEFAULT_MAX_QUEUE_SIZE
+from .storage_write import PENDING, DEFAULT_BATCH_SIZE, DEFAULT_MAX_IN_FLIGHT
+from .merge import MergeResult
+from .extract import ExtractedTable, PARQUET, CSV, NEWLINE_DELIMITED_JSON
+from .table_options import TableOptions, build_table, partition_range, DAY, RANGE
+
+# hidden duckdb, BQ and pandas imports due to https://github.com/allegro/bigflow/issues/149
+
+
+logger = logging.getLogger(__name__)
+
+
+DATABASE_ENV_VARIABLE = 'bf_bigquery_local_database'
+DEFAULT_DATABASE = ':memory:'
+
+INGESTION_TIME = '_PARTITIONTIME'
+_METADATA_SCHEMA = 'bigflow_local'
+
+_TOKENS = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)""", re.S)
+
+_REWRITES = [
+    (re.compile(r'\bSTRING\b', re.I), 'VARCHAR'),
+    (re.compile(r'\bINT64\b', re.I), 'BIGINT'),
+    (re.compile(r'\bFLOAT64\b', re.I), 'DOUBLE'),
+    (re.compile(r'\bBYTES\b', re.I), 'BLOB'),
+    (re.compile(r'\b(?:BIG)?NUMERIC\b', re.I), 'DECIMAL(38, 9)'),
+    (re.compile(r'\bARRAY\s*<\s*([\w(), ]+?)\s*>', re.I), r'\1[]'),
+    (re.compile(r'\bSAFE_CAST\s*\(', re.I), 'TRY_CAST('),
+    (re.compile(r'\bCOUNTIF\s*\(', re.I), 'count_if('),
+    (re.compile(r'\b(?:TIMESTAMP|DATETIME)\s*\(', re.I), 'bq_timestamp('),
+    (re.compile(r'\bDATE\s*\(', re.I), 'bq_date('),
+    (re.compile(r'\bDATETIME\b', re.I), 'TIMESTAMP'),
+    (re.compile(r'\bCURRENT_(TIMESTAMP|DATE)\s*\(\s*\)', re.I), r'CURRENT_\1'),
+    (re.compile(r'\*\s*EXCEPT\s*\(', re.I), '* EXCLUDE ('),
+    (re.compile(r'\b_PARTITIONDATE\b', re.I), f'CAST({INGESTION_TIME} AS DATE)'),
+]
+
+_MACROS = [
+    'CREATE OR REPLACE TEMP MACRO bq_timestamp(x) AS CAST(x AS TIMESTAMP)',
+    'CREATE OR REPLACE TEMP MACRO bq_date(x) AS CAST(x AS DATE)',
+]
+
+_COLUMN_TYPES = {
+    'STRING': 'VARCHAR',
+    'GEOGRAPHY': 'VARCHAR',
+    'BYTES': 'BLOB',
+    'INTEGER': 'BIGINT',
+    'INT64': 'BIGINT',
+    'FLOAT': 'DOUBLE',
+    'FLOAT64': 'DOUBLE',
+    'BOOLEAN': 'BOOLEAN',
+    'BOOL': 'BOOLEAN',
+    'DATE': 'DATE',
+    'TIME': 'TIME',
+    'TIMESTAMP': 'TIMESTAMP',
+    'DATETIME': 'TIMESTAMP',
+    'NUMERIC': 'DECIMAL(38, 9)',
+    'BIGNUMERIC': 'DECIMAL(38, 9)',
+}
+
+
+def _quote(identifier: str) -> str:
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+def _translate_identifier(token: str) -> str:
+    parts = token.strip('`').split('.')
+    return '.'.join(_quote(p) for p in parts[-2:])
+
+
+def _translate_string(token: str) -> str:
+    content = token[1:-1].replace("\\'", "'").replace('\\"', '"')
+    return "'{}'".format(content.replace("'", "''"))
+
+
+_PARAMETER = re.compile(r'(?<!@)@(\w+)')
+
+
+def sql_literal(value) -> str:
+    """DuckDB literal of a query parameter value."""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (list, tuple)):
+        return '[{}]'.format(', '.join(sql_literal(v) for v in value))
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return repr(value) if isinstance(value, float) else str(value)
+    if isinstance(value, datetime.datetime):
+        return f"TIMESTAMP '{value.isoformat(sep=' ')}'"
+    if isinstance(value, datetime.date):
+        return f"DATE '{value.isoformat()}'"
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def _bind_parameters(token: str, query_parameters: typing.Mapping[str, typing.Any]) -> str:
+    def bind(match):
+        if match.group(1) not in query_parameters:
+            raise ValueError(f"Query parameter @{match.group(1)} is not provided")
+        return sql_literal(query_parameters[match.group(1)])
+    return _PARAMETER.sub(bind, token)
+
+
+def translate_sql(sql: str, query_parameters: typing.Optional[typing.Mapping[str, typing.Any]] = None) -> str:
+    """
+    Translates BigQuery standard SQL to the DuckDB dialect, named query parameters (`@name`) are bound as literals.
+
+    >>> translate_sql('SELECT SAFE_CAST(x AS INT64), "a" FROM `project.dataset.table` WHERE _PARTITIONDATE = DATE("2020-01-01")')
+    'SELECT TRY_CAST(x AS BIGINT), \\'a\\' FROM "dataset"."table" WHERE CAST(_PARTITIONTIME AS DATE) = bq_date(\\'2020-01-01\\')'
+    """
+    result = []
+    for i, token in enumerate(_TOKENS.split(sql)):
+        if i % 2 == 0:
+            for pattern, replacement in _REWRITES:
+                token = pattern.sub(replacement, token)
+            if query_parameters:
+                token = _bind_parameters(token, query_parameters)
+            result.append(token)
+        elif token.startswith('`'):
+            result.append(_translate_identifier(token))
+        else:
+            result.append(_translate_string(token))
+    return ''.join(result)
+
+
+def _remove_options(sql: str) -> str:
+    """Removes `OPTIONS(...)` clauses (which may contain parentheses within string literals)."""
+    while True:
+        match = re.search(r'\bOPTIONS\s*\(', sql, re.I)
+        if not match:
+            return sql
+        depth, quote, i = 1, None, match.end()
+        while i < len(sql) and depth:
+            char = sql[i]
+            if quote:
+                if char == '\\':
+                    i += 1
+                elif char == quote:
+                    quote = None
+            elif char in '\'"':
+                quote = char
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            i += 1
+        sql = sql[:match.start()] + sql[i:]
+
+
+class TableDefinition(typing.NamedTuple):
+    sql: str
+    dataset: typing.Optional[str]
+    table: str
+    partition_field: typing.Optional[str]
+    partition_type: typing.Optional[str] = None
+
+
+def translate_ddl(create_query: str) -> TableDefinition:
+    """
+    Translates `CREATE TABLE` statement and extracts the partitioning column,
+    `PARTITION BY`, `CLUSTER BY` and `OPTIONS` clauses are not supported by DuckDB.
+    """
+    select = re.search(r'\bAS\s*(?=\(?\s*(?:SELECT|WITH)\b)', create_query, re.I)
+    head, tail = (create_query[:select.start()], create_query[select.start():]) if select else (create_query, '')
+
+    head = _remove_options(head)
+    partition_field = None
+    partition_type = None
+    partition = re.search(r'\bPARTITION\s+BY\s+(.+?)(?=\bCLUSTER\s+BY\b|;|$)', head, re.I | re.S)
+    if partition:
+        expression = partition.group(1).strip()
+        unit = re.search(r',\s*(HOUR|DAY|MONTH|YEAR)\s*\)', expression, re.I)
+        partition_type = RANGE if re.match(r'RANGE_BUCKET\b', expression, re.I) else \
+            (unit.group(1).upper() if unit else DAY)
+        if re.search(r'_PARTITION(?:DATE|TIME)', expression, re.I):
+            partition_field = INGESTION_TIME
+        else:
+            column = re.search(r'\(\s*`?(\w+)`?', expression) or re.match(r'`?(\w+)`?', expression)
+            partition_field = column.group(1)
+        head = head[:partition.start()] + head[partition.end():]
+    head = re.sub(r'\bCLUSTER\s+BY\s+.+?(?=;|$)', '', head, flags=re.I | re.S)
+
+    name = re.search(r'\bTABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(`[^`]+`|[\w.]+)', head, re.I)
+    if not name:
+        raise ValueError(f"Can't find a table name in: {create_query}")
+    parts = name.group(1).strip('`').split('.')
+    return TableDefinition(
+        sql=translate_sql(head.rstrip() + (' ' + tail if tail else '')),
+        dataset=parts[-2] if len(parts) > 1 else None,
+        table=parts[-1],
+        partition_field=partition_field,
+        partition_type=partition_type)
+
+
+def column_definition(field) -> str:
+    """DuckDB column type of `bigquery.SchemaField`."""
+    if field.field_type in ('RECORD', 'STRUCT'):
+        column_type = 'STRUCT({})'.format(', '.join(
+            f"{_quote(f.name)} {column_definition(f)}" for f in field.fields))
+    elif field.field_type in _COLUMN_TYPES:
+        column_type = _COLUMN_TYPES[field.field_type]
+    else:
+        raise ValueError(f"Column {field.name} of type {field.field_type} is not supported by the local backend")
+    if field.mode == 'REPEATED':
+        return column_type + '[]'
+    return column_type + (' NOT NULL' if field.mode == 'REQUIRED' else '')
+
+
+class LocalDataset(typing.NamedTuple):
+    project: str
+    dataset_id: str
+
+    @property
+    def full_dataset_id(self):
+        return f"{self.project}:{self.dataset_id}"
+
+
+class _CompletedJob(typing.NamedTuple):
+    job_id: str
+    value: typing.Any
+
+    def done(self):
+        return True
+
+    def result(self):
+        return self.value
+
+    def cancel(self):
+        return False
+
+
+class LocalTable(typing.NamedTuple):
+    dataset: str
+    table: str
+    partition: typing.Optional[str]
+
+    @property
+    def name(self):
+        return f"{_quote(self.dataset)}.{_quote(self.table)}"
+
+
+def get_connection(database: typing.Optional[str] = None, resources: typing.Optional[ResourceRegistry] = None):
+    """DuckDB connection to the database shared by all local dataset managers, in-memory database by default."""
+    import duckdb
+    from .dataset_manager import client_pool
+    database = database or os.environ.get(DATABASE_ENV_VARIABLE) or DEFAULT_DATABASE
+    resources = resources if resources is not None else client_pool
+    return resources.get_or_create(('duckdb', database), lambda: duckdb.connect(database), teardown=lambda c: c.close())
+
+
+class LocalDatasetManager(object):
+    """
+    Manages IO operations on a local DuckDB database, the same way `DatasetManager` does on BigQuery.
+    """
+    def __init__(self, connection, project_id, dataset_name, logger):
+        self.bigquery_client = None
+        self.dataset = LocalDataset(project_id, dataset_name)
+        self.dataset_id = f"{project_id}.{dataset_name}"
+        self.logger = logger
+        # each manager uses its own cursor, so it can be used from a separate thread
+        self.connection = connection.cursor()
+        self.connection.execute(f"CREATE SCHEMA IF NOT EXISTS {_quote(dataset_name)}")
+        self.connection.execute(f"CREATE SCHEMA IF NOT EXISTS {_METADATA_SCHEMA}")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {_METADATA_SCHEMA}.partitioning "
+            "(dataset VARCHAR, table_name VARCHAR, field VARCHAR)")
+        self.connection.execute(
+            f"ALTER TABLE {_METADATA_SCHEMA}.partitioning ADD COLUMN IF NOT EXISTS partition_type VARCHAR")
+        self.connection.execute(f"SET schema = '{dataset_name}'")
+        for macro in _MACROS:
+            self.connection.execute(macro)
+
+    def write_tmp(self, table_id, sql, query_parameters=None):
+        table = self._table(table_id)
+        self.logger.info('WRITE_TRUNCATE to %s', table_id)
+        self.connection.execute(f"CREATE OR REPLACE TABLE {table.name} AS {translate_sql(sql, query_parameters)}")
+
+    def write(self, table_id, sql, mode, query_parameters=None):
+        table = self._table(table_id)
+        self.logger.info('%s to %s', mode, table_id)
+        self.connection.begin()
+        try:
+            if mode == 'WRITE_TRUNCATE':
+                self._delete_partition(table)
+            self._insert_select(table, translate_sql(sql, query_parameters))
+        except Exception:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
+    def write_truncate(self, table_id, sql, query_parameters=None):
+        self.table_exists_or_error(table_id)
+        return self.write(table_id, sql, 'WRITE_TRUNCATE', query_parameters)
+
+    def write_append(self, table_id, sql, query_parameters=None):
+        self.table_exists_or_error(table_id)
+        return self.write(table_id, sql, 'WRITE_APPEND', query_parameters)
+
+    def write_merge(self, table_id, sql, keys, query_parameters=None) -> MergeResult:
+        # DuckDB has no MERGE, matched rows are deleted and all rows of the query are inserted
+        self.table_exists_or_error(table_id)
+        table = self._table(table_id)
+        self.logger.info('MERGE into %s', table_id)
+        matched = ' AND '.join(f"{_quote(table.table)}.{_quote(k)} = source.{_quote(k)}" for k in keys)
+        condition, parameters = f"EXISTS (SELECT 1 FROM bigflow_merge_source source WHERE {matched})", []
+        if table.partition is not None:
+            field = _quote(self._partition_field(table))
+            condition += f" AND {field} >= ? AND {field} < ?"
+            parameters = list(partition_range(table.partition))
+        self.connection.begin()
+        try:
+            self.connection.execute(
+                f"CREATE OR REPLACE TEMP TABLE bigflow_merge_source AS {translate_sql(sql, query_parameters)}")
+            rows = self.connection.execute("SELECT COUNT(*) FROM bigflow_merge_source").fetchone()[0]
+            updated = self.connection.execute(
+                f"SELECT COUNT(*) FROM {table.name} WHERE {condition}", parameters).fetchone()[0]
+            self.connection.execute(f"DELETE FROM {table.name} WHERE {condition}", parameters)
+            self._insert_select(table, "SELECT * FROM bigflow_merge_source")
+            self.connection.execute("DROP TABLE bigflow_merge_source")
+        except Exception:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+        return MergeResult(inserted=rows - updated, updated=updated)
+
+    def copy_table(self, source_table_id, destination_table_id, write_disposition='WRITE_TRUNCATE'):
+        source, destination = self._table(source_table_id), self._table(destination_table_id)
+        if source.partition is not None:
+            raise ValueError("Copying a partition is not supported by the local backend")
+        self.logger.info('COPY %s to %s (%s)', source_table_id, destination_table_id, write_disposition)
+        if not self._exists(destination):
+            return self._create_copy(source, destination)
+        select = f"SELECT * FROM {source.name}"
+        if destination.partition is not None and INGESTION_TIME in self._columns(source):
+            select = f"SELECT * EXCLUDE ({INGESTION_TIME}) FROM {source.name}"
+        self.connection.begin()
+        try:
+            if write_disposition == 'WRITE_TRUNCATE':
+                self._delete_partition(destination)
+            self._insert_select(destination, select)
+        except Exception:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
+    def copy_table_async(
+            self,
+            source_table_id,
+            destination_table_id,
+            write_disposition='WRITE_TRUNCATE') -> QueryFuture:
+        return QueryFuture(lambda: _CompletedJob(
+            destination_table_id, self.copy_table(source_table_id, destination_table_id, write_disposition)))
+
+    def extract_async(self, table_id, destination_uri, destination_format=PARQUET, compression=None) -> QueryFuture:
+        return QueryFuture(lambda: _CompletedJob(
+            table_id, self.extract(table_id, destination_uri, destination_format, compression)))
+
+    def extract(self, table_id, destination_uri, destination_format=PARQUET, compression=None) -> ExtractedTable:
+        # a single file is written, the `*` wildcard is replaced with the number of the first BigQuery shard
+        formats = {PARQUET: 'PARQUET', CSV: 'CSV', NEWLINE_DELIMITED_JSON: 'JSON'}
+        if destination_uri.startswith('gs://'):
+            raise ValueError("The local backend extracts tables to local files only")
+        if destination_format not in formats:
+            raise ValueError(f"{destination_format} files are not supported by the local backend")
+        table = self._table(table_id)
+        select = f"SELECT * FROM {table.name}"
+        if table.partition is not None:
+            start, end = partition_range(table.partition)
+            field = _quote(self._partition_field(table))
+            select += (f" WHERE {field} >= TIMESTAMP '{start.isoformat(' ')}'"
+                       f" AND {field} < TIMESTAMP '{end.isoformat(' ')}'")
+        path = destination_uri.replace('*', '000000000000')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        options = [f"FORMAT {formats[destination_format]}"]
+        if compression is not None:
+            options.append(f"COMPRESSION {compression.lower()}")
+        if destination_format == CSV:
+            options.append("HEADER")
+        self.logger.info('EXTRACT %s to %s', table_id, path)
+        self.connection.execute(f"COPY ({select}) TO '{path.replace(chr(39), chr(39) * 2)}' ({', '.join(options)})")
+        return ExtractedTable(table_id, destination_uri, 1)
+
+    def snapshot_table(self, source_table_id, snapshot_table_id, expiration_days=None, snapshot_time=None):
+        # expiration and time travel are not emulated, a snapshot is a copy of the current table
+        self._create_copy(self._table(source_table_id), self._table(snapshot_table_id))
+
+    def clone_table(self, source_table_id, clone_table_id, snapshot_time=None):
+        self._create_copy(self._table(source_table_id), self._table(clone_table_id))
+
+    def _create_copy(self, source: LocalTable, destination: LocalTable):
+        self.connection.execute(f"CREATE TABLE {destination.name} AS SELECT * FROM {source.name}")
+        row = self.connection.execute(
+            f"SELECT field, partition_type FROM {_METADATA_SCHEMA}.partitioning WHERE dataset = ? AND table_name = ?",
+            [source.dataset, source.table]).fetchone()
+        if row is not None:
+            self._set_partitioning(destination, row[0], row[1])
+
+    def write_async(self, table_id, sql, mode, check_table_exists=False, query_parameters=None) -> QueryFuture:
+        def submit():
+            if check_table_exists:
+                self.table_exists_or_error(table_id)
+            return _CompletedJob(table_id, self.write(table_id, sql, mode, query_parameters))
+        return QueryFuture(submit)
+
+    def write_truncate_async(self, table_id, sql, query_parameters=None) -> QueryFuture:
+        return self.write_async(table_id, sql, 'WRITE_TRUNCATE', True, query_parameters)
+
+    def write_append_async(self, table_id, sql, query_parameters=None) -> QueryFuture:
+        return self.write_async(table_id, sql, 'WRITE_APPEND', True, query_parameters)
+
+    def write_tmp_async(self, table_id, sql, query_parameters=None) -> QueryFuture:
+        return QueryFuture(lambda: _CompletedJob(table_id, self.write_tmp(table_id, sql, query_parameters)))
+
+    def collect_async(self, sql, query_parameters=None) -> QueryFuture:
+        return QueryFuture(lambda: _CompletedJob('collect', self.collect(sql, query_parameters)))
+
+    def collect_list_async(self, sql: str, record_as_dict: bool = False, query_parameters=None) -> QueryFuture:
+        return QueryFuture(
+            lambda: _CompletedJob('collect_list', self.collect_list(sql, record_as_dict, query_parameters)))
+
+    def write_truncate_range(self, table_id, queries: typing.Dict[str, str]):
+        raise RangeNotSupportedError("Scripts are not supported by the local backend")
+
+    def run_script(self, statements):
+        # statements are run one by one, TEMP tables are regular tables of the dataset
+        operations = {WRITE_TMP: self.write_tmp, WRITE_TRUNCATE: self.write_truncate, WRITE_APPEND: self.write_append}
+        for statement in statements:
+            operations[statement.operation](statement.table_id, statement.sql)
+
+    def table_exists_or_error(self, table_id):
+        if not self._exists(self._table(table_id)):
+            raise ValueError('Table {id} does not exist'.format(id=table_id))
+
+    def create_table(self, create_query):
+        self.logger.info('CREATE TABLE: %s', create_query)
+        definition = translate_ddl(create_query)
+        table = LocalTable(definition.dataset or self.dataset.dataset_id, definition.table, None)
+        self.connection.execute(definition.sql)
+        if definition.partition_field:
+            self._set_partitioning(table, definition.partition_field, definition.partition_type)
+
+    def collect(self, sql, query_parameters=None):
+        return self._query(sql, query_parameters).df()
+
+    def collect_list(self, sql: str, record_as_dict: bool = False, query_parameters=None):
+        from google.cloud.bigquery.table import Row
+        cursor = self._query(sql, query_parameters)
+        names = [column[0] for column in cursor.description]
+        field_to_index = {name: i for i, name in enumerate(names)}
+        rows = cursor.fetchall()
+        return [dict(zip(names, r)) if record_as_dict else Row(r, field_to_index) for r in rows]
+
+    def collect_arrow(self, sql, max_streams=DEFAULT_MAX_STREAMS, query_parameters=None):
+        return self._query(sql, query_parameters).arrow()
+
+    def collect_batches(
+            self,
+            sql,
+            as_dataframe=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+            query_parameters=None):
+        reader = self._query(sql, query_parameters).fetch_record_batch()
+        return (batch.to_pandas() if as_dataframe else batch for batch in reader)
+
+    def collect_iter(
+            self,
+            sql,
+            record_as_dict=False,
+            max_streams=DEFAULT_MAX_STREAMS,
+            max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+            query_parameters=None):
+        from .storage_read import iter_rows
+        return iter_rows(
+            self.collect_batches(sql, max_streams=max_streams, query_parameters=query_parameters), record_as_dict)
+
+    def dry_run(self, sql, query_parameters=None):
+        self._query('EXPLAIN ' + sql, query_parameters)
+        return "This query will process 0.0 B and cost 0.0 USD."
+
+    def remove_dataset(self):
+        self.connection.execute(f"DROP SCHEMA IF EXISTS {_quote(self.dataset.dataset_id)} CASCADE")
+        self.connection.execute(
+            f"DELETE FROM {_METADATA_SCHEMA}.partitioning WHERE dataset = ?", [self.dataset.dataset_id])
+
+    def load_table_from_dataframe(self, table_id, df):
+        table = self._table(table_id)
+        self.connection.register('bigflow_dataframe', df)
+        try:
+            self._insert_select(table, 'SELECT * FROM bigflow_dataframe')
+        finally:
+            self.connection.unregister('bigflow_dataframe')
+
+    def table_exists(self, table_name):
+        return self._exists(LocalTable(self.dataset.dataset_id, table_name, None))
+
+    def create_table_from_schema(
+            self,
+            table_id: str,
+            schema: typing.Union[typing.List[dict], dict, Path, None] = None,
+            table=None,
+            table_options: typing.Optional[TableOptions] = None):
+        table = build_table(table_id, schema, table, table_options)
+
+        self.logger.info(f'CREATING TABLE FROM SCHEMA: {table.schema}')
+        local_table = LocalTable(table.dataset_id, table.table_id, None)
+        columns = [f"{_quote(f.name)} {column_definition(f)}" for f in table.schema]
+        partitioning = table.time_partitioning
+        if partitioning is not None and partitioning.field is None:
+            columns.append(f"{INGESTION_TIME} TIMESTAMP")
+        self.connection.execute(f"CREATE TABLE {local_table.name} ({', '.join(columns)})")
+        if table.range_partitioning is not None:
+            self._set_partitioning(local_table, table.range_partitioning.field, RANGE)
+        elif partitioning is not None:
+            self._set_partitioning(local_table, partitioning.field or INGESTION_TIME, partitioning.type_ or DAY)
+
+    def partition_type(self, table_id: str) -> typing.Optional[str]:
+        table = self._table(table_id)
+        if not self._exists(table):
+            return DAY
+        row = self.connection.execute(
+            f"SELECT partition_type FROM {_METADATA_SCHEMA}.partitioning WHERE dataset = ? AND table_name = ?",
+            [table.dataset, table.table]).fetchone()
+        if row is None:
+            return None
+        return row[0] or DAY
+
+    def insert(
+            self,
+            table_id: str,
+            records: typing.Union[typing.Iterable[dict], Path],
+            bulk: bool = False,
+            source_format: str = NEWLINE_DELIMITED_JSON,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_concurrency: int = 1):
+        import pandas as pd
+        self.logger.info('INSERTING RECORDS TO TABLE: %s', table_id)
+        count = 0
+        for chunk in chunked(iter_records(records), chunk_size):
+            self.load_table_from_dataframe(table_id, pd.DataFrame.from_records(chunk))
+            count += len(chunk)
+        return count
+
+    def open_writer(
+            self,
+            table_id: str,
+            stream_type: str = PENDING,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> 'LocalWriter':
+        return LocalWriter(self, table_id, batch_size)
+
+    def _query(self, sql, query_parameters=None):
+        self.logger.info('COLLECTING DATA: %s', sql)
+        return self.connection.execute(translate_sql(sql, query_parameters))
+
+    def _table(self, table_id: str) -> LocalTable:
+        table_id, _, partition = table_id.partition('$')
+        parts = table_id.split('.')
+        return LocalTable(parts[-2] if len(parts) > 1 else self.dataset.dataset_id, parts[-1], partition or None)
+
+    def _exists(self, table: LocalTable) -> bool:
+        return bool(self.connection.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = ? AND table_name = ?",
+            [table.dataset, table.table]).fetchone()[0])
+
+    def _partition_field(self, table: LocalTable) -> str:
+        row = self.connection.execute(
+            f"SELECT field FROM {_METADATA_SCHEMA}.partitioning WHERE dataset = ? AND table_name = ?",
+            [table.dataset, table.table]).fetchone()
+        if row is None:
+            raise ValueError(f"Table {table.dataset}.{table.table} is not partitioned")
+        return row[0]
+
+    def _set_partitioning(self, table: LocalTable, field: str, partition_type: typing.Optional[str] = DAY):
+        if field == INGESTION_TIME and INGESTION_TIME not in self._columns(table):
+            self.connection.execute(f"ALTER TABLE {table.name} ADD COLUMN {INGESTION_TIME} TIMESTAMP")
+        self.connection.execute(
+            f"DELETE FROM {_METADATA_SCHEMA}.partitioning WHERE dataset = ? AND table_name = ?",
+            [table.dataset, table.table])
+        self.connection.execute(
+            f"INSERT INTO {_METADATA_SCHEMA}.partitioning (dataset, table_name, field, partition_type) "
+            "VALUES (?, ?, ?, ?)", [table.dataset, table.table, field, partition_type])
+
+    def _columns(self, table: LocalTable) -> typing.List[str]:
+        return [r[0] for r in self.connection.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_schema = ? AND table_name = ?",
+            [table.dataset, table.table]).fetchall()]
+
+    def _delete_partition(self, table: LocalTable):
+        if table.partition is None:
+            self.connection.execute(f"DELETE FROM {table.name}")
+            return
+        start, end = partition_range(table.partition)
+        field = _quote(self._partition_field(table))
+        self.connection.execute(
+            f"DELETE FROM {table.name} WHERE {field} >= ? AND {field} < ?", [start, end])
+
+    def _insert_select(self, table: LocalTable, select_sql: str):
+        if table.partition is not None and self._partition_field(table) == INGESTION_TIME:
+            start, _ = partition_range(table.partition)
+            select_sql = f"SELECT *, TIMESTAMP '{start.isoformat(' ')}' AS {INGESTION_TIME} FROM ({select_sql})"
+        self.connection.execute(f"INSERT INTO {table.name} BY NAME {select_sql}")
+
+
+class LocalWriter(object):
+    """Writer of `LocalDatasetManager`, rows are inserted at once when the writer is closed."""
+
+    def __init__(self, dataset_manager: LocalDatasetManager, table_id: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self._dataset_manager = dataset_manager
+        self._table_id = table_id
+        self._batch_size = batch_size
+        self._rows = []
+        self._closed = False
+        self.rows_written = 0
+
+    def write(self, row: dict):
+        if self._closed:
+            raise ValueError("Writer is closed")
+        self._rows.append(row)
+
+    def write_rows(self, rows: typing.Iterable[dict]):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        pass
+
+    def close(self) -> int:
+        if not self._closed:
+            self._closed = True
+            self.rows_written = self._dataset_manager.insert(self._table_id, self._rows, chunk_size=self._batch_size)
+            self._rows = []
+        return self.rows_written
+
+    def abort(self):
+        self._closed = True
+        self._rows = []
+
+    def __enter__(self) -> 'LocalWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,97 @@
+"""Reusing intermediate tables whose SQL and inputs did not change.
+
+When `cache_tmp_tables` is enabled for a dataset, `write_tmp` computes a fingerprint of the rendered SQL,
+the query parameters and the last modification times of the tables read by the query (found with a dry run).
+The fingerprint is kept in the `bigflow_fingerprint` label of the written table. The next `write_tmp` with the
+same fingerprint reuses the table instead of running the query again. The label is removed before every `write_tmp`
+(with or without the cache), so a table rewritten by an interrupted or uncached write is never reused.
+
+A table's last modification time changes when any of its partitions changes, so a change of any partition
+of an input table invalidates the cache. Queries are never cached when they read views or external tables
+(their modification time doesn't follow the data), or call non-deterministic functions like `CURRENT_DATE`.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import typing
+
+
+logger = logging.getLogger(__name__)
+
+
+FINGERPRINT_LABEL = 'bigflow_fingerprint'
+FINGERPRINT_LENGTH = 40
+# BigQuery lists at most 50 tables read by a query
+MAX_REFERENCED_TABLES = 50
+
+_NON_DETERMINISTIC = re.compile(
+    r'\bCURRENT_(DATE|TIME|DATETIME|TIMESTAMP)\b|\b(RAND|GENERATE_UUID|SESSION_USER)\s*\(', re.I)
+
+
+def fingerprint(sql: str, query_parameters: typing.Optional[dict], input_versions: typing.Dict[str, str]) -> str:
+    content = json.dumps(
+        {'sql': sql, 'query_parameters': query_parameters or {}, 'inputs': input_versions},
+        sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def input_versions(bigquery_client, referenced_tables) -> typing.Optional[typing.Dict[str, str]]:
+    """Last modification times of the tables, None when any of them is not a regular table."""
+    if len(referenced_tables) >= MAX_REFERENCED_TABLES:
+        return None
+    versions = {}
+    for reference in referenced_tables:
+        table = bigquery_client.get_table(reference)
+        if table.table_type != 'TABLE' or table.modified is None:
+            logger.debug("%s is a %s, can't be cached", table.full_table_id, table.table_type)
+            return None
+        versions[f'{table.project}.{table.dataset_id}.{table.table_id}'] = table.modified.isoformat()
+    return versions
+
+
+def query_fingerprint(bigquery_client, sql: str, job_config, query_parameters=None) -> typing.Optional[str]:
+    """
+    Fingerprint of the query and its inputs, None when the result of the query can't be cached.
+    `job_config` is a `QueryJobConfig` of the query (e.g. with query parameters), it is sent as a dry run.
+    """
+    if _NON_DETERMINISTIC.search(sql):
+        return None
+    job_config.dry_run = True
+    job_config.use_query_cache = False
+    referenced_tables = bigquery_client.query(sql, job_config=job_config).referenced_tables
+    versions = input_versions(bigquery_client, referenced_tables)
+    if versions is None:
+        return None
+    return fingerprint(sql, query_parameters, versions)
+
+
+def is_materialized(bigquery_client, table_id: str, query_fingerprint: typing.Optional[str]) -> bool:
+    from google.api_core.exceptions import NotFound
+    if query_fingerprint is None:
+        return False
+    try:
+        table = bigquery_client.get_table(table_id)
+    except NotFound:
+        return False
+    return (table.labels or {}).get(FINGERPRINT_LABEL) == query_fingerprint
+
+
+def clear_fingerprint(bigquery_client, table_id: str):
+    from google.api_core.exceptions import NotFound
+    try:
+        save_fingerprint(bigquery_client, table_id, None)
+    except NotFound:
+        pass
+
+
+def save_fingerprint(bigquery_client, table_id: str, query_fingerprint: typing.Optional[str]):
+    table = bigquery_client.get_table(table_id)
+    labels = dict(table.labels or {})
+    if query_fingerprint is None and FINGERPRINT_LABEL not in labels:
+        return
+    # a label set to None is removed
+    labels[FINGERPRINT_LABEL] = query_fingerprint
+    table.labels = labels
+    bigquery_client.update_table(table, ['labels'])
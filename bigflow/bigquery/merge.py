@@ -0,0 +1,159 @@
+"""Upserting query results with MERGE.
+
+`write_merge` updates the rows of a table which match the rows returned by the query on the key columns,
+and inserts the others. Rows of the table which are not returned by the query are left untouched.
+
+The target of the MERGE statement is restricted with constant bounds, so BigQuery reads only the affected
+partitions. For a partitioned write these are the bounds of the runtime partition (a row of the query outside
+the partition fails the statement, just like in `write_truncate`). For a non-partitioned write to a table partitioned
+by a column, the query result is staged in a table first, and the bounds are the minimum and the maximum
+of the partitioning column of the staged rows.
+"""
+
+import datetime
+import typing
+
+from .backfill import INGESTION_TIME, is_single_query, _subquery, _quoted_table_id
+from .table_options import partition_range
+
+
+TARGET = 'T'
+SOURCE = 'S'
+STAGING_TABLE_SUFFIX = '_merge_staging_'
+
+
+class MergeResult(typing.NamedTuple):
+    inserted: typing.Optional[int]
+    updated: typing.Optional[int]
+
+
+def _column(name: str, alias: typing.Optional[str] = None) -> str:
+    column = name if name == INGESTION_TIME else f"`{name}`"
+    return f"{alias}.{column}" if alias else column
+
+
+def literal(field_type: str, value) -> str:
+    """SQL literal of a value of a partitioning column."""
+    if field_type == 'DATE':
+        value = value.date() if isinstance(value, datetime.datetime) else value
+        return f"DATE '{value.isoformat()}'"
+    if field_type in ('DATETIME', 'TIMESTAMP'):
+        return f"{field_type} '{value.isoformat(' ')}'"
+    if field_type in ('INTEGER', 'INT64'):
+        return str(int(value))
+    raise ValueError(f"Unsupported type of a partitioning column: {field_type}")
+
+
+def partition_column(table) -> typing.Optional[typing.Tuple[str, str]]:
+    """Name and type of the partitioning column of `google.cloud.bigquery.Table`, None if there is none."""
+    if table.range_partitioning is not None:
+        name = table.range_partitioning.field
+    elif table.time_partitioning is not None:
+        name = table.time_partitioning.field
+        if name is None:
+            return INGESTION_TIME, 'TIMESTAMP'
+    else:
+        return None
+    field_type = next((f.field_type for f in table.schema if f.name == name), None)
+    if field_type is None:
+        raise ValueError(f"Partitioning column {name} is not a column of {table.table_id}")
+    return name, field_type
+
+
+def partition_condition(table, partition: str, alias: typing.Optional[str] = None) -> str:
+    """Condition on the rows of the partition (a decorator like `20200101`) of a time-partitioned table."""
+    column = partition_column(table)
+    if column is None or table.time_partitioning is None:
+        raise ValueError(f"Table {table.table_id} is not partitioned by time")
+    name, field_type = column
+    start, end = partition_range(partition)
+    return (f"{_column(name, alias)} >= {literal(field_type, start)} "
+            f"AND {_column(name, alias)} < {literal(field_type, end)}")
+
+
+def bounds_condition(
+        table,
+        minimum,
+        maximum,
+        has_nulls: bool,
+        alias: typing.Optional[str] = None) -> typing.Optional[str]:
+    """Condition on the rows with the partitioning column between `minimum` and `maximum` (both inclusive)."""
+    name, field_type = partition_column(table)
+    conditions = []
+    if minimum is not None:
+        conditions.append(
+            f"{_column(name, alias)} BETWEEN {literal(field_type, minimum)} AND {literal(field_type, maximum)}")
+    if has_nulls:
+        conditions.append(f"{_column(name, alias)} IS NULL")
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else f"({' OR '.join(conditions)})"
+
+
+def bounds_query(table, source_table_id: str) -> str:
+    """Query for the minimum and maximum of the partitioning column of the rows of the source table."""
+    name, _ = partition_column(table)
+    column = _column(name)
+    return f"SELECT MIN({column}) AS minimum, MAX({column}) AS maximum, COUNTIF({column} IS NULL) > 0 AS has_nulls " \
+           f"FROM `{source_table_id}`"
+
+
+def merge_statement(
+        table,
+        sql: str,
+        keys: typing.List[str],
+        partition: typing.Optional[str] = None,
+        target_condition: typing.Optional[str] = None) -> str:
+    """
+    MERGE statement which upserts the results of the query to the table (`google.cloud.bigquery.Table`)
+    or to its partition. The query has to return the columns of the table.
+    """
+    columns = [field.name for field in table.schema]
+    if not keys:
+        raise ValueError("At least one key column is required to merge")
+    unknown = [key for key in keys if key not in columns]
+    if unknown:
+        raise ValueError(f"Keys {', '.join(unknown)} are not columns of {table.table_id}")
+    if not is_single_query(sql):
+        raise ValueError(f"SQL of write_merge to {table.table_id} is a script, it can't be merged")
+
+    source = f"SELECT {', '.join(_column(c) for c in columns)} FROM {_subquery(sql)}"
+    insert_columns = [_column(c) for c in columns]
+    insert_values = [_column(c, SOURCE) for c in columns]
+    if partition is not None:
+        target_condition = partition_condition(table, partition, TARGET)
+        if table.time_partitioning.field is None:
+            insert_columns.insert(0, INGESTION_TIME)
+            insert_values.insert(0, literal('TIMESTAMP', partition_range(partition)[0]))
+        else:
+            source += (f"\nWHERE IF({partition_condition(table, partition)}, TRUE, "
+                       f"ERROR('Row outside of partition {partition}'))")
+
+    on = [f"{_column(key, TARGET)} = {_column(key, SOURCE)}" for key in keys]
+    if target_condition:
+        on.append(target_condition)
+    updates = [f"{_column(c)} = {_column(c, SOURCE)}" for c in columns if c not in keys]
+    lines = [
+        f"MERGE {_quoted_table_id(table)} {TARGET}",
+        f"USING {_subquery(source)} {SOURCE}",
+        f"ON {' AND '.join(on)}",
+    ]
+    if updates:
+        lines.append(f"WHEN MATCHED THEN UPDATE SET {', '.join(updates)}")
+    lines.append(f"WHEN NOT MATCHED THEN INSERT ({', '.join(insert_columns)}) VALUES ({', '.join(insert_values)})")
+    return '\n'.join(lines) + ';'
+
+
+def _int_or_none(value):
+    return None if value is None else int(value)
+
+
+def merge_result(job) -> MergeResult:
+    """Numbers of rows inserted and updated by a finished MERGE job."""
+    # `dml_stats` of a job is available since google-cloud-bigquery 2.13
+    dml_stats = getattr(job, 'dml_stats', None)
+    if dml_stats is not None:
+        return MergeResult(_int_or_none(dml_stats.inserted_row_count), _int_or_none(dml_stats.updated_row_count))
+    properties = getattr(job, '_properties', None) or {}
+    dml_stats = properties.get('statistics', {}).get('query', {}).get('dmlStats') or {}
+    return MergeResult(_int_or_none(dml_stats.get('insertedRowCount')), _int_or_none(dml_stats.get('updatedRowCount')))
@@ -0,0 +1,195 @@
+"""Non-blocking BigQuery operations.
+
+`*_async` methods of a dataset manager submit a query job and return a `QueryFuture` immediately.
+Independent operations run concurrently in BigQuery and are awaited together with `gather`
+or within the `ds.parallel()` block, which also limits the number of concurrently running jobs.
+The first failed operation cancels all the remaining ones (including BigQuery jobs which are already running).
+"""
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+import typing
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_CONCURRENCY = 10
+DEFAULT_POLL_INTERVAL_SEC = 1.0
+
+_PENDING = object()
+
+_local = threading.local()
+
+
+def current_concurrency() -> int:
+    """`max_concurrency` of the operation group starting an operation, 1 outside of groups."""
+    return getattr(_local, 'concurrency', 1)
+
+
+@contextlib.contextmanager
+def _concurrency(max_concurrency: int):
+    previous = current_concurrency()
+    _local.concurrency = max_concurrency
+    try:
+        yield
+    finally:
+        _local.concurrency = previous
+
+
+class QueryFuture(object):
+    """
+    Result of a BigQuery operation which is submitted by calling `submit` (returns `bigquery.QueryJob`).
+    The result is fetched from the finished job by `fetch_result`.
+    """
+    def __init__(
+            self,
+            submit: typing.Callable[[], typing.Any],
+            fetch_result: typing.Callable[[typing.Any], typing.Any] = lambda job: job.result()):
+        self._submit = submit
+        self._fetch_result = fetch_result
+        self._result = _PENDING
+        self._exception = None
+        self._cancelled = False
+        self.job = None
+
+    def start(self) -> 'QueryFuture':
+        if self.job is None and not self._cancelled:
+            try:
+                self.job = self._submit()
+            except Exception as e:
+                self._exception = e
+                raise
+        return self
+
+    @property
+    def started(self) -> bool:
+        return self.job is not None or self._exception is not None
+
+    def done(self) -> bool:
+        if self._result is not _PENDING or self._exception is not None or self._cancelled:
+            return True
+        return self.job is not None and self.job.done()
+
+    def result(self):
+        if self._cancelled:
+            raise CancelledOperationError("Operation was cancelled")
+        if self._exception is not None:
+            raise self._exception
+        if self._result is _PENDING:
+            self.start()
+            try:
+                self._result = self._fetch_result(self.job)
+            except Exception as e:
+                self._exception = e
+                raise
+        return self._result
+
+    def cancel(self) -> bool:
+        if self.done():
+            return False
+        self._cancelled = True
+        if self.job is not None:
+            logger.info("Cancel BigQuery job %s", self.job.job_id)
+            self.job.cancel()
+        return True
+
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+
+class CompletedFuture(QueryFuture):
+    """Future of an operation which was not sent to BigQuery (e.g. skipped or peeked operation)."""
+
+    def __init__(self, result):
+        super().__init__(submit=lambda: None)
+        self._result = result
+
+
+class CancelledOperationError(Exception):
+    pass
+
+
+class OperationGroup(object):
+    """
+    Runs up to `max_concurrency` operations at the same time and waits for all of them.
+    When any operation fails, the remaining operations are cancelled and the error is reraised.
+    """
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, poll_interval_sec: float = DEFAULT_POLL_INTERVAL_SEC):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency should be a positive number")
+        self.max_concurrency = max_concurrency
+        self.poll_interval_sec = poll_interval_sec
+        self._futures: typing.List[QueryFuture] = []
+        self._pending: typing.Deque[QueryFuture] = collections.deque()
+        self._running: typing.List[QueryFuture] = []
+
+    def add(self, future: QueryFuture) -> QueryFuture:
+        self._futures.append(future)
+        if future.started:
+            self._running.append(future)
+        else:
+            self._pending.append(future)
+        self._start_pending()
+        return future
+
+    def wait(self) -> list:
+        logger.debug("Wait for %d operations", len(self._futures))
+        while self._pending or self._running:
+            finished = [f for f in self._running if f.done()]
+            for future in finished:
+                self._running.remove(future)
+                self._fetch(future)
+            self._start_pending()
+            if not finished:
+                time.sleep(self.poll_interval_sec)
+        return [f.result() for f in self._futures]
+
+    def cancel(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        for future in self._running:
+            future.cancel()
+        self._running.clear()
+
+    def _start_pending(self):
+        while self._pending and len(self._running) < self.max_concurrency:
+            future = self._pending.popleft()
+            self._running.append(future)
+            with _concurrency(self.max_concurrency):
+                self._call_or_cancel(future.start)
+
+    def _fetch(self, future):
+        self._call_or_cancel(future.result)
+
+    def _call_or_cancel(self, fn):
+        try:
+            fn()
+        except Exception:
+            logger.error("Operation failed, cancel the remaining operations")
+            self.cancel()
+            raise
+
+    def __enter__(self) -> 'OperationGroup':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.wait()
+        else:
+            self.cancel()
+
+
+def gather(
+        *futures: QueryFuture,
+        max_concurrency: typing.Optional[int] = None,
+        poll_interval_sec: float = DEFAULT_POLL_INTERVAL_SEC) -> list:
+    """Waits for all the futures and returns their results, the first failure cancels all the remaining futures."""
+    group = OperationGroup(max_concurrency or max(1, len(futures)), poll_interval_sec)
+    for future in futures:
+        group.add(future)
+    return group.wait()
@@ -0,0 +1,204 @@
+"""Finding performance problems in query plans of finished BigQuery jobs.
+
+`analyze_plan` looks at the stages of a plan (`QueryJob.query_plan`) and warns about:
+* skewed stages - the slowest worker computes much longer than an average one (hot keys in JOIN or GROUP BY),
+* shuffle spills - a stage writes a lot of its output to disk instead of memory,
+* full scans of partitioned tables - a table is read without a filter on its partitioning column,
+* repartition-heavy joins - both sides of a join are shuffled, and the data is repartitioned several times.
+
+Warnings are logged next to the operation by dataset managers, and printed by `bigflow analyze-job`.
+"""
+
+import logging
+import re
+import typing
+
+from .stats import _human_bytes
+
+
+logger = logging.getLogger(__name__)
+
+
+SKEW = 'SKEW'
+SPILL = 'SPILL'
+FULL_SCAN = 'FULL_SCAN'
+REPARTITION_JOIN = 'REPARTITION_JOIN'
+
+DEFAULT_SKEW_RATIO = 5.0
+MIN_SKEWED_STAGE_MS = 10_000
+MIN_SPILLED_BYTES = 2 ** 30
+MIN_REPARTITION_STAGES = 2
+
+INGESTION_TIME_COLUMNS = ('_PARTITIONTIME', '_PARTITIONDATE')
+
+_FROM = re.compile(r'^FROM\s+`?([\w\-.:]+)`?', re.I)
+_COLUMN_ALIAS = re.compile(r'(\$\d+):(\w+)')
+
+
+class PlanWarning(typing.NamedTuple):
+    kind: str
+    stage: typing.Optional[str]
+    message: str
+
+    def __str__(self):
+        return f"[{self.kind}] {self.stage}: {self.message}" if self.stage else f"[{self.kind}] {self.message}"
+
+
+def _number(value) -> float:
+    return value if isinstance(value, (int, float)) else 0
+
+
+def _normalize_table_id(table_id: str) -> str:
+    return table_id.replace(':', '.').strip('`')
+
+
+def read_tables(query_plan) -> typing.List[str]:
+    """Ids of tables read by READ steps of the plan."""
+    tables = []
+    for stage in query_plan or ():
+        for step in stage.steps or ():
+            if step.kind != 'READ':
+                continue
+            for substep in step.substeps:
+                match = _FROM.match(substep.strip())
+                if match and _normalize_table_id(match.group(1)) not in tables:
+                    tables.append(_normalize_table_id(match.group(1)))
+    return tables
+
+
+def _skewed_stage(stage, skew_ratio) -> typing.Optional[PlanWarning]:
+    compute_avg, compute_max = _number(stage.compute_ms_avg), _number(stage.compute_ms_max)
+    if compute_avg <= 0 or compute_max < MIN_SKEWED_STAGE_MS or compute_max / compute_avg < skew_ratio:
+        return None
+    return PlanWarning(SKEW, stage.name, (
+        f"the slowest worker computed {compute_max / compute_avg:.1f}x longer than average "
+        f"({compute_max / 1000:.1f}s vs {compute_avg / 1000:.1f}s). "
+        "Look for hot keys in JOIN and GROUP BY columns (e.g. NULLs or default values), "
+        "filter them out or handle them separately."))
+
+
+def _spilling_stage(stage) -> typing.Optional[PlanWarning]:
+    spilled = _number(stage.shuffle_output_bytes_spilled)
+    if spilled < MIN_SPILLED_BYTES:
+        return None
+    return PlanWarning(SPILL, stage.name, (
+        f"{_human_bytes(spilled)} of the shuffle output spilled to disk. "
+        "Reduce the data before this stage: select fewer columns, filter or aggregate earlier."))
+
+
+def _full_scans(stage, partitioning_columns: typing.Mapping[str, str]) -> typing.List[PlanWarning]:
+    warnings = []
+    for step in stage.steps or ():
+        if step.kind != 'READ':
+            continue
+        substeps = [s.strip() for s in step.substeps]
+        tables = [_normalize_table_id(m.group(1)) for m in map(_FROM.match, substeps) if m]
+        where = ' '.join(s for s in substeps if s.upper().startswith('WHERE'))
+        aliases = dict((column.upper(), alias) for s in substeps for alias, column in _COLUMN_ALIAS.findall(s))
+        for table in tables:
+            column = _partitioning_column(table, partitioning_columns)
+            if column is None:
+                continue
+            names = INGESTION_TIME_COLUMNS if column in INGESTION_TIME_COLUMNS else (column,)
+            references = [n for n in names if n in where.upper()] + [
+                aliases[n.upper()] for n in names if n.upper() in aliases and aliases[n.upper()] in where]
+            if not references:
+                warnings.append(PlanWarning(FULL_SCAN, stage.name, (
+                    f"partitioned table {table} is read without a filter on {column}, all partitions are scanned. "
+                    f"Add a condition on {column} to the WHERE clause.")))
+    return warnings
+
+
+def _partitioning_column(table: str, partitioning_columns: typing.Mapping[str, str]) -> typing.Optional[str]:
+    for table_id, column in partitioning_columns.items():
+        table_id = _normalize_table_id(table_id)
+        if table_id == table or table_id.endswith('.' + table) or table.endswith('.' + table_id):
+            return column
+    return None
+
+
+def _repartition_joins(query_plan) -> typing.List[PlanWarning]:
+    repartitions = [s for s in query_plan if 'REPARTITION' in (s.name or '').upper()]
+    if len(repartitions) < MIN_REPARTITION_STAGES:
+        return []
+    shuffled = sum(_number(s.shuffle_output_bytes) for s in repartitions)
+    warnings = []
+    for stage in query_plan:
+        for step in stage.steps or ():
+            if step.kind == 'JOIN' and any('EACH WITH EACH' in s.upper() for s in step.substeps):
+                warnings.append(PlanWarning(REPARTITION_JOIN, stage.name, (
+                    f"both sides of the join are shuffled, and the plan has {len(repartitions)} repartition stages "
+                    f"which shuffle {_human_bytes(shuffled)}. Filter and aggregate the inputs before the join, "
+                    "put the largest table first, or make the other side small enough to be broadcast.")))
+                break
+    return warnings
+
+
+def analyze_plan(
+        query_plan,
+        partitioning_columns: typing.Optional[typing.Mapping[str, str]] = None,
+        skew_ratio: float = DEFAULT_SKEW_RATIO) -> typing.List[PlanWarning]:
+    """
+    Finds problems in stages of a query plan (list of `QueryPlanEntry`).
+    `partitioning_columns` maps ids of partitioned tables to their partitioning columns
+    (`_PARTITIONTIME` for ingestion-time partitioned tables), full scans are detected only for those tables.
+    """
+    query_plan = list(query_plan or ())
+    warnings = []
+    for stage in query_plan:
+        warnings.extend(filter(None, [_skewed_stage(stage, skew_ratio), _spilling_stage(stage)]))
+        warnings.extend(_full_scans(stage, partitioning_columns or {}))
+    warnings.extend(_repartition_joins(query_plan))
+    return warnings
+
+
+def partitioning_column(table) -> typing.Optional[str]:
+    """Partitioning column of `google.cloud.bigquery.Table`, None when the table is not partitioned."""
+    if table.time_partitioning is not None:
+        return table.time_partitioning.field or '_PARTITIONTIME'
+    if getattr(table, 'range_partitioning', None) is not None:
+        return table.range_partitioning.field
+    return None
+
+
+def analyze_job(job, get_table: typing.Optional[typing.Callable[[str], typing.Any]] = None) -> typing.List[PlanWarning]:
+    """
+    Analyzes the plan of a finished `QueryJob`. `get_table` (e.g. `bigquery.Client.get_table`) is used to find out
+    partitioning of the read tables, without it full scans are not detected.
+    """
+    query_plan = getattr(job, 'query_plan', None)
+    if not query_plan:
+        return []
+    partitioning_columns = {}
+    if get_table is not None:
+        for table_id in read_tables(query_plan):
+            try:
+                column = partitioning_column(get_table(table_id))
+            except Exception as e:
+                logger.debug("Can't get table %s: %r", table_id, e)
+                continue
+            if column is not None:
+                partitioning_columns[table_id] = column
+    return analyze_plan(query_plan, partitioning_columns)
+
+
+def format_plan(job, warnings: typing.List[PlanWarning]) -> str:
+    """Human readable report of the job stages and the warnings, printed by `bigflow analyze-job`."""
+    lines = [
+        f"Job {job.job_id}: {job.state}, processed {_human_bytes(_number(job.total_bytes_processed))}, "
+        f"billed {_human_bytes(_number(job.total_bytes_billed))}, slot ms {job.slot_millis}, cache hit {job.cache_hit}",
+        "",
+        f"{'stage':<32} {'compute avg/max ms':>20} {'records read':>14} {'records written':>16} {'spilled':>10}",
+    ]
+    for stage in job.query_plan or ():
+        lines.append("{:<32} {:>20} {:>14} {:>16} {:>10}".format(
+            stage.name,
+            f"{_number(stage.compute_ms_avg)}/{_number(stage.compute_ms_max)}",
+            _number(stage.records_read),
+            _number(stage.records_written),
+            _human_bytes(_number(stage.shuffle_output_bytes_spilled))))
+    lines.append("")
+    lines.extend(str(w) for w in warnings)
+    if not warnings:
+        lines.append("No problems found.")
+    return '\n'.join(lines)
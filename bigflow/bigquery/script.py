@@ -0,0 +1,129 @@
+"""Running a chain of write operations as one BigQuery multi-statement script.
+
+Within the `with ds.script():` block, `write_tmp`, `write_truncate` and `write_append` are not run one by one.
+They are collected and, when the block exits, sent as a single multi-statement script, so the scheduling latency
+of a BigQuery job is paid once. Tables written by `write_tmp` are TEMP tables of the script (unless
+`temp_tables=False`), they are not stored in the dataset and they are gone when the script ends.
+
+Each statement of a script runs as a child job of the script job. Statistics of child jobs are recorded
+per operation, and an error of a child job names the operation which failed.
+"""
+
+import bisect
+import re
+import typing
+
+from .backfill import partition_insert, is_single_query, _subquery
+
+
+WRITE_TMP = 'write_tmp'
+WRITE_TRUNCATE = 'write_truncate'
+WRITE_APPEND = 'write_append'
+
+_ERROR_POSITION = re.compile(r'at \[(\d+):\d+\]')
+
+
+class ScriptStatement(typing.NamedTuple):
+    operation: str
+    table_id: str
+    sql: str
+    temp: bool = False
+
+
+class ScriptError(ValueError):
+
+    def __init__(self, message: str, statement: typing.Optional[ScriptStatement] = None):
+        super().__init__(message)
+        self.statement = statement
+
+
+def _partition_date(partition: str) -> str:
+    if len(partition) != 8:
+        raise ValueError(f"Only daily partitions can be written in a script, got ${partition}")
+    return f"{partition[:4]}-{partition[4:6]}-{partition[6:]}"
+
+
+def _transaction(*statements: str) -> str:
+    return '\n'.join(['BEGIN TRANSACTION;', *statements, 'COMMIT TRANSACTION;'])
+
+
+def statement_sql(statement: ScriptStatement, table=None) -> str:
+    """
+    SQL of the operation. `table` (`google.cloud.bigquery.Table`) is the destination of `write_truncate`
+    and `write_append`, queries have to return its columns.
+    """
+    if not is_single_query(statement.sql):
+        raise ValueError(f"SQL of {statement.operation} to {statement.table_id} is a script, it can't be a statement")
+    table_id, _, partition = statement.table_id.partition('$')
+    if statement.operation == WRITE_TMP:
+        if statement.temp:
+            return f"CREATE OR REPLACE TEMP TABLE `{table_id.split('.')[-1]}` AS\n{_subquery(statement.sql)};"
+        return f"CREATE OR REPLACE TABLE `{table_id}` AS\n{_subquery(statement.sql)};"
+
+    if partition:
+        day = _partition_date(partition)
+        partition_date, insert = partition_insert(table, {day: statement.sql})
+        delete = f"DELETE FROM `{table_id}` WHERE {partition_date} = DATE '{day}';"
+    else:
+        columns = ', '.join(f"`{field.name}`" for field in table.schema)
+        insert = f"INSERT INTO `{table_id}` ({columns})\nSELECT {columns} FROM {_subquery(statement.sql)};"
+        delete = f"DELETE FROM `{table_id}` WHERE TRUE;"
+    if statement.operation == WRITE_APPEND:
+        return insert
+    return _transaction(delete, insert)
+
+
+def build_script(
+        statements: typing.List[ScriptStatement],
+        get_table: typing.Callable[[str], typing.Any]) -> typing.Tuple[str, typing.List[int]]:
+    """
+    The script and the first line (1-based) of each statement.
+    Unlike the operations run on their own, `write_truncate` and `write_append` don't create missing tables.
+    """
+    lines = []
+    start_lines = []
+    for statement in statements:
+        table = None if statement.operation == WRITE_TMP else _get_destination(statement, get_table)
+        start_lines.append(len(lines) + 1)
+        lines.extend(statement_sql(statement, table).split('\n'))
+    return '\n'.join(lines), start_lines
+
+
+def _get_destination(statement: ScriptStatement, get_table):
+    from google.api_core.exceptions import NotFound
+    table_id = statement.table_id.split('$')[0]
+    try:
+        return get_table(table_id)
+    except NotFound:
+        raise ScriptError(
+            f"{statement.operation} to {statement.table_id} can't be a part of a script, the table doesn't exist. "
+            "Create the table before the script, or write it outside of the script", statement)
+
+
+def statement_at(
+        statements: typing.List[ScriptStatement],
+        start_lines: typing.List[int],
+        line: typing.Optional[int]) -> typing.Optional[ScriptStatement]:
+    if line is None or line < 1:
+        return None
+    return statements[bisect.bisect_right(start_lines, line) - 1]
+
+
+def child_job_line(child_job) -> typing.Optional[int]:
+    """Line of the script where the statement run by the child job starts."""
+    script_statistics = getattr(child_job, 'script_statistics', None)
+    if script_statistics is None or not script_statistics.stack_frames:
+        return None
+    return script_statistics.stack_frames[0].start_line
+
+
+def failed_statement(
+        statements: typing.List[ScriptStatement],
+        start_lines: typing.List[int],
+        child_jobs: list,
+        error_message: str) -> typing.Optional[ScriptStatement]:
+    for child_job in child_jobs:
+        if child_job.error_result:
+            return statement_at(statements, start_lines, child_job_line(child_job))
+    match = _ERROR_POSITION.search(error_message)
+    return statement_at(statements, start_lines, int(match.group(1))) if match else None
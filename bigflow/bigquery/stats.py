@@ -0,0 +1,274 @@
+"""Statistics of BigQuery jobs run by dataset managers.
+
+Every query, load and insert issued by `DatasetManager` within a `bigflow.bigquery.Job` is described by `JobStats`
+(bytes processed and billed, slot-ms, cache hit, stage timings, BigQuery job id) tagged with the bigflow job id
+and runtime. The stats are passed to sinks and summarized in the job log when the job ends.
+
+Sinks are configured with `add_sink`, or with environment variables:
+`bf_bigquery_stats_file` (JSON lines file), `bf_bigquery_stats_textfile` (Prometheus textfile collector file)
+and `bf_bigquery_stats_log` (any value, logs stats of each operation).
+"""
+
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+import typing
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+
+JSON_LINES_ENV_VARIABLE = 'bf_bigquery_stats_file'
+PROMETHEUS_TEXTFILE_ENV_VARIABLE = 'bf_bigquery_stats_textfile'
+LOG_ENV_VARIABLE = 'bf_bigquery_stats_log'
+
+# on-demand pricing, USD per TiB
+TIB_COST = 5
+
+
+class StageStats(typing.NamedTuple):
+    name: str
+    duration_ms: typing.Optional[int]
+    slot_ms: typing.Optional[int]
+    records_read: typing.Optional[int]
+    records_written: typing.Optional[int]
+
+
+class JobStats(typing.NamedTuple):
+    job_id: str
+    runtime: str
+    operation: str
+    target: typing.Optional[str] = None
+    bigquery_job_id: typing.Optional[str] = None
+    bytes_processed: typing.Optional[int] = None
+    bytes_billed: typing.Optional[int] = None
+    slot_ms: typing.Optional[int] = None
+    cache_hit: typing.Optional[bool] = None
+    duration_sec: typing.Optional[float] = None
+    rows: typing.Optional[int] = None
+    stages: typing.Tuple[StageStats, ...] = ()
+
+    def to_json(self) -> dict:
+        result = self._asdict()
+        result['stages'] = [s._asdict() for s in self.stages]
+        return result
+
+
+def _millis(start: typing.Optional[datetime.datetime], end: typing.Optional[datetime.datetime]):
+    if start is None or end is None:
+        return None
+    return int((end - start).total_seconds() * 1000)
+
+
+def _int_or_none(value):
+    return None if value is None else int(value)
+
+
+def job_stats(job_id: str, runtime: str, operation: str, bigquery_job, target: typing.Optional[str] = None) -> JobStats:
+    """Reads statistics of a finished `QueryJob` or `LoadJob`."""
+    duration_ms = _millis(getattr(bigquery_job, 'started', None), getattr(bigquery_job, 'ended', None))
+    stages = tuple(
+        StageStats(
+            name=entry.name,
+            duration_ms=_millis(entry.start, entry.end),
+            # `slot_ms` of a stage is available since google-cloud-bigquery 2.0
+            slot_ms=_int_or_none(getattr(entry, 'slot_ms', None)),
+            records_read=_int_or_none(entry.records_read),
+            records_written=_int_or_none(entry.records_written))
+        for entry in getattr(bigquery_job, 'query_plan', None) or ())
+    return JobStats(
+        job_id=job_id,
+        runtime=runtime,
+        operation=operation,
+        target=target,
+        bigquery_job_id=getattr(bigquery_job, 'job_id', None),
+        bytes_processed=_int_or_none(getattr(bigquery_job, 'total_bytes_processed', None)),
+        bytes_billed=_int_or_none(getattr(bigquery_job, 'total_bytes_billed', None)),
+        slot_ms=_int_or_none(getattr(bigquery_job, 'slot_millis', None)),
+        cache_hit=getattr(bigquery_job, 'cache_hit', None),
+        duration_sec=None if duration_ms is None else duration_ms / 1000,
+        rows=_int_or_none(getattr(bigquery_job, 'output_rows', None)),
+        stages=stages)
+
+
+class StatsSink(object):
+    """Receives stats of every BigQuery operation."""
+
+    def emit(self, stats: JobStats):
+        raise NotImplementedError()
+
+
+class JsonLinesSink(StatsSink):
+    """Appends stats as JSON lines to the file."""
+
+    def __init__(self, path: typing.Union[str, Path]):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def emit(self, stats: JobStats):
+        line = json.dumps(stats.to_json(), sort_keys=True)
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+
+class PrometheusTextfileSink(StatsSink):
+    """
+    Keeps totals per job and operation, and rewrites the file for the node exporter textfile collector
+    (the file is replaced atomically, so the collector never reads a partial file).
+    """
+
+    _COUNTERS = [
+        ('bigflow_bigquery_operations_total', 'BigQuery operations run by dataset managers.', lambda s: 1),
+        ('bigflow_bigquery_bytes_processed_total', 'Bytes processed by BigQuery operations.', lambda s: s.bytes_processed),
+        ('bigflow_bigquery_bytes_billed_total', 'Bytes billed for BigQuery operations.', lambda s: s.bytes_billed),
+        ('bigflow_bigquery_slot_milliseconds_total', 'Slot time of BigQuery operations.', lambda s: s.slot_ms),
+        ('bigflow_bigquery_cache_hits_total', 'BigQuery operations answered from the query cache.', lambda s: int(bool(s.cache_hit))),
+        ('bigflow_bigquery_duration_seconds_total', 'Duration of BigQuery operations.', lambda s: s.duration_sec),
+        ('bigflow_bigquery_rows_total', 'Rows loaded or inserted by BigQuery operations.', lambda s: s.rows),
+    ]
+
+    def __init__(self, path: typing.Union[str, Path]):
+        self.path = Path(path)
+        self._totals: typing.Dict[typing.Tuple[str, str], typing.List[float]] = {}
+        self._lock = threading.Lock()
+
+    def emit(self, stats: JobStats):
+        with self._lock:
+            totals = self._totals.setdefault((stats.job_id, stats.operation), [0] * len(self._COUNTERS))
+            for i, (_, _, value) in enumerate(self._COUNTERS):
+                totals[i] += value(stats) or 0
+            self._write(self.render())
+
+    def render(self) -> str:
+        lines = []
+        for i, (name, description, _) in enumerate(self._COUNTERS):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for (job_id, operation), totals in sorted(self._totals.items()):
+                lines.append(f'{name}{{job_id="{_escape(job_id)}",operation="{operation}"}} {totals[i]}')
+        return '\n'.join(lines) + '\n'
+
+    def _write(self, content: str):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, self.path)
+
+
+def _escape(label_value: str) -> str:
+    return label_value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class LoggingSink(StatsSink):
+
+    def __init__(self, log: logging.Logger = logger, level: int = logging.INFO):
+        self.log = log
+        self.level = level
+
+    def emit(self, stats: JobStats):
+        self.log.log(
+            self.level, "BigQuery %s %s (job %s): processed %s, billed %s, slot ms %s, cache hit %s, %s sec",
+            stats.operation, stats.target or '', stats.bigquery_job_id,
+            _human_bytes(stats.bytes_processed), _human_bytes(stats.bytes_billed),
+            stats.slot_ms, stats.cache_hit, stats.duration_sec)
+
+
+_sinks: typing.List[StatsSink] = []
+_env_sinks: typing.Optional[typing.List[StatsSink]] = None
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink: StatsSink):
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def remove_sink(sink: StatsSink):
+    with _sinks_lock:
+        _sinks.remove(sink)
+
+
+def _sinks_from_env() -> typing.List[StatsSink]:
+    sinks = []
+    if os.environ.get(JSON_LINES_ENV_VARIABLE):
+        sinks.append(JsonLinesSink(os.environ[JSON_LINES_ENV_VARIABLE]))
+    if os.environ.get(PROMETHEUS_TEXTFILE_ENV_VARIABLE):
+        sinks.append(PrometheusTextfileSink(os.environ[PROMETHEUS_TEXTFILE_ENV_VARIABLE]))
+    if os.environ.get(LOG_ENV_VARIABLE):
+        sinks.append(LoggingSink())
+    return sinks
+
+
+def configured_sinks() -> typing.List[StatsSink]:
+    """Sinks added with `add_sink` and sinks configured by environment variables (created once per process)."""
+    global _env_sinks
+    with _sinks_lock:
+        if _env_sinks is None:
+            _env_sinks = _sinks_from_env()
+        return _sinks + _env_sinks
+
+
+class StatsCollector(object):
+    """Collects stats of BigQuery operations run by one bigflow job, for one runtime."""
+
+    def __init__(self, job_id: str, runtime: str, sinks: typing.Optional[typing.List[StatsSink]] = None):
+        self.job_id = job_id
+        self.runtime = runtime
+        self.sinks = configured_sinks() if sinks is None else sinks
+        self.stats: typing.List[JobStats] = []
+        self._lock = threading.Lock()
+
+    def record_job(self, operation: str, bigquery_job, target: typing.Optional[str] = None) -> JobStats:
+        return self.record(job_stats(self.job_id, self.runtime, operation, bigquery_job, target))
+
+    def record_rows(self, operation: str, rows: int, target: typing.Optional[str] = None) -> JobStats:
+        return self.record(JobStats(self.job_id, self.runtime, operation, target=target, rows=rows))
+
+    def record(self, stats: JobStats) -> JobStats:
+        with self._lock:
+            self.stats.append(stats)
+        for sink in self.sinks:
+            try:
+                sink.emit(stats)
+            except Exception:
+                logger.exception("Stats sink %s failed", sink)
+        return stats
+
+    def summary(self) -> str:
+        with self._lock:
+            stats = list(self.stats)
+        billed = sum(s.bytes_billed or 0 for s in stats)
+        lines = [
+            "BigQuery stats of job {} ({}): {} operations, processed {}, billed {} (~{:.2f} USD), slot ms {}, "
+            "cache hits {}".format(
+                self.job_id, self.runtime, len(stats),
+                _human_bytes(sum(s.bytes_processed or 0 for s in stats)), _human_bytes(billed),
+                billed / 2 ** 40 * TIB_COST, sum(s.slot_ms or 0 for s in stats), sum(bool(s.cache_hit) for s in stats)),
+        ]
+        for s in sorted(stats, key=lambda s: -(s.bytes_billed or 0)):
+            lines.append("  {:<16} {:<48} billed {:>10}, slot ms {}, {} sec".format(
+                s.operation, s.target or '', _human_bytes(s.bytes_billed), s.slot_ms, s.duration_sec))
+        return '\n'.join(lines)
+
+    def log_summary(self):
+        if self.stats:
+            logger.info("%s", self.summary())
+
+
+def _human_bytes(size: typing.Optional[int]) -> str:
+    """
+    >>> _human_bytes(3 * 2 ** 30)
+    '3.0 GB'
+    """
+    if size is None:
+        return '-'
+    size = float(size)
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size < 1024 or unit == 'TB':
+            break
+        size /= 1024
+    return f"{round(size, 2)} {unit}"
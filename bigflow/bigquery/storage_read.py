@@ -0,0 +1,137 @@
+"""Reading query results with the BigQuery Storage Read API.
+
+A result table is read in the Arrow format from several streams in parallel. Record batches are passed to the consumer
+through a bounded queue, so memory used by a reader does not depend on the size of the result.
+"""
+
+import functools
+import logging
+import queue
+import threading
+import typing
+
+# hidden BQ, BQ Storage and pyarrow imports due to https://github.com/allegro/bigflow/issues/149
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_STREAMS = 8
+DEFAULT_MAX_QUEUE_SIZE = 16
+
+_END_OF_STREAM = object()
+
+
+class _StreamError(typing.NamedTuple):
+    error: Exception
+
+
+def merge_streams(
+        streams: typing.Sequence[typing.Callable[[], typing.Iterable]],
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE) -> typing.Iterator:
+    """
+    Reads each stream in a separate thread and yields items in the order they arrive.
+    At most `max_queue_size` items wait for the consumer, stream readers are blocked until there is room in the queue.
+    The first error raised by any stream is reraised to the consumer and stops the remaining readers.
+    """
+    if max_queue_size < 1:
+        raise ValueError("max_queue_size should be a positive number")
+    if not streams:
+        return
+
+    items = queue.Queue(maxsize=max_queue_size)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read(stream):
+        try:
+            for item in stream():
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_StreamError(e))
+        else:
+            put(_END_OF_STREAM)
+
+    for i, stream in enumerate(streams):
+        threading.Thread(target=read, args=(stream,), name=f"bigquery-read-stream-{i}", daemon=True).start()
+
+    finished = 0
+    try:
+        while finished < len(streams):
+            item = items.get()
+            if item is _END_OF_STREAM:
+                finished += 1
+            elif isinstance(item, _StreamError):
+                raise item.error
+            else:
+                yield item
+    finally:
+        stopped.set()
+
+
+def create_bqstorage_client(bigquery_client):
+    from google.cloud import bigquery_storage
+    return bigquery_storage.BigQueryReadClient(credentials=bigquery_client._credentials)
+
+
+class ArrowTableReader(object):
+    """
+    Iterates over `pyarrow.RecordBatch` objects of a BigQuery table.
+    Streams of the read session are read in parallel, so the order of batches is not deterministic.
+    """
+    def __init__(
+            self,
+            bqstorage_client,
+            table,
+            parent_project: str,
+            max_streams: int = DEFAULT_MAX_STREAMS,
+            max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE):
+        from google.cloud import bigquery_storage
+        self._bqstorage_client = bqstorage_client
+        self._max_queue_size = max_queue_size
+        requested_session = bigquery_storage.types.ReadSession(
+            table=f"projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}",
+            data_format=bigquery_storage.types.DataFormat.ARROW)
+        self._session = bqstorage_client.create_read_session(
+            parent=f"projects/{parent_project}",
+            read_session=requested_session,
+            max_stream_count=max_streams)
+        logger.info("Read %s.%s.%s with %d streams",
+                    table.project, table.dataset_id, table.table_id, len(self._session.streams))
+
+    @property
+    def schema(self):
+        import pyarrow
+        return pyarrow.ipc.read_schema(pyarrow.py_buffer(self._session.arrow_schema.serialized_schema))
+
+    def __iter__(self):
+        return merge_streams(
+            [functools.partial(self._read_stream, stream.name) for stream in self._session.streams],
+            self._max_queue_size)
+
+    def read_all(self):
+        import pyarrow
+        return pyarrow.Table.from_batches(list(self), schema=self.schema)
+
+    def _read_stream(self, stream_name):
+        for page in self._bqstorage_client.read_rows(stream_name).rows(self._session).pages:
+            yield page.to_arrow()
+
+
+def iter_rows(batches: typing.Iterable, record_as_dict: bool = False) -> typing.Iterator:
+    """Turns record batches into `bigquery.Row` objects (or dicts), one batch is converted at a time."""
+    from google.cloud.bigquery.table import Row
+    for batch in batches:
+        names = batch.schema.names
+        field_to_index = {name: i for i, name in enumerate(names)}
+        for values in zip(*(column.to_pylist() for column in batch.columns)):
+            yield dict(zip(names, values)) if record_as_dict else Row(values, field_to_index)
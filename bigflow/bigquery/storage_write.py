@@ -0,0 +1,282 @@
+"""Writing rows with the BigQuery Storage Write API.
+
+Rows are serialized to protocol buffer messages built from the table schema and appended to a write stream in batches.
+Several appends are kept in flight, when the limit is reached `write` blocks until the oldest append is acknowledged.
+Rows written to a pending stream become visible in the table only when the writer is closed (committed exactly once).
+"""
+
+import collections
+import datetime
+import logging
+import typing
+
+# hidden BQ Storage imports due to https://github.com/allegro/bigflow/issues/149
+
+
+logger = logging.getLogger(__name__)
+
+
+PENDING = 'PENDING'
+COMMITTED = 'COMMITTED'
+
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_MAX_BATCH_BYTES = 8 * 1024 * 1024  # single AppendRows request is limited to 10 MB
+DEFAULT_MAX_IN_FLIGHT = 4
+
+_EPOCH_DATE = datetime.date(1970, 1, 1)
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _date_value(value):
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    return (value - _EPOCH_DATE).days
+
+
+def _timestamp_value(value):
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return (value - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _string_value(value):
+    return value.isoformat() if isinstance(value, (datetime.date, datetime.time)) else str(value)
+
+
+# BigQuery type -> (protobuf field type name, value converter), see
+# https://cloud.google.com/bigquery/docs/write-api#data_type_conversions
+_PROTO_TYPES = {
+    'STRING': ('TYPE_STRING', str),
+    'GEOGRAPHY': ('TYPE_STRING', str),
+    'BYTES': ('TYPE_BYTES', bytes),
+    'INTEGER': ('TYPE_INT64', int),
+    'INT64': ('TYPE_INT64', int),
+    'FLOAT': ('TYPE_DOUBLE', float),
+    'FLOAT64': ('TYPE_DOUBLE', float),
+    'BOOLEAN': ('TYPE_BOOL', bool),
+    'BOOL': ('TYPE_BOOL', bool),
+    'DATE': ('TYPE_INT32', _date_value),
+    'TIMESTAMP': ('TYPE_INT64', _timestamp_value),
+    'DATETIME': ('TYPE_STRING', _string_value),
+    'TIME': ('TYPE_STRING', _string_value),
+    'NUMERIC': ('TYPE_STRING', _string_value),
+    'BIGNUMERIC': ('TYPE_STRING', _string_value),
+}
+
+
+def proto_descriptor(schema, name: str = 'Row'):
+    """Builds `DescriptorProto` of messages matching the BigQuery table schema (list of `bigquery.SchemaField`)."""
+    from google.protobuf import descriptor_pb2
+    FieldDescriptorProto = descriptor_pb2.FieldDescriptorProto
+
+    descriptor = descriptor_pb2.DescriptorProto(name=name)
+    for number, field in enumerate(schema, start=1):
+        proto_field = descriptor.field.add(name=field.name, number=number)
+        if field.field_type in ('RECORD', 'STRUCT'):
+            nested_name = f"{field.name.capitalize()}Record"
+            descriptor.nested_type.add().CopyFrom(proto_descriptor(field.fields, nested_name))
+            proto_field.type = FieldDescriptorProto.TYPE_MESSAGE
+            proto_field.type_name = nested_name
+        elif field.field_type in _PROTO_TYPES:
+            proto_field.type = FieldDescriptorProto.Type.Value(_PROTO_TYPES[field.field_type][0])
+        else:
+            raise ValueError(f"Column {field.name} of type {field.field_type} can't be written with the Storage Write API")
+        if field.mode == 'REPEATED':
+            proto_field.label = FieldDescriptorProto.LABEL_REPEATED
+        elif field.mode == 'REQUIRED':
+            proto_field.label = FieldDescriptorProto.LABEL_REQUIRED
+        else:
+            proto_field.label = FieldDescriptorProto.LABEL_OPTIONAL
+    return descriptor
+
+
+def proto_message_class(descriptor):
+    from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(descriptor_pb2.FileDescriptorProto(
+        name=f"bigflow_{descriptor.name}.proto", package='bigflow', message_type=[descriptor]))
+    message_descriptor = pool.FindMessageTypeByName(f"bigflow.{descriptor.name}")
+    if hasattr(message_factory, 'GetMessageClass'):
+        return message_factory.GetMessageClass(message_descriptor)
+    return message_factory.MessageFactory(pool).GetPrototype(message_descriptor)
+
+
+def fill_message(message, schema, row: dict):
+    for field in schema:
+        value = row.get(field.name)
+        if value is None:
+            continue
+        if field.field_type in ('RECORD', 'STRUCT'):
+            if field.mode == 'REPEATED':
+                for item in value:
+                    fill_message(getattr(message, field.name).add(), field.fields, item)
+            else:
+                fill_message(getattr(message, field.name), field.fields, value)
+        else:
+            convert = _PROTO_TYPES[field.field_type][1]
+            if field.mode == 'REPEATED':
+                getattr(message, field.name).extend(convert(v) for v in value)
+            else:
+                setattr(message, field.name, convert(value))
+    return message
+
+
+class BoundedAppends(object):
+    """Keeps at most `max_in_flight` appends unacknowledged, adding a new one waits for the oldest."""
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight should be a positive number")
+        self.max_in_flight = max_in_flight
+        self._futures = collections.deque()
+
+    def add(self, future):
+        while len(self._futures) >= self.max_in_flight:
+            self._futures.popleft().result()
+        self._futures.append(future)
+
+    def wait_all(self):
+        while self._futures:
+            self._futures.popleft().result()
+
+    def __len__(self):
+        return len(self._futures)
+
+
+def table_path(table_id: str) -> str:
+    project, dataset, table = table_id.split('.')
+    return f"projects/{project}/datasets/{dataset}/tables/{table}"
+
+
+class StorageWriter(object):
+    """
+    Appends rows to a BigQuery table (or a partition, `table$YYYYMMDD`) with the Storage Write API.
+    Use it as a context manager: rows are committed when the block exits, and discarded when it raises an error.
+    """
+    def __init__(
+            self,
+            bigquery_client,
+            table_id: str,
+            stream_type: str = PENDING,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+            write_client=None):
+        from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types, writer
+        if stream_type not in (PENDING, COMMITTED):
+            raise ValueError(f"Unsupported stream type {stream_type}, use {PENDING} or {COMMITTED}")
+
+        self.table_id = table_id
+        self.stream_type = stream_type
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._types = types
+        self._table_path = table_path(table_id)
+        self._schema = bigquery_client.get_table(table_id.split('$')[0]).schema
+        descriptor = proto_descriptor(self._schema)
+        self._message_class = proto_message_class(descriptor)
+        self._write_client = write_client or BigQueryWriteClient(credentials=bigquery_client._credentials)
+
+        self._stream = self._write_client.create_write_stream(
+            parent=self._table_path,
+            write_stream=types.WriteStream(type_=getattr(types.WriteStream.Type, stream_type)))
+        logger.info("Open %s write stream %s", stream_type, self._stream.name)
+
+        request_template = types.AppendRowsRequest(write_stream=self._stream.name)
+        request_template.proto_rows.writer_schema.proto_descriptor = descriptor
+        self._append_rows_stream = writer.AppendRowsStream(self._write_client, request_template)
+        self._appends = BoundedAppends(max_in_flight)
+        self._batch = []
+        self._batch_bytes = 0
+        self._closed = False
+
+    def write(self, row: dict):
+        if self._closed:
+            raise ValueError("Writer is closed")
+        serialized = fill_message(self._message_class(), self._schema, row).SerializeToString()
+        if self._batch and self._batch_bytes + len(serialized) > DEFAULT_MAX_BATCH_BYTES:
+            self.flush()
+        self._batch.append(serialized)
+        self._batch_bytes += len(serialized)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_rows(self, rows: typing.Iterable[dict]):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        if not self._batch:
+            return
+        request = self._types.AppendRowsRequest()
+        # offsets make retried appends idempotent
+        request.offset = self.rows_written
+        request.proto_rows.rows.serialized_rows.extend(self._batch)
+        self._appends.add(self._append_rows_stream.send(request))
+        self.rows_written += len(self._batch)
+        self._batch = []
+        self._batch_bytes = 0
+
+    def close(self) -> int:
+        """Appends the remaining rows and commits them. Returns the number of written rows."""
+        if self._closed:
+            return self.rows_written
+        self.flush()
+        self._appends.wait_all()
+        self._closed = True
+        self._append_rows_stream.close()
+        self._write_client.finalize_write_stream(name=self._stream.name)
+        if self.stream_type == PENDING:
+            response = self._write_client.batch_commit_write_streams(self._types.BatchCommitWriteStreamsRequest(
+                parent=self._table_path.split('$')[0],
+                write_streams=[self._stream.name]))
+            if response.stream_errors:
+                raise ValueError(f"Failed to commit {self._stream.name}: {list(response.stream_errors)}")
+        logger.info("Written %d rows to %s", self.rows_written, self.table_id)
+        return self.rows_written
+
+    def abort(self):
+        """Stops writing, rows of a pending stream are never committed."""
+        if self._closed:
+            return
+        self._closed = True
+        self._batch = []
+        self._append_rows_stream.close()
+        logger.info("Aborted write stream %s", self._stream.name)
+
+    def __enter__(self) -> 'StorageWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class DiscardingWriter(object):
+    """Writer of an operation which is not run (e.g. other than the one selected by `operation_name`)."""
+
+    rows_written = 0
+
+    def write(self, row: dict):
+        pass
+
+    def write_rows(self, rows: typing.Iterable[dict]):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self) -> int:
+        return 0
+
+    def abort(self):
+        pass
+
+    def __enter__(self) -> 'DiscardingWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
@@ -0,0 +1,66 @@
+"""Copying tables without scanning them.
+
+`copy_table` runs a BigQuery copy job, `snapshot_table` and `clone_table` run `CREATE SNAPSHOT TABLE` and
+`CREATE TABLE ... CLONE` statements. None of them is billed for the bytes of the copied table, unlike
+`write_truncate('final', 'SELECT * FROM {tmp}')`, and they finish in seconds regardless of the table size.
+
+A snapshot is a read-only copy of a table as of a point in time, it is billed only for the data which changes
+in the source table later. A clone is a writable copy, also billed only for the data which differs from the source.
+"""
+
+import datetime
+import typing
+
+
+WRITE_TRUNCATE = 'WRITE_TRUNCATE'
+WRITE_APPEND = 'WRITE_APPEND'
+WRITE_EMPTY = 'WRITE_EMPTY'
+
+
+def _check_whole_table(table_id: str):
+    if '$' in table_id:
+        raise ValueError(f"Snapshots and clones are made of whole tables, got a partition {table_id}")
+
+
+def _system_time(snapshot_time: typing.Optional[datetime.datetime]) -> str:
+    if snapshot_time is None:
+        return ''
+    if snapshot_time.tzinfo is None:
+        snapshot_time = snapshot_time.replace(tzinfo=datetime.timezone.utc)
+    return f"\nFOR SYSTEM_TIME AS OF TIMESTAMP '{snapshot_time.isoformat(' ')}'"
+
+
+def snapshot_ddl(
+        source_table_id: str,
+        snapshot_table_id: str,
+        expiration_days: typing.Optional[float] = None,
+        snapshot_time: typing.Optional[datetime.datetime] = None) -> str:
+    """
+    >>> print(snapshot_ddl('p.d.events', 'p.d.events_snapshot', expiration_days=7))
+    CREATE SNAPSHOT TABLE `p.d.events_snapshot`
+    CLONE `p.d.events`
+    OPTIONS(expiration_timestamp = TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL 168 HOUR))
+    """
+    _check_whole_table(source_table_id)
+    _check_whole_table(snapshot_table_id)
+    ddl = f"CREATE SNAPSHOT TABLE `{snapshot_table_id}`\nCLONE `{source_table_id}`{_system_time(snapshot_time)}"
+    if expiration_days is not None:
+        hours = int(expiration_days * 24)
+        ddl += f"\nOPTIONS(expiration_timestamp = TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL {hours} HOUR))"
+    return ddl
+
+
+def clone_ddl(
+        source_table_id: str,
+        clone_table_id: str,
+        snapshot_time: typing.Optional[datetime.datetime] = None,
+        or_replace: bool = False) -> str:
+    """
+    >>> print(clone_ddl('p.d.events', 'p.d.events_clone'))
+    CREATE TABLE `p.d.events_clone`
+    CLONE `p.d.events`
+    """
+    _check_whole_table(source_table_id)
+    _check_whole_table(clone_table_id)
+    create = 'CREATE OR REPLACE TABLE' if or_replace else 'CREATE TABLE'
+    return f"{create} `{clone_table_id}`\nCLONE `{source_table_id}`{_system_time(snapshot_time)}"
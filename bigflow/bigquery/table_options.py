@@ -0,0 +1,177 @@
+"""Partitioning and clustering of tables created by `create_table_from_schema`.
+
+A table is partitioned by day on the ingestion time by default. `TableOptions` changes the partitioning
+(hourly, daily, monthly or yearly on a column or the ingestion time, integer ranges, or none at all),
+the clustering, partition expiration and the requirement of a partition filter in queries.
+
+Options can be passed to `create_table_from_schema` or stored in a schema file, next to the fields:
+
+    {
+        "fields": [{"name": "created", "type": "TIMESTAMP"}, {"name": "country", "type": "STRING"}],
+        "partition_type": "HOUR",
+        "partition_field": "created",
+        "partition_expiration_days": 30,
+        "clustering_fields": ["country"],
+        "require_partition_filter": true
+    }
+"""
+
+import datetime
+import json
+import typing
+from pathlib import Path
+
+# hidden BQ imports due to https://github.com/allegro/bigflow/issues/149
+
+
+HOUR = 'HOUR'
+DAY = 'DAY'
+MONTH = 'MONTH'
+YEAR = 'YEAR'
+RANGE = 'RANGE'
+
+TIME_PARTITION_TYPES = (HOUR, DAY, MONTH, YEAR)
+# BigQuery allows at most 4 clustering columns
+MAX_CLUSTERING_FIELDS = 4
+
+
+class IntegerRange(typing.NamedTuple):
+    field: str
+    start: int
+    end: int
+    interval: int
+
+
+class TableOptions(typing.NamedTuple):
+    partition_type: typing.Optional[str] = DAY
+    partition_field: typing.Optional[str] = None
+    partition_expiration_days: typing.Optional[float] = None
+    range_partitioning: typing.Optional[IntegerRange] = None
+    clustering_fields: typing.Optional[typing.List[str]] = None
+    require_partition_filter: bool = False
+
+    @classmethod
+    def from_dict(cls, options: dict) -> 'TableOptions':
+        unknown = set(options) - set(cls._fields)
+        if unknown:
+            raise ValueError(f"Unknown table options: {', '.join(sorted(unknown))}")
+        options = dict(options)
+        if isinstance(options.get('range_partitioning'), dict):
+            options['range_partitioning'] = IntegerRange(**options['range_partitioning'])
+        return cls(**options).validated()
+
+    def validated(self) -> 'TableOptions':
+        if self.range_partitioning is not None:
+            if self.partition_field is not None or self.partition_expiration_days is not None:
+                raise ValueError("Integer range partitioning can't be combined with time partitioning options")
+        elif self.partition_type is not None and self.partition_type not in TIME_PARTITION_TYPES:
+            raise ValueError(
+                f"Invalid partition type {self.partition_type}, expected one of: {', '.join(TIME_PARTITION_TYPES)}")
+        elif self.partition_type is None and (self.partition_field or self.partition_expiration_days):
+            raise ValueError("Partitioning options are given for a table which is not partitioned")
+        if self.clustering_fields is not None and not 0 < len(self.clustering_fields) <= MAX_CLUSTERING_FIELDS:
+            raise ValueError(f"A table can be clustered by 1 to {MAX_CLUSTERING_FIELDS} fields")
+        if self.require_partition_filter and not self.is_partitioned:
+            raise ValueError("A partition filter can be required only for a partitioned table")
+        return self
+
+    @property
+    def is_partitioned(self) -> bool:
+        return self.range_partitioning is not None or self.partition_type is not None
+
+    def apply(self, table):
+        """Sets the options on `google.cloud.bigquery.Table`."""
+        from google.cloud.bigquery import TimePartitioning, RangePartitioning, PartitionRange
+        self.validated()
+        if self.range_partitioning is not None:
+            table.range_partitioning = RangePartitioning(
+                field=self.range_partitioning.field,
+                range_=PartitionRange(
+                    start=self.range_partitioning.start,
+                    end=self.range_partitioning.end,
+                    interval=self.range_partitioning.interval))
+        elif self.partition_type is not None:
+            expiration_ms = None
+            if self.partition_expiration_days is not None:
+                expiration_ms = int(datetime.timedelta(days=self.partition_expiration_days).total_seconds() * 1000)
+            table.time_partitioning = TimePartitioning(
+                type_=self.partition_type,
+                field=self.partition_field,
+                expiration_ms=expiration_ms)
+        if self.clustering_fields:
+            table.clustering_fields = list(self.clustering_fields)
+        if self.require_partition_filter:
+            table.require_partition_filter = True
+        return table
+
+
+def parse_schema(content: typing.Union[list, dict]) -> typing.Tuple[list, typing.Optional[TableOptions]]:
+    """Fields and options of a schema file, a file with a list of fields has no options."""
+    if isinstance(content, list):
+        return content, None
+    content = dict(content)
+    if 'fields' not in content:
+        raise ValueError("A schema file with table options has to list the table fields in 'fields'")
+    fields = content.pop('fields')
+    return fields, TableOptions.from_dict(content)
+
+
+def partition_type(table) -> typing.Optional[str]:
+    """Partitioning of `google.cloud.bigquery.Table`: one of `HOUR`, `DAY`, `MONTH`, `YEAR`, `RANGE` or None."""
+    from google.cloud.bigquery import TimePartitioning, RangePartitioning
+    if isinstance(table.range_partitioning, RangePartitioning):
+        return RANGE
+    if isinstance(table.time_partitioning, TimePartitioning):
+        return table.time_partitioning.type_ or DAY
+    return None
+
+
+def partition_range(partition: str) -> typing.Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Time range of a partition decorator (yearly, monthly, daily or hourly).
+
+    >>> partition_range('20200131')
+    (datetime.datetime(2020, 1, 31, 0, 0), datetime.datetime(2020, 2, 1, 0, 0))
+    """
+    formats = {4: '%Y', 6: '%Y%m', 8: '%Y%m%d', 10: '%Y%m%d%H'}
+    if len(partition) not in formats:
+        raise ValueError(f"Invalid partition decorator: {partition}")
+    start = datetime.datetime.strptime(partition, formats[len(partition)])
+    if len(partition) == 4:
+        end = start.replace(year=start.year + 1)
+    elif len(partition) == 6:
+        end = (start + datetime.timedelta(days=32)).replace(day=1)
+    elif len(partition) == 8:
+        end = start + datetime.timedelta(days=1)
+    else:
+        end = start + datetime.timedelta(hours=1)
+    return start, end
+
+
+def build_table(
+        table_id: str,
+        schema: typing.Union[typing.List[dict], dict, Path, None] = None,
+        table=None,
+        table_options: typing.Optional[TableOptions] = None):
+    """
+    `google.cloud.bigquery.Table` of `create_table_from_schema`. The options override the ones of the schema file,
+    a table without options is partitioned by day on the ingestion time.
+    """
+    from google.cloud.bigquery import Table
+
+    if schema and table:
+        raise ValueError("You can't provide both schema and table, because the table you provide"
+                         "should already contain the schema.")
+    if not schema and not table:
+        raise ValueError("You must provide either schema or table.")
+
+    if isinstance(schema, Path):
+        schema = json.loads(schema.read_text())
+
+    if table is None:
+        fields, schema_options = parse_schema(schema)
+        table = Table(table_id, schema=fields)
+        table_options = table_options or schema_options or TableOptions()
+    if table_options is not None:
+        table_options.apply(table)
+    return table
@@ -0,0 +1,351 @@
+"""Compiled SQL templates.
+
+SQL passed to dataset operations is a `str.format` template with placeholders for table aliases, extras and `dt`.
+Each template is parsed once and cached, placeholders of all BigQuery components can be checked
+without running them (`bigflow build` fails when an operation refers to an unknown alias).
+"""
+
+import datetime
+import decimal
+import functools
+import inspect
+import logging
+import re
+import string
+import typing
+
+
+logger = logging.getLogger(__name__)
+
+
+TEMPLATES_CACHE_SIZE = 4096
+
+_formatter = string.Formatter()
+
+
+class AliasNotFoundError(ValueError):
+
+    def __init__(self, message: str, alias: typing.Optional[str] = None):
+        super().__init__(message)
+        self.alias = alias
+
+
+class CompiledTemplate(object):
+    """SQL template parsed into literal parts and placeholders."""
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self._parts = list(_formatter.parse(sql))
+        self.placeholders = frozenset(
+            _root_name(field_name) for _, field_name, _, _ in self._parts if field_name is not None)
+        # attribute/index access, conversions and format specs are left to `str.format`
+        self._simple = all(
+            field_name is None or (_root_name(field_name) == field_name and not spec and not conversion)
+            for _, field_name, spec, conversion in self._parts)
+
+    def missing_placeholders(self, variable_names: typing.Iterable[str]) -> typing.List[str]:
+        return sorted(self.placeholders.difference(variable_names))
+
+    def render(self, variables: typing.Mapping[str, typing.Any]) -> str:
+        self._check_missing(variables)
+        if not self._simple:
+            return self.sql.format_map(variables)
+        return ''.join(
+            literal + (str(variables[field_name]) if field_name is not None else '')
+            for literal, field_name, _, _ in self._parts)
+
+
+    def render_with_parameters(
+            self,
+            variables: typing.Mapping[str, typing.Any],
+            parameter_names: typing.Container[str]) -> typing.Tuple[str, typing.Dict[str, typing.Any]]:
+        """
+        Renders the template, placeholders from `parameter_names` become named query parameters (`@name`).
+        A placeholder quoted as a whole in a plain string literal (`'{dt}'`) is replaced together with the quotes.
+        Values are inlined when a placeholder is a part of an identifier (e.g. `{table}_{dt}` or `{project}.d.t`),
+        a typed, raw or triple-quoted literal (e.g. `DATE '{dt}'`), a string literal or a comment, has a format spec
+        or a value of a type which can't be a query parameter.
+        Returns the SQL and the used parameters.
+        """
+        self._check_missing(variables)
+        result, parameters = [], {}
+        state = None
+        strip_quote = False
+        for i, (literal, field_name, spec, conversion) in enumerate(self._parts):
+            if strip_quote:
+                literal, strip_quote = literal[1:], False
+            start_state, state = state, _scan(literal, state)
+            result.append(literal)
+            if field_name is None:
+                continue
+            value = _formatter.get_field(field_name, (), variables)[0]
+            parameter = (
+                field_name in parameter_names and not spec and not conversion
+                and query_parameter_type(value) is not None)
+            before = literal if literal or i == 0 else _PLACEHOLDER
+            after = self._next_literal(i)
+            if parameter and state is None and not _touches(before, after):
+                result.append('@' + field_name)
+                parameters[field_name] = value
+            elif (parameter and state in _STRING_QUOTES and literal.endswith(state) and after.startswith(state)
+                  and _scan(literal[:-1], start_state) is None
+                  and not _touches(literal[:-1] if literal[:-1] or i == 0 else _PLACEHOLDER, after[1:])
+                  and not _TYPED_LITERAL.search(literal[:-1])):
+                result[-1] = literal[:-1]
+                result.append('@' + field_name)
+                parameters[field_name] = value
+                strip_quote, state = True, None
+            else:
+                result.append(_formatter.format_field(_formatter.convert_field(value, conversion), spec))
+        return ''.join(result), parameters
+
+    def _next_literal(self, i: int) -> str:
+        """Literal after the i-th placeholder, a placeholder right after it is represented by `_PLACEHOLDER`."""
+        if i + 1 >= len(self._parts):
+            return ''
+        literal, field_name, _, _ = self._parts[i + 1]
+        return literal or (_PLACEHOLDER if field_name is not None else '')
+
+    def _check_missing(self, variables):
+        missing = self.missing_placeholders(variables)
+        if missing:
+            raise AliasNotFoundError(
+                "'{missing_variable}' is missing in internal_tables or external_tables or extras.".format(
+                    missing_variable=missing[0]), missing[0])
+
+
+_STRING_QUOTES = ("'", '"')
+_LINE_COMMENT = '\n'
+_BLOCK_COMMENT = '*/'
+_PLACEHOLDER = '{}'
+# a parameter next to these characters would be a part of an identifier, of another placeholder,
+# a raw or bytes literal (`r'{dt}'`) or a triple-quoted literal
+_IDENTIFIER_CHARACTERS = frozenset(string.ascii_letters + string.digits + '_.@$\'"`{}')
+# a literal of these types can't be replaced by a parameter, e.g. `DATE @dt` is not valid
+_TYPED_LITERAL = re.compile(
+    r'\b(DATE|DATETIME|TIME|TIMESTAMP|NUMERIC|BIGNUMERIC|DECIMAL|BIGDECIMAL|JSON|INTERVAL)\s*$', re.I)
+
+
+def _touches(before: str, after: str) -> bool:
+    return bool(before) and before[-1] in _IDENTIFIER_CHARACTERS or bool(after) and after[0] in _IDENTIFIER_CHARACTERS
+
+
+def _scan(sql: str, state: typing.Optional[str]) -> typing.Optional[str]:
+    """
+    Returns the lexical state at the end of the SQL fragment: None or the terminator of an open
+    string literal, quoted identifier or comment.
+    """
+    i = 0
+    while i < len(sql):
+        if state is None:
+            if sql[i] in '\'"`':
+                state = sql[i]
+            elif sql[i] == '#' or sql.startswith('--', i):
+                state = _LINE_COMMENT
+            elif sql.startswith('/*', i):
+                state = _BLOCK_COMMENT
+                i += 1
+        elif state in _STRING_QUOTES and sql[i] == '\\':
+            i += 1
+        elif sql.startswith(state, i):
+            i += len(state) - 1
+            state = None
+        i += 1
+    return state
+
+
+def query_parameter_type(value) -> typing.Optional[str]:
+    """
+    BigQuery type of a query parameter holding the value, `ARRAY<type>` for lists.
+    Returns None when the value can't be a parameter.
+    """
+    if isinstance(value, (list, tuple)):
+        element_types = {query_parameter_type(v) for v in value}
+        if len(element_types) > 1 or None in element_types or any(t.startswith('ARRAY') for t in element_types):
+            return None
+        return 'ARRAY<{}>'.format(element_types.pop() if element_types else 'STRING')
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, int):
+        return 'INT64'
+    if isinstance(value, float):
+        return 'FLOAT64'
+    if isinstance(value, decimal.Decimal):
+        return 'NUMERIC'
+    if isinstance(value, str):
+        return 'STRING'
+    if isinstance(value, datetime.datetime):
+        return 'DATETIME' if value.tzinfo is None else 'TIMESTAMP'
+    if isinstance(value, datetime.date):
+        return 'DATE'
+    return None
+
+
+def _root_name(field_name: str) -> str:
+    return field_name.split('.', 1)[0].split('[', 1)[0]
+
+
+@functools.lru_cache(maxsize=TEMPLATES_CACHE_SIZE)
+def compile_template(sql: str) -> CompiledTemplate:
+    return CompiledTemplate(sql)
+
+
+def render(sql: str, variables: typing.Mapping[str, typing.Any]) -> str:
+    return compile_template(sql).render(variables)
+
+
+def render_with_parameters(
+        sql: str,
+        variables: typing.Mapping[str, typing.Any],
+        parameter_names: typing.Container[str]) -> typing.Tuple[str, typing.Dict[str, typing.Any]]:
+    return compile_template(sql).render_with_parameters(variables, parameter_names)
+
+
+class TemplateError(typing.NamedTuple):
+    job_id: str
+    dependency: str
+    operation: str
+    missing: typing.List[str]
+
+    def __str__(self):
+        return "job '{}': {} on '{}' refers to unknown {}".format(
+            self.job_id, self.operation, self.dependency, ', '.join(f"{{{m}}}" for m in self.missing))
+
+
+class TemplateCheckingDatasetManager(object):
+    """
+    Stands for a dataset manager when a component is run to check its SQL templates, nothing is sent to BigQuery.
+    Operations return empty results, so components which depend on query results may not be fully checked.
+    """
+
+    _EMPTY_RESULTS = {
+        'collect_list': list,
+        'collect_iter': list,
+        'collect_batches': list,
+    }
+
+    def __init__(self, job_id: str, dependency: str, config, errors: typing.List[TemplateError]):
+        self._job_id = job_id
+        self._dependency = dependency
+        self._config = config
+        self._errors = errors
+        self._variable_names = {'dt'}
+        self._variable_names.update(config.internal_tables)
+        self._variable_names.update(config.external_tables)
+        self._variable_names.update(config.extras)
+
+    def write_tmp(self, table_name, sql, custom_run_datetime=None):
+        self._check('write_tmp', sql)
+        self._variable_names.add(table_name)
+
+    def write_tmp_async(self, table_name, sql, custom_run_datetime=None):
+        from .parallel import CompletedFuture
+        return CompletedFuture(self.write_tmp(table_name, sql))
+
+    def parallel(self, max_concurrency=None):
+        import contextlib
+        return contextlib.nullcontext()
+
+    def script(self, temp_tables=True):
+        import contextlib
+        return contextlib.nullcontext()
+
+    def open_writer(self, *args, **kwargs):
+        from .storage_write import DiscardingWriter
+        return DiscardingWriter()
+
+    @property
+    def runtime_str(self):
+        from .interface import DEFAULT_RUNTIME
+        return DEFAULT_RUNTIME
+
+    @property
+    def extras(self):
+        return self._config.extras
+
+    @property
+    def project_id(self):
+        return self._config.project_id
+
+    @property
+    def dataset_name(self):
+        return self._config.dataset_name
+
+    @property
+    def internal_tables(self):
+        return self._config.internal_tables
+
+    @property
+    def external_tables(self):
+        return self._config.external_tables
+
+    @property
+    def client(self):
+        return None
+
+    def __getattr__(self, operation):
+        if operation.startswith('_'):
+            raise AttributeError(operation)
+
+        def checked_operation(*args, **kwargs):
+            sql = self._bound_sql(operation, args, kwargs)
+            if sql is not None:
+                self._check(operation, sql)
+            base_operation = operation[:-len('_async')] if operation.endswith('_async') else operation
+            result = self._empty_result(base_operation)
+            if operation.endswith('_async'):
+                from .parallel import CompletedFuture
+                return CompletedFuture(result)
+            return result
+
+        return checked_operation
+
+    @staticmethod
+    def _bound_sql(operation, args, kwargs):
+        """The `sql` argument of the call, passed by position or by keyword, as the dataset manager method gets it."""
+        from .dataset_manager import PartitionedDatasetManager
+        method = getattr(PartitionedDatasetManager, operation, None)
+        if not callable(method):
+            return kwargs.get('sql')
+        # a call which doesn't match the method fails here, like it would in BigQuery
+        return inspect.signature(method).bind(None, *args, **kwargs).arguments.get('sql')
+
+    def _empty_result(self, operation):
+        if operation in self._EMPTY_RESULTS:
+            return self._EMPTY_RESULTS[operation]()
+        if operation.startswith('collect'):
+            import pandas as pd
+            return pd.DataFrame()
+        return None
+
+    def _check(self, operation, sql):
+        missing = compile_template(sql).missing_placeholders(self._variable_names)
+        if missing:
+            self._errors.append(TemplateError(self._job_id, self._dependency, operation, missing))
+
+
+def check_job_templates(job) -> typing.List[TemplateError]:
+    """
+    Runs the component of `bigflow.bigquery.Job` with `TemplateCheckingDatasetManager` dependencies
+    and returns placeholders of SQL templates which can't be resolved.
+    The component is really called, so its code other than dataset operations (e.g. HTTP requests) runs too.
+    """
+    errors = []
+    dependencies = {
+        name: TemplateCheckingDatasetManager(job.id, name, job._find_config(name), errors)
+        for name in job._component_dependencies
+    }
+    try:
+        job._run_component(dependencies)
+    except Exception as e:
+        logger.warning("SQL templates of job %s can't be fully checked, the component failed: %r", job.id, e)
+    return errors
+
+
+def check_workflow_templates(workflow) -> typing.List[TemplateError]:
+    from .job import Job
+    errors = []
+    for workflow_job in workflow._build_sequential_order():
+        if isinstance(workflow_job.job, Job):
+            errors.extend(check_job_templates(workflow_job.job))
+    return errors
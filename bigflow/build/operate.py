@@ -83,6 +83,7 @@ def build_dags(
     project_spec: BigflowProjectSpec,
     start_time: str,
     workflow_id: typing.Optional[str] = None,
+    check_templates: bool = False,
 ):
     logger.info("Building airflow DAGs...")
     clear_dags_leftovers(project_spec)
@@ -100,6 +101,8 @@ def build_dags(
         for workflow in walk_workflows(project_spec.project_dir / root_package):
             if workflow_id is not None and workflow_id != workflow.workflow_id:
                 continue
+            if check_templates:
+                _check_sql_templates(workflow)
             logger.info("Generating DAG file for %s", workflow.workflow_id)
             cnt += 1
             bigflow.dagbuilder.generate_dag_file(
@@ -114,6 +117,19 @@ def build_dags(
     logger.info("Geneated %d DAG files", cnt)
 
 
+def _check_sql_templates(workflow):
+    try:
+        from bigflow.bigquery.templates import check_workflow_templates
+    except ImportError:
+        # project without `bigflow[bigquery]` extras
+        return
+    logger.info("Checking SQL templates of %s", workflow.workflow_id)
+    errors = check_workflow_templates(workflow)
+    if errors:
+        raise ValueError("Workflow {} uses unknown SQL placeholders:\n{}".format(
+            workflow.workflow_id, "\n".join(map(str, errors))))
+
+
 def _rmtree(p: Path):
     logger.info("Removing directory %s", p)
     shutil.rmtree(p, ignore_errors=True)
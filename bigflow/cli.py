@@ -1,5 +1,7 @@
 import argparse
+import functools
 import importlib
+import json
 import os
 import pathlib
 import subprocess
@@ -9,11 +11,11 @@ import logging
 import importlib.util
 
 from argparse import Namespace
-from datetime import datetime
+from datetime import datetime, timedelta
 from importlib import import_module
 from pathlib import Path
 from types import ModuleType
-from typing import Tuple, Iterator
+from typing import Tuple, Iterator, List, Dict, Union
 from typing import Optional
 from glob import glob1
 
@@ -127,6 +129,22 @@ def find_workflow(root_package: Path, workflow_id: str) -> bf.Workflow:
             return workflow
     raise ValueError('Workflow with id {} not found in package {}'.format(workflow_id, root_package))
 
+
+def find_workflows(root_package: Path, workflow_ids: List[str]) -> Dict[str, bf.Workflow]:
+    """
+    Imports modules once and finds all the workflows with ids from `workflow_ids`
+    """
+    logger.debug("find workflows, root %s, workflow_ids %r", root_package, workflow_ids)
+    workflows = {}
+    for workflow in walk_workflows(root_package):
+        if workflow.workflow_id in workflow_ids:
+            workflows.setdefault(workflow.workflow_id, workflow)
+    for workflow_id in workflow_ids:
+        if workflow_id not in workflows:
+            raise ValueError('Workflow with id {} not found in package {}'.format(workflow_id, root_package))
+    return workflows
+
+
 def set_configuration_env(env):
     """
     Sets 'bf_env' env variable
@@ -171,6 +189,69 @@ def execute_workflow(root_package: Path, workflow_id: str, runtime=None):
     w.run(runtime)
 
 
+def _parse_full_job_id(full_job_id: str) -> Tuple[str, str]:
+    try:
+        workflow_id, job_id = full_job_id.split('.')
+    except ValueError:
+        raise ValueError(
+            'You should specify job using the workflow_id and job_id parameters - --job <workflow_id>.<job_id>.')
+    return workflow_id, job_id
+
+
+def execute_many(
+    root_package: Path,
+    full_job_ids: List[str],
+    workflow_ids: List[str],
+    runtime=None,
+    parallelism: int = 1,
+):
+    """
+    Executes several jobs and workflows in a single process.
+
+    Modules are imported once, jobs of the same workflow share a single `JobContext`.
+    A job is started only after all the selected jobs it depends on (according to the workflow definition)
+    are finished, jobs and workflows without such constraints are executed in parallel when `parallelism` > 1.
+
+    @param full_job_ids: list of jobs in format "<workflow_id>.<job_id>"
+    @param workflow_ids: list of workflows to execute as a whole
+    @param runtime: str determine partition that will be used for write operations.
+    @param parallelism: int maximum number of jobs/workflows executed at the same time
+    """
+    jobs = [_parse_full_job_id(full_job_id) for full_job_id in full_job_ids]
+    workflows = find_workflows(
+        root_package, list(dict.fromkeys(workflow_ids + [workflow_id for workflow_id, _ in jobs])))
+
+    # `bigflow.log` may be configured only once per process
+    for w in workflows.values():
+        if w.log_config:
+            _init_workflow_log(w)
+            break
+
+    contexts = {}
+    tasks = {}
+    upstream = {}
+
+    for workflow_id, job_id in jobs:
+        w = workflows[workflow_id]
+        job = w.find_job(job_id)
+        if workflow_id not in contexts:
+            contexts[workflow_id] = w._make_job_context(runtime)
+        tasks[f"{workflow_id}.{job_id}"] = functools.partial(w._execute_job, job, contexts[workflow_id])
+        upstream[f"{workflow_id}.{job_id}"] = {f"{workflow_id}.{j}" for j in w._upstream_job_ids(job_id)}
+
+    for workflow_id in workflow_ids:
+        tasks[workflow_id] = functools.partial(workflows[workflow_id].run, runtime)
+
+    # resources of each workflow are shared by all its jobs and closed at the end
+    for w in workflows.values():
+        w.resources.setup()
+    try:
+        bf.workflow.run_in_dependency_order(tasks, upstream, parallelism)
+    finally:
+        for w in workflows.values():
+            w.resources.teardown()
+
+
 def read_project_name_from_setup() -> Optional[str]:
     logger.debug("Read project name from project spec")
     try:
@@ -221,34 +302,46 @@ def import_deployment_config(deployment_config_path: str, property_name: str):
 
 def cli_run(project_package: str,
             runtime: Optional[str] = None,
-            full_job_id: Optional[str] = None,
-            workflow_id: Optional[str] = None) -> None:
+            full_job_id: Union[str, List[str], None] = None,
+            workflow_id: Union[str, List[str], None] = None,
+            parallelism: int = 1) -> None:
     """
-    Runs the specified job or workflow
+    Runs the specified jobs and/or workflows
 
     @param project_package: str The main package of a user's project
     @param runtime: Optional[str] Date of XXX in format "%Y-%m-%d %H:%M:%S"
-    @param full_job_id: Optional[str] Represents both workflow_id and job_id in a string in format "<workflow_id>.<job_id>"
-    @param workflow_id: Optional[str] The id of the workflow that should be executed
+    @param full_job_id: Union[str, List[str], None] Represents both workflow_id and job_id in a string in format "<workflow_id>.<job_id>"
+    @param workflow_id: Union[str, List[str], None] The id of the workflow that should be executed
+    @param parallelism: int Maximum number of jobs/workflows executed at the same time
     @return:
     """
 
     # TODO: Check that installed libs in sync with `requirements.txt`
     bigflow.build.pip.check_requirements_needs_recompile(Path("resources/requirements.txt"))
 
-    if full_job_id is not None:
-        try:
-            workflow_id, job_id = full_job_id.split('.')
-        except ValueError:
-            raise ValueError(
-                'You should specify job using the workflow_id and job_id parameters - --job <workflow_id>.<job_id>.')
+    full_job_ids = _as_list(full_job_id)
+    workflow_ids = _as_list(workflow_id)
+
+    if len(full_job_ids) == 1 and not workflow_ids:
+        workflow_id, job_id = _parse_full_job_id(full_job_ids[0])
         execute_job(project_package, workflow_id, job_id, runtime=runtime)
-    elif workflow_id is not None:
-        execute_workflow(project_package, workflow_id, runtime=runtime)
+    elif len(workflow_ids) == 1 and not full_job_ids:
+        execute_workflow(project_package, workflow_ids[0], runtime=runtime)
+    elif full_job_ids or workflow_ids:
+        execute_many(project_package, full_job_ids, workflow_ids, runtime=runtime, parallelism=parallelism)
     else:
         raise ValueError('You must provide the --job or --workflow for the run command.')
 
 
+def _as_list(value: Union[str, List[str], None]) -> List[str]:
+    if value is None:
+        return []
+    elif isinstance(value, str):
+        return [value]
+    else:
+        return list(value)
+
+
 def _parse_args(project_name: Optional[str], args) -> Namespace:
     parser = argparse.ArgumentParser(description=f'Welcome to BigFlow CLI.'
                                                   '\nType: bigflow {command} -h to print detailed help for a selected command.')
@@ -282,6 +375,12 @@ def _parse_args(project_name: Optional[str], args) -> Namespace:
     _create_build_requirements_parser(subparsers)
 
     _create_codegen_parser(subparsers)
+    _create_benchmark_parser(subparsers)
+    _create_schedule_load_parser(subparsers)
+    _create_enqueue_parser(subparsers)
+    _create_worker_parser(subparsers)
+    _create_analyze_job_parser(subparsers)
+    _create_estimate_parser(subparsers)
 
     return parser.parse_args(args)
 
@@ -337,6 +436,10 @@ def _create_build_dags_parser(subparsers):
     parser = subparsers.add_parser('build-dags',
                                    description='Builds DAG files from local sources to {current_dir}/.dags')
     _add_build_dags_parser_arguments(parser)
+    parser.add_argument('--check-templates',
+                        action='store_true',
+                        help='Checks SQL templates of BigQuery jobs, fails when they refer to unknown tables or extras. '
+                             'Components of the jobs are called with a stub dataset, so their other code runs too.')
 
 
 def _create_build_image_parser(subparsers):
@@ -348,14 +451,20 @@ def _create_run_parser(subparsers, project_name):
     parser = subparsers.add_parser('run',
                                    description='BigFlow CLI run command -- run a workflow or job')
 
-    group = parser.add_mutually_exclusive_group()
-    group.required = True
-    group.add_argument('-j', '--job',
-                       type=str,
-                       help='The job to start, identified by workflow id and job id in format "<workflow_id>.<job_id>".')
-    group.add_argument('-w', '--workflow',
-                       type=str,
-                       help='The id of the workflow to start.')
+    parser.add_argument('-j', '--job',
+                        type=str,
+                        nargs='+',
+                        help='The job to start, identified by workflow id and job id in format "<workflow_id>.<job_id>". '
+                             'Several jobs may be specified, they are started in order of the workflow definitions.')
+    parser.add_argument('-w', '--workflow',
+                        type=str,
+                        nargs='+',
+                        help='The id of the workflow to start. Several workflows may be specified.')
+    parser.add_argument('--parallelism',
+                        type=int,
+                        default=1,
+                        help='Maximum number of jobs/workflows executed at the same time, '
+                             'when several of them are specified. Default: %(default)s')
     parser.add_argument('-r', '--runtime',
                         type=str, default=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                         help='The date and time when this job or workflow should be started. '
@@ -567,6 +676,7 @@ def _cli_build_dags(args):
         prj,
         start_time=args.start_time if _is_starttime_selected(args) else datetime.now().strftime("%Y-%m-%d %H:00:00"),
         workflow_id=args.workflow if _is_workflow_selected(args) else None,
+        check_templates=args.check_templates,
     )
 
 
@@ -600,6 +710,244 @@ def _create_codegen_parser(subparsers: argparse._SubParsersAction):
     p.set_defaults(func=_cli_codegen_pin_dataflow_requirements)
 
 
+def _create_benchmark_parser(subparsers):
+    parser = subparsers.add_parser(
+        'benchmark',
+        description="Measures performance of bigflow hot paths and prints results as json",
+    )
+    parser.add_argument('-b', '--benchmark',
+                        type=str,
+                        nargs='+',
+                        help="Benchmarks to run. If not set, all benchmarks are run.")
+    parser.add_argument('-n', '--repeat',
+                        type=int,
+                        default=5,
+                        help="How many times each benchmark is repeated. Default: %(default)s")
+    parser.add_argument('-s', '--scale',
+                        type=float,
+                        default=1.0,
+                        help="Multiplier of the default size (number of modules, jobs, iterations) of each benchmark. "
+                             "Default: %(default)s")
+    parser.add_argument('-o', '--output',
+                        type=str,
+                        help="Path to the output json file. If not set, results are printed to stdout.")
+
+
+def _cli_benchmark(args):
+    import bigflow.benchmark
+    results = bigflow.benchmark.run_benchmarks(args.benchmark, repeat=args.repeat, scale=args.scale)
+    bigflow.benchmark.dump_results(results, args.output)
+
+
+def _create_schedule_load_parser(subparsers):
+    parser = subparsers.add_parser(
+        'schedule-load',
+        description="Forecasts how many workflows run concurrently in Composer "
+                    "and optionally assigns start time offsets which keep the peak under a limit",
+    )
+    parser.add_argument('-d', '--days',
+                        type=int,
+                        default=7,
+                        help="How many days are simulated. Default: %(default)s")
+    parser.add_argument('--bucket-minutes',
+                        type=int,
+                        default=5,
+                        help="Size of the time bucket in minutes. Default: %(default)s")
+    parser.add_argument('--durations',
+                        type=str,
+                        help="Path to a json file with historical durations of workflows, "
+                             'in seconds, for example: {"workflow_id": 600}')
+    parser.add_argument('--default-duration',
+                        type=int,
+                        default=600,
+                        help="Duration (in seconds) of workflows not listed in the durations file. Default: %(default)s")
+    parser.add_argument('--max-concurrency',
+                        type=int,
+                        help="If set, start time offsets are assigned to workflows, "
+                             "so that peak concurrency stays under this limit")
+    parser.add_argument('--max-offset-minutes',
+                        type=int,
+                        default=360,
+                        help="The biggest offset which can be assigned to a workflow. Default: %(default)s")
+    parser.add_argument('-o', '--output',
+                        type=str,
+                        help="Path to the output json file. If not set, the report is printed to stdout.")
+    parser.add_argument('--project-package',
+                        type=str,
+                        help='The main package of your project. '
+                             'Should contain `setup.py`')
+
+
+def _cli_schedule_load(root_package: Path, args):
+    import bigflow.schedule as schedule
+
+    durations = json.loads(Path(args.durations).read_text()) if args.durations else {}
+    loads = schedule.workflow_loads(
+        walk_workflows(root_package), durations, timedelta(seconds=args.default_duration))
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    bucket = timedelta(minutes=args.bucket_minutes)
+
+    offsets = None
+    staggered_loads = loads
+    if args.max_concurrency is not None:
+        offsets = schedule.assign_offsets(
+            loads, start, args.max_concurrency, args.days, bucket,
+            max_offset=timedelta(minutes=args.max_offset_minutes))
+        staggered_loads = [load._replace(offset=offsets[load.workflow_id]) for load in loads]
+
+    forecast = schedule.forecast_load(staggered_loads, start, args.days, bucket)
+    # the report compares assigned offsets with the current ones
+    content = json.dumps(schedule.forecast_report(forecast, loads, offsets), indent=2)
+    if args.output:
+        Path(args.output).write_text(content)
+    else:
+        print(content)
+
+
+def _add_queue_argument(parser):
+    parser.add_argument('-q', '--queue',
+                        type=str,
+                        required=True,
+                        help="Url of the work queue, a plain path means SQLite database file, "
+                             "for example: /mnt/shared/backfill.db")
+    parser.add_argument('--project-package',
+                        type=str,
+                        help='The main package of your project. '
+                             'Should contain `setup.py`')
+
+
+def _create_enqueue_parser(subparsers):
+    parser = subparsers.add_parser(
+        'enqueue',
+        description="Adds jobs of a workflow to the work queue, they are executed by `bigflow worker` processes",
+    )
+    parser.add_argument('-w', '--workflow',
+                        type=str,
+                        required=True,
+                        help='The id of the workflow to enqueue.')
+    parser.add_argument('-r', '--runtime',
+                        type=str,
+                        default=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        help='The first runtime, for example: 2020-01-01 or 2020-01-01 10:00:00. Default: now')
+    parser.add_argument('--runtime-to',
+                        type=str,
+                        help='The last runtime (inclusive). Runtimes between the first and the last one '
+                             'are taken from the workflow schedule_interval. If not set, only the first runtime is enqueued.')
+    _add_queue_argument(parser)
+
+
+def _create_worker_parser(subparsers):
+    parser = subparsers.add_parser(
+        'worker',
+        description="Claims jobs from the work queue and executes them",
+    )
+    parser.add_argument('--lease-sec',
+                        type=int,
+                        default=600,
+                        help="For how long a claimed job is leased by the worker, the lease is extended while "
+                             "the job is running. Jobs of dead workers are claimed again. Default: %(default)s")
+    parser.add_argument('--poll-interval-sec',
+                        type=int,
+                        default=5,
+                        help="How long the worker waits when there are no ready jobs. Default: %(default)s")
+    parser.add_argument('--max-tasks',
+                        type=int,
+                        help="The worker stops after executing that many jobs.")
+    parser.add_argument('--keep-running',
+                        action='store_true',
+                        help="Don't stop the worker when all jobs in the queue are finished.")
+    _add_queue_argument(parser)
+    _add_parsers_common_arguments(parser)
+
+
+def _create_analyze_job_parser(subparsers):
+    parser = subparsers.add_parser(
+        'analyze-job',
+        description="Prints stages of a finished BigQuery query job and warns about skew, shuffle spills, "
+                    "full scans of partitioned tables and repartition-heavy joins",
+    )
+    parser.add_argument('job_id',
+                        type=str,
+                        help="Id of the BigQuery job, e.g. printed in bigflow logs next to the operation.")
+    parser.add_argument('-p', '--project-id',
+                        type=str,
+                        help="GCP project of the job. If not set, the default project is used.")
+    parser.add_argument('-l', '--location',
+                        type=str,
+                        help="Location of the job, e.g. EU.")
+
+
+def _cli_analyze_job(args):
+    from google.cloud import bigquery
+    from bigflow.bigquery.query_plan import analyze_job, format_plan
+
+    client = bigquery.Client(project=args.project_id, location=args.location)
+    job = client.get_job(args.job_id, location=args.location)
+    if job.job_type != 'query':
+        raise ValueError(f"Job {args.job_id} is a {job.job_type} job, only query jobs have a query plan")
+    print(format_plan(job, analyze_job(job, client.get_table)))
+
+
+def _create_estimate_parser(subparsers):
+    parser = subparsers.add_parser(
+        'estimate',
+        description="Dry-runs queries of all BigQuery jobs of a workflow and prints how many bytes they would process. "
+                    "Fails when the estimate exceeds the byte budgets of the jobs or of the workflow",
+    )
+    parser.add_argument('-w', '--workflow',
+                        type=str,
+                        required=True,
+                        help='The id of the workflow to estimate.')
+    parser.add_argument('-r', '--runtime',
+                        type=str,
+                        default=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        help='The runtime of the workflow, for example: 2020-01-01 or 2020-01-01 10:00:00. Default: now')
+    parser.add_argument('--project-package',
+                        type=str,
+                        help='The main package of your project. '
+                             'Should contain `setup.py`')
+    _add_parsers_common_arguments(parser)
+
+
+def _cli_estimate(root_package: Path, args):
+    from bigflow.bigquery.estimate import estimate_workflow
+
+    estimate = estimate_workflow(find_workflow(root_package, args.workflow), args.runtime)
+    print(estimate.format())
+    if estimate.over_budget:
+        raise ValueError(f"Workflow {args.workflow} would exceed its byte budget")
+
+
+def _enqueue_runtimes(workflow: bf.Workflow, runtime: str, runtime_to: Optional[str]) -> List[datetime]:
+    import bigflow.schedule
+    start = bf.workflow._parse_runtime_str(runtime)
+    if not runtime_to:
+        return [start]
+    end = bf.workflow._parse_runtime_str(runtime_to) + timedelta(microseconds=1)
+    return list(bigflow.schedule.schedule_fire_times(workflow.schedule_interval, start, end))
+
+
+def _cli_enqueue(root_package: Path, args):
+    import bigflow.workqueue
+    workflow = find_workflow(root_package, args.workflow)
+    queue = bigflow.workqueue.create_queue(args.queue)
+    tasks = bigflow.workqueue.enqueue_workflow(queue, workflow, _enqueue_runtimes(workflow, args.runtime, args.runtime_to))
+    print(f"Enqueued {len(tasks)} jobs of workflow {workflow.workflow_id}")
+
+
+def _cli_worker(root_package: Path, args):
+    import bigflow.workqueue
+    workflows = {w.workflow_id: w for w in walk_workflows(root_package)}
+    bigflow.workqueue.run_worker(
+        bigflow.workqueue.create_queue(args.queue),
+        workflows,
+        lease=timedelta(seconds=args.lease_sec),
+        poll_interval=timedelta(seconds=args.poll_interval_sec),
+        max_tasks=args.max_tasks,
+        exit_when_empty=not args.keep_running,
+    )
+
+
 def _cli_build_requirements(args):
     in_file = pathlib.Path(args.in_file)
     bigflow.build.pip.pip_compile(in_file)
@@ -762,7 +1110,7 @@ def cli(raw_args) -> None:
     if operation == 'run':
         set_configuration_env(parsed_args.config)
         root_package = find_root_package(project_name, read_project_package(parsed_args))
-        cli_run(root_package, parsed_args.runtime, parsed_args.job, parsed_args.workflow)
+        cli_run(root_package, parsed_args.runtime, parsed_args.job, parsed_args.workflow, parsed_args.parallelism)
     elif operation == 'deploy-image':
         _cli_deploy_image(parsed_args)
     elif operation == 'deploy-dags':
@@ -792,5 +1140,23 @@ def cli(raw_args) -> None:
         _cli_build_requirements(parsed_args)
     elif operation == 'codegen':
         _cli_codegen(parsed_args)
+    elif operation == 'benchmark':
+        _cli_benchmark(parsed_args)
+    elif operation == 'schedule-load':
+        root_package = find_root_package(project_name, read_project_package(parsed_args))
+        _cli_schedule_load(root_package, parsed_args)
+    elif operation == 'enqueue':
+        root_package = find_root_package(project_name, read_project_package(parsed_args))
+        _cli_enqueue(root_package, parsed_args)
+    elif operation == 'worker':
+        set_configuration_env(parsed_args.config)
+        root_package = find_root_package(project_name, read_project_package(parsed_args))
+        _cli_worker(root_package, parsed_args)
+    elif operation == 'analyze-job':
+        _cli_analyze_job(parsed_args)
+    elif operation == 'estimate':
+        set_configuration_env(parsed_args.config)
+        root_package = find_root_package(project_name, read_project_package(parsed_args))
+        _cli_estimate(root_package, parsed_args)
     else:
         raise ValueError(f'Operation unknown - {operation}')
@@ -5,6 +5,7 @@ from pathlib import Path
 from datetime import datetime
 
 from bigflow import commons
+from bigflow.schedule import schedule_offset, shift_schedule_interval
 from bigflow.workflow import DEFAULT_EXECUTION_TIMEOUT_IN_SECONDS
 
 
@@ -35,6 +36,14 @@ def generate_dag_file(workdir: str,
     dag_file_path = get_dags_output_dir(workdir) / (dag_deployment_id + '_dag.py')
     start_date_as_str = repr(workflow.start_time_factory(start_from))
 
+    # airflow ignores minutes of `start_date` when cron schedule is used,
+    # so staggered workflows have shifted schedule and the runtime is shifted back
+    offset = schedule_offset(workflow)
+    schedule_interval = shift_schedule_interval(workflow.schedule_interval, offset)
+    runtime_template = '{{ execution_date.strftime("%Y-%m-%d %H:%M:%S") }}' if not offset else (
+        '{{ (execution_date - macros.timedelta(seconds=%d)).strftime("%%Y-%%m-%%d %%H:%%M:%%S") }}'
+        % offset.total_seconds())
+
     print(f'dag_file_path: {dag_file_path.resolve()}')
 
     dag_chunks = []
@@ -62,7 +71,7 @@ dag = DAG(
 )
 """.format(dag_id=dag_deployment_id,
            start_date_as_str=start_date_as_str,
-           schedule_interval=workflow.schedule_interval,
+           schedule_interval=schedule_interval,
            depends_on_past=workflow.depends_on_past,
            execution_timeout_sec=DEFAULT_EXECUTION_TIMEOUT_IN_SECONDS))
 
@@ -83,7 +92,7 @@ dag = DAG(
     task_id='{task_id}',
     name='{task_id}',
     cmds=['bf'],
-    arguments=['run', '--job', '{bf_job}', '--runtime', '{{{{ execution_date.strftime("%Y-%m-%d %H:%M:%S") }}}}', '--project-package', '{root_folder}', '--config', '{{{{var.value.env}}}}'],
+    arguments=['run', '--job', '{bf_job}', '--runtime', '{runtime_template}', '--project-package', '{root_folder}', '--config', '{{{{var.value.env}}}}'],
     namespace='default',
     image='{docker_image}',
     is_delete_operator_pod=True,
@@ -96,6 +105,7 @@ dag = DAG(
           task_id=task_id,
           docker_image = commons.build_docker_image_tag(docker_repository, build_ver),
           bf_job= workflow.workflow_id+"."+job.id,
+          runtime_template=runtime_template,
           root_folder=root_package_name,
           retries=job.retry_count if hasattr(job, 'retry_count') else 3,
           retry_delay=job.retry_pause_sec if hasattr(job, 'retry_pause_sec') else 60,
@@ -0,0 +1,279 @@
+"""Forecasting of the load generated by scheduled workflows and staggering of their start times.
+
+All workflows with the default `daily_start_time` are triggered by Composer at the same instant,
+which creates spikes of concurrently running pods and BigQuery jobs.  Functions in this module
+simulate future runs of all workflows (based on `schedule_interval`, `start_time_factory`
+and historical durations), report concurrency peaks and assign schedule offsets which keep
+the peak concurrency below a limit (see `bigflow.workflow.staggered_start_time`).
+"""
+
+import datetime as dt
+import logging
+import typing
+
+import bigflow
+from bigflow.commons import public
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_FORECAST_DAYS = 7
+DEFAULT_BUCKET = dt.timedelta(minutes=5)
+DEFAULT_DURATION = dt.timedelta(minutes=10)
+DEFAULT_MAX_OFFSET = dt.timedelta(hours=6)
+
+_CRON_PRESETS = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+}
+
+# (min, max) values of cron fields: minute, hour, day of month, month, day of week
+_CRON_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+class WorkflowLoad(typing.NamedTuple):
+    workflow_id: str
+    schedule_interval: str
+    duration: dt.timedelta
+    offset: dt.timedelta = dt.timedelta(0)
+
+
+class LoadForecast(typing.NamedTuple):
+    start: dt.datetime
+    bucket: dt.timedelta
+    concurrency: typing.List[int]
+
+    @property
+    def peak(self) -> int:
+        return max(self.concurrency, default=0)
+
+    def peak_times(self) -> typing.List[dt.datetime]:
+        return [self.start + i * self.bucket for i, c in enumerate(self.concurrency) if c and c == self.peak]
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> typing.Set[int]:
+    values = set()
+    for part in field.split(','):
+        value_range, _, step = part.partition('/')
+        if value_range == '*':
+            start, end = low, high
+        elif '-' in value_range:
+            start, end = map(int, value_range.split('-'))
+        else:
+            start = end = int(value_range)
+            if step:
+                end = high
+        if not low <= start <= end <= high:
+            raise ValueError(f"Invalid cron field {field!r}, values should be in range {low}-{high}")
+        values.update(range(start, end + 1, int(step or 1)))
+    return values
+
+
+def _parse_cron(schedule_interval: str):
+    expression = _CRON_PRESETS.get(schedule_interval, schedule_interval)
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"Unsupported schedule_interval {schedule_interval!r}, expected cron expression or preset")
+    parsed = [_parse_cron_field(f, low, high) for f, (low, high) in zip(fields, _CRON_RANGES)]
+    # both 0 and 7 mean sunday
+    if 7 in parsed[4]:
+        parsed[4] = (parsed[4] - {7}) | {0}
+    restricted_dom, restricted_dow = fields[2] != '*', fields[4] != '*'
+    return parsed, restricted_dom, restricted_dow
+
+
+def schedule_fire_times(
+    schedule_interval: typing.Union[str, dt.timedelta],
+    start: dt.datetime,
+    end: dt.datetime,
+) -> typing.Iterator[dt.datetime]:
+    """Returns all the moments within [start, end) when a workflow with `schedule_interval` is triggered."""
+
+    if schedule_interval in (None, '@once'):
+        return
+    if isinstance(schedule_interval, dt.timedelta):
+        t = start
+        while t < end:
+            yield t
+            t += schedule_interval
+        return
+
+    (minutes, hours, doms, months, dows), restricted_dom, restricted_dow = _parse_cron(schedule_interval)
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        # cron weekday: 0 = sunday
+        dow = (day.weekday() + 1) % 7
+        if restricted_dom and restricted_dow:
+            day_matches = day.day in doms or dow in dows
+        else:
+            day_matches = day.day in doms and dow in dows
+        if day.month in months and day_matches:
+            for hour in sorted(hours):
+                for minute in sorted(minutes):
+                    t = day.replace(hour=hour, minute=minute)
+                    if start <= t < end:
+                        yield t
+        day += dt.timedelta(days=1)
+
+
+def schedule_offset(workflow: 'bigflow.Workflow') -> dt.timedelta:
+    """Returns schedule offset assigned to the workflow with `bigflow.workflow.staggered_start_time`."""
+    return getattr(workflow.start_time_factory, 'schedule_offset', dt.timedelta(0))
+
+
+def shift_schedule_interval(schedule_interval: str, offset: dt.timedelta) -> str:
+    """Shifts schedule (cron expression or preset) by `offset`, e.g. `@daily` shifted by 15 minutes is `15 0 * * *`.
+
+    Only schedules with a single minute and a single (or any) hour are supported.
+    """
+    if not offset:
+        return schedule_interval
+    if offset % dt.timedelta(minutes=1) or offset < dt.timedelta(0):
+        raise ValueError(f"Schedule offset should be positive number of minutes, got {offset}")
+
+    expression = _CRON_PRESETS.get(schedule_interval, schedule_interval or '')
+    fields = expression.split()
+    if len(fields) != 5 or not fields[0].isdigit() or not (fields[1].isdigit() or fields[1] == '*'):
+        raise ValueError(f"Can't shift schedule_interval {schedule_interval!r}")
+
+    offset_minutes = offset // dt.timedelta(minutes=1)
+    if fields[1] == '*':
+        minute = int(fields[0]) + offset_minutes
+        if minute >= 60:
+            raise ValueError(f"Offset {offset} of hourly schedule {schedule_interval!r} should be less than 1 hour")
+        return " ".join([str(minute)] + fields[1:])
+
+    minute_of_day = int(fields[1]) * 60 + int(fields[0]) + offset_minutes
+    if minute_of_day >= 24 * 60:
+        raise ValueError(f"Offset {offset} moves schedule {schedule_interval!r} to the next day")
+    return " ".join([str(minute_of_day % 60), str(minute_of_day // 60)] + fields[2:])
+
+
+def workflow_loads(
+    workflows: typing.Iterable['bigflow.Workflow'],
+    durations: typing.Optional[typing.Dict[str, float]] = None,
+    default_duration: dt.timedelta = DEFAULT_DURATION,
+) -> typing.List[WorkflowLoad]:
+    """Builds description of the load of each workflow, `durations` maps workflow id to duration in seconds."""
+    durations = durations or {}
+    return [
+        WorkflowLoad(
+            workflow_id=w.workflow_id,
+            schedule_interval=w.schedule_interval,
+            duration=dt.timedelta(seconds=durations[w.workflow_id]) if w.workflow_id in durations else default_duration,
+            offset=schedule_offset(w),
+        )
+        for w in workflows
+    ]
+
+
+def _bucket_range(fire_time, duration, start, bucket, buckets_count):
+    first = max(0, (fire_time - start) // bucket)
+    last = min(buckets_count - 1, (fire_time + duration - start - dt.timedelta(microseconds=1)) // bucket)
+    return range(first, last + 1)
+
+
+def _add_load(concurrency, load: WorkflowLoad, offset: dt.timedelta, start: dt.datetime, bucket: dt.timedelta):
+    end = start + bucket * len(concurrency)
+    for fire_time in schedule_fire_times(load.schedule_interval, start - load.duration, end):
+        for i in _bucket_range(fire_time + offset, load.duration, start, bucket, len(concurrency)):
+            concurrency[i] += 1
+
+
+@public()
+def forecast_load(
+    loads: typing.Iterable[WorkflowLoad],
+    start: dt.datetime,
+    days: int = DEFAULT_FORECAST_DAYS,
+    bucket: dt.timedelta = DEFAULT_BUCKET,
+) -> LoadForecast:
+    """Simulates the next `days` of workflow runs and counts concurrently running workflows in each time bucket."""
+    concurrency = [0] * (dt.timedelta(days=days) // bucket)
+    for load in loads:
+        _add_load(concurrency, load, load.offset, start, bucket)
+    return LoadForecast(start=start, bucket=bucket, concurrency=concurrency)
+
+
+def _max_offset(load: WorkflowLoad, max_offset: dt.timedelta) -> dt.timedelta:
+    try:
+        expression = _CRON_PRESETS.get(load.schedule_interval, load.schedule_interval or '').split()
+        if expression[1] == '*':
+            return min(max_offset, dt.timedelta(minutes=59 - int(expression[0])))
+        return min(max_offset, dt.timedelta(minutes=24 * 60 - 1 - int(expression[1]) * 60 - int(expression[0])))
+    except (IndexError, ValueError):
+        return dt.timedelta(0)
+
+
+@public()
+def assign_offsets(
+    loads: typing.Iterable[WorkflowLoad],
+    start: dt.datetime,
+    max_concurrency: int,
+    days: int = DEFAULT_FORECAST_DAYS,
+    bucket: dt.timedelta = DEFAULT_BUCKET,
+    max_offset: dt.timedelta = DEFAULT_MAX_OFFSET,
+) -> typing.Dict[str, dt.timedelta]:
+    """Greedily assigns schedule offsets (multiplies of `bucket`) so that peak concurrency stays under the limit.
+
+    The longest workflows are placed first, each one gets the smallest offset which keeps the peak
+    within `max_concurrency` (or the offset which minimizes the peak, when the limit can't be met).
+    Workflows with schedules which can't be shifted (see `shift_schedule_interval`) keep their offsets.
+    """
+    loads = sorted(loads, key=lambda l: l.duration, reverse=True)
+    concurrency = [0] * (dt.timedelta(days=days) // bucket)
+    offsets = {}
+
+    for load in loads:
+        candidates = [load.offset]
+        limit = _max_offset(load, max_offset)
+        candidate = dt.timedelta(0)
+        while candidate <= limit:
+            if candidate != load.offset:
+                candidates.append(candidate)
+            candidate += bucket
+
+        best = None
+        for offset in candidates:
+            trial = list(concurrency)
+            _add_load(trial, load, offset, start, bucket)
+            peak = max(trial, default=0)
+            if best is None or peak < best[0]:
+                best = (peak, offset, trial)
+            if peak <= max_concurrency:
+                best = (peak, offset, trial)
+                break
+
+        _, offsets[load.workflow_id], concurrency = best
+        logger.debug("Workflow %s gets schedule offset %s", load.workflow_id, offsets[load.workflow_id])
+
+    return offsets
+
+
+def forecast_report(
+    forecast: LoadForecast,
+    loads: typing.List[WorkflowLoad],
+    offsets: typing.Optional[typing.Dict[str, dt.timedelta]] = None,
+) -> dict:
+    report = {
+        'start': forecast.start.isoformat(),
+        'bucket_minutes': forecast.bucket / dt.timedelta(minutes=1),
+        'peak_concurrency': forecast.peak,
+        'peak_times': [t.isoformat() for t in forecast.peak_times()[:20]],
+        'concurrency': forecast.concurrency,
+    }
+    if offsets is not None:
+        report['offsets'] = {
+            load.workflow_id: {
+                'offset_minutes': offsets[load.workflow_id] / dt.timedelta(minutes=1),
+                'schedule_interval': shift_schedule_interval(load.schedule_interval, offsets[load.workflow_id]),
+            }
+            for load in loads
+            if offsets[load.workflow_id] != load.offset
+        }
+    return report
@@ -0,0 +1,305 @@
+"""Pool of reusable BigQuery datasets for test suites.
+
+`create_dataset_manager` without a dataset name creates a fresh dataset, which a test deletes with its contents
+afterwards. It adds seconds to each test, and datasets of crashed tests are never deleted. A `DatasetPool` keeps
+a fixed number of datasets, which are leased by tests and returned to the pool afterwards. A returned dataset
+is not deleted, only tables modified during the lease are truncated, so tables created by the next test with
+`CREATE TABLE IF NOT EXISTS` already exist.
+
+Leases are kept in dataset labels and taken with a conditional update (matching the etag of a dataset), so many
+processes and machines can share a pool. A lease of a crashed test expires after `lease_timeout_sec`, then the
+next lease of the dataset cleans up after it.
+"""
+
+import contextlib
+import datetime
+import logging
+import random
+import re
+import time
+import typing
+
+from bigflow.bigquery.dataset_manager import create_dataset_manager, get_bigquery_client, random_uuid, \
+    forget_dataset, tables_cache, PartitionedDatasetManager, DEFAULT_LOCATION, BIGQUERY_BACKEND
+from bigflow.bigquery.materialization import FINGERPRINT_LABEL
+from bigflow.bigquery.table_copy import clone_ddl
+
+# hidden BQ imports due to https://github.com/allegro/bigflow/issues/149
+
+
+logger = logging.getLogger(__name__)
+
+
+POOL_LABEL = 'bigflow_test_pool'
+LEASE_LABEL = 'bigflow_lease'
+LEASED_AT_LABEL = 'bigflow_leased_at'
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_LEASE_TIMEOUT_SEC = 3600
+DEFAULT_WAIT_TIMEOUT_SEC = 600
+DEFAULT_POLL_INTERVAL_SEC = 5
+# tables modified shortly before a lease are cleaned up too, in case clocks of machines sharing a pool differ
+CLOCK_SKEW_SEC = 60
+
+_POOL_NAME = re.compile(r'[a-z][a-z0-9_]{0,62}')
+
+
+class DatasetPoolExhaustedError(ValueError):
+    pass
+
+
+class DatasetLease(object):
+    """A dataset leased from a `DatasetPool`, it belongs to a single test until it is released."""
+
+    def __init__(self, pool: 'DatasetPool', dataset_name: str, lease_id: str, leased_at: int):
+        self.pool = pool
+        self.dataset_name = dataset_name
+        self.lease_id = lease_id
+        self.leased_at = leased_at
+
+    @property
+    def dataset_id(self) -> str:
+        return f'{self.pool.project_id}.{self.dataset_name}'
+
+    def create_dataset_manager(
+            self,
+            runtime,
+            internal_tables=None,
+            external_tables=None,
+            extras=None,
+            **kwargs) -> typing.Tuple[str, PartitionedDatasetManager]:
+        """Dataset manager of the leased dataset, see `bigflow.bigquery.dataset_manager.create_dataset_manager`."""
+        return create_dataset_manager(
+            self.pool.project_id,
+            runtime,
+            dataset_name=self.dataset_name,
+            internal_tables=internal_tables,
+            external_tables=external_tables,
+            extras=extras,
+            credentials=self.pool.credentials,
+            location=self.pool.location,
+            resources=self.pool.resources,
+            backend=BIGQUERY_BACKEND,
+            **kwargs)
+
+    def clone_tables(self, fixtures: typing.Dict[str, str]) -> typing.List[str]:
+        """
+        Replaces tables of the leased dataset with clones of fixture tables, in a single script.
+        A clone is not billed for the data it shares with the fixture table, and it is created in seconds.
+
+        :param fixtures: dict where key is a table name and value is a full ID of a fixture table,
+         in the same location as the pool.
+        :return: list of full IDs of the cloned tables.
+        """
+        table_ids = [f'{self.dataset_id}.{table_name}' for table_name in fixtures]
+        if not table_ids:
+            return []
+        script = ';\n'.join(
+            clone_ddl(fixture_id, table_id, or_replace=True)
+            for table_id, fixture_id in zip(table_ids, fixtures.values()))
+        self.pool.client.query(script).result()
+        for table_id in table_ids:
+            tables_cache.add(table_id)
+        return table_ids
+
+
+class DatasetPool(object):
+    """
+    Datasets `<name>_0` ... `<name>_<size - 1>` in the project, created on the first lease.
+
+    :param project_id: string project id where datasets of the pool are created.
+    :param name: name of the pool (lowercase letters, digits and underscores), a prefix of names of its datasets.
+    :param size: number of datasets, it limits the number of tests running at the same time.
+    :param lease_timeout_sec: a lease not released for that long is taken over by another test.
+    :param wait_timeout_sec: how long `acquire` waits for a dataset when all of them are leased.
+    """
+
+    def __init__(
+            self,
+            project_id: str,
+            name: str,
+            size: int = DEFAULT_POOL_SIZE,
+            credentials=None,
+            location: str = DEFAULT_LOCATION,
+            resources=None,
+            lease_timeout_sec: float = DEFAULT_LEASE_TIMEOUT_SEC,
+            wait_timeout_sec: float = DEFAULT_WAIT_TIMEOUT_SEC,
+            poll_interval_sec: float = DEFAULT_POLL_INTERVAL_SEC):
+        if not _POOL_NAME.fullmatch(name):
+            raise ValueError(f"Invalid pool name {name}, use lowercase letters, digits and underscores")
+        if size < 1:
+            raise ValueError("size should be a positive number")
+        self.project_id = project_id
+        self.name = name
+        self.size = size
+        self.credentials = credentials
+        self.location = location
+        self.resources = resources
+        self.lease_timeout_sec = lease_timeout_sec
+        self.wait_timeout_sec = wait_timeout_sec
+        self.poll_interval_sec = poll_interval_sec
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_bigquery_client(self.project_id, self.credentials, self.location, self.resources)
+        return self._client
+
+    @property
+    def dataset_names(self) -> typing.List[str]:
+        return [f'{self.name}_{i}' for i in range(self.size)]
+
+    @contextlib.contextmanager
+    def lease(self) -> typing.Iterator[DatasetLease]:
+        lease = self.acquire()
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+    def acquire(self) -> DatasetLease:
+        """Leases a free dataset, waits up to `wait_timeout_sec` when all datasets are leased."""
+        deadline = time.monotonic() + self.wait_timeout_sec
+        while True:
+            # processes sharing the pool try datasets in a different order, so they rarely compete for one
+            dataset_names = self.dataset_names
+            random.shuffle(dataset_names)
+            for dataset_name in dataset_names:
+                lease = self._try_lease(dataset_name)
+                if lease is not None:
+                    logger.info("Leased dataset %s", lease.dataset_id)
+                    return lease
+            if time.monotonic() >= deadline:
+                raise DatasetPoolExhaustedError(
+                    f"All {self.size} datasets of pool {self.name} are leased for more than {self.wait_timeout_sec}s")
+            logger.info("All %d datasets of pool %s are leased, waiting", self.size, self.name)
+            time.sleep(self.poll_interval_sec)
+
+    def release(self, lease: DatasetLease):
+        """Truncates tables modified during the lease and returns the dataset to the pool."""
+        from google.api_core.exceptions import PreconditionFailed
+        if not self._is_leased_by(lease):
+            logger.warning("Lease of dataset %s expired and was taken over, it is not cleaned up", lease.dataset_id)
+            return
+        self.truncate_modified_tables(lease.dataset_id, lease.leased_at)
+        dataset = self.client.get_dataset(lease.dataset_id)
+        # a label set to None is removed
+        dataset.labels = {**dataset.labels, LEASE_LABEL: None, LEASED_AT_LABEL: None}
+        try:
+            self.client.update_dataset(dataset, ['labels'])
+        except PreconditionFailed:
+            logger.warning("Lease of dataset %s was taken over while it was released", lease.dataset_id)
+
+    def truncate_modified_tables(self, dataset_id: str, since: int) -> typing.List[str]:
+        """
+        Truncates tables of the dataset modified since the time (in seconds since the epoch), with a single script.
+        Tables reused by `cache_tmp_tables` are dropped instead, so an empty table is never taken for a query result.
+
+        :return: list of full IDs of the truncated and dropped tables.
+        """
+        modified_since = datetime.datetime.fromtimestamp(since - CLOCK_SKEW_SEC, datetime.timezone.utc)
+        statements = []
+        touched = []
+        for item in self.client.list_tables(dataset_id):
+            if item.table_type != 'TABLE':
+                continue
+            table = self.client.get_table(item.reference)
+            if table.modified is None or table.modified < modified_since:
+                continue
+            table_id = f'{dataset_id}.{item.table_id}'
+            if FINGERPRINT_LABEL in (table.labels or {}):
+                statements.append(f'DROP TABLE `{table_id}`')
+            else:
+                statements.append(f'TRUNCATE TABLE `{table_id}`')
+            touched.append(table_id)
+        if statements:
+            self.client.query(';\n'.join(statements)).result()
+            tables_cache.invalidate(dataset_id)
+        logger.info("Cleaned up %d tables of dataset %s", len(touched), dataset_id)
+        return touched
+
+    def cleanup(self, max_age_sec: float) -> typing.List[str]:
+        """Deletes datasets of the pool not leased for `max_age_sec`, see `cleanup_leaked_datasets`."""
+        return cleanup_leaked_datasets(self.client, max_age_sec, self.name, self.lease_timeout_sec)
+
+    def _try_lease(self, dataset_name: str) -> typing.Optional[DatasetLease]:
+        from google.api_core.exceptions import PreconditionFailed
+        dataset = self._get_or_create_dataset(dataset_name)
+        labels = dict(dataset.labels or {})
+        now = int(time.time())
+        previous_leased_at = _leased_at(labels)
+        if previous_leased_at is not None and now - previous_leased_at < self.lease_timeout_sec:
+            return None
+        lease_id = random_uuid()
+        dataset.labels = {**labels, LEASE_LABEL: lease_id, LEASED_AT_LABEL: str(now)}
+        try:
+            self.client.update_dataset(dataset, ['labels'])
+        except PreconditionFailed:
+            # leased by another process in the meantime
+            return None
+        lease = DatasetLease(self, dataset_name, lease_id, now)
+        if previous_leased_at is not None:
+            logger.warning("Lease of dataset %s expired, cleaning up after it", lease.dataset_id)
+            self.truncate_modified_tables(lease.dataset_id, previous_leased_at)
+        return lease
+
+    def _is_leased_by(self, lease: DatasetLease) -> bool:
+        dataset = self.client.get_dataset(lease.dataset_id)
+        return (dataset.labels or {}).get(LEASE_LABEL) == lease.lease_id
+
+    def _get_or_create_dataset(self, dataset_name: str):
+        from google.api_core.exceptions import NotFound
+        from google.cloud import bigquery
+        dataset_id = f'{self.project_id}.{dataset_name}'
+        try:
+            return self.client.get_dataset(dataset_id)
+        except NotFound:
+            dataset = bigquery.Dataset(dataset_id)
+            dataset.location = self.location
+            dataset.labels = {POOL_LABEL: self.name}
+            self.client.create_dataset(dataset, exists_ok=True)
+            # etag of the dataset is needed to lease it
+            return self.client.get_dataset(dataset_id)
+
+
+def _leased_at(labels: typing.Dict[str, str]) -> typing.Optional[int]:
+    if not labels.get(LEASE_LABEL):
+        return None
+    try:
+        return int(labels.get(LEASED_AT_LABEL))
+    except (TypeError, ValueError):
+        return 0
+
+
+def cleanup_leaked_datasets(
+        bigquery_client,
+        max_age_sec: float,
+        pool_name: typing.Optional[str] = None,
+        lease_timeout_sec: float = DEFAULT_LEASE_TIMEOUT_SEC) -> typing.List[str]:
+    """
+    Deletes datasets of test pools (all of them, or of the named pool) which were not modified, or leased,
+    for `max_age_sec`, e.g. datasets of a pool whose size was reduced, or of a pool no longer used.
+    A dataset leased for less than `lease_timeout_sec` is in use by a running test, it is never deleted.
+    A deleted dataset of a pool still in use is created again by its next lease.
+
+    :return: list of IDs of the deleted datasets.
+    """
+    label_filter = f'labels.{POOL_LABEL}' + (f':{pool_name}' if pool_name else '')
+    now = datetime.datetime.now(datetime.timezone.utc)
+    modified_before = now - datetime.timedelta(seconds=max_age_sec)
+    deleted = []
+    for item in bigquery_client.list_datasets(filter=label_filter):
+        dataset = bigquery_client.get_dataset(item.reference)
+        if dataset.modified is not None and dataset.modified >= modified_before:
+            continue
+        leased_at = _leased_at(dataset.labels or {})
+        if leased_at is not None and now.timestamp() - leased_at < lease_timeout_sec:
+            continue
+        dataset_id = f'{dataset.project}.{dataset.dataset_id}'
+        logger.info("Delete leaked dataset %s, last modified %s", dataset_id, dataset.modified)
+        bigquery_client.delete_dataset(dataset, delete_contents=True, not_found_ok=True)
+        tables_cache.invalidate(dataset_id)
+        forget_dataset(dataset_id)
+        deleted.append(dataset_id)
+    return deleted
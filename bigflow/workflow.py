@@ -1,5 +1,7 @@
 import abc
+import atexit
 import collections
+import threading
 import typing
 import warnings
 import datetime as dt
@@ -39,6 +41,112 @@ def daily_start_time(start_time: dt.datetime) -> dt.datetime:
     return start_time.replace(hour=0, minute=0, second=0, microsecond=0) - td
 
 
+@public()
+def staggered_start_time(
+        offset: dt.timedelta,
+        start_time_factory: typing.Callable[[dt.datetime], dt.datetime] = daily_start_time,
+) -> typing.Callable[[dt.datetime], dt.datetime]:
+    """Delays runs of the workflow by `offset` (see `bigflow.schedule.assign_offsets`).
+
+    Generated DAG is triggered `offset` later than `schedule_interval` says,
+    while the runtime passed to jobs is not shifted.
+    """
+    def factory(start_time: dt.datetime) -> dt.datetime:
+        return start_time_factory(start_time) + offset
+
+    factory.schedule_offset = offset
+    return factory
+
+
+@public()
+class ResourceRegistry:
+    """Expensive objects (API clients, loaded models, lookup tables) shared by all jobs of a workflow run.
+
+    A resource is created on the first `get` (or during `setup` when it is registered as `eager`),
+    and then reused by all jobs, including jobs running in parallel threads.
+    All created resources are closed by `teardown`, in the reverse order of creation.
+    Each workflow owns a registry (`Workflow.resources`), which is set up at the start of
+    `Workflow.run` / `Workflow.run_job` and torn down at the end.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._creation_locks: typing.Dict[typing.Hashable, threading.Lock] = {}
+        self._factories: typing.Dict[typing.Hashable, tuple] = {}
+        self._resources: typing.Dict[typing.Hashable, tuple] = collections.OrderedDict()
+        self._active_runs = 0
+
+    def register(
+        self,
+        name: typing.Hashable,
+        factory: typing.Callable[[], typing.Any],
+        teardown: typing.Optional[typing.Callable[[typing.Any], None]] = None,
+        eager: bool = False,
+    ):
+        with self._lock:
+            self._factories[name] = (factory, teardown, eager)
+
+    def get(self, name: typing.Hashable):
+        if name not in self._factories:
+            raise ValueError(f"Resource {name!r} is not registered")
+        factory, teardown, _ = self._factories[name]
+        return self.get_or_create(name, factory, teardown)
+
+    def get_or_create(
+        self,
+        name: typing.Hashable,
+        factory: typing.Callable[[], typing.Any],
+        teardown: typing.Optional[typing.Callable[[typing.Any], None]] = None,
+    ):
+        if name in self._resources:
+            return self._resources[name][0]
+        with self._lock:
+            creation_lock = self._creation_locks.setdefault(name, threading.Lock())
+        # slow factories of different resources don't block each other
+        with creation_lock:
+            if name not in self._resources:
+                logger.debug("Create resource %r", name)
+                self._resources[name] = (factory(), teardown)
+            return self._resources[name][0]
+
+    def __contains__(self, name):
+        return name in self._resources
+
+    def is_registered(self, name: typing.Hashable) -> bool:
+        return name in self._factories
+
+    def setup(self):
+        with self._lock:
+            self._active_runs += 1
+            eager = [name for name, (_, _, is_eager) in self._factories.items() if is_eager]
+        for name in eager:
+            self.get(name)
+
+    def teardown(self):
+        """Closes all resources, nested runs (`setup` called many times) are closed by the outermost `teardown`."""
+        with self._lock:
+            self._active_runs = max(0, self._active_runs - 1)
+            if self._active_runs:
+                return
+            resources = list(self._resources.items())
+            self._resources.clear()
+            self._creation_locks.clear()
+
+        for name, (resource, teardown) in reversed(resources):
+            if teardown is None:
+                continue
+            try:
+                logger.debug("Teardown resource %r", name)
+                teardown(resource)
+            except Exception:
+                logger.exception("Failed to teardown resource %r", name)
+
+
+# used by jobs executed without a workflow, e.g. interactive components
+_process_resources = ResourceRegistry()
+atexit.register(_process_resources.teardown)
+
+
 @public()
 class JobContext(typing.NamedTuple):
 
@@ -51,6 +159,8 @@ class JobContext(typing.NamedTuple):
     env: typing.Optional[str]
     # TODO: add unique 'workflow execution id' (for tracing/logging)
 
+    resources: typing.Optional[ResourceRegistry] = None
+
     @classmethod
     def make(
         cls,
@@ -60,6 +170,7 @@ class JobContext(typing.NamedTuple):
         workflow: typing.Optional['Workflow'] = None,
         workflow_id: typing.Optional[str] = None,
         env: typing.Optional[str] = None,
+        resources: typing.Optional[ResourceRegistry] = None,
     ):
         logger.debug("Build new JobContext...")
 
@@ -94,12 +205,16 @@ class JobContext(typing.NamedTuple):
             # TODO: Try to load/reconstruct workflow based on its id?
             pass
 
+        if resources is None:
+            resources = getattr(workflow, 'resources', None) or _process_resources
+
         jc = cls(
             runtime=runtime,
             runtime_str=runtime_str,
             workflow=workflow,
             workflow_id=workflow_id,
             env=env,
+            resources=resources,
         )
 
         logger.debug("JobContext is %r", jc)
@@ -164,6 +279,7 @@ class Workflow(object):
         self.log_config = log_config
         self.depends_on_past = depends_on_past
         self.secrets = secrets
+        self.resources = ResourceRegistry()
 
     @staticmethod
     def _execute_job(job, context):
@@ -181,8 +297,12 @@ class Workflow(object):
 
     def run(self, runtime: typing.Union[dt.date, str, None] = None):
         context = self._make_job_context(runtime)
-        for job in self._build_sequential_order():
-            self._execute_job(job, context)
+        self.resources.setup()
+        try:
+            for job in self._build_sequential_order():
+                self._execute_job(job, context)
+        finally:
+            self.resources.teardown()
 
     def find_job(self, job_id) -> Job:
         for job_wrapper in self._build_sequential_order():
@@ -192,7 +312,15 @@ class Workflow(object):
 
     def run_job(self, job_id: str, runtime: typing.Union[dt.date, str, None] = None):
         context = self._make_job_context(runtime)
-        self._execute_job(self.find_job(job_id), context)
+        self.resources.setup()
+        try:
+            self._execute_job(self.find_job(job_id), context)
+        finally:
+            self.resources.teardown()
+
+    def _upstream_job_ids(self, job_id: str) -> typing.Set[str]:
+        """Returns ids of all the jobs (direct and transitive) which must be finished before `job_id`"""
+        return self.definition._upstream_job_ids(job_id)
 
     def _build_sequential_order(self):
         return self.definition._sequential_order()
@@ -255,6 +383,9 @@ class Definition:
     def _call_on_graph_nodes(self, consumer):
         return self.job_order_resolver._call_on_graph_nodes(consumer)
 
+    def _upstream_job_ids(self, job_id):
+        return self.job_order_resolver.find_upstream_job_ids(job_id)
+
     def _build_graph(self, jobs):
         if isinstance(jobs, list):
             job_graph = self._convert_list_to_graph(jobs)
@@ -333,6 +464,19 @@ class JobOrderResolver:
         self._call_on_graph_nodes(add_to_ordered_job)
         return ordered_jobs
 
+    def find_upstream_job_ids(self, job_id):
+        stack = [job for job in self.parental_map if job.id == job_id]
+        if not stack:
+            raise ValueError(f'Job {job_id} not found.')
+
+        upstream = set()
+        while stack:
+            for parent in self.parental_map[stack.pop()]:
+                if parent.id not in upstream:
+                    upstream.add(parent.id)
+                    stack.append(parent)
+        return upstream
+
     def _call_on_graph_nodes(self, consumer):
         visited = set()
         for job in self.parental_map:
@@ -371,6 +515,64 @@ class JobOrderResolver:
         consumer(job, parental_map[job])
 
 
+def run_in_dependency_order(
+    tasks: typing.Dict[str, typing.Callable[[], None]],
+    upstream: typing.Dict[str, typing.Set[str]],
+    parallelism: int = 1,
+):
+    """Runs `tasks` (name -> callable), a task is started only when all its `upstream` tasks are finished.
+
+    Tasks are started in the order of `tasks` as soon as they are ready.  When `parallelism` is greater
+    than 1 up to `parallelism` ready tasks are executed at the same time in a thread pool.
+    The first failure stops scheduling of new tasks, already running tasks are awaited and the error is reraised.
+    """
+    upstream = {name: set(upstream.get(name, ())) & tasks.keys() for name in tasks}
+    pending = list(tasks)
+    done = set()
+
+    def pop_ready():
+        for name in pending:
+            if upstream[name] <= done:
+                pending.remove(name)
+                return name
+        return None
+
+    if parallelism <= 1:
+        while pending:
+            name = pop_ready()
+            logger.debug("Run task %s", name)
+            tasks[name]()
+            done.add(name)
+        return
+
+    import concurrent.futures
+
+    error = None
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+        while True:
+            while error is None and len(running) < parallelism:
+                name = pop_ready()
+                if name is None:
+                    break
+                logger.debug("Submit task %s", name)
+                running[executor.submit(tasks[name])] = name
+            if not running:
+                break
+
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    logger.error("Task %s failed: %s", name, future.exception())
+                    error = error or future.exception()
+                else:
+                    done.add(name)
+
+    if error is not None:
+        raise error
+
+
 def _parse_runtime_str(runtime: str):
     for format in _RUNTIME_FORMATS:
         try:
@@ -0,0 +1,374 @@
+"""Queue-based executor which spreads jobs of workflows (e.g. large backfills) across many machines without Composer.
+
+Jobs are enqueued (by `bigflow enqueue`) together with their dependencies taken from the workflow definition.
+`bigflow worker` processes, running on any host with access to the queue, claim ready jobs,
+execute them with `Workflow.run_job` and acknowledge them.  A claimed job is leased for a limited time -
+when a worker dies, the lease expires and the job is claimed again.  Failed jobs are retried.
+
+`SqliteWorkQueue` is the reference backend.  Other backends (e.g. Redis) implement the `WorkQueue`
+interface and are registered with `register_queue_backend`.
+"""
+
+import abc
+import datetime as dt
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import typing
+
+import bigflow
+from bigflow.commons import public
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_LEASE = dt.timedelta(minutes=10)
+DEFAULT_POLL_INTERVAL = dt.timedelta(seconds=5)
+DEFAULT_MAX_ATTEMPTS = 3
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Task(typing.NamedTuple):
+    task_id: str
+    workflow_id: str
+    job_id: str
+    runtime: str
+    depends_on: typing.Tuple[str, ...] = ()
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    attempts: int = 0
+
+
+def make_task_id(workflow_id: str, job_id: str, runtime: str) -> str:
+    return f"{workflow_id}.{job_id}@{runtime}"
+
+
+@public()
+class WorkQueue(abc.ABC):
+
+    @abc.abstractmethod
+    def put(self, tasks: typing.Iterable[Task]):
+        """Adds tasks to the queue, tasks which are already in the queue are ignored."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def claim(self, worker_id: str, lease: dt.timedelta) -> typing.Optional[Task]:
+        """Leases a task whose dependencies are done, returns `None` when there is no such task."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def extend_lease(self, task_id: str, worker_id: str, lease: dt.timedelta) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def ack(self, task_id: str, worker_id: str):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def nack(self, task_id: str, worker_id: str, error: str):
+        """Releases failed task, it is claimed again unless it has reached the max number of attempts."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def counts(self) -> typing.Dict[str, int]:
+        """Returns number of tasks in each state."""
+        raise NotImplementedError
+
+    def has_unfinished_tasks(self) -> bool:
+        counts = self.counts()
+        return bool(counts.get(PENDING) or counts.get(RUNNING))
+
+
+@public()
+class SqliteWorkQueue(WorkQueue):
+    """Queue stored in a SQLite database file, which should be located on a filesystem shared by workers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT UNIQUE NOT NULL,
+                    workflow_id TEXT NOT NULL,
+                    job_id TEXT NOT NULL,
+                    runtime TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    worker_id TEXT,
+                    lease_until REAL,
+                    error TEXT
+                );
+                CREATE TABLE IF NOT EXISTS dependencies (
+                    task_id TEXT NOT NULL,
+                    upstream_task_id TEXT NOT NULL,
+                    PRIMARY KEY (task_id, upstream_task_id)
+                );
+            """)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # `isolation_level=None` - transactions are controlled explicitly
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        finally:
+            conn.close()
+
+    def put(self, tasks: typing.Iterable[Task]):
+        tasks = list(tasks)
+
+        def insert(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (task_id, workflow_id, job_id, runtime, state, max_attempts) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(t.task_id, t.workflow_id, t.job_id, t.runtime, PENDING, t.max_attempts) for t in tasks])
+            conn.executemany(
+                "INSERT OR IGNORE INTO dependencies (task_id, upstream_task_id) VALUES (?, ?)",
+                [(t.task_id, d) for t in tasks for d in t.depends_on])
+
+        self._transaction(insert)
+        logger.info("Enqueued %d tasks", len(tasks))
+
+    def claim(self, worker_id: str, lease: dt.timedelta) -> typing.Optional[Task]:
+        def claim_ready(conn):
+            now = time.time()
+            # leases of dead workers are expired, their tasks are released or failed
+            conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+                "error = 'lease expired', worker_id = NULL "
+                "WHERE state = ? AND lease_until < ?",
+                (PENDING, FAILED, RUNNING, now))
+            # tasks downstream of failed ones would never be ready
+            while conn.execute("""
+                UPDATE tasks SET state = ?, error = 'upstream task failed'
+                WHERE state = ? AND EXISTS (
+                    SELECT 1 FROM dependencies d
+                    JOIN tasks u ON u.task_id = d.upstream_task_id
+                    WHERE d.task_id = tasks.task_id AND u.state = ?
+                )
+            """, (FAILED, PENDING, FAILED)).rowcount:
+                pass
+            row = conn.execute("""
+                SELECT * FROM tasks t
+                WHERE state = ? AND NOT EXISTS (
+                    SELECT 1 FROM dependencies d
+                    JOIN tasks u ON u.task_id = d.upstream_task_id
+                    WHERE d.task_id = t.task_id AND u.state != ?
+                )
+                ORDER BY seq LIMIT 1
+            """, (PENDING, DONE)).fetchone()
+            if row is None:
+                return None
+
+            conn.execute(
+                "UPDATE tasks SET state = ?, worker_id = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE task_id = ?",
+                (RUNNING, worker_id, now + lease.total_seconds(), row['task_id']))
+            depends_on = conn.execute(
+                "SELECT upstream_task_id FROM dependencies WHERE task_id = ?", (row['task_id'],)).fetchall()
+            return Task(
+                task_id=row['task_id'],
+                workflow_id=row['workflow_id'],
+                job_id=row['job_id'],
+                runtime=row['runtime'],
+                depends_on=tuple(d[0] for d in depends_on),
+                max_attempts=row['max_attempts'],
+                attempts=row['attempts'] + 1,
+            )
+
+        return self._transaction(claim_ready)
+
+    def _update_leased(self, task_id, worker_id, assignments, params) -> bool:
+        def update(conn):
+            return conn.execute(
+                f"UPDATE tasks SET {assignments} WHERE task_id = ? AND worker_id = ? AND state = ?",
+                params + (task_id, worker_id, RUNNING)).rowcount
+        updated = self._transaction(update)
+        if not updated:
+            logger.warning("Task %s is not leased by worker %s anymore", task_id, worker_id)
+        return bool(updated)
+
+    def extend_lease(self, task_id: str, worker_id: str, lease: dt.timedelta) -> bool:
+        return self._update_leased(task_id, worker_id, "lease_until = ?", (time.time() + lease.total_seconds(),))
+
+    def ack(self, task_id: str, worker_id: str):
+        self._update_leased(task_id, worker_id, "state = ?, lease_until = NULL", (DONE,))
+
+    def nack(self, task_id: str, worker_id: str, error: str):
+        self._update_leased(
+            task_id, worker_id,
+            "state = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, error = ?, lease_until = NULL, worker_id = NULL",
+            (PENDING, FAILED, error))
+
+    def counts(self) -> typing.Dict[str, int]:
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+        finally:
+            conn.close()
+
+
+_QUEUE_BACKENDS: typing.Dict[str, typing.Callable[[str], WorkQueue]] = {
+    'sqlite': SqliteWorkQueue,
+}
+
+
+@public()
+def register_queue_backend(scheme: str, factory: typing.Callable[[str], WorkQueue]):
+    """Registers queue backend for urls `scheme://...`, `factory` gets the url without the scheme."""
+    _QUEUE_BACKENDS[scheme] = factory
+
+
+@public()
+def create_queue(url: str) -> WorkQueue:
+    """Creates a queue from url `scheme://location`, plain path means a SQLite queue."""
+    scheme, sep, location = url.partition('://')
+    if not sep:
+        scheme, location = 'sqlite', url
+    if scheme not in _QUEUE_BACKENDS:
+        raise ValueError(f"Unknown queue backend {scheme!r}, available are {list(_QUEUE_BACKENDS)}")
+    return _QUEUE_BACKENDS[scheme](location)
+
+
+def _runtime_str(runtime: typing.Union[dt.datetime, str]) -> str:
+    if isinstance(runtime, str):
+        return runtime
+    return runtime.strftime("%Y-%m-%d %H:%M:%S")
+
+
+@public()
+def workflow_tasks(
+    workflow: 'bigflow.Workflow',
+    runtimes: typing.Iterable[typing.Union[dt.datetime, str]],
+) -> typing.List[Task]:
+    """Builds tasks for all jobs of the workflow for each runtime.
+
+    A task depends on the tasks of its upstream jobs with the same runtime.
+    When the workflow `depends_on_past`, a task depends also on the same job with the previous runtime.
+    """
+    runtimes = [_runtime_str(r) for r in runtimes]
+    jobs = []
+    workflow._call_on_graph_nodes(lambda job, dependencies: jobs.append((job, dependencies)))
+
+    tasks = []
+    for i, runtime in enumerate(runtimes):
+        for job, dependencies in jobs:
+            depends_on = [make_task_id(workflow.workflow_id, d.id, runtime) for d in dependencies]
+            if workflow.depends_on_past and i > 0:
+                depends_on.append(make_task_id(workflow.workflow_id, job.id, runtimes[i - 1]))
+            tasks.append(Task(
+                task_id=make_task_id(workflow.workflow_id, job.id, runtime),
+                workflow_id=workflow.workflow_id,
+                job_id=job.id,
+                runtime=runtime,
+                depends_on=tuple(depends_on),
+                max_attempts=getattr(job.job, 'retry_count', DEFAULT_MAX_ATTEMPTS - 1) + 1,
+            ))
+    return tasks
+
+
+@public()
+def enqueue_workflow(
+    queue: WorkQueue,
+    workflow: 'bigflow.Workflow',
+    runtimes: typing.Iterable[typing.Union[dt.datetime, str]],
+) -> typing.List[Task]:
+    tasks = workflow_tasks(workflow, runtimes)
+    queue.put(tasks)
+    return tasks
+
+
+class _LeaseKeeper(threading.Thread):
+    """Periodically extends the lease of the task, while it is being executed."""
+
+    def __init__(self, queue: WorkQueue, task: Task, worker_id: str, lease: dt.timedelta):
+        super().__init__(daemon=True)
+        self.queue, self.task, self.worker_id, self.lease = queue, task, worker_id, lease
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.lease.total_seconds() / 3):
+            self.queue.extend_lease(self.task.task_id, self.worker_id, self.lease)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@public()
+def run_worker(
+    queue: WorkQueue,
+    workflows: typing.Dict[str, 'bigflow.Workflow'],
+    worker_id: typing.Optional[str] = None,
+    lease: dt.timedelta = DEFAULT_LEASE,
+    poll_interval: dt.timedelta = DEFAULT_POLL_INTERVAL,
+    max_tasks: typing.Optional[int] = None,
+    exit_when_empty: bool = True,
+) -> int:
+    """Claims and executes tasks until the queue is empty (or `max_tasks` are executed), returns number of executed tasks."""
+    worker_id = worker_id or default_worker_id()
+    logger.info("Worker %s started", worker_id)
+
+    # resources are shared by all the tasks executed by the worker
+    for workflow in workflows.values():
+        workflow.resources.setup()
+    try:
+        executed = _claim_and_execute(queue, workflows, worker_id, lease, poll_interval, max_tasks, exit_when_empty)
+    finally:
+        for workflow in workflows.values():
+            workflow.resources.teardown()
+
+    logger.info("Worker %s finished, executed %d tasks, queue state: %s", worker_id, executed, queue.counts())
+    return executed
+
+
+def _claim_and_execute(queue, workflows, worker_id, lease, poll_interval, max_tasks, exit_when_empty) -> int:
+    executed = 0
+    while max_tasks is None or executed < max_tasks:
+        task = queue.claim(worker_id, lease)
+        if task is None:
+            if exit_when_empty and not queue.has_unfinished_tasks():
+                break
+            time.sleep(poll_interval.total_seconds())
+            continue
+
+        logger.info("Worker %s runs %s (attempt %d/%d)", worker_id, task.task_id, task.attempts, task.max_attempts)
+        keeper = _LeaseKeeper(queue, task, worker_id, lease)
+        keeper.start()
+        try:
+            if task.workflow_id not in workflows:
+                raise ValueError(f"Workflow {task.workflow_id} not found")
+            workflows[task.workflow_id].run_job(task.job_id, task.runtime)
+        except Exception as e:
+            logger.exception("Task %s failed", task.task_id)
+            queue.nack(task.task_id, worker_id, repr(e))
+        else:
+            queue.ack(task.task_id, worker_id)
+        finally:
+            keeper.finished.set()
+            keeper.join()
+        executed += 1
+    return executed
@@ -40,6 +40,7 @@ setuptools.setup(
         'log': read_requirements("log_extras.txt"),
         'dataproc': read_requirements("dataproc_extras.txt"),
         'dataflow': read_requirements("dataflow_extras.txt"),
+        'local': read_requirements("local_extras.txt"),
     },
     scripts=["scripts/bf", "scripts/bigflow"],
 )
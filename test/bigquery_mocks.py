@@ -0,0 +1,39 @@
+from unittest import mock
+
+from bigflow.bigquery.dataset_manager import DatasetManager, TemplatedDatasetManager, PartitionedDatasetManager, \
+    get_partition_from_run_datetime_or_none, tables_cache
+
+
+def finished_job(bytes_billed=0, **kwargs):
+    """Finished BigQuery job with the statistics read by `StatsCollector`, `kwargs` override them."""
+    return mock.Mock(**{
+        'started': None,
+        'ended': None,
+        'total_bytes_processed': bytes_billed,
+        'total_bytes_billed': bytes_billed,
+        'slot_millis': None,
+        'cache_hit': None,
+        'output_rows': None,
+        'query_plan': [],
+        **kwargs,
+    })
+
+
+def dataset_manager(
+        client,
+        internal_tables=('events',),
+        external_tables=None,
+        run_datetime='2020-01-01',
+        stats=None,
+        budget=None):
+    """
+    Dataset manager of `project.dataset` sending jobs to the mocked client, like the one a `Job` passes to its component.
+    Tables listed by previous tests are forgotten.
+    """
+    tables_cache.invalidate()
+    return PartitionedDatasetManager(TemplatedDatasetManager(
+        DatasetManager(client, mock.Mock(full_dataset_id='project:dataset'), mock.Mock(), stats, budget=budget),
+        internal_tables=list(internal_tables),
+        external_tables=external_tables or {},
+        extras={},
+        run_datetime=run_datetime), get_partition_from_run_datetime_or_none(run_datetime))
@@ -240,6 +240,47 @@ class CliTestCase(
         # then
         self.assert_started_jobs(['J_ID_3', 'J_ID_3'])
 
+    def test_should_run_many_jobs_in_order_of_workflow_definition(self):
+        # given
+        root_package = TESTS_DIR / "test_module"
+
+        # when
+        cli_run(root_package, full_job_id=["ID_3.J_ID_4", "ID_4.J_ID_5", "ID_3.J_ID_3"])
+
+        # then
+        self.assert_started_jobs(['J_ID_5', 'J_ID_3', 'J_ID_4'])
+
+    def test_should_run_many_jobs_and_workflows_in_parallel(self):
+        # given
+        root_package = TESTS_DIR / "test_module"
+
+        # when
+        cli_run(root_package, full_job_id=["ID_3.J_ID_4", "ID_3.J_ID_3"], workflow_id=["ID_4"], parallelism=3)
+
+        # then
+        started_jobs = import_module("test_module.Unused1").started_jobs
+        self.assertCountEqual(['J_ID_3', 'J_ID_4', 'J_ID_5'], started_jobs)
+        self.assertLess(started_jobs.index('J_ID_3'), started_jobs.index('J_ID_4'))
+
+    def test_should_run_many_workflows(self):
+        # given
+        root_package = TESTS_DIR / "test_module"
+
+        # when
+        cli_run(root_package, workflow_id=["ID_4", "ID_3"])
+
+        # then
+        self.assert_started_jobs(['J_ID_5', 'J_ID_3', 'J_ID_4'])
+
+    @mock.patch('bigflow.cli.cli_run')
+    def test_should_pass_many_jobs_to_cli_run(self, cli_run_mock):
+        # when
+        cli(['run', '--job', 'ID_3.J_ID_3', 'ID_4.J_ID_5', '--parallelism', '2', '--runtime', '2020-01-01',
+             '--project-package', 'main_package'])
+
+        # then
+        cli_run_mock.assert_called_with(mock.ANY, '2020-01-01', ['ID_3.J_ID_3', 'ID_4.J_ID_5'], None, 2)
+
     def test_should_read_project_package_if_set(self):
         # given
         args = lambda: None
@@ -547,31 +588,37 @@ deployment_config = Config(name='dev',
         cli(['build-dags'])
 
         # then
-        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time=None, workflow=None, verbose=False))
+        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time=None, workflow=None, verbose=False, check_templates=False))
 
         # when
         cli(['build-dags', '-t', '2020-01-01 00:00:00'])
 
         # then
-        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time='2020-01-01 00:00:00', workflow=None, verbose=False))
+        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time='2020-01-01 00:00:00', workflow=None, verbose=False, check_templates=False))
 
         # when
         cli(['build-dags', '-w', 'some_workflow'])
 
         # then
-        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time=None, workflow='some_workflow', verbose=False))
+        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time=None, workflow='some_workflow', verbose=False, check_templates=False))
 
         # when
         cli(['build-dags', '-w', 'some_workflow', '-t', '2020-01-01 00:00:00'])
 
         # then
-        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time='2020-01-01 00:00:00', workflow='some_workflow', verbose=False))
+        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time='2020-01-01 00:00:00', workflow='some_workflow', verbose=False, check_templates=False))
 
         # when
         cli(['build-dags', '-w', 'some_workflow', '-t', '2020-01-01'])
 
         # then
-        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time='2020-01-01', workflow='some_workflow', verbose=False))
+        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time='2020-01-01', workflow='some_workflow', verbose=False, check_templates=False))
+
+        # when
+        cli(['build-dags', '--check-templates'])
+
+        # then
+        _cli_build_dags_mock.assert_called_with(Namespace(operation='build-dags', start_time=None, workflow=None, verbose=False, check_templates=True))
 
         # when
         with self.assertRaises(SystemExit):
@@ -594,6 +641,7 @@ deployment_config = Config(name='dev',
             read_project_spec.return_value,
             start_time="2001-02-03 15:00:00",
             workflow_id=None,
+            check_templates=False,
         )
 
     @mock.patch('bigflow.build.operate.build_project')
@@ -717,6 +765,7 @@ deployment_config = Config(name='dev',
             read_project_mock.return_value,
             start_time="2001-02-03 15:00:00",
             workflow_id=None,
+            check_templates=False,
         )
 
     @mock.patch('bigflow.cli.get_version')
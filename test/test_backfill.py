@@ -0,0 +1,95 @@
+from unittest import TestCase, mock
+
+from google.cloud.bigquery import Table, SchemaField, TimePartitioning
+
+from bigflow.bigquery.backfill import partition_dates, is_single_query, range_script, RangeNotSupportedError
+from test import bigquery_mocks
+
+
+SCHEMA = [SchemaField('id', 'INT64'), SchemaField('day', 'DATE')]
+
+
+class BackfillTestCase(TestCase):
+
+    def test_should_list_partition_dates(self):
+        self.assertEqual(partition_dates('2020-12-31', '2021-01-02'), ['2020-12-31', '2021-01-01', '2021-01-02'])
+        with self.assertRaises(ValueError):
+            partition_dates('2021-01-02', '2021-01-01')
+
+    def test_should_detect_scripts(self):
+        self.assertTrue(is_single_query("SELECT ';' AS a -- b; c\n;"))
+        self.assertFalse(is_single_query("DECLARE x INT64 DEFAULT 1; SELECT x"))
+
+    def test_should_build_script_for_ingestion_time_partitioned_table(self):
+        # given
+        table = Table('p.d.t', schema=SCHEMA)
+        table.time_partitioning = TimePartitioning()
+
+        # when
+        script = range_script(table, {'2020-01-02': 'SELECT 2', '2020-01-01': 'SELECT 1;'})
+
+        # then
+        self.assertEqual(script, '\n'.join([
+            "BEGIN TRANSACTION;",
+            "DELETE FROM `p.d.t` WHERE _PARTITIONDATE BETWEEN DATE '2020-01-01' AND DATE '2020-01-02';",
+            "INSERT INTO `p.d.t` (_PARTITIONTIME, `id`, `day`)",
+            "SELECT TIMESTAMP '2020-01-01', `id`, `day` FROM (\nSELECT 1\n)",
+            "UNION ALL",
+            "SELECT TIMESTAMP '2020-01-02', `id`, `day` FROM (\nSELECT 2\n);",
+            "COMMIT TRANSACTION;",
+        ]))
+
+    def test_should_fail_rows_outside_partition_of_column_partitioned_table(self):
+        # given
+        table = Table('p.d.t', schema=SCHEMA)
+        table.time_partitioning = TimePartitioning(field='day')
+
+        # when
+        script = range_script(table, {'2020-01-01': 'SELECT 1'})
+
+        # then
+        self.assertIn("DELETE FROM `p.d.t` WHERE DATE(`day`) BETWEEN DATE '2020-01-01' AND DATE '2020-01-01';", script)
+        self.assertIn(
+            "WHERE IF(DATE(`day`) = DATE '2020-01-01', TRUE, ERROR('Row outside of partition 2020-01-01'))", script)
+
+    def test_should_not_support_tables_not_partitioned_by_day(self):
+        # given
+        hourly = Table('p.d.t', schema=SCHEMA)
+        hourly.time_partitioning = TimePartitioning(type_='HOUR')
+
+        # expect
+        with self.assertRaises(RangeNotSupportedError):
+            range_script(Table('p.d.t', schema=SCHEMA), {'2020-01-01': 'SELECT 1'})
+        with self.assertRaises(RangeNotSupportedError):
+            range_script(hourly, {'2020-01-01': 'SELECT 1'})
+
+
+class WriteTruncateRangeTestCase(TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.list_tables.return_value = [mock.Mock(table_id='events')]
+        self.table = Table('project.dataset.events', schema=SCHEMA)
+        self.table.time_partitioning = TimePartitioning()
+        self.client.get_table.return_value = self.table
+        self.dataset_manager = bigquery_mocks.dataset_manager(self.client)
+
+    def test_should_rewrite_range_in_chunks_of_days(self):
+        # when
+        self.dataset_manager.write_truncate_range(
+            'events', "SELECT 1 AS id, DATE('{dt}') AS day", '2020-01-01', '2020-01-05', days_per_job=2)
+
+        # then
+        scripts = [c[0][0] for c in self.client.query.call_args_list]
+        self.assertEqual(len(scripts), 3)
+        self.assertIn("BETWEEN DATE '2020-01-05' AND DATE '2020-01-05'", scripts[2])
+        self.assertIn("DATE('2020-01-04')", scripts[1])
+
+    def test_should_write_partitions_one_by_one_when_sql_is_a_script(self):
+        # when
+        self.dataset_manager.write_truncate_range(
+            'events', "DECLARE d DATE DEFAULT '{dt}'; SELECT 1 AS id, d AS day", '2020-01-01', '2020-01-03')
+
+        # then
+        destinations = sorted(c[1]['job_config'].destination.table_id for c in self.client.query.call_args_list)
+        self.assertEqual(destinations, ['events$20200101', 'events$20200102', 'events$20200103'])
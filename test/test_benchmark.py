@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+import bigflow
+import bigflow.benchmark
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_should_run_all_benchmarks(self):
+        # when
+        results = bigflow.benchmark.run_benchmarks(repeat=1, scale=0.01)
+
+        # then
+        self.assertEqual([r.name for r in results], bigflow.benchmark.list_benchmarks())
+        for r in results:
+            if r.skipped is None:
+                self.assertLessEqual(r.min_sec, r.max_sec, r.name)
+
+    def test_should_dump_results_as_json_document(self):
+        # given
+        results = bigflow.benchmark.run_benchmarks(['definition_order'], repeat=3, scale=0.01)
+
+        # when
+        document = bigflow.benchmark.results_to_json(results)
+
+        # then
+        self.assertEqual(document['bigflow_version'], bigflow.__version__)
+        self.assertEqual(len(document['results']), 1)
+        self.assertEqual(document['results'][0]['name'], 'definition_order')
+        self.assertEqual(document['results'][0]['repeat'], 3)
+        self.assertEqual(document['results'][0]['size'], 20)
+
+    def test_should_raise_error_for_unknown_benchmark(self):
+        with self.assertRaises(ValueError):
+            bigflow.benchmark.run_benchmarks(['no_such_benchmark'])
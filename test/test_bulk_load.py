@@ -0,0 +1,96 @@
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import TestCase, mock
+
+from bigflow.bigquery.bulk_load import iter_records, chunked, run_bounded, load_records
+from bigflow.bigquery.dataset_manager import DatasetManager
+
+
+class BulkLoadTestCase(TestCase):
+
+    def test_should_read_records_from_ndjson_and_json_array_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # given
+            ndjson = Path(tmpdir) / 'records.ndjson'
+            ndjson.write_text('{"id": 1}\n\n{"id": 2}\n')
+            array = Path(tmpdir) / 'records.json'
+            array.write_text(' [{"id": 1}, {"id": 2}]')
+
+            # then
+            self.assertEqual(list(iter_records(ndjson)), [{'id': 1}, {'id': 2}])
+            self.assertEqual(list(iter_records(array)), [{'id': 1}, {'id': 2}])
+
+    def test_should_split_records_into_chunks(self):
+        self.assertEqual(list(chunked(iter([1, 2, 3, 4, 5]), 2)), [[1, 2], [3, 4], [5]])
+
+    def test_should_limit_number_of_items_in_progress(self):
+        # given
+        in_progress = []
+        max_in_progress = []
+        lock = threading.Lock()
+
+        def items():
+            for i in range(8):
+                with lock:
+                    in_progress.append(i)
+                    max_in_progress.append(len(in_progress))
+                yield i
+
+        def process(item):
+            time.sleep(0.01)
+            with lock:
+                in_progress.remove(item)
+            return item * 2
+
+        # when
+        results = run_bounded(process, items(), max_concurrency=3)
+
+        # then
+        self.assertEqual(results, [0, 2, 4, 6, 8, 10, 12, 14])
+        self.assertLessEqual(max(max_in_progress), 3)
+
+    def test_should_stop_after_first_failure(self):
+        # given
+        processed = []
+
+        def process(item):
+            processed.append(item)
+            if item == 0:
+                raise RuntimeError("load failed")
+
+        # then
+        with self.assertRaises(RuntimeError):
+            run_bounded(process, iter(range(100)), max_concurrency=2)
+        self.assertLess(len(processed), 100)
+
+    def test_should_load_records_in_chunks_of_ndjson(self):
+        # given
+        client = mock.Mock()
+        loaded = []
+        client.load_table_from_file.side_effect = lambda f, table_id, job_config: loaded.append(f.read()) or mock.Mock()
+
+        # when
+        count = load_records(client, 'project.dataset.table$20200101', iter([{'id': i} for i in range(5)]), chunk_size=2)
+
+        # then
+        self.assertEqual(count, 5)
+        self.assertEqual(loaded, [b'{"id": 0}\n{"id": 1}\n', b'{"id": 2}\n{"id": 3}\n', b'{"id": 4}\n'])
+        job_config = client.load_table_from_file.call_args[1]['job_config']
+        self.assertEqual(job_config.source_format, 'NEWLINE_DELIMITED_JSON')
+        self.assertEqual(job_config.write_disposition, 'WRITE_APPEND')
+        client.insert_rows.assert_not_called()
+
+    def test_should_use_load_jobs_in_bulk_insert(self):
+        # given
+        client = mock.Mock()
+        ds = DatasetManager(client, mock.Mock(full_dataset_id='project:dataset'), mock.Mock())
+
+        # when
+        ds.insert('project.dataset.table', [{'id': 1}], bulk=True)
+
+        # then
+        client.load_table_from_file.assert_called_once()
+        client.insert_rows.assert_not_called()
@@ -1,3 +1,4 @@
+import datetime
 import difflib
 import os
 from pathlib import Path
@@ -6,7 +7,8 @@ import mock
 from unittest import TestCase
 from bigflow.bigquery.job import Job
 from bigflow.dagbuilder import get_dags_output_dir, clear_dags_output_dir, generate_dag_file, secret_template
-from bigflow.workflow import WorkflowJob, Workflow, Definition, get_timezone_offset_seconds, hourly_start_time
+from bigflow.workflow import WorkflowJob, Workflow, Definition, get_timezone_offset_seconds, hourly_start_time, \
+    staggered_start_time
 
 
 class DagBuilderTestCase(TestCase):
@@ -292,6 +294,27 @@ tjob1 = kubernetes_pod_operator.KubernetesPodOperator(
 '''
         self.assert_files_are_equal(expected_dag_content, dag_file_content)
 
+    def test_should_shift_schedule_of_staggered_workflow(self):
+        # given
+        workdir = os.path.dirname(__file__)
+        job1 = Job(id='job1', component=mock.Mock())
+        workflow = Workflow(
+            workflow_id='my_staggered_workflow',
+            definition=[job1],
+            schedule_interval='@daily',
+            start_time_factory=staggered_start_time(datetime.timedelta(minutes=20)))
+
+        # when
+        dag_file_path = generate_dag_file(workdir, 'eu.gcr.io/project/image', workflow, '2020-07-02', '0.3.0', 'ca')
+
+        # then
+        dag_file_content = Path(dag_file_path).read_text()
+        self.assertIn("'start_date': datetime.datetime(2020, 7, 1, 0, 20)", dag_file_content)
+        self.assertIn("schedule_interval='20 0 * * *'", dag_file_content)
+        self.assertIn(
+            '''--runtime', '{{ (execution_date - macros.timedelta(seconds=1200)).strftime("%Y-%m-%d %H:%M:%S") }}''',
+            dag_file_content)
+
     def assert_files_are_equal(self, expected_dag_content, dag_file_content):
         if not expected_dag_content == dag_file_content:
 
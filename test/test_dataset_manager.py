@@ -1,6 +1,8 @@
-from unittest import TestCase
+from unittest import TestCase, mock
 from bigflow.bigquery.dataset_manager import handle_key_error
 from bigflow.bigquery.dataset_manager import AliasNotFoundError
+from bigflow.bigquery.dataset_manager import DatasetManager, TablesCache, TemplatedDatasetManager, create_dataset_manager
+from bigflow.workflow import ResourceRegistry
 
 
 class HandleKeyErrorTestCase(TestCase):
@@ -11,4 +13,123 @@ class HandleKeyErrorTestCase(TestCase):
 
     @handle_key_error
     def raise_key_error(self):
-        '{missing_key}'.format(meh='bla')
\ No newline at end of file
+        '{missing_key}'.format(meh='bla')
+
+
+class TablesCacheTestCase(TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.list_tables.return_value = [mock.Mock(table_id='table_a'), mock.Mock(table_id='table_b')]
+
+    def test_should_list_dataset_tables_once(self):
+        # given
+        cache = TablesCache()
+
+        # when
+        exists = [cache.table_exists(self.client, 'project.dataset', t) for t in ['table_a', 'table_b', 'table_a']]
+
+        # then
+        self.assertEqual(exists, [True, True, True])
+        self.client.list_tables.assert_called_once_with('project.dataset')
+
+    def test_should_refresh_listing_when_table_is_missing_or_listing_expired(self):
+        # given
+        cache = TablesCache(ttl_sec=60)
+
+        # when
+        with mock.patch('time.monotonic', return_value=0):
+            cache.table_exists(self.client, 'project.dataset', 'table_a')
+            missing = cache.table_exists(self.client, 'project.dataset', 'table_c')
+        with mock.patch('time.monotonic', return_value=100):
+            cache.table_exists(self.client, 'project.dataset', 'table_a')
+
+        # then
+        self.assertFalse(missing)
+        self.assertEqual(self.client.list_tables.call_count, 3)
+
+    def test_should_add_written_tables_and_evict_removed_datasets(self):
+        # given
+        cache = TablesCache()
+        cache.table_exists(self.client, 'project.dataset', 'table_a')
+
+        # when
+        cache.add('project.dataset.table_c$20200101')
+
+        # then
+        self.assertTrue(cache.table_exists(self.client, 'project.dataset', 'table_c'))
+        self.client.list_tables.assert_called_once()
+
+        # when
+        cache.invalidate('project.dataset')
+        cache.table_exists(self.client, 'project.dataset', 'table_a')
+
+        # then
+        self.assertEqual(self.client.list_tables.call_count, 2)
+
+
+class DatasetManagerTestCase(TestCase):
+    def test_should_check_table_existence_before_write_without_query_jobs(self):
+        # given
+        client = mock.Mock()
+        client.list_tables.return_value = [mock.Mock(table_id='table_a')]
+        dataset = mock.Mock(full_dataset_id='project:dataset_for_write_test')
+        dataset_manager = DatasetManager(client, dataset, mock.Mock())
+
+        # when
+        with mock.patch('bigflow.bigquery.dataset_manager.tables_cache', TablesCache()):
+            for _ in range(3):
+                dataset_manager.write_truncate('project.dataset_for_write_test.table_a$20200101', 'SELECT 1')
+            with self.assertRaises(ValueError):
+                dataset_manager.write_truncate('project.dataset_for_write_test.table_b', 'SELECT 1')
+
+        # then
+        self.assertEqual(client.query.call_count, 3)
+        self.assertEqual(client.list_tables.call_count, 2)
+
+
+class QueryParametersTestCase(TestCase):
+    def test_should_pass_runtime_and_extras_as_query_parameters(self):
+        # given
+        client = mock.Mock()
+        dataset = mock.Mock(full_dataset_id='project:dataset')
+        dataset_manager = TemplatedDatasetManager(
+            DatasetManager(client, dataset, mock.Mock()),
+            internal_tables=['events'],
+            external_tables={},
+            extras={'country': 'PL'},
+            run_datetime='2020-01-01',
+            use_query_parameters=True)
+
+        # when
+        for run_datetime in ['2020-01-01', '2020-01-02']:
+            dataset_manager.collect(
+                "SELECT * FROM `{events}` WHERE dt = '{dt}' AND country = {country}", run_datetime)
+
+        # then
+        queries = [c[0][0] for c in client.query.call_args_list]
+        self.assertEqual(queries, ["SELECT * FROM `project.dataset.events` WHERE dt = @dt AND country = @country"] * 2)
+        parameters = client.query.call_args_list[1][1]['job_config'].query_parameters
+        self.assertEqual(
+            [(p.name, p.type_, p.value) for p in parameters],
+            [('dt', 'STRING', '2020-01-02'), ('country', 'STRING', 'PL')])
+
+
+class CreateDatasetManagerTestCase(TestCase):
+    @mock.patch('bigflow.bigquery.dataset_manager.create_bigquery_client')
+    def test_should_reuse_clients_and_datasets(self, create_bigquery_client_mock):
+        # given
+        client = create_bigquery_client_mock.return_value
+        client.project = 'project-for-pool-test'
+        client.create_dataset.side_effect = lambda ds, exists_ok: mock.Mock(
+            full_dataset_id=ds.full_dataset_id or 'project-for-pool-test:' + ds.dataset_id)
+
+        with mock.patch('bigflow.bigquery.dataset_manager.client_pool', ResourceRegistry()):
+            # when
+            for _ in range(3):
+                dataset_id, _ = create_dataset_manager('project-for-pool-test', '2020-01-01', 'pooled_dataset')
+            create_dataset_manager('project-for-pool-test', '2020-01-01', 'pooled_dataset', location='US')
+
+        # then
+        self.assertEqual(dataset_id, 'project-for-pool-test.pooled_dataset')
+        self.assertEqual(create_bigquery_client_mock.call_count, 2)
+        client.create_dataset.assert_called_once()
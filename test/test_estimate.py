@@ -0,0 +1,150 @@
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import NotFound
+
+import bigflow
+from bigflow.bigquery.budget import BytesBudget, BudgetExceededError, limit_workflow_bytes_billed, job_budget
+from bigflow.bigquery.dataset_manager import DatasetManager
+from bigflow.bigquery.estimate import estimate_workflow
+from bigflow.bigquery.interactive import DatasetConfigInternal
+from bigflow.bigquery.job import Job
+from test import bigquery_mocks
+
+GB = 2 ** 30
+
+
+def finished_job(bytes_billed, job_config):
+    return bigquery_mocks.finished_job(
+        bytes_billed, maximum_bytes_billed=job_config.maximum_bytes_billed, **{'result.return_value': []})
+
+
+def dry_run_job(bytes_processed):
+    return mock.Mock(total_bytes_processed=bytes_processed)
+
+
+class BudgetTestCase(TestCase):
+
+    def test_should_limit_queries_to_what_is_left_of_job_and_workflow_budgets(self):
+        # given
+        workflow_budget = BytesBudget(10 * GB, 'budget of workflow')
+        budget = BytesBudget(4 * GB, 'budget of job', workflow_budget)
+        client = mock.Mock()
+        client.query.side_effect = lambda sql, job_config: finished_job(3 * GB, job_config)
+        client.get_table.side_effect = NotFound('tmp')
+        dataset_manager = DatasetManager(client, mock.Mock(full_dataset_id='project:dataset'), mock.Mock(), budget=budget)
+
+        # when
+        dataset_manager.write_tmp('project.dataset.tmp', 'SELECT 1')
+        dataset_manager.collect_list('SELECT 2')
+
+        # then
+        limits = [c[1]['job_config'].maximum_bytes_billed for c in client.query.call_args_list]
+        self.assertEqual(limits, [4 * GB, GB])
+        self.assertEqual(workflow_budget.billed, 6 * GB)
+
+        # and
+        with self.assertRaises(BudgetExceededError):
+            dataset_manager.collect_list('SELECT 3')
+
+    def test_should_reserve_limits_of_running_queries(self):
+        # given
+        workflow_budget = BytesBudget(10 * GB, 'budget of workflow')
+        budget = BytesBudget(8 * GB, 'budget of job', workflow_budget)
+
+        # when
+        first = budget.limit(concurrency=4)
+        second = budget.limit(concurrency=4)
+        budget.charge(GB, first)
+        third = budget.limit()
+
+        # then
+        self.assertEqual((first, second, third), (2 * GB, 2 * GB, 5 * GB))
+        other_budget = BytesBudget(4 * GB, 'budget of other job', workflow_budget)
+        self.assertEqual(other_budget.limit(), 2 * GB)
+        with self.assertRaises(BudgetExceededError):
+            budget.limit()
+
+        # when
+        budget.charge(GB, second)
+        budget.charge(GB, third)
+
+        # then
+        self.assertEqual((budget.remaining(), workflow_budget.remaining()), (5 * GB, 5 * GB))
+
+    def test_should_share_budget_by_queries_of_parallel_block(self):
+        # given
+        budget = BytesBudget(8 * GB, 'budget of job')
+        client = mock.Mock()
+        client.query.side_effect = lambda sql, job_config: finished_job(GB, job_config)
+        ds = bigquery_mocks.dataset_manager(client, internal_tables=[], budget=budget)
+
+        # when
+        with ds.parallel(max_concurrency=4):
+            for i in range(2):
+                ds.collect_list_async(f'SELECT {i}')
+        ds.collect_list('SELECT 2')
+
+        # then
+        limits = [c[1]['job_config'].maximum_bytes_billed for c in client.query.call_args_list]
+        self.assertEqual(limits, [2 * GB, 2 * GB, 6 * GB])
+        self.assertEqual((budget.billed, budget.reserved), (3 * GB, 0))
+
+    def test_should_share_workflow_budget_by_jobs_of_one_run(self):
+        # given
+        workflow = bigflow.Workflow(workflow_id='workflow', definition=[])
+        limit_workflow_bytes_billed(workflow, 10 * GB)
+
+        # when
+        workflow.resources.setup()
+        first = job_budget('first', 4 * GB, workflow.resources)
+        second = job_budget('second', None, workflow.resources)
+        first.charge(3 * GB)
+        workflow.resources.teardown()
+
+        # then
+        self.assertEqual(second.remaining(), 7 * GB)
+        self.assertEqual(job_budget('first', 4 * GB, workflow.resources).remaining(), 4 * GB)
+        self.assertIsNone(job_budget('other', None, bigflow.workflow.ResourceRegistry()))
+
+
+class EstimateTestCase(TestCase):
+
+    @mock.patch('bigflow.bigquery.dataset_manager.create_dataset')
+    @mock.patch('bigflow.bigquery.dataset_manager.get_bigquery_client')
+    def test_should_dry_run_queries_of_all_jobs(self, get_bigquery_client_mock, create_dataset_mock):
+        # given
+        client = get_bigquery_client_mock.return_value
+        client.project = 'project'
+        client.query.side_effect = lambda sql, job_config: dry_run_job(GB if 'events' in sql else 100)
+        config = DatasetConfigInternal(
+            project_id='project', dataset_name='dataset', internal_tables=['events', 'report'])
+
+        def first(ds):
+            ds.write_truncate('report', 'SELECT * FROM {events}')
+            ds.collect_list('SELECT 1')
+
+        def second(ds):
+            if ds.collect('SELECT COUNT(*) FROM {events}').empty:
+                raise ValueError('no data')
+
+        workflow = bigflow.Workflow(workflow_id='workflow', definition=[
+            Job(first, ds=config, maximum_bytes_billed=GB // 2),
+            Job(second, ds=config),
+        ])
+        limit_workflow_bytes_billed(workflow, 10 * GB)
+
+        # when
+        estimate = estimate_workflow(workflow, '2020-01-01')
+
+        # then
+        self.assertEqual([j.total_bytes for j in estimate.jobs], [GB + 100, GB])
+        self.assertEqual(estimate.total_bytes, 2 * GB + 100)
+        self.assertTrue(all(c[1]['job_config'].dry_run for c in client.query.call_args_list))
+        create_dataset_mock.assert_not_called()
+
+        # and
+        self.assertTrue(estimate.over_budget)
+        self.assertFalse(estimate.jobs[1].complete)
+        report = estimate.format()
+        self.assertIn('job first: processes 1.0 GB, EXCEEDS the budget of 512.0 MB', report)
+        self.assertIn("the component failed: ValueError('no data')", report)
@@ -0,0 +1,104 @@
+import importlib.util
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import NotFound
+
+from bigflow.bigquery.extract import ShardReader, ExtractedTable, extract_job_config, list_shards
+from bigflow.bigquery.stats import StatsCollector
+from test import bigquery_mocks
+
+
+class ExtractTestCase(TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.get_table.side_effect = NotFound('events')
+        self.client.list_tables.return_value = []
+        self.client.extract_table.side_effect = \
+            lambda *args, **kwargs: bigquery_mocks.finished_job(destination_uri_file_counts=[3])
+        self.stats = StatsCollector('job', '2020-01-01', sinks=[])
+        self.dataset_manager = bigquery_mocks.dataset_manager(
+            self.client,
+            internal_tables=['events', 'users'],
+            external_tables={'raw_events': 'p.raw.events', 'archived_events': 'p.archive.events'},
+            stats=self.stats)
+
+    def test_should_extract_many_tables(self):
+        # when
+        result = self.dataset_manager.extract(
+            ['events', 'users'], 'gs://bucket/{table}/{dt}/*.avro', 'AVRO', 'SNAPPY', max_concurrency=2)
+
+        # then
+        self.assertEqual(result, [
+            ExtractedTable('project.dataset.events', 'gs://bucket/events/2020-01-01/*.avro', 3),
+            ExtractedTable('project.dataset.users', 'gs://bucket/users/2020-01-01/*.avro', 3),
+        ])
+        job_config = self.client.extract_table.call_args[1]['job_config']
+        self.assertEqual((job_config.destination_format, job_config.compression), ('AVRO', 'SNAPPY'))
+        self.assertTrue(job_config.use_avro_logical_types)
+        self.assertEqual([s.operation for s in self.stats.stats], ['extract', 'extract'])
+
+    def test_should_extract_runtime_partition(self):
+        # when
+        self.dataset_manager.extract('events', 'gs://bucket/{table}/{partition}/*.parquet', partitioned=True)
+
+        # then
+        self.client.extract_table.assert_called_once_with(
+            'project.dataset.events$20200101', 'gs://bucket/events/20200101/*.parquet', job_config=mock.ANY)
+
+    def test_should_not_extract_tables_to_the_same_files(self):
+        with self.assertRaises(ValueError):
+            self.dataset_manager.extract(['events', 'users'], 'gs://bucket/export/*.parquet')
+        self.client.extract_table.assert_not_called()
+
+    def test_should_not_extract_external_tables_with_the_same_name_to_the_same_files(self):
+        with self.assertRaises(ValueError):
+            self.dataset_manager.extract(['raw_events', 'archived_events'], 'gs://bucket/{table}/*.parquet')
+        self.client.extract_table.assert_not_called()
+
+    def test_should_reject_invalid_compression(self):
+        with self.assertRaises(ValueError):
+            extract_job_config('CSV', 'SNAPPY')
+
+
+class ShardReaderTestCase(TestCase):
+
+    def test_should_list_shards_matching_pattern(self):
+        # given
+        storage_client = mock.Mock()
+        storage_client.list_blobs.return_value = [mock.Mock() for _ in range(3)]
+        for blob, name in zip(storage_client.list_blobs.return_value, [
+                'export/events-000000000001.parquet', 'export/events-000000000000.parquet', 'export/events.json']):
+            blob.name = name
+
+        # when
+        shards = list_shards(storage_client, 'gs://bucket/export/events-*.parquet')
+
+        # then
+        storage_client.list_blobs.assert_called_once_with('bucket', prefix='export/events-')
+        self.assertEqual(shards, [
+            'gs://bucket/export/events-000000000000.parquet',
+            'gs://bucket/export/events-000000000001.parquet',
+        ])
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_should_read_all_shards(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        # given
+        directory = Path(tempfile.mkdtemp())
+        for i in range(5):
+            pyarrow.parquet.write_table(
+                pyarrow.table({'id': list(range(i * 10, i * 10 + 10))}), str(directory / f'{i:012}.parquet'),
+                row_group_size=3)
+
+        # when
+        reader = ShardReader(None, str(directory / '*.parquet'), max_workers=2, max_queue_size=1)
+
+        # then
+        self.assertEqual(len(reader.shards), 5)
+        self.assertEqual(sorted(reader.read_all().column('id').to_pylist()), list(range(50)))
@@ -510,11 +510,16 @@ class InteractiveDatasetManagerTestCase(TestCase):
             mock.call.create_table_from_schema(
                 table_name='table',
                 schema=[{}],
-                table=None),
+                table=None,
+                table_options=None),
             mock.call.insert(
                 table_name='table',
                 records=[{}],
-                partitioned=True),
+                partitioned=True,
+                bulk=False,
+                source_format='NEWLINE_DELIMITED_JSON',
+                chunk_size=100_000,
+                max_concurrency=1),
             mock.call.remove_dataset(),
         ])
 
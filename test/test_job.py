@@ -26,7 +26,13 @@ class JobTestCase(TestCase):
                 'extras': {'extra_param': 'some-extra-param'},
                 'runtime': '2019-01-01 00:00:00',
                 'credentials': 'credentials',
-                'location': 'EU'
+                'location': 'EU',
+                'backend': None,
+                'use_query_parameters': False,
+                'cache_tmp_tables': False,
+                'resources': context.resources,
+                'stats': mock.ANY,
+                'budget': None,
             })
 
             # and
@@ -38,7 +44,13 @@ class JobTestCase(TestCase):
                 'extras': {'extra_param': 'some-extra-param'},
                 'credentials': 'credentials',
                 'runtime': '2019-01-01 00:00:00',
-                'location': 'EU'
+                'location': 'EU',
+                'backend': None,
+                'use_query_parameters': False,
+                'cache_tmp_tables': False,
+                'resources': context.resources,
+                'stats': mock.ANY,
+                'budget': None,
             })
 
         job = Job(component=test_component,
@@ -57,5 +69,7 @@ class JobTestCase(TestCase):
                       credentials='credentials',
                       extras={'extra_param': 'some-extra-param'}))
 
+        context = bigflow.JobContext.make(runtime=datetime.date(2019, 1, 1))
+
         # when
-        job.execute(bigflow.JobContext.make(runtime=datetime.date(2019, 1, 1)))
\ No newline at end of file
+        job.execute(context)
\ No newline at end of file
@@ -0,0 +1,123 @@
+import datetime
+import importlib.util
+import unittest
+from unittest import TestCase
+
+from bigflow.bigquery.dataset_manager import create_dataset_manager
+from bigflow.bigquery.local import translate_sql, translate_ddl, partition_range, INGESTION_TIME
+
+
+class TranslationTestCase(TestCase):
+
+    def test_should_translate_identifiers_literals_and_types(self):
+        # when
+        sql = translate_sql('''
+        SELECT * EXCEPT (a), CAST(b AS STRING), "it's", COUNTIF(c)
+        FROM `project.dataset.table`
+        WHERE _PARTITIONDATE = DATE('2020-01-01')
+        ''')
+
+        # then
+        self.assertEqual(sql, '''
+        SELECT * EXCLUDE (a), CAST(b AS VARCHAR), 'it''s', count_if(c)
+        FROM "dataset"."table"
+        WHERE CAST(_PARTITIONTIME AS DATE) = bq_date('2020-01-01')
+        ''')
+
+    def test_should_bind_query_parameters_as_literals(self):
+        # when
+        sql = translate_sql(
+            "SELECT @@dataset_id, '@dt' FROM `p.d.t` WHERE dt = @dt AND n IN UNNEST(@ns) AND ok = @ok",
+            {'dt': "2020-01-01", 'ns': [1, 2], 'ok': True})
+
+        # then
+        self.assertEqual(
+            sql,
+            """SELECT @@dataset_id, '@dt' FROM "d"."t" WHERE dt = '2020-01-01' AND n IN UNNEST([1, 2]) AND ok = TRUE""")
+
+    def test_should_extract_partitioning_from_create_table(self):
+        # when
+        column_partitioned = translate_ddl('''
+        CREATE TABLE IF NOT EXISTS `project.dataset.events` (
+            batch_date TIMESTAMP,
+            name STRING OPTIONS(description="name (first)"))
+        PARTITION BY DATE(batch_date)
+        CLUSTER BY name
+        ''')
+        ingestion_time_partitioned = translate_ddl('''
+        CREATE TABLE ports
+        PARTITION BY _PARTITIONDATE
+        AS SELECT ROW_NUMBER() OVER (PARTITION BY country) AS n FROM `project.dataset.all_ports`
+        ''')
+
+        # then
+        self.assertEqual(column_partitioned.sql, '''
+        CREATE TABLE IF NOT EXISTS "dataset"."events" (
+            batch_date TIMESTAMP,
+            name VARCHAR )''')
+        self.assertEqual(
+            (column_partitioned.dataset, column_partitioned.table, column_partitioned.partition_field),
+            ('dataset', 'events', 'batch_date'))
+        self.assertEqual(ingestion_time_partitioned.partition_field, INGESTION_TIME)
+        self.assertIn('OVER (PARTITION BY country)', ingestion_time_partitioned.sql)
+
+    def test_should_extract_partition_type_from_create_table(self):
+        # when
+        hourly = translate_ddl('CREATE TABLE t (created TIMESTAMP) PARTITION BY TIMESTAMP_TRUNC(created, HOUR)')
+        monthly = translate_ddl('CREATE TABLE t (day DATE) PARTITION BY DATE_TRUNC(day, MONTH)')
+        by_range = translate_ddl(
+            'CREATE TABLE t (id INT64) PARTITION BY RANGE_BUCKET(id, GENERATE_ARRAY(0, 100, 10))')
+
+        # then
+        self.assertEqual((hourly.partition_field, hourly.partition_type), ('created', 'HOUR'))
+        self.assertEqual((monthly.partition_field, monthly.partition_type), ('day', 'MONTH'))
+        self.assertEqual((by_range.partition_field, by_range.partition_type), ('id', 'RANGE'))
+
+    def test_should_compute_partition_range(self):
+        self.assertEqual(partition_range('202012'), (datetime.datetime(2020, 12, 1), datetime.datetime(2021, 1, 1)))
+        self.assertEqual(
+            partition_range('2020010123'), (datetime.datetime(2020, 1, 1, 23), datetime.datetime(2020, 1, 2)))
+        with self.assertRaises(ValueError):
+            partition_range('2020-01-01')
+
+
+@unittest.skipUnless(importlib.util.find_spec('duckdb'), 'duckdb is not installed')
+class LocalDatasetManagerTestCase(TestCase):
+
+    def setUp(self):
+        _, self.ds = create_dataset_manager(
+            'project', '2020-01-02', dataset_name='local_test', internal_tables=['events'], backend='local')
+        self.ds.create_table('''
+        CREATE TABLE events (
+            batch_date TIMESTAMP,
+            name STRING)
+        PARTITION BY DATE(batch_date)
+        ''')
+
+    def tearDown(self):
+        self.ds.remove_dataset()
+
+    def test_should_overwrite_only_runtime_partition(self):
+        # given
+        self.ds.insert('events', [
+            {'batch_date': '2020-01-01 10:00:00', 'name': 'old'},
+            {'batch_date': '2020-01-02 10:00:00', 'name': 'old'},
+        ], partitioned=False)
+
+        # when
+        self.ds.write_truncate('events', '''
+        SELECT TIMESTAMP('{dt} 12:00:00') AS batch_date, "new" AS name
+        ''')
+
+        # then
+        self.assertEqual(
+            self.ds.collect_list('SELECT name FROM `{events}` ORDER BY batch_date', record_as_dict=True),
+            [{'name': 'old'}, {'name': 'new'}])
+
+    def test_should_create_table_from_query_result(self):
+        # when
+        self.ds.write_tmp('names', 'SELECT DISTINCT name FROM `{events}`')
+
+        # then
+        self.assertTrue(self.ds._table_exists('names'))
+        self.assertTrue(self.ds.collect('SELECT * FROM `{events}`').empty)
@@ -0,0 +1,143 @@
+import copy
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import NotFound
+from google.cloud.bigquery import Table, TableReference
+
+from bigflow.bigquery.dataset_manager import DatasetManager
+from bigflow.bigquery.materialization import query_fingerprint, FINGERPRINT_LABEL
+
+
+def table(table_id, modified_ms=1000, table_type='TABLE', labels=None):
+    project, dataset, name = table_id.split('.')
+    return Table.from_api_repr({
+        'tableReference': {'projectId': project, 'datasetId': dataset, 'tableId': name},
+        'type': table_type,
+        'lastModifiedTime': str(modified_ms),
+        'labels': labels or {},
+    })
+
+
+class FakeBigQuery(object):
+
+    def __init__(self, *tables):
+        self.tables = {t.table_id: t for t in tables}
+        self.queries = []
+
+    def get_table(self, table_id):
+        name = table_id.table_id if isinstance(table_id, TableReference) else table_id.split('.')[-1]
+        if name not in self.tables:
+            raise NotFound(name)
+        return Table.from_api_repr(copy.deepcopy(self.tables[name].to_api_repr()))
+
+    def update_table(self, table, fields):
+        # a label set to None is removed
+        table.labels = {key: value for key, value in table.labels.items() if value is not None}
+        self.tables[table.table_id] = table
+
+    def query(self, sql, job_config):
+        if not job_config.dry_run:
+            self.queries.append(sql)
+            destination = job_config.destination
+            # like WRITE_TRUNCATE, a rewrite keeps labels of the table
+            previous = self.tables.get(destination.table_id)
+            self.tables[destination.table_id] = table(
+                f'{destination.project}.{destination.dataset_id}.{destination.table_id}',
+                labels=previous.labels if previous else None)
+        return mock.Mock(
+            referenced_tables=[TableReference.from_string('p.d.events')],
+            total_bytes_billed=0,
+            query_plan=[])
+
+
+class MaterializationTestCase(TestCase):
+
+    def test_should_fingerprint_query_and_versions_of_its_inputs(self):
+        # given
+        client = FakeBigQuery(table('p.d.events'))
+        config = lambda: mock.Mock(dry_run=False)
+
+        # when
+        fingerprint = query_fingerprint(client, 'SELECT * FROM p.d.events', config())
+
+        # then
+        self.assertEqual(fingerprint, query_fingerprint(client, 'SELECT * FROM p.d.events', config()))
+        self.assertNotEqual(fingerprint, query_fingerprint(client, 'SELECT id FROM p.d.events', config()))
+        self.assertIsNone(query_fingerprint(client, 'SELECT CURRENT_DATE() FROM p.d.events', config()))
+
+        # when
+        client.tables['events'] = table('p.d.events', modified_ms=2000)
+
+        # then
+        self.assertNotEqual(fingerprint, query_fingerprint(client, 'SELECT * FROM p.d.events', config()))
+
+        # when
+        client.tables['events'] = table('p.d.events', table_type='VIEW')
+
+        # then
+        self.assertIsNone(query_fingerprint(client, 'SELECT * FROM p.d.events', config()))
+
+    def test_should_reuse_tmp_table_until_its_input_changes(self):
+        # given
+        client = FakeBigQuery(table('p.d.events'))
+        dataset_manager = DatasetManager(
+            client, mock.Mock(full_dataset_id='p:d'), mock.Mock(), cache_tmp_tables=True)
+
+        # when
+        dataset_manager.write_tmp('p.d.tmp', 'SELECT * FROM p.d.events')
+        dataset_manager.write_tmp_async('p.d.tmp', 'SELECT * FROM p.d.events').result()
+
+        # then
+        self.assertEqual(len(client.queries), 1)
+        self.assertIn(FINGERPRINT_LABEL, client.tables['tmp'].labels)
+
+        # when
+        client.tables['events'] = table('p.d.events', modified_ms=2000)
+        dataset_manager.write_tmp_async('p.d.tmp', 'SELECT * FROM p.d.events').result()
+
+        # then
+        self.assertEqual(len(client.queries), 2)
+
+    def test_should_not_reuse_tmp_table_rewritten_by_other_query(self):
+        # given
+        client = FakeBigQuery(table('p.d.events'))
+        cached, uncached = [
+            DatasetManager(client, mock.Mock(full_dataset_id='p:d'), mock.Mock(), cache_tmp_tables=cache_tmp_tables)
+            for cache_tmp_tables in (True, False)]
+        cached.write_tmp('p.d.tmp', 'SELECT * FROM p.d.events')
+
+        # when
+        uncached.write_tmp_async('p.d.tmp', 'SELECT id FROM p.d.events').result()
+        cached.write_tmp('p.d.tmp', 'SELECT * FROM p.d.events')
+
+        # then
+        self.assertEqual(len(client.queries), 3)
+
+    def test_should_not_reuse_tmp_table_rewritten_by_interrupted_write(self):
+        # given
+        client = FakeBigQuery(table('p.d.events'))
+        dataset_manager = DatasetManager(
+            client, mock.Mock(full_dataset_id='p:d'), mock.Mock(), cache_tmp_tables=True)
+        dataset_manager.write_tmp('p.d.tmp', 'SELECT * FROM p.d.events')
+        updates = []
+
+        def update_table(table, fields):
+            # the fingerprint is removed, but the job dies before the new one is saved
+            updates.append(table)
+            if len(updates) > 1:
+                raise RuntimeError('interrupted')
+            FakeBigQuery.update_table(client, table, fields)
+
+        # when
+        with mock.patch.object(client, 'update_table', side_effect=update_table):
+            with self.assertRaises(RuntimeError):
+                dataset_manager.write_tmp('p.d.tmp', 'SELECT id FROM p.d.events')
+
+        # then
+        self.assertNotIn(FINGERPRINT_LABEL, client.tables['tmp'].labels)
+
+        # when
+        dataset_manager.write_tmp('p.d.tmp', 'SELECT * FROM p.d.events')
+
+        # then
+        self.assertEqual(len(client.queries), 3)
@@ -0,0 +1,110 @@
+import datetime
+from unittest import TestCase, mock
+
+from google.cloud.bigquery import Table, SchemaField, TimePartitioning
+
+from bigflow.bigquery.merge import merge_statement, merge_result, MergeResult
+from bigflow.bigquery.stats import StatsCollector
+from test import bigquery_mocks
+
+
+SCHEMA = [SchemaField('id', 'INT64'), SchemaField('name', 'STRING'), SchemaField('day', 'DATE')]
+
+
+def events_table(partition_field=None):
+    table = Table('project.dataset.events', schema=SCHEMA)
+    table.time_partitioning = TimePartitioning(field=partition_field)
+    return table
+
+
+def query_job(**kwargs):
+    return bigquery_mocks.finished_job(100, slot_millis=10, cache_hit=False, dml_stats=None, **kwargs)
+
+
+def merge_job(inserted, updated):
+    return query_job(_properties={'statistics': {'query': {'dmlStats': {
+        'insertedRowCount': str(inserted), 'updatedRowCount': str(updated)}}}})
+
+
+class MergeStatementTestCase(TestCase):
+
+    def test_should_merge_into_ingestion_time_partition(self):
+        # when
+        statement = merge_statement(events_table(), 'SELECT * FROM updates', ['id'], '20200101')
+
+        # then
+        self.assertEqual(statement, '\n'.join([
+            "MERGE `project.dataset.events` T",
+            "USING (\nSELECT `id`, `name`, `day` FROM (\nSELECT * FROM updates\n)\n) S",
+            "ON T.`id` = S.`id` AND T._PARTITIONTIME >= TIMESTAMP '2020-01-01 00:00:00' "
+            "AND T._PARTITIONTIME < TIMESTAMP '2020-01-02 00:00:00'",
+            "WHEN MATCHED THEN UPDATE SET `name` = S.`name`, `day` = S.`day`",
+            "WHEN NOT MATCHED THEN INSERT (_PARTITIONTIME, `id`, `name`, `day`) "
+            "VALUES (TIMESTAMP '2020-01-01 00:00:00', S.`id`, S.`name`, S.`day`);",
+        ]))
+
+    def test_should_fail_rows_outside_of_column_partition(self):
+        # when
+        statement = merge_statement(events_table('day'), 'SELECT * FROM updates', ['id', 'day'], '202001')
+
+        # then
+        self.assertIn(
+            "WHERE IF(`day` >= DATE '2020-01-01' AND `day` < DATE '2020-02-01', TRUE, "
+            "ERROR('Row outside of partition 202001'))", statement)
+        self.assertIn("ON T.`id` = S.`id` AND T.`day` = S.`day` AND T.`day` >= DATE '2020-01-01'", statement)
+        self.assertIn("WHEN MATCHED THEN UPDATE SET `name` = S.`name`\n", statement)
+
+    def test_should_reject_unknown_keys(self):
+        with self.assertRaises(ValueError):
+            merge_statement(events_table(), 'SELECT * FROM updates', ['user_id'], '20200101')
+        with self.assertRaises(ValueError):
+            merge_statement(events_table(), 'SELECT * FROM updates', [], '20200101')
+
+    def test_should_read_inserted_and_updated_rows(self):
+        self.assertEqual(merge_result(merge_job(2, 3)), MergeResult(inserted=2, updated=3))
+
+
+class WriteMergeTestCase(TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.list_tables.return_value = [mock.Mock(table_id='events')]
+        self.stats = StatsCollector('job', '2020-01-01', sinks=[])
+        self.dataset_manager = bigquery_mocks.dataset_manager(self.client, stats=self.stats)
+
+    def test_should_merge_into_runtime_partition(self):
+        # given
+        self.client.get_table.return_value = events_table('day')
+        self.client.query.return_value = merge_job(2, 3)
+
+        # when
+        result = self.dataset_manager.write_merge('events', "SELECT * FROM updates WHERE day = '{dt}'", keys=['id'])
+
+        # then
+        self.assertEqual(result, MergeResult(inserted=2, updated=3))
+        statement = self.client.query.call_args[0][0]
+        self.assertIn("WHERE day = '2020-01-01'", statement)
+        self.assertIn("T.`day` >= DATE '2020-01-01' AND T.`day` < DATE '2020-01-02'", statement)
+        self.assertEqual(
+            [(s.operation, s.target) for s in self.stats.stats],
+            [('write_merge', 'project.dataset.events$20200101')])
+
+    def test_should_stage_rows_to_find_merged_partitions(self):
+        # given
+        self.client.get_table.return_value = events_table('day')
+        bounds_job = query_job()
+        bounds_job.result.return_value = [(datetime.date(2020, 1, 3), datetime.date(2020, 1, 5), False)]
+        self.client.query.side_effect = [query_job(), bounds_job, merge_job(1, 0)]
+
+        # when
+        result = self.dataset_manager.write_merge('events', 'SELECT * FROM updates', keys=['id'], partitioned=False)
+
+        # then
+        self.assertEqual(result, MergeResult(inserted=1, updated=0))
+        staging_table_id = self.client.query.call_args_list[0][1]['job_config'].destination
+        self.assertTrue(staging_table_id.table_id.startswith('events_merge_staging_'))
+        statement = self.client.query.call_args_list[2][0][0]
+        self.assertIn(f"FROM `{staging_table_id.project}.{staging_table_id.dataset_id}.{staging_table_id.table_id}`",
+                      statement)
+        self.assertIn("T.`day` BETWEEN DATE '2020-01-03' AND DATE '2020-01-05'", statement)
+        self.client.delete_table.assert_called_once()
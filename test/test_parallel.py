@@ -0,0 +1,99 @@
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import NotFound
+
+from bigflow.bigquery.dataset_manager import DatasetManager, TemplatedDatasetManager, PartitionedDatasetManager
+from bigflow.bigquery.parallel import QueryFuture, OperationGroup, CancelledOperationError, gather
+
+
+class FakeJob:
+
+    def __init__(self, name, events, polls=1, error=None):
+        self.name = name
+        self.job_id = name
+        self.events = events
+        self.polls = polls
+        self.error = error
+        self.cancelled = False
+
+    def done(self):
+        self.polls -= 1
+        return self.polls <= 0
+
+    def result(self):
+        self.events.append(('result', self.name))
+        if self.error:
+            raise self.error
+        return self.name
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def submitting(job):
+    def submit():
+        job.events.append(('submit', job.name))
+        return job
+    return submit
+
+
+class OperationGroupTestCase(TestCase):
+
+    def test_should_run_operations_concurrently_with_limit(self):
+        # given
+        events = []
+        jobs = [FakeJob(f'job{i}', events, polls=2) for i in range(3)]
+
+        # when
+        results = gather(*[QueryFuture(submitting(j)) for j in jobs], max_concurrency=2, poll_interval_sec=0)
+
+        # then
+        self.assertEqual(results, ['job0', 'job1', 'job2'])
+        self.assertEqual(events[:2], [('submit', 'job0'), ('submit', 'job1')])
+        self.assertLess(events.index(('result', 'job0')), events.index(('submit', 'job2')))
+
+    def test_should_cancel_remaining_operations_after_failure(self):
+        # given
+        events = []
+        failing = FakeJob('failing', events, polls=1, error=RuntimeError("query failed"))
+        running = FakeJob('running', events, polls=100)
+        pending = FakeJob('pending', events)
+        futures = [QueryFuture(submitting(j)) for j in [failing, running, pending]]
+
+        # when
+        with self.assertRaises(RuntimeError):
+            with OperationGroup(max_concurrency=2, poll_interval_sec=0) as group:
+                for f in futures:
+                    group.add(f)
+
+        # then
+        self.assertTrue(running.cancelled)
+        self.assertNotIn(('submit', 'pending'), events)
+        with self.assertRaises(CancelledOperationError):
+            futures[2].result()
+
+
+class DatasetManagerAsyncTestCase(TestCase):
+
+    def test_should_submit_writes_of_parallel_block_together(self):
+        # given
+        client = mock.Mock()
+        client.list_tables.return_value = []
+        client.get_table.side_effect = NotFound('tmp')
+        dataset = mock.Mock(full_dataset_id='project:dataset_for_async_test')
+        ds = PartitionedDatasetManager(
+            TemplatedDatasetManager(DatasetManager(client, dataset, mock.Mock()), [], {}, {}, '2020-01-01'),
+            '20200101')
+
+        # when
+        with ds.parallel(max_concurrency=5):
+            futures = [ds.write_tmp_async(f'table_{i}', f'SELECT {i}') for i in range(3)]
+            # then
+            self.assertEqual(client.query.call_count, 3)
+            client.query.return_value.result.assert_not_called()
+
+        # then
+        self.assertEqual(client.query.return_value.result.call_count, 3)
+        self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual(
+            client.query.call_args_list[0][1]['job_config'].destination.table_id, 'table_0')
@@ -0,0 +1,69 @@
+from unittest import TestCase, mock
+
+from google.cloud.bigquery import Table, TimePartitioning
+from google.cloud.bigquery.job import QueryPlanEntry
+
+from bigflow.bigquery.query_plan import analyze_plan, analyze_job, read_tables, SKEW, SPILL, FULL_SCAN, \
+    REPARTITION_JOIN
+
+
+def stage(name, steps=(), **properties):
+    return QueryPlanEntry.from_api_repr(dict(
+        name=name,
+        steps=[{'kind': kind, 'substeps': list(substeps)} for kind, substeps in steps],
+        **{k: str(v) for k, v in properties.items()}))
+
+
+class QueryPlanTestCase(TestCase):
+
+    def test_should_find_skewed_and_spilling_stages(self):
+        # given
+        plan = [
+            stage('S00: Input', computeMsAvg=1000, computeMsMax=2000),
+            stage('S01: Join+', computeMsAvg=2000, computeMsMax=60000),
+            stage('S02: Aggregate', shuffleOutputBytesSpilled=5 * 2 ** 30),
+        ]
+
+        # when
+        warnings = analyze_plan(plan)
+
+        # then
+        self.assertEqual([(w.kind, w.stage) for w in warnings], [(SKEW, 'S01: Join+'), (SPILL, 'S02: Aggregate')])
+        self.assertIn('30.0x longer than average', warnings[0].message)
+        self.assertIn('5.0 GB', warnings[1].message)
+
+    def test_should_find_reads_of_partitioned_tables_without_partition_filter(self):
+        # given
+        plan = [
+            stage('S00: Input', steps=[('READ', ['$1:id, $2:day', 'FROM project.dataset.events', 'WHERE equal($2, 1)'])]),
+            stage('S01: Input', steps=[('READ', ['$1:id, $2:day', 'FROM project.dataset.clicks', 'WHERE equal($2, 1)'])]),
+            stage('S02: Input', steps=[('READ', ['$1:id', 'FROM project.dataset.views'])]),
+        ]
+        events = Table('project.dataset.events')
+        events.time_partitioning = TimePartitioning(field='created')
+        clicks = Table('project.dataset.clicks')
+        clicks.time_partitioning = TimePartitioning(field='day')
+        tables = {t.table_id: t for t in [events, clicks, Table('project.dataset.views')]}
+
+        # when
+        warnings = analyze_job(mock.Mock(query_plan=plan), lambda table_id: tables[table_id.split('.')[-1]])
+
+        # then
+        self.assertEqual(read_tables(plan), ['project.dataset.events', 'project.dataset.clicks', 'project.dataset.views'])
+        self.assertEqual([(w.kind, w.stage) for w in warnings], [(FULL_SCAN, 'S00: Input')])
+
+    def test_should_find_repartition_heavy_joins(self):
+        # given
+        plan = [
+            stage('S00: Input'),
+            stage('S01: Repartition', shuffleOutputBytes=2 ** 30),
+            stage('S02: Repartition', shuffleOutputBytes=2 ** 30),
+            stage('S03: Join+', steps=[('JOIN', ['INNER HASH JOIN EACH WITH EACH ON $1 = $2'])]),
+        ]
+
+        # when
+        warnings = analyze_plan(plan)
+
+        # then
+        self.assertEqual([(w.kind, w.stage) for w in warnings], [(REPARTITION_JOIN, 'S03: Join+')])
+        self.assertIn('2 repartition stages which shuffle 2.0 GB', warnings[0].message)
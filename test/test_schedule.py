@@ -0,0 +1,147 @@
+import argparse
+import datetime as dt
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+import bigflow
+from bigflow.schedule import WorkflowLoad, schedule_fire_times, shift_schedule_interval, forecast_load, \
+    assign_offsets, workflow_loads, forecast_report
+from bigflow.cli import _cli_schedule_load
+from bigflow.workflow import staggered_start_time
+
+
+class ScheduleFireTimesTestCase(TestCase):
+
+    def test_should_list_fire_times_of_cron_presets_and_expressions(self):
+        # given
+        start = dt.datetime(2021, 3, 1)  # monday
+        end = dt.datetime(2021, 3, 8)
+
+        # expect
+        self.assertEqual(len(list(schedule_fire_times('@daily', start, end))), 7)
+        self.assertEqual(len(list(schedule_fire_times('@hourly', start, end))), 7 * 24)
+        self.assertEqual(list(schedule_fire_times('@weekly', start, end)), [dt.datetime(2021, 3, 7)])
+        self.assertEqual(list(schedule_fire_times('@once', start, end)), [])
+        self.assertEqual(
+            list(schedule_fire_times('30 2-6/2 * * 1-2', start, end)),
+            [dt.datetime(2021, 3, d, h, 30) for d in (1, 2) for h in (2, 4, 6)])
+        self.assertEqual(len(list(schedule_fire_times(dt.timedelta(hours=6), start, end))), 28)
+
+    def test_should_raise_error_for_invalid_cron_expression(self):
+        with self.assertRaises(ValueError):
+            list(schedule_fire_times('0 25 * * *', dt.datetime(2021, 3, 1), dt.datetime(2021, 3, 2)))
+        with self.assertRaises(ValueError):
+            list(schedule_fire_times('@sometimes', dt.datetime(2021, 3, 1), dt.datetime(2021, 3, 2)))
+
+
+class ShiftScheduleIntervalTestCase(TestCase):
+
+    def test_should_shift_schedule_interval(self):
+        self.assertEqual(shift_schedule_interval('@daily', dt.timedelta(0)), '@daily')
+        self.assertEqual(shift_schedule_interval('@daily', dt.timedelta(minutes=90)), '30 1 * * *')
+        self.assertEqual(shift_schedule_interval('@hourly', dt.timedelta(minutes=15)), '15 * * * *')
+        self.assertEqual(shift_schedule_interval('10 3 * * 1', dt.timedelta(minutes=5)), '15 3 * * 1')
+
+    def test_should_not_shift_schedule_beyond_its_period(self):
+        with self.assertRaises(ValueError):
+            shift_schedule_interval('@hourly', dt.timedelta(minutes=60))
+        with self.assertRaises(ValueError):
+            shift_schedule_interval('0 23 * * *', dt.timedelta(hours=1))
+        with self.assertRaises(ValueError):
+            shift_schedule_interval('*/5 * * * *', dt.timedelta(minutes=1))
+
+
+class ForecastLoadTestCase(TestCase):
+
+    def test_should_count_concurrently_running_workflows(self):
+        # given
+        start = dt.datetime(2021, 3, 1)
+        loads = [
+            WorkflowLoad('a', '@daily', dt.timedelta(minutes=30)),
+            WorkflowLoad('b', '@daily', dt.timedelta(minutes=10), offset=dt.timedelta(minutes=20)),
+            WorkflowLoad('c', '@hourly', dt.timedelta(minutes=5)),
+        ]
+
+        # when
+        forecast = forecast_load(loads, start, days=1, bucket=dt.timedelta(minutes=10))
+
+        # then
+        self.assertEqual(len(forecast.concurrency), 144)
+        self.assertEqual(forecast.concurrency[:7], [2, 1, 2, 0, 0, 0, 1])
+        self.assertEqual(forecast.peak, 2)
+        self.assertEqual(forecast.peak_times()[:2], [dt.datetime(2021, 3, 1), dt.datetime(2021, 3, 1, 0, 20)])
+
+    def test_should_assign_offsets_keeping_peak_under_limit(self):
+        # given
+        start = dt.datetime(2021, 3, 1)
+        loads = [WorkflowLoad(f'w{i}', '@daily', dt.timedelta(minutes=10 + i)) for i in range(6)]
+
+        # when
+        offsets = assign_offsets(loads, start, max_concurrency=2, days=2)
+        forecast = forecast_load(
+            [l._replace(offset=offsets[l.workflow_id]) for l in loads], start, days=2)
+
+        # then
+        self.assertLessEqual(forecast.peak, 2)
+        self.assertEqual(sorted(offsets), [f'w{i}' for i in range(6)])
+        self.assertEqual(offsets['w5'], dt.timedelta(0))
+
+    def test_should_build_loads_from_workflows(self):
+        # given
+        workflows = [
+            bigflow.Workflow(workflow_id='a', definition=[]),
+            bigflow.Workflow(
+                workflow_id='b',
+                definition=[],
+                schedule_interval='@hourly',
+                start_time_factory=staggered_start_time(dt.timedelta(minutes=5))),
+        ]
+
+        # when
+        loads = workflow_loads(workflows, {'a': 60}, default_duration=dt.timedelta(minutes=1))
+
+        # then
+        self.assertEqual(loads, [
+            WorkflowLoad('a', '@daily', dt.timedelta(minutes=1)),
+            WorkflowLoad('b', '@hourly', dt.timedelta(minutes=1), dt.timedelta(minutes=5)),
+        ])
+
+
+class ForecastReportTestCase(TestCase):
+
+    def test_should_report_changed_offsets(self):
+        # given
+        start = dt.datetime(2021, 3, 1)
+        loads = [
+            WorkflowLoad('a', '@daily', dt.timedelta(minutes=10)),
+            WorkflowLoad('b', '@daily', dt.timedelta(minutes=10), offset=dt.timedelta(minutes=5)),
+        ]
+        offsets = {'a': dt.timedelta(minutes=15), 'b': dt.timedelta(minutes=5)}
+
+        # when
+        report = forecast_report(forecast_load(loads, start, days=1), loads, offsets)
+
+        # then
+        self.assertEqual(report['offsets'], {'a': {'offset_minutes': 15.0, 'schedule_interval': '15 0 * * *'}})
+        self.assertEqual(report['peak_concurrency'], 2)
+
+    def test_should_report_offsets_assigned_by_schedule_load_command(self):
+        # given
+        workflows = [bigflow.Workflow(workflow_id=f'w{i}', definition=[]) for i in range(3)]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'report.json'
+            args = argparse.Namespace(
+                durations=None, default_duration=600, days=2, bucket_minutes=5, max_concurrency=1,
+                max_offset_minutes=360, output=str(output))
+
+            # when
+            with mock.patch('bigflow.cli.walk_workflows', return_value=workflows):
+                _cli_schedule_load(Path(tmp), args)
+
+            # then
+            report = json.loads(output.read_text())
+        self.assertEqual(report['peak_concurrency'], 1)
+        self.assertEqual(sorted(o['offset_minutes'] for o in report['offsets'].values()), [10.0, 20.0])
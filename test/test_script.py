@@ -0,0 +1,140 @@
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import BadRequest, NotFound
+from google.cloud.bigquery import Table, SchemaField, TimePartitioning
+
+from bigflow.bigquery.script import ScriptStatement, ScriptError, build_script, WRITE_TMP, WRITE_TRUNCATE, \
+    WRITE_APPEND
+from bigflow.bigquery.stats import StatsCollector
+from bigflow.bigquery.templates import AliasNotFoundError
+from test import bigquery_mocks
+
+
+SCHEMA = [SchemaField('id', 'INT64'), SchemaField('day', 'DATE')]
+
+
+def child_job(start_line, bytes_billed=100, error_result=None):
+    return bigquery_mocks.finished_job(
+        bytes_billed,
+        job_id=f'child-{start_line}',
+        error_result=error_result,
+        script_statistics=mock.Mock(stack_frames=[mock.Mock(start_line=start_line)]),
+        slot_millis=10,
+        cache_hit=False)
+
+
+def partitioned_table(table_id):
+    table = Table(table_id, schema=SCHEMA)
+    table.time_partitioning = TimePartitioning(field='day')
+    return table
+
+
+class BuildScriptTestCase(TestCase):
+
+    def test_should_build_statements_of_write_operations(self):
+        # given
+        statements = [
+            ScriptStatement(WRITE_TMP, 'p.d.ids', 'SELECT 1 AS id;', temp=True),
+            ScriptStatement(WRITE_TRUNCATE, 'p.d.events$20200101', "SELECT id, DATE '2020-01-01' AS day FROM ids"),
+            ScriptStatement(WRITE_APPEND, 'p.d.all_ids', 'SELECT id FROM ids'),
+        ]
+        tables = {'p.d.events': partitioned_table('p.d.events'), 'p.d.all_ids': Table('p.d.all_ids', schema=SCHEMA[:1])}
+
+        # when
+        script, start_lines = build_script(statements, tables.get)
+
+        # then
+        self.assertEqual(script, '\n'.join([
+            "CREATE OR REPLACE TEMP TABLE `ids` AS",
+            "(\nSELECT 1 AS id\n);",
+            "BEGIN TRANSACTION;",
+            "DELETE FROM `p.d.events` WHERE DATE(`day`) = DATE '2020-01-01';",
+            "INSERT INTO `p.d.events` (`id`, `day`)",
+            "SELECT `id`, `day` FROM (\nSELECT id, DATE '2020-01-01' AS day FROM ids\n)",
+            "WHERE IF(DATE(`day`) = DATE '2020-01-01', TRUE, ERROR('Row outside of partition 2020-01-01'));",
+            "COMMIT TRANSACTION;",
+            "INSERT INTO `p.d.all_ids` (`id`)",
+            "SELECT `id` FROM (\nSELECT id FROM ids\n);",
+        ]))
+        self.assertEqual(start_lines, [1, 5, 13])
+
+    def test_should_not_accept_scripts_as_statements(self):
+        with self.assertRaises(ValueError):
+            build_script([ScriptStatement(WRITE_TMP, 'p.d.t', 'DECLARE x INT64; SELECT x')], {}.get)
+
+
+class ScriptTestCase(TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.list_tables.return_value = [mock.Mock(table_id='events')]
+        self.client.get_table.return_value = partitioned_table('project.dataset.events')
+        self.stats = StatsCollector('job', '2020-01-01', sinks=[])
+        self.dataset_manager = bigquery_mocks.dataset_manager(self.client, stats=self.stats)
+
+    def test_should_run_writes_as_one_script_and_record_stats_per_statement(self):
+        # given
+        self.client.list_jobs.return_value = [child_job(6, 300), child_job(1, 100)]
+
+        # when
+        with self.dataset_manager.script():
+            self.dataset_manager.write_tmp('ids', 'SELECT 1 AS id')
+            self.dataset_manager.write_truncate('events', "SELECT id, DATE('{dt}') AS day FROM {ids}")
+
+        # then
+        self.client.query.assert_called_once()
+        script = self.client.query.call_args[0][0]
+        self.assertIn('CREATE OR REPLACE TEMP TABLE `ids`', script)
+        self.assertIn("SELECT id, DATE('2020-01-01') AS day FROM ids", script)
+        self.assertEqual(
+            [(s.operation, s.target, s.bytes_billed) for s in self.stats.stats],
+            [('write_truncate', 'project.dataset.events$20200101', 300), ('write_tmp', 'project.dataset.ids', 100)])
+        self.assertNotIn('ids', self.dataset_manager.internal_tables)
+
+    def test_should_not_refer_to_temp_tables_after_script(self):
+        # given
+        self.client.list_jobs.return_value = [child_job(1), child_job(4)]
+        with self.dataset_manager.script():
+            self.dataset_manager.write_tmp('ids', 'SELECT 1 AS id')
+            self.dataset_manager.write_tmp('events', 'SELECT 1 AS id')
+
+        # then
+        with self.assertRaisesRegex(AliasNotFoundError, "'ids' was a TEMP table of a script"):
+            self.dataset_manager.collect('SELECT * FROM {ids}')
+        self.assertEqual(self.dataset_manager.internal_tables['events'], 'project.dataset.events')
+        self.client.query.assert_called_once()
+
+    def test_should_not_write_missing_table_in_script(self):
+        # given
+        self.client.get_table.side_effect = NotFound('project.dataset.events')
+
+        # when
+        with self.assertRaises(ScriptError) as context:
+            with self.dataset_manager.script():
+                self.dataset_manager.write_append('events', 'SELECT 1 AS id')
+
+        # then
+        self.assertIn("the table doesn't exist", str(context.exception))
+        self.client.query.assert_not_called()
+
+    def test_should_name_failed_operation(self):
+        # given
+        self.client.query.return_value.result.side_effect = BadRequest('Query error: Row outside of partition')
+        self.client.list_jobs.return_value = [child_job(7, error_result={'reason': 'invalidQuery'}), child_job(1)]
+
+        # when
+        with self.assertRaises(ScriptError) as context:
+            with self.dataset_manager.script():
+                self.dataset_manager.write_tmp('ids', 'SELECT 1 AS id')
+                self.dataset_manager.write_truncate('events', 'SELECT id, day FROM {ids}')
+
+        # then
+        self.assertEqual(context.exception.statement.operation, WRITE_TRUNCATE)
+        self.assertIn('write_truncate to project.dataset.events$20200101 failed', str(context.exception))
+
+    def test_should_not_collect_within_script(self):
+        with self.assertRaises(ValueError):
+            with self.dataset_manager.script():
+                self.dataset_manager.write_tmp('ids', 'SELECT 1 AS id')
+                self.dataset_manager.collect('SELECT * FROM {ids}')
+        self.client.query.assert_not_called()
@@ -0,0 +1,82 @@
+import datetime
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import NotFound
+from google.cloud.bigquery.job import QueryPlanEntry
+
+from bigflow.bigquery.dataset_manager import DatasetManager
+from bigflow.bigquery.stats import StatsCollector, JsonLinesSink, PrometheusTextfileSink, job_stats, JobStats
+
+START = datetime.datetime(2020, 1, 1, 10, 0, 0)
+
+
+def finished_query_job(bytes_billed=2 ** 30, cache_hit=False):
+    return mock.Mock(
+        job_id='bq-job-1',
+        total_bytes_processed=bytes_billed,
+        total_bytes_billed=bytes_billed,
+        slot_millis=1500,
+        cache_hit=cache_hit,
+        started=START,
+        ended=START + datetime.timedelta(seconds=3),
+        output_rows=None,
+        query_plan=[QueryPlanEntry.from_api_repr({
+            'name': 'S00: Input', 'startMs': '1000', 'endMs': '3000', 'recordsRead': '10', 'recordsWritten': '5'})])
+
+
+class StatsTestCase(TestCase):
+
+    def test_should_read_query_job_statistics(self):
+        # given
+        job = finished_query_job()
+
+        # when
+        stats = job_stats('job', '2020-01-01', 'collect', job)
+
+        # then
+        self.assertEqual(stats.bigquery_job_id, 'bq-job-1')
+        self.assertEqual(stats.bytes_billed, 2 ** 30)
+        self.assertEqual(stats.slot_ms, 1500)
+        self.assertEqual(stats.duration_sec, 3)
+        self.assertEqual(stats.stages[0].name, 'S00: Input')
+        self.assertEqual(stats.stages[0].duration_ms, 2000)
+
+    def test_should_export_stats_to_sinks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # given
+            json_lines = JsonLinesSink(Path(tmp) / 'stats.jsonl')
+            prometheus = PrometheusTextfileSink(Path(tmp) / 'bigflow.prom')
+            collector = StatsCollector('my_job', '2020-01-01', [json_lines, prometheus])
+
+            # when
+            collector.record(JobStats('my_job', '2020-01-01', 'write_truncate', bytes_billed=100, cache_hit=False))
+            collector.record(JobStats('my_job', '2020-01-01', 'write_truncate', bytes_billed=50, cache_hit=True))
+
+            # then
+            lines = [json.loads(l) for l in json_lines.path.read_text().splitlines()]
+            self.assertEqual([l['bytes_billed'] for l in lines], [100, 50])
+            textfile = prometheus.path.read_text()
+            self.assertIn('bigflow_bigquery_bytes_billed_total{job_id="my_job",operation="write_truncate"} 150', textfile)
+            self.assertIn('bigflow_bigquery_cache_hits_total{job_id="my_job",operation="write_truncate"} 1', textfile)
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()), ['bigflow.prom', 'stats.jsonl'])
+
+    def test_should_collect_stats_of_dataset_manager_operations(self):
+        # given
+        client = mock.Mock()
+        client.query.return_value = finished_query_job()
+        client.get_table.side_effect = NotFound('tmp')
+        collector = StatsCollector('my_job', '2020-01-01', sinks=[])
+        dataset_manager = DatasetManager(client, mock.Mock(full_dataset_id='project:dataset'), mock.Mock(), collector)
+
+        # when
+        dataset_manager.write_tmp('project.dataset.tmp', 'SELECT 1')
+        dataset_manager.collect('SELECT 1')
+
+        # then
+        self.assertEqual(
+            [(s.operation, s.target, s.bytes_billed) for s in collector.stats],
+            [('write_truncate', 'project.dataset.tmp', 2 ** 30), ('collect', None, 2 ** 30)])
+        self.assertIn('2 operations, processed 2.0 GB, billed 2.0 GB', collector.summary())
@@ -0,0 +1,45 @@
+import threading
+from unittest import TestCase
+
+from bigflow.bigquery.storage_read import merge_streams
+
+
+class MergeStreamsTestCase(TestCase):
+
+    def test_should_yield_items_of_all_streams(self):
+        # when
+        items = list(merge_streams([lambda: range(0, 50), lambda: range(50, 100), lambda: []]))
+
+        # then
+        self.assertEqual(sorted(items), list(range(100)))
+
+    def test_should_block_stream_readers_when_queue_is_full(self):
+        # given
+        produced = []
+        done = threading.Event()
+
+        def stream():
+            for i in range(10):
+                produced.append(i)
+                yield i
+            done.set()
+
+        # when
+        merged = merge_streams([stream], max_queue_size=2)
+        first = next(merged)
+
+        # then
+        self.assertEqual(first, 0)
+        self.assertFalse(done.wait(0.3))
+        self.assertLessEqual(len(produced), 4)
+        self.assertEqual(list(merged), list(range(1, 10)))
+
+    def test_should_reraise_stream_error(self):
+        # given
+        def failing_stream():
+            yield 1
+            raise RuntimeError("stream failed")
+
+        # then
+        with self.assertRaises(RuntimeError):
+            list(merge_streams([failing_stream, lambda: range(3)]))
@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+from google.cloud.bigquery import SchemaField
+
+from bigflow.bigquery.storage_write import proto_descriptor, proto_message_class, fill_message, BoundedAppends
+
+
+class FakeAppendFuture:
+
+    def __init__(self, name, acknowledged):
+        self.name = name
+        self.acknowledged = acknowledged
+
+    def result(self):
+        self.acknowledged.append(self.name)
+
+
+class StorageWriteTestCase(TestCase):
+
+    def test_should_serialize_rows_according_to_table_schema(self):
+        # given
+        schema = [
+            SchemaField('id', 'INTEGER', 'REQUIRED'),
+            SchemaField('day', 'DATE'),
+            SchemaField('created', 'TIMESTAMP'),
+            SchemaField('tags', 'STRING', 'REPEATED'),
+            SchemaField('address', 'RECORD', fields=[SchemaField('city', 'STRING')]),
+        ]
+        message_class = proto_message_class(proto_descriptor(schema))
+
+        # when
+        message = fill_message(message_class(), schema, {
+            'id': 1,
+            'day': '1970-01-11',
+            'created': '1970-01-01T00:00:01',
+            'tags': ['a', 'b'],
+            'address': {'city': 'Warsaw'},
+        })
+
+        # then
+        parsed = message_class.FromString(message.SerializeToString())
+        self.assertEqual(
+            (parsed.id, parsed.day, parsed.created, list(parsed.tags), parsed.address.city),
+            (1, 10, 1_000_000, ['a', 'b'], 'Warsaw'))
+
+    def test_should_reject_unsupported_column_type(self):
+        with self.assertRaises(ValueError):
+            proto_descriptor([SchemaField('interval', 'INTERVAL')])
+
+    def test_should_wait_for_oldest_append_when_limit_is_reached(self):
+        # given
+        acknowledged = []
+        appends = BoundedAppends(max_in_flight=2)
+
+        # when
+        for i in range(3):
+            appends.add(FakeAppendFuture(i, acknowledged))
+
+        # then
+        self.assertEqual(acknowledged, [0])
+        self.assertEqual(len(appends), 2)
+
+        # when
+        appends.wait_all()
+
+        # then
+        self.assertEqual(acknowledged, [0, 1, 2])
@@ -0,0 +1,81 @@
+import datetime
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import NotFound
+
+from bigflow.bigquery.stats import StatsCollector
+from bigflow.bigquery.table_copy import snapshot_ddl, clone_ddl
+from test import bigquery_mocks
+
+
+class TableCopyDdlTestCase(TestCase):
+
+    def test_should_create_snapshot_as_of_time(self):
+        # when
+        ddl = snapshot_ddl('p.d.events', 'p.d.events_20200101', expiration_days=1,
+                           snapshot_time=datetime.datetime(2020, 1, 1, 12))
+
+        # then
+        self.assertEqual(ddl, '\n'.join([
+            "CREATE SNAPSHOT TABLE `p.d.events_20200101`",
+            "CLONE `p.d.events`",
+            "FOR SYSTEM_TIME AS OF TIMESTAMP '2020-01-01 12:00:00+00:00'",
+            "OPTIONS(expiration_timestamp = TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL 24 HOUR))",
+        ]))
+
+    def test_should_not_clone_partition(self):
+        with self.assertRaises(ValueError):
+            clone_ddl('p.d.events$20200101', 'p.d.events_clone')
+
+
+class TableCopyTestCase(TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.get_table.side_effect = NotFound('events')
+        self.client.list_tables.return_value = []
+        self.client.copy_table.side_effect = lambda *args, **kwargs: bigquery_mocks.finished_job()
+        self.stats = StatsCollector('job', '2020-01-01', sinks=[])
+        self.dataset_manager = bigquery_mocks.dataset_manager(
+            self.client, external_tables={'raw_events': 'other-project.raw.events'}, stats=self.stats)
+
+    def test_should_copy_table_to_runtime_partition(self):
+        # when
+        self.dataset_manager.copy_table('events_tmp', 'events')
+
+        # then
+        source, destination = self.client.copy_table.call_args[0]
+        self.assertEqual((source, destination), ('project.dataset.events_tmp', 'project.dataset.events$20200101'))
+        self.assertEqual(self.client.copy_table.call_args[1]['job_config'].write_disposition, 'WRITE_TRUNCATE')
+        self.assertEqual(
+            [(s.operation, s.target) for s in self.stats.stats],
+            [('copy_table', 'project.dataset.events$20200101')])
+
+    def test_should_copy_tables_concurrently(self):
+        # when
+        with self.dataset_manager.parallel():
+            self.dataset_manager.copy_table_async('raw_events', 'events', partitioned=False)
+            self.dataset_manager.copy_table_async(
+                'events', 'events_backup', partitioned=False, write_disposition='WRITE_APPEND')
+
+        # then
+        self.assertEqual(
+            [c[0] for c in self.client.copy_table.call_args_list],
+            [('other-project.raw.events', 'project.dataset.events'),
+             ('project.dataset.events', 'project.dataset.events_backup')])
+        self.assertEqual(len(self.stats.stats), 2)
+
+    def test_should_snapshot_and_clone_with_ddl(self):
+        # given
+        self.client.query.side_effect = lambda *args, **kwargs: bigquery_mocks.finished_job()
+
+        # when
+        self.dataset_manager.snapshot_table('events', 'events_snapshot', expiration_days=7)
+        self.dataset_manager.clone_table('events', 'events_clone')
+
+        # then
+        snapshot, clone = [c[0][0] for c in self.client.query.call_args_list]
+        self.assertTrue(snapshot.startswith(
+            'CREATE SNAPSHOT TABLE `project.dataset.events_snapshot`\nCLONE `project.dataset.events`'))
+        self.assertEqual(clone, 'CREATE TABLE `project.dataset.events_clone`\nCLONE `project.dataset.events`')
+        self.assertEqual([s.operation for s in self.stats.stats], ['snapshot_table', 'clone_table'])
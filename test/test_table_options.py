@@ -0,0 +1,176 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import NotFound
+from google.cloud.bigquery import Table, TimePartitioning
+from google.cloud.bigquery.table import TableListItem
+
+from bigflow.bigquery.dataset_manager import get_partition_from_run_datetime_or_none
+from bigflow.bigquery.table_options import TableOptions, IntegerRange, build_table
+from test import bigquery_mocks
+
+
+class TableOptionsTestCase(TestCase):
+
+    def test_should_create_table_partitioned_by_day_by_default(self):
+        # when
+        table = build_table('p.d.t', [{'name': 'id', 'type': 'INT64'}])
+
+        # then
+        self.assertEqual(table.time_partitioning.type_, 'DAY')
+        self.assertIsNone(table.time_partitioning.field)
+        self.assertIsNone(table.clustering_fields)
+
+    def test_should_apply_options(self):
+        # when
+        table = build_table('p.d.t', [{'name': 'created', 'type': 'TIMESTAMP'}], table_options=TableOptions(
+            partition_type='HOUR',
+            partition_field='created',
+            partition_expiration_days=2,
+            clustering_fields=['created'],
+            require_partition_filter=True))
+
+        # then
+        self.assertEqual(table.time_partitioning.type_, 'HOUR')
+        self.assertEqual(table.time_partitioning.field, 'created')
+        self.assertEqual(table.time_partitioning.expiration_ms, 2 * 24 * 3600 * 1000)
+        self.assertEqual(table.clustering_fields, ['created'])
+        self.assertTrue(table.require_partition_filter)
+
+        # when
+        table = build_table('p.d.t', [{'name': 'id', 'type': 'INT64'}], table_options=TableOptions(
+            range_partitioning=IntegerRange('id', 0, 100, 10)))
+
+        # then
+        self.assertIsNone(table.time_partitioning)
+        self.assertEqual(table.range_partitioning.field, 'id')
+        self.assertEqual(table.range_partitioning.range_.interval, 10)
+
+    def test_should_read_options_from_schema_file(self):
+        # given
+        schema_file = Path(tempfile.mkdtemp()) / 'schema.json'
+        schema_file.write_text(json.dumps({
+            'fields': [{'name': 'day', 'type': 'DATE'}, {'name': 'country', 'type': 'STRING'}],
+            'partition_type': 'MONTH',
+            'partition_field': 'day',
+            'clustering_fields': ['country'],
+        }))
+
+        # when
+        table = build_table('p.d.t', schema_file)
+
+        # then
+        self.assertEqual([f.name for f in table.schema], ['day', 'country'])
+        self.assertEqual((table.time_partitioning.type_, table.time_partitioning.field), ('MONTH', 'day'))
+        self.assertEqual(table.clustering_fields, ['country'])
+
+    def test_should_reject_invalid_options(self):
+        for options in [
+            {'partition_type': 'WEEK'},
+            {'partition_type': None, 'require_partition_filter': True},
+            {'clustering_fields': ['a', 'b', 'c', 'd', 'e']},
+            {'range_partitioning': {'field': 'id', 'start': 0, 'end': 10, 'interval': 1}, 'partition_field': 'day'},
+            {'partition_typ': 'DAY'},
+        ]:
+            with self.subTest(options=options):
+                with self.assertRaises(ValueError):
+                    TableOptions.from_dict(options)
+
+
+class PartitionDecoratorTestCase(TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.list_tables.return_value = [mock.Mock(table_id='events')]
+        self.partitioned_dataset_manager = bigquery_mocks.dataset_manager(self.client, run_datetime='2020-01-02 13:00:00')
+
+    def test_should_compute_partition_from_run_datetime(self):
+        self.assertEqual(get_partition_from_run_datetime_or_none('2020-01-02 13:00:00', 'HOUR'), '2020010213')
+        self.assertEqual(get_partition_from_run_datetime_or_none('2020-01-02', 'HOUR'), '2020010200')
+        self.assertEqual(get_partition_from_run_datetime_or_none('2020-01-02 13:00:00'), '20200102')
+        self.assertEqual(get_partition_from_run_datetime_or_none('2020-01-02', 'MONTH'), '202001')
+        self.assertEqual(get_partition_from_run_datetime_or_none('2020-01-02', 'YEAR'), '2020')
+
+    def test_should_write_partition_matching_table_partitioning(self):
+        for partition_type, partition in [('HOUR', '2020010213'), ('DAY', '20200102'), ('MONTH', '202001')]:
+            with self.subTest(partition_type=partition_type):
+                # given
+                table = Table('project.dataset.events')
+                table.time_partitioning = TimePartitioning(type_=partition_type)
+                self.client.get_table.return_value = table
+                self.partitioned_dataset_manager._dataset_manager.dataset_manager._tables.clear()
+
+                # when
+                self.partitioned_dataset_manager.write_truncate('events', 'SELECT 1')
+
+                # then
+                job_config = self.client.query.call_args[1]['job_config']
+                self.assertEqual(job_config.destination.table_id, f'events${partition}')
+
+    def test_should_take_time_partitioning_from_dataset_listing(self):
+        # given
+        self.client.list_tables.return_value = [TableListItem({
+            'tableReference': {'projectId': 'project', 'datasetId': 'dataset', 'tableId': 'events'},
+            'timePartitioning': {'type': 'DAY'},
+        })]
+
+        # when
+        self.partitioned_dataset_manager.write_truncate('events', 'SELECT 1')
+
+        # then
+        self.client.get_table.assert_not_called()
+        self.assertEqual(self.client.query.call_args[1]['job_config'].destination.table_id, 'events$20200102')
+
+    def test_should_get_partitioning_of_table_replaced_by_ddl(self):
+        # given
+        daily, monthly = Table('project.dataset.events'), Table('project.dataset.events')
+        daily.time_partitioning = TimePartitioning(type_='DAY')
+        monthly.time_partitioning = TimePartitioning(type_='MONTH')
+        self.client.get_table.side_effect = [daily, monthly, monthly]
+        self.partitioned_dataset_manager.write_truncate('events', 'SELECT 1')
+
+        # when
+        self.partitioned_dataset_manager.create_table(
+            'CREATE OR REPLACE TABLE events (day DATE) PARTITION BY DATE_TRUNC(day, MONTH)')
+        self.partitioned_dataset_manager.write_truncate('events', 'SELECT 1')
+
+        # then
+        self.assertEqual(self.client.query.call_args[1]['job_config'].destination.table_id, 'events$202001')
+
+        # when
+        self.client.get_table.side_effect = [daily, monthly]
+        self.partitioned_dataset_manager.remove_dataset()
+        self.partitioned_dataset_manager.write_truncate('events', 'SELECT 1')
+
+        # then
+        self.assertEqual(self.client.query.call_args[1]['job_config'].destination.table_id, 'events$20200102')
+
+        # when
+        self.partitioned_dataset_manager._dataset_manager.dataset_manager.clone_table(
+            'project.archive.events', 'project.dataset.events')
+        self.partitioned_dataset_manager.write_truncate('events', 'SELECT 1')
+
+        # then
+        self.assertEqual(self.client.query.call_args[1]['job_config'].destination.table_id, 'events$202001')
+
+    def test_should_use_daily_partition_of_table_which_does_not_exist(self):
+        # given
+        self.client.get_table.side_effect = NotFound('events')
+
+        # when
+        table_id = self.partitioned_dataset_manager._create_table_id('2020-03-04', 'events', True)
+
+        # then
+        self.assertEqual(table_id, 'events$20200304')
+
+    def test_should_not_write_partition_of_range_partitioned_table(self):
+        # given
+        table = build_table('project.dataset.events', [{'name': 'id', 'type': 'INT64'}], table_options=TableOptions(
+            range_partitioning=IntegerRange('id', 0, 100, 10)))
+        self.client.get_table.return_value = table
+
+        # then
+        with self.assertRaises(ValueError):
+            self.partitioned_dataset_manager.write_truncate('events', 'SELECT 1')
@@ -0,0 +1,107 @@
+from unittest import TestCase
+
+import bigflow
+from bigflow.bigquery.interactive import InteractiveDatasetManager, interactive_component, DatasetConfigInternal
+from bigflow.bigquery.job import Job
+from bigflow.bigquery.templates import compile_template, render, render_with_parameters, check_workflow_templates, \
+    AliasNotFoundError
+
+
+class TemplatesTestCase(TestCase):
+
+    def test_should_compile_template_once(self):
+        self.assertIs(compile_template('SELECT * FROM `{table}`'), compile_template('SELECT * FROM `{table}`'))
+
+    def test_should_render_template_like_str_format(self):
+        # given
+        variables = {'table': 'p.d.t', 'dt': '2020-01-01', 'limit': 10}
+
+        # expect
+        for sql in [
+            "SELECT * FROM `{table}` WHERE dt = '{dt}'",
+            "SELECT '{{not a placeholder}}' FROM `{table}` LIMIT {limit:d}",
+            "SELECT {limit!r}",
+        ]:
+            self.assertEqual(render(sql, variables), sql.format(**variables))
+
+    def test_should_render_runtime_values_as_query_parameters(self):
+        # given
+        variables = {'table': 'p.d.t', 'dt': '2020-01-01', 'ids': [1, 2], 'limit': 10}
+
+        # when
+        sql, parameters = render_with_parameters(
+            "SELECT '{dt}' AS dt, 'day_{dt}' FROM `{table}_{dt}` -- it's {dt}\n"
+            "WHERE dt = \"{dt}\" AND id IN UNNEST({ids}) LIMIT {limit:d}",
+            variables,
+            {'dt', 'ids', 'limit'})
+
+        # then
+        self.assertEqual(sql, (
+            "SELECT @dt AS dt, 'day_2020-01-01' FROM `p.d.t_2020-01-01` -- it's 2020-01-01\n"
+            "WHERE dt = @dt AND id IN UNNEST(@ids) LIMIT 10"))
+        self.assertEqual(parameters, {'dt': '2020-01-01', 'ids': [1, 2]})
+
+    def test_should_inline_runtime_values_which_cant_be_query_parameters(self):
+        # given
+        variables = {'table': 'p.d.t', 'project': 'p', 'dt': '2020-01-01'}
+
+        # expect
+        for sql, expected in [
+            ("WHERE dt = DATE '{dt}'", "WHERE dt = DATE '2020-01-01'"),
+            ('WHERE ts > timestamp "{dt}"', 'WHERE ts > timestamp "2020-01-01"'),
+            ("SELECT r'{dt}'", "SELECT r'2020-01-01'"),
+            ("SELECT '''{dt}'''", "SELECT '''2020-01-01'''"),
+            ("SELECT * FROM {project}.d.t", "SELECT * FROM p.d.t"),
+            ("SELECT * FROM {table}_{dt}", "SELECT * FROM p.d.t_2020-01-01"),
+            ("SELECT {project}{dt}", "SELECT p2020-01-01"),
+        ]:
+            self.assertEqual(render_with_parameters(sql, variables, {'project', 'dt'}), (expected, {}))
+
+    def test_should_raise_error_for_missing_alias(self):
+        with self.assertRaises(AliasNotFoundError):
+            render('SELECT * FROM `{missing_table}`', {'table': 'p.d.t'})
+
+    def test_should_find_unknown_placeholders_in_workflow_components(self):
+        # given
+        dataset = InteractiveDatasetManager('project', 'dataset', internal_tables=['events'], extras={'country': 'PL'})
+
+        @interactive_component(ds=dataset)
+        def component(ds):
+            ds.write_tmp('tmp_events', "SELECT * FROM `{events}` WHERE country = '{country}'")
+            ds.write_truncate('events', 'SELECT * FROM `{tmp_events}` JOIN `{unknown_table}`')
+
+        workflow = bigflow.Workflow(workflow_id='w', definition=[
+            component.to_job(id='component'),
+            dataset.collect('SELECT * FROM `{events}` WHERE dt = "{dt}" AND x = {unknown_extra}').to_job(id='collect'),
+        ])
+
+        # when
+        errors = check_workflow_templates(workflow)
+
+        # then
+        self.assertEqual([(e.job_id, e.operation, e.missing) for e in errors], [
+            ('component', 'write_truncate', ['unknown_table']),
+            ('collect', 'collect', ['unknown_extra']),
+        ])
+
+    def test_should_find_unknown_placeholders_in_sql_passed_by_position(self):
+        # given
+        config = DatasetConfigInternal('project', 'dataset', internal_tables=['events'])
+
+        def component(ds):
+            ds.write_truncate('events', 'SELECT * FROM `{typo}`')
+            ds.collect('SELECT * FROM `{events}` WHERE x = {unknown_extra}')
+            ds.write_merge('events', 'SELECT * FROM `{events}` JOIN `{updates}`', ['id'])
+            ds.collect_list(sql='SELECT * FROM `{events}`', record_as_dict=True)
+
+        workflow = bigflow.Workflow(workflow_id='w', definition=[Job(component, id='component', ds=config)])
+
+        # when
+        errors = check_workflow_templates(workflow)
+
+        # then
+        self.assertEqual([(e.operation, e.missing) for e in errors], [
+            ('write_truncate', ['typo']),
+            ('collect', ['unknown_extra']),
+            ('write_merge', ['updates']),
+        ])
@@ -3,14 +3,31 @@ import bigflow
 import freezegun
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase, mock
 
 from google.cloud import logging_v2
 
-from bigflow.workflow import JobContext, Workflow, Definition, InvalidJobGraph, WorkflowJob
+from bigflow.workflow import JobContext, Workflow, Definition, InvalidJobGraph, WorkflowJob, run_in_dependency_order, \
+    ResourceRegistry
 
 
 class WorkflowTestCase(TestCase):
+    def test_should_find_upstream_job_ids(self):
+        # given
+        job_a, job_b, job_c, job_d = [mock.Mock(id=job_id) for job_id in "abcd"]
+        workflow = Workflow(workflow_id='test_workflow', definition=Definition({
+            job_a: [job_b, job_c],
+            job_b: [job_d],
+        }))
+
+        # expect
+        self.assertEqual(workflow._upstream_job_ids('a'), set())
+        self.assertEqual(workflow._upstream_job_ids('b'), {'a'})
+        self.assertEqual(workflow._upstream_job_ids('d'), {'a', 'b'})
+        with self.assertRaises(ValueError):
+            workflow._upstream_job_ids('e')
+
     def test_should_run_jobs(self):
         # given
         definition = [mock.Mock() for i in range(100)]
@@ -278,4 +295,101 @@ class WorkflowTestCase(TestCase):
         workflow = Workflow(workflow_id='test_workflow', definition=definition, schedule_interval='@hourly')
 
         # expected
-        self.assertEqual(workflow._build_sequential_order(), [job1, job5, job2, job3, job6, job9, job4, job7, job8])
\ No newline at end of file
+        self.assertEqual(workflow._build_sequential_order(), [job1, job5, job2, job3, job6, job9, job4, job7, job8])
+
+class RunInDependencyOrderTestCase(TestCase):
+    def test_should_run_tasks_after_their_upstream_tasks(self):
+        for parallelism in [1, 4]:
+            # given
+            started = []
+            tasks = OrderedDict((name, lambda name=name: started.append(name)) for name in ['c', 'b', 'a', 'd'])
+
+            # when
+            run_in_dependency_order(tasks, {'c': {'b'}, 'b': {'a'}, 'd': {'x'}}, parallelism)
+
+            # then
+            self.assertCountEqual(started, ['a', 'b', 'c', 'd'])
+            self.assertLess(started.index('a'), started.index('b'))
+            self.assertLess(started.index('b'), started.index('c'))
+
+    def test_should_stop_scheduling_tasks_after_failure(self):
+        for parallelism in [1, 2]:
+            # given
+            started = []
+
+            def fail():
+                raise RuntimeError("failed")
+
+            tasks = OrderedDict([('a', fail), ('b', lambda: started.append('b'))])
+
+            # when
+            with self.assertRaises(RuntimeError):
+                run_in_dependency_order(tasks, {'b': {'a'}}, parallelism)
+
+            # then
+            self.assertEqual(started, [])
+
+
+class ResourceRegistryTestCase(TestCase):
+    def test_should_share_resources_between_jobs_of_workflow_run(self):
+        # given
+        created, closed = [], []
+
+        class ClientJob(bigflow.Job):
+            def execute(self, context):
+                self.client = context.resources.get('client')
+
+        job1, job2 = ClientJob(id='job1'), ClientJob(id='job2')
+        workflow = Workflow(workflow_id='test_workflow', definition=[job1, job2])
+        workflow.resources.register(
+            'client', lambda: created.append('client') or object(), teardown=closed.append)
+
+        # when
+        workflow.run(datetime.datetime(2020, 1, 1))
+
+        # then
+        self.assertIs(job1.client, job2.client)
+        self.assertEqual(created, ['client'])
+        self.assertEqual(closed, [job1.client])
+        self.assertNotIn('client', workflow.resources)
+
+    def test_should_create_resource_once_for_parallel_jobs(self):
+        # given
+        registry = ResourceRegistry()
+        created = []
+
+        def factory():
+            created.append(1)
+            return object()
+
+        # when
+        with ThreadPoolExecutor(8) as executor:
+            resources = list(executor.map(lambda _: registry.get_or_create('r', factory), range(32)))
+
+        # then
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len({id(r) for r in resources}), 1)
+
+    def test_should_teardown_resources_after_outermost_run(self):
+        # given
+        registry = ResourceRegistry()
+        closed = []
+        registry.register('a', lambda: 'a', teardown=closed.append, eager=True)
+        registry.register('b', lambda: 'b', teardown=closed.append)
+
+        # when
+        registry.setup()
+        registry.setup()
+        registry.get('b')
+        registry.teardown()
+
+        # then
+        self.assertEqual(closed, [])
+
+        # when
+        registry.teardown()
+
+        # then
+        self.assertEqual(closed, ['b', 'a'])
+        with self.assertRaises(ValueError):
+            registry.get('c')
@@ -0,0 +1,134 @@
+import datetime as dt
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import bigflow
+from bigflow.workqueue import SqliteWorkQueue, Task, create_queue, workflow_tasks, enqueue_workflow, run_worker, \
+    DONE, FAILED
+
+
+class RecordingJob(bigflow.Job):
+
+    def __init__(self, id, executed, fail_times=0, retry_count=0):
+        self.id = id
+        self.executed = executed
+        self.fail_times = fail_times
+        self.retry_count = retry_count
+
+    def execute(self, context):
+        self.executed.append((self.id, context.runtime_str))
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("job failed")
+
+
+class WorkQueueTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue = create_queue(os.path.join(self.tmpdir.name, "queue.db"))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_should_create_sqlite_queue_from_url(self):
+        self.assertIsInstance(self.queue, SqliteWorkQueue)
+        self.assertIsInstance(create_queue("sqlite://" + os.path.join(self.tmpdir.name, "other.db")), SqliteWorkQueue)
+        with self.assertRaises(ValueError):
+            create_queue("unknown://host")
+
+    def test_should_build_tasks_from_workflow_graph(self):
+        # given
+        job_a, job_b, job_c = [RecordingJob(job_id, []) for job_id in "abc"]
+        workflow = bigflow.Workflow(
+            workflow_id='w',
+            definition=bigflow.Definition({job_a: [job_b, job_c]}),
+        )
+
+        # when
+        tasks = workflow_tasks(workflow, ["2020-01-01", dt.datetime(2020, 1, 2)])
+
+        # then
+        self.assertEqual({t.task_id: set(t.depends_on) for t in tasks}, {
+            'w.a@2020-01-01': set(),
+            'w.b@2020-01-01': {'w.a@2020-01-01'},
+            'w.c@2020-01-01': {'w.a@2020-01-01'},
+            'w.a@2020-01-02 00:00:00': {'w.a@2020-01-01'},
+            'w.b@2020-01-02 00:00:00': {'w.a@2020-01-02 00:00:00', 'w.b@2020-01-01'},
+            'w.c@2020-01-02 00:00:00': {'w.a@2020-01-02 00:00:00', 'w.c@2020-01-01'},
+        })
+
+    def test_should_claim_only_ready_tasks(self):
+        # given
+        self.queue.put([
+            Task('a', 'w', 'a', '2020-01-01'),
+            Task('b', 'w', 'b', '2020-01-01', depends_on=('a',)),
+        ])
+
+        # when
+        task = self.queue.claim('worker', dt.timedelta(minutes=1))
+
+        # then
+        self.assertEqual((task.task_id, task.attempts), ('a', 1))
+        self.assertIsNone(self.queue.claim('worker', dt.timedelta(minutes=1)))
+
+        # when
+        self.queue.ack('a', 'worker')
+
+        # then
+        self.assertEqual(self.queue.claim('worker', dt.timedelta(minutes=1)).task_id, 'b')
+
+    def test_should_retry_failed_tasks_and_fail_downstream_tasks(self):
+        # given
+        self.queue.put([
+            Task('a', 'w', 'a', '2020-01-01', max_attempts=2),
+            Task('b', 'w', 'b', '2020-01-01', depends_on=('a',)),
+        ])
+
+        # when
+        for attempt in [1, 2]:
+            task = self.queue.claim('worker', dt.timedelta(minutes=1))
+            self.assertEqual((task.task_id, task.attempts), ('a', attempt))
+            self.queue.nack('a', 'worker', 'error')
+
+        # then
+        self.assertIsNone(self.queue.claim('worker', dt.timedelta(minutes=1)))
+        self.assertEqual(self.queue.counts(), {FAILED: 2})
+        self.assertFalse(self.queue.has_unfinished_tasks())
+
+    def test_should_release_tasks_with_expired_lease(self):
+        # given
+        self.queue.put([Task('a', 'w', 'a', '2020-01-01')])
+
+        # when
+        with mock.patch('time.time', return_value=1000):
+            self.queue.claim('dead-worker', dt.timedelta(seconds=10))
+        with mock.patch('time.time', return_value=2000):
+            task = self.queue.claim('worker', dt.timedelta(seconds=10))
+
+        # then
+        self.assertEqual((task.task_id, task.attempts), ('a', 2))
+        self.assertFalse(self.queue.extend_lease('a', 'dead-worker', dt.timedelta(seconds=10)))
+
+    def test_worker_should_execute_enqueued_workflow(self):
+        # given
+        executed = []
+        job_a = RecordingJob('a', executed, fail_times=1, retry_count=1)
+        job_b = RecordingJob('b', executed)
+        workflow = bigflow.Workflow(workflow_id='w', definition=[job_a, job_b])
+        enqueue_workflow(self.queue, workflow, ["2020-01-01", "2020-01-02"])
+
+        # when
+        count = run_worker(self.queue, {'w': workflow}, poll_interval=dt.timedelta(0))
+
+        # then
+        self.assertEqual(count, 5)
+        self.assertEqual(executed, [
+            ('a', '2020-01-01'),
+            ('a', '2020-01-01'),
+            ('b', '2020-01-01'),
+            ('a', '2020-01-02'),
+            ('b', '2020-01-02'),
+        ])
+        self.assertEqual(self.queue.counts(), {DONE: 4})
@@ -0,0 +1,167 @@
+import time
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud.bigquery import Dataset, Table
+from google.cloud.bigquery.table import TableListItem
+
+from bigflow.testing.dataset_pool import DatasetPool, DatasetPoolExhaustedError, cleanup_leaked_datasets, \
+    POOL_LABEL, LEASE_LABEL, LEASED_AT_LABEL
+
+
+def dataset(dataset_name, labels=None, modified_ms=None):
+    return Dataset.from_api_repr({
+        'datasetReference': {'projectId': 'project', 'datasetId': dataset_name},
+        'etag': 'etag',
+        'labels': labels or {},
+        'lastModifiedTime': str(modified_ms or int(time.time() * 1000)),
+    })
+
+
+def table(table_name, modified_sec, labels=None):
+    return Table.from_api_repr({
+        'tableReference': {'projectId': 'project', 'datasetId': 'pool_0', 'tableId': table_name},
+        'type': 'TABLE',
+        'labels': labels or {},
+        'lastModifiedTime': str(int(modified_sec * 1000)),
+    })
+
+
+def table_item(table_name, table_type='TABLE'):
+    return TableListItem({
+        'tableReference': {'projectId': 'project', 'datasetId': 'pool_0', 'tableId': table_name},
+        'type': table_type,
+    })
+
+
+class DatasetPoolTestCase(TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        patcher = mock.patch('bigflow.testing.dataset_pool.get_bigquery_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = DatasetPool('project', 'pool', size=1, wait_timeout_sec=0)
+
+    def test_should_create_missing_dataset_and_lease_it(self):
+        # given
+        self.client.get_dataset.side_effect = [NotFound('pool_0'), dataset('pool_0', {POOL_LABEL: 'pool'})]
+
+        # when
+        lease = self.pool.acquire()
+
+        # then
+        self.assertEqual(lease.dataset_id, 'project.pool_0')
+        created = self.client.create_dataset.call_args[0][0]
+        self.assertEqual(created.labels, {POOL_LABEL: 'pool'})
+        leased, fields = self.client.update_dataset.call_args[0]
+        self.assertEqual(fields, ['labels'])
+        self.assertEqual(leased.labels[LEASE_LABEL], lease.lease_id)
+        self.assertEqual(leased.etag, 'etag')
+
+    def test_should_fail_when_all_datasets_are_leased(self):
+        # given
+        self.client.get_dataset.return_value = dataset(
+            'pool_0', {LEASE_LABEL: 'other', LEASED_AT_LABEL: str(int(time.time()))})
+
+        # then
+        with self.assertRaises(DatasetPoolExhaustedError):
+            self.pool.acquire()
+        self.client.update_dataset.assert_not_called()
+
+    def test_should_not_lease_dataset_taken_by_other_process(self):
+        # given
+        self.client.get_dataset.return_value = dataset('pool_0')
+        self.client.update_dataset.side_effect = PreconditionFailed('etag')
+
+        # then
+        with self.assertRaises(DatasetPoolExhaustedError):
+            self.pool.acquire()
+
+    def test_should_take_over_expired_lease_and_clean_up_after_it(self):
+        # given
+        leased_at = int(time.time()) - 7200
+        self.client.get_dataset.return_value = dataset(
+            'pool_0', {LEASE_LABEL: 'crashed', LEASED_AT_LABEL: str(leased_at)})
+        self.client.list_tables.return_value = [table_item('events')]
+        self.client.get_table.return_value = table('events', leased_at + 10)
+
+        # when
+        self.pool.acquire()
+
+        # then
+        self.client.query.assert_called_once_with('TRUNCATE TABLE `project.pool_0.events`')
+
+    def test_should_truncate_tables_modified_during_lease_on_release(self):
+        # given
+        self.client.get_dataset.return_value = dataset('pool_0')
+        lease = self.pool.acquire()
+        self.client.get_dataset.return_value = dataset('pool_0', {LEASE_LABEL: lease.lease_id})
+        self.client.list_tables.return_value = [
+            table_item('events'), table_item('users'), table_item('events_tmp'), table_item('events_view', 'VIEW')]
+        self.client.get_table.side_effect = [
+            table('events', lease.leased_at + 5),
+            table('users', lease.leased_at - 3600),
+            table('events_tmp', lease.leased_at + 5, {'bigflow_fingerprint': 'abc'}),
+        ]
+
+        # when
+        self.pool.release(lease)
+
+        # then
+        self.client.query.assert_called_once_with(
+            'TRUNCATE TABLE `project.pool_0.events`;\nDROP TABLE `project.pool_0.events_tmp`')
+        released = self.client.update_dataset.call_args[0][0]
+        self.assertEqual(released._properties['labels'], {LEASE_LABEL: None, LEASED_AT_LABEL: None})
+
+    def test_should_clone_fixture_tables_in_single_script(self):
+        # given
+        self.client.get_dataset.return_value = dataset('pool_0')
+
+        # when
+        lease = self.pool.acquire()
+        lease.clone_tables({'events': 'fixtures.data.events', 'users': 'fixtures.data.users'})
+
+        # then
+        self.client.query.assert_called_once_with('\n'.join([
+            'CREATE OR REPLACE TABLE `project.pool_0.events`',
+            'CLONE `fixtures.data.events`;',
+            'CREATE OR REPLACE TABLE `project.pool_0.users`',
+            'CLONE `fixtures.data.users`',
+        ]))
+
+    def test_should_delete_datasets_not_modified_for_max_age(self):
+        # given
+        now_ms = int(time.time() * 1000)
+        old, recent = dataset('pool_0', modified_ms=now_ms - 3 * 86400 * 1000), dataset('pool_1', modified_ms=now_ms)
+        self.client.list_datasets.return_value = [old, recent]
+        self.client.get_dataset.side_effect = [old, recent]
+
+        # when
+        deleted = cleanup_leaked_datasets(self.client, max_age_sec=86400, pool_name='pool')
+
+        # then
+        self.client.list_datasets.assert_called_once_with(filter=f'labels.{POOL_LABEL}:pool')
+        self.assertEqual(deleted, ['project.pool_0'])
+        self.client.delete_dataset.assert_called_once_with(old, delete_contents=True, not_found_ok=True)
+
+    def test_should_not_delete_leased_datasets(self):
+        # given
+        old_ms = int(time.time() * 1000) - 3 * 86400 * 1000
+        leased = dataset(
+            'pool_0', {LEASE_LABEL: 'running', LEASED_AT_LABEL: str(int(time.time()) - 600)}, modified_ms=old_ms)
+        expired = dataset(
+            'pool_1', {LEASE_LABEL: 'crashed', LEASED_AT_LABEL: str(int(time.time()) - 7200)}, modified_ms=old_ms)
+        self.client.list_datasets.return_value = [leased, expired]
+        self.client.get_dataset.side_effect = [leased, expired]
+
+        # when
+        deleted = self.pool.cleanup(max_age_sec=300)
+
+        # then
+        self.assertEqual(deleted, ['project.pool_1'])
+        self.client.delete_dataset.assert_called_once_with(expired, delete_contents=True, not_found_ok=True)
+
+    def test_should_reject_invalid_pool_name(self):
+        with self.assertRaises(ValueError):
+            DatasetPool('project', 'Pool-1')